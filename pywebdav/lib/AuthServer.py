@@ -1,6 +1,7 @@
 """Authenticating HTTP Server
 
-This module builds on BaseHTTPServer and implements basic authentication
+This module builds on BaseHTTPServer and implements basic and digest
+authentication
 
 """
 
@@ -8,6 +9,8 @@ import base64
 import binascii
 from http.server import BaseHTTPRequestHandler
 
+from . import digest
+
 
 DEFAULT_AUTH_ERROR_MESSAGE = """
 <head>
@@ -35,31 +38,128 @@ class AuthRequestHandler(BaseHTTPRequestHandler):
     In your subclass you have to define the method get_userinfo(user, password)
     which should return 1 or None depending on whether the password was
     ok or not. None means that the user is not authorized.
+
+    For digest authentication define get_digest_ha1(user, realm, algorithm,
+    command) which should return the hashed credentials or None.
     """
 
     # False means no authentiation
     DO_AUTH = 1
 
+    # accepted authentication schemes, any of 'basic' and 'digest'
+    AUTH_SCHEMES = ('basic',)
+    AUTH_REALM = 'PyWebDAV'
+
+    # NonceCache used for digest authentication
+    NONCES = None
+
+    # optional SessionManager: authenticated clients get a signed
+    # cookie which is accepted instead of their credentials
+    SESSION = None
+
+    # headers to add to the response of the current request
+    _auth_headers = ()
+    _stale_nonce = False
+
     def parse_request(self):
+        self._auth_headers = []
+        self._stale_nonce = False
         if not BaseHTTPRequestHandler.parse_request(self):
             return False
 
         if self.DO_AUTH:
+            if self.SESSION is not None and 'Cookie' in self.headers:
+                if self.SESSION.validate(self.headers['Cookie'], self.command):
+                    return True
+
             authorization = self.headers.get('Authorization', '')
             if not authorization:
                 self.send_autherror(401, "Authorization Required")
                 return False
-            scheme, credentials = authorization.split()
-            if scheme != 'Basic':
+            scheme, _, credentials = authorization.strip().partition(' ')
+            scheme = scheme.lower()
+            if scheme not in self.AUTH_SCHEMES:
                 self.send_error(501)
                 return False
-            credentials = base64.decodebytes(credentials.encode()).decode()
-            user, password = credentials.split(':')
-            if not self.get_userinfo(user, password, self.command):
+
+            if scheme == 'digest':
+                user = self._check_digest(credentials)
+            else:
+                user = self._check_basic(credentials)
+
+            if user is None:
                 self.send_autherror(401, "Authorization Required")
                 return False
+            if self.SESSION is not None:
+                self._auth_headers.append(
+                    ('Set-Cookie', self.SESSION.issue(user, self.command)))
         return True
 
+    def _check_basic(self, credentials):
+        """ return the user name if the Basic credentials are valid """
+        try:
+            credentials = base64.b64decode(credentials.strip()).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        user, _, password = credentials.partition(':')
+        if not self.get_userinfo(user, password, self.command):
+            return None
+        return user
+
+    def _check_digest(self, credentials):
+        """ return the user name if the Digest credentials are valid """
+        params = digest.parse_digest_header(credentials)
+        try:
+            user = params['username']
+            nonce = params['nonce']
+            algorithm = params.get('algorithm', 'MD5').upper()
+            if algorithm not in digest.ALGORITHMS or \
+                    params.get('realm') != self.AUTH_REALM or \
+                    params.get('qop', 'auth') != 'auth' or \
+                    params['uri'] != self.path:
+                return None
+            nc = params['nc']
+        except KeyError:
+            return None
+
+        state = self.NONCES.check(nonce, nc)
+        if state != digest.NONCE_OK:
+            self._stale_nonce = state == digest.NONCE_STALE
+            return None
+
+        ha1 = self.get_digest_ha1(user, self.AUTH_REALM,
+                                  algorithm.replace('-SESS', ''),
+                                  self.command)
+        if not ha1 or not digest.check_response(params, ha1, self.command):
+            return None
+
+        # hand out the next nonce before the current one expires
+        if self.NONCES.remaining(nonce) < self.NONCES.ttl / 10:
+            self._auth_headers.append(
+                ('Authentication-Info', 'nextnonce="%s"' % self.NONCES.new()))
+        return user
+
+    def end_headers(self):
+        for keyword, value in self._auth_headers:
+            self.send_header(keyword, value)
+        self._auth_headers = []
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def _auth_challenges(self):
+        """ return the WWW-Authenticate values for all accepted schemes """
+        challenges = []
+        if 'digest' in self.AUTH_SCHEMES:
+            nonce = self.NONCES.new()
+            for algorithm in ('SHA-256', 'MD5'):
+                challenges.append(
+                    'Digest realm="%s", qop="auth", algorithm=%s, '
+                    'nonce="%s", stale=%s' % (
+                        self.AUTH_REALM, algorithm, nonce,
+                        self._stale_nonce and 'true' or 'false'))
+        if 'basic' in self.AUTH_SCHEMES:
+            challenges.append('Basic realm="%s"' % self.AUTH_REALM)
+        return challenges
+
     def send_autherror(self, code, message=None):
         """Send and log an auth error reply.
 
@@ -87,7 +187,8 @@ class AuthRequestHandler(BaseHTTPRequestHandler):
                    _quote_html(message), 'explain': explain})
         self.send_response(code, message)
         self.send_header('Content-Type', self.error_content_type)
-        self.send_header('WWW-Authenticate', 'Basic realm="PyWebDAV"')
+        for challenge in self._auth_challenges():
+            self.send_header('WWW-Authenticate', challenge)
         self.send_header('Connection', 'close')
         self.end_headers()
         self.wfile.write(content.encode('utf-8'))
@@ -100,3 +201,11 @@ class AuthRequestHandler(BaseHTTPRequestHandler):
         """
         # Always reject
         return None
+
+    def get_digest_ha1(self, user, realm, algorithm, command):
+        """Returns the hex digest of user:realm:password computed
+        with the given algorithm ('MD5' or 'SHA-256') if the user
+        is allowed to access, None otherwise.
+        """
+        # Always reject
+        return None
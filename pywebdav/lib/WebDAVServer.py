@@ -9,26 +9,41 @@ import urllib.parse
 
 from .propfind import PROPFIND
 from .report import REPORT
+from .sync import SYNC
+from .proppatch import PROPPATCH
 from .delete import DELETE
 from .davcopy import COPY
 from .davmove import MOVE
 
+from . import davxml, utils
 from .utils import rfc1123_date, IfParser, tokenFinder
-from .errors import DAV_Error, DAV_NotFound
+from .errors import DAV_Error, DAV_NotFound, DAV_Condition
 
 from .constants import DAV_VERSION_1, DAV_VERSION_2
 from .locks import LockManager
+from .settings import Settings
+from .urimap import base_uri, request_uri, uri_path
+from .propcache import request_key, body_key
+from .zipstream import ZipStream
 import gzip
 import io
+import re
+import select
+import socket
+import zlib
 
 from pywebdav import __version__
 
-from xml.parsers.expat import ExpatError
-
 log = logging.getLogger(__name__)
 
 BUFFER_SIZE = 128 * 1000  # 128 Ko
 
+# bytes of a streamed multistatus body generated before the status is sent
+PREFETCH_SIZE = 256 * 1024
+
+# the Range headers served (a single range)
+RANGE = re.compile(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$')
+
 
 class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
     """Simple DAV request handler with
@@ -54,6 +69,42 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
     server_version = "DAV/" + __version__
     encode_threshold = 1400  # common MTU
 
+    # the configuration and the Settings compiled from it
+    _compiled = (None, Settings())
+
+    # ResponseCache for PROPFIND and REPORT responses
+    RESPONSE_CACHE = None
+
+    # BodyParser of XML request bodies
+    XML_PARSER = davxml.default_parser
+
+    @classmethod
+    def set_config(cls, config):
+        """ validate and install a new configuration
+
+        The configuration is compiled into Settings before anything
+        is replaced, thus an invalid configuration raises a ValueError
+        and leaves the current one active.
+        """
+        settings = Settings.from_config(config)
+        cls._compiled = (config, settings)
+        cls._config = config
+        return settings
+
+    @property
+    def settings(self):
+        """ the typed options of the current configuration """
+        config, settings = self._compiled
+        if config is not self._config:
+            # _config has been replaced without set_config
+            settings = self.set_config(self._config)
+        return settings
+
+    def _accepts_gzip(self):
+        """ test if the client accepts gzip content encoding """
+        encodings = self.headers.get('Accept-Encoding', '')
+        return 'gzip' in (e.split(';')[0].strip() for e in encodings.split(','))
+
     def send_body(self, DATA, code=None, msg=None, desc=None,
                   ctype='application/octet-stream', headers={}):
         """ send a body in one part """
@@ -62,20 +113,27 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         self.send_response(code, message=msg)
         self.send_header("Connection", "close")
         self.send_header("Accept-Ranges", "bytes")
-        self.send_header('Date', rfc1123_date())
 
         self._send_dav_version()
 
         for a, v in headers.items():
             self.send_header(a, v)
 
+        if isinstance(DATA, str):
+            DATA = DATA.encode('utf-8')
+        elif DATA is not None and not hasattr(DATA, '__len__'):
+            # the length of generated content is only known at the end
+            DATA = b''.join(DATA)
+
         if DATA:
             try:
-                if 'gzip' in self.headers.get('Accept-Encoding', '').split(',') \
-                        and len(DATA) > self.encode_threshold:
+                if (self._accepts_gzip() and
+                        'Content-Encoding' not in headers and
+                        'Content-Range' not in headers and
+                        len(DATA) > self.encode_threshold):
                     buffer = io.BytesIO()
                     output = gzip.GzipFile(mode='wb', fileobj=buffer)
-                    if isinstance(DATA, str):
+                    if isinstance(DATA, bytes):
                         output.write(DATA)
                     else:
                         for buf in DATA:
@@ -94,13 +152,11 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
 
         self.end_headers()
         if DATA:
-            if isinstance(DATA, str):
-                DATA = DATA.encode('utf-8')
-            if isinstance(DATA, str) or isinstance(DATA, bytes):
+            if isinstance(DATA, bytes):
                 log.debug("Don't use iterator")
                 self.wfile.write(DATA)
             else:
-                if self._config.DAV.getboolean('http_response_use_iterator'):
+                if self.settings.http_response_use_iterator:
                     # Use iterator to reduce using memory
                     log.debug("Use iterator")
                     for buf in DATA:
@@ -120,83 +176,160 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
                                    ctype='text/xml; encoding="utf-8"',
                                    headers={}):
         if (self.request_version == 'HTTP/1.0' or
-            not self._config.DAV.getboolean('chunked_http_response')):
+            not self.settings.chunked_http_response):
             self.send_body(DATA, code, msg, desc, ctype, headers)
         else:
             self.send_body_chunks(DATA, code, msg, desc, ctype, headers)
 
     def send_body_chunks(self, DATA, code, msg=None, desc=None,
                          ctype='text/xml"', headers={}):
-        """ send a body in chunks """
+        """ send a body in chunks
+
+        DATA may be bytes, a string or an iterable of those whose
+        length need not be known in advance. Compressed content is
+        streamed chunk by chunk as well.
+        """
 
         self.responses[207] = (msg, desc)
         self.send_response(code, message=msg)
-        self.send_header("Content-type", ctype)
         self.send_header("Transfer-Encoding", "chunked")
-        self.send_header('Date', rfc1123_date())
 
         self._send_dav_version()
 
         for a, v in headers.items():
             self.send_header(a, v)
 
-        GZDATA = None
-        if DATA:
-            if ('gzip' in self.headers.get('Accept-Encoding', '').split(',')
-                and len(DATA) > self.encode_threshold):
-                buffer = io.BytesIO()
-                output = gzip.GzipFile(mode='wb', fileobj=buffer)
-                if isinstance(DATA, bytes):
-                    output.write(DATA)
-                else:
-                    for buf in DATA:
-                        buf = buf.encode() if isinstance(buf, str) else buf
-                        output.write(buf)
-                output.close()
-                buffer.seek(0)
-                GZDATA = buffer.getvalue()
+        if isinstance(DATA, str):
+            DATA = DATA.encode('utf-8')
+
+        compressor = None
+        if DATA is not None:
+            if (self._accepts_gzip() and
+                    'Content-Encoding' not in headers and
+                    'Content-Range' not in headers and
+                    (not hasattr(DATA, '__len__') or
+                     len(DATA) > self.encode_threshold)):
+                compressor = zlib.compressobj(wbits=31)
                 self.send_header('Content-Encoding', 'gzip')
-
-            self.send_header('Content-Length', len(DATA))
-            self.send_header('Content-Type', ctype)
-
-        else:
-            self.send_header('Content-Length', 0)
+        self.send_header('Content-Type', ctype)
 
         self.end_headers()
 
-        if GZDATA:
-            self.wfile.write(GZDATA)
+        if DATA is None:
+            # HEAD request
+            return
 
-        elif DATA:
-            DATA = DATA.encode() if isinstance(DATA, str) else DATA
-            if isinstance(DATA, bytes):
-                self.wfile.write(b"%s\r\n" % hex(len(DATA))[2:].encode())
-                self.wfile.write(DATA)
-                self.wfile.write(b"\r\n")
-                self.wfile.write(b"0\r\n")
-                self.wfile.write(b"\r\n")
-            else:
-                if self._config.DAV.getboolean('http_response_use_iterator'):
-                    # Use iterator to reduce using memory
-                    for buf in DATA:
-                        buf = buf.encode() if isinstance(buf, str) else buf
-                        self.wfile.write((hex(len(buf))[2:] + "\r\n").encode())
-                        self.wfile.write(buf)
-                        self.wfile.write(b"\r\n")
+        if isinstance(DATA, bytes):
+            chunks = (DATA,)
+        elif self.settings.http_response_use_iterator:
+            # Use iterator to reduce using memory
+            chunks = DATA
+        else:
+            # Don't use iterator, it's a compatibility option
+            chunks = (DATA.read(),)
+
+        for buf in chunks:
+            buf = buf.encode() if isinstance(buf, str) else buf
+            if compressor is not None:
+                buf = compressor.compress(buf)
+            self._write_chunk(buf)
+        if compressor is not None:
+            self._write_chunk(compressor.flush())
+
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, buf):
+        # an empty chunk would end the body
+        if not buf:
+            return
+        if isinstance(buf, memoryview):
+            # (a slice of a memory mapped file) written without a copy
+            self.wfile.write(b"%x\r\n" % len(buf))
+            self.wfile.write(buf)
+            self.wfile.write(b"\r\n")
+        else:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(buf), buf))
+
+    def _response_key(self, dc, uri, depth, request):
+        """ return the cache key of a multistatus response or None """
+        cache = self.RESPONSE_CACHE
+        if cache is None or depth not in ('0', '1'):
+            return None
+        return cache.make_key(uri_path(uri), self.headers.get('Host', ''),
+                              depth, self.command, request,
+                              dc.get_collection_version(uri))
+
+    def _resources_changed(self, *uris, created=()):
+        """ note the modification of uris by the current request
+
+        Cached responses are invalidated and the changes are appended
+        to the change journal. Resources (or trees) which exist are
+        recorded as changed, the others as removed. created are those
+        of uris which did not exist before the request.
+        """
+        self._invalidate_responses(*uris)
 
-                    self.wfile.write(b"0\r\n")
-                    self.wfile.write(b"\r\n")
+        dc = self.IFACE_CLASS
+        if dc.journal is None:
+            return
+        changed = []
+        new = []
+        removed = []
+        for uri in uris:
+            if not uri:
+                continue
+            if dc.exists(uri):
+                members = [uri_path(member) for member in
+                           utils.create_treelist(dc, uri)]
+                if uri in created:
+                    new.extend(members)
                 else:
-                    # Don't use iterator, it's a compatibility option
-                    self.wfile.write((hex(len(DATA))[2:] + "\r\n").encode())
-                    self.wfile.write(DATA.read())
-                    self.wfile.write(b"\r\n")
-                    self.wfile.write(b"0\r\n")
-                    self.wfile.write(b"\r\n")
+                    changed.extend(members)
+            else:
+                removed.append(uri_path(uri))
+        dc.journal.record(changed)
+        dc.journal.record(new, created=True)
+        dc.journal.record(removed, deleted=True)
+
+    def _invalidate_responses(self, *uris):
+        """ forget cached responses affected by changes of uris """
+        if self.RESPONSE_CACHE is not None:
+            for uri in uris:
+                if uri:
+                    self.RESPONSE_CACHE.invalidate(uri_path(uri))
+
+    def send_condition(self, error):
+        """ send the DAV:error body of a DAV_Condition """
+        (ec, condition) = error.args
+        self.send_body(utils.make_condition(condition), ec,
+                       self.responses.get(ec, [''])[0], None,
+                       'text/xml; charset="utf-8"')
+
+    def client_disconnected(self):
+        """ test if the client has closed the connection """
+        try:
+            readable, w, x = select.select([self.connection], [], [], 0)
+            if readable:
+                return self.connection.recv(1, socket.MSG_PEEK) == b''
+        except (OSError, ValueError):
+            return True
+        return False
+
+    def send_multistatus(self, DATA, GZDATA=None):
+        """ send a multistatus body, precompressed if possible """
+        headers = {}
+        if GZDATA is not None and self._accepts_gzip():
+            DATA = GZDATA
+            headers['Content-Encoding'] = 'gzip'
+        self.send_body_chunks_if_http11(DATA, 207, 'Multi-Status',
+                                        'Multiple responses', headers=headers)
+
+    def date_time_string(self, timestamp=None):
+        """ date for the Date header sent by send_response """
+        return rfc1123_date(timestamp)
 
     def _send_dav_version(self):
-        if self._config.DAV.getboolean('lockemulation'):
+        if self.settings.lockemulation:
             self.send_header('DAV', DAV_VERSION_2['version'])
         else:
             self.send_header('DAV', DAV_VERSION_1['version'])
@@ -209,7 +342,7 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         self.send_response(200)
         self.send_header("Content-Length", 0)
 
-        if self._config.DAV.getboolean('lockemulation'):
+        if self.settings.lockemulation:
             self.send_header('Allow', DAV_VERSION_2['options'])
         else:
             self.send_header('Allow', DAV_VERSION_1['options'])
@@ -223,7 +356,10 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         """ Returns headers and body for given resource """
 
         dc = self.IFACE_CLASS
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
+
+        if self._wants_zip(uri) and dc.is_collection(uri):
+            return self._send_zip(dc, uri, with_body)
 
         headers = {}
 
@@ -241,10 +377,11 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
             pass
 
         # get the content type
+        collection = False
         try:
-            if uri.endswith('/'):
-                # we could do away with this very non-local workaround for
-                # _get_listing if the data could have a type attached
+            collection = dc.is_collection(uri)
+            if collection:
+                # collections are shown as HTML listings
                 content_type = 'text/html;charset=utf-8'
             else:
                 content_type = dc.get_prop(uri, "DAV:", "getcontenttype")
@@ -253,11 +390,25 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
 
         range = None
         status_code = 200
-        if 'Range' in self.headers:
-            p = self.headers['Range'].find("bytes=")
-            if p != -1:
-                range = self.headers['Range'][p + 6:].split("-")
+        # only single ranges of files are served, others are ignored
+        m = RANGE.match(self.headers.get('Range', ''))
+        if m and (m.group(1) or m.group(2)) and not collection:
+            try:
+                size = int(dc.get_prop(uri, "DAV:", "getcontentlength"))
+            except (DAV_Error, ValueError):
+                # served as a whole
+                size = None
+            if size is not None:
+                try:
+                    first, end = utils.byte_range(m.groups(), size)
+                except DAV_Error as error:
+                    (ec, dd) = error.args
+                    self.send_status(ec)
+                    return ec
+                range = (first, end - 1)
                 status_code = 206
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                    first, end - 1, size)
 
         # get the data
         try:
@@ -267,20 +418,94 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
             self.send_status(ec)
             return ec
 
-        # send the data
-        if with_body is False:
-            data = None
+        try:
+            # send the data
+            body = data
+            if with_body is False:
+                body = None
+
+            if isinstance(body, str):
+                self.send_body(body, status_code, None, None, content_type,
+                               headers)
+            else:
+                headers['Keep-Alive'] = 'timeout=15, max=86'
+                headers['Connection'] = 'Keep-Alive'
+                self.send_body_chunks_if_http11(body, status_code, None,
+                                                None, content_type, headers)
+        finally:
+            # release what the interface opened for the content, it is
+            # not sent for HEAD and only in part if the client is gone
+            close = getattr(data, 'close', None)
+            if close is not None:
+                close()
+
+        return status_code
 
-        if isinstance(data, str):
-            self.send_body(data, status_code, None, None, content_type,
-                           headers)
+    def _wants_zip(self, uri):
+        """ test if a collection is requested as ZIP archive """
+        if not self.settings.zip_download:
+            return False
+        query = urllib.parse.parse_qs(uri.partition('?')[2])
+        if query.get('download') == ['zip']:
+            return True
+        for accepted in self.headers.get('Accept', '').split(','):
+            media, sep, params = accepted.partition(';')
+            if media.strip().lower() == 'application/zip':
+                q = re.search(r'q\s*=\s*([01](?:\.[0-9]*)?)', params)
+                return not q or float(q.group(1)) > 0
+        return False
+
+    def _send_zip(self, dc, uri, with_body):
+        """ stream the tree below the collection uri as ZIP archive
+
+        The archive is sent in chunks as it is generated, HTTP/1.0
+        clients get it until the connection is closed.
+        """
+        settings = self.settings
+        name = uri_path(uri).rpartition('/')[2] or 'download'
+        chunked = (self.request_version != 'HTTP/1.0' and
+                   settings.chunked_http_response)
+
+        # the walk is limited like the one of a Depth infinity PROPFIND
+        stream = ZipStream(dc, uri, settings.zip_compress_level,
+                           max_entries=settings.propfind_max_entries,
+                           max_time=settings.propfind_max_time)
+        try:
+            stream.check()
+        except DAV_Error as error:
+            (ec, dd) = error.args
+            self.send_status(ec)
+            return ec
+
+        self.send_response(200)
+        self._send_dav_version()
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition',
+                         utils.content_disposition(name + '.zip'))
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
         else:
-            headers['Keep-Alive'] = 'timeout=15, max=86'
-            headers['Connection'] = 'Keep-Alive'
-            self.send_body_chunks_if_http11(data, status_code, None, None,
-                                            content_type, headers)
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
 
-        return status_code
+        if not with_body:
+            return 200
+
+        log.info('Sending %s as ZIP archive' % uri)
+        try:
+            for buf in stream:
+                if chunked:
+                    self._write_chunk(buf)
+                else:
+                    self.wfile.write(buf)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except ConnectionError:
+            # downloads of whole trees are often cancelled
+            log.info('Client aborted the ZIP download of %s' % uri)
+            self.close_connection = True
+        return 200
 
     def do_HEAD(self):
         """ Send a HEAD response: Retrieves resource information w/o body """
@@ -314,38 +539,98 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         self.send_body(None, 405, 'Method Not Allowed', 'Method Not Allowed')
 
     def do_PROPPATCH(self):
-        # currently unsupported
-        return self.send_status(423)
-
-    def do_PROPFIND(self):
-        """ Retrieve properties on defined resource. """
+        """ set and remove dead properties """
 
         dc = self.IFACE_CLASS
 
-        # read the body containing the xml request
-        # iff there is no body then this is an ALLPROP request
-        body = None
-        if 'Content-Length' in self.headers:
-            l = self.headers['Content-Length']
-            body = self.rfile.read(int(l))
+        try:
+            body = self.read_xml_body()
+        except DAV_Error as error:
+            return self.send_status(error.args[0])
 
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
 
-        try:
-            pf = PROPFIND(uri, dc, self.headers.get('Depth', 'infinity'), body)
-        except ExpatError:
-            # parse error
-            return self.send_status(400)
+        if self._l_isLocked(uri) and not self._has_lock_token(uri):
+            return self.send_body(None, 423, 'Locked', 'Locked')
+
+        if not dc.exists(uri):
+            return self.send_status(404)
 
         try:
-            DATA = pf.createResponse()
+            pp = PROPPATCH(uri, dc, body, self.XML_PARSER)
         except DAV_Error as error:
             (ec, dd) = error.args
             return self.send_status(ec)
 
+        DATA = pp.createResponse()
+        if pp.applied:
+            self._resources_changed(uri)
+        self.send_multistatus(DATA)
+
+    def _has_lock_token(self, uri):
+        """ return True if the If header names the lock of uri """
+        ifheader = self.headers.get('If')
+        if not ifheader:
+            return False
+        uri_token = self._l_getLockForUri(uri)
+        for tag in IfParser(ifheader):
+            for listitem in tag.list:
+                token = tokenFinder(listitem)
+                if (token and self._l_hasLock(token) and
+                        self._l_getLock(token) == uri_token):
+                    return True
+        return False
+
+    def do_PROPFIND(self):
+        """ Retrieve properties on defined resource. """
+
+        dc = self.IFACE_CLASS
+
+        uri = self.get_request_uri(dc)
+        depth = self.headers.get('Depth', 'infinity')
+
+        settings = self.settings
+        try:
+            # read the body containing the xml request
+            # iff there is no body then this is an ALLPROP request
+            body = self.read_xml_body()
+            pf = PROPFIND(uri, dc, depth, body,
+                          max_entries=settings.propfind_max_entries,
+                          max_time=settings.propfind_max_time,
+                          max_bytes=settings.propfind_max_bytes,
+                          cancelled=self.client_disconnected,
+                          parser=self.XML_PARSER)
+        except DAV_Error as error:
+            # parse error
+            return self.send_status(error.args[0])
+
+        cache = self.RESPONSE_CACHE
+        generation = cache is not None and cache.generation
+        key = self._response_key(dc, uri, depth,
+                                 request_key(pf.request_type, pf.proplist))
+        entry = key is not None and cache.get(key)
+        if entry:
+            DATA, GZDATA = entry
+        else:
+            try:
+                DATA = pf.createResponse()
+                if not isinstance(DATA, bytes):
+                    # the limits of a Depth infinity walk should rather
+                    # be hit before the status has been sent
+                    DATA = utils.prefetch(DATA, PREFETCH_SIZE)
+            except DAV_Condition as error:
+                return self.send_condition(error)
+            except DAV_Error as error:
+                (ec, dd) = error.args
+                return self.send_status(ec)
+
+            GZDATA = None
+            if key is not None and isinstance(DATA, bytes):
+                DATA, GZDATA = cache.put(key, DATA, generation)
+
         # work around MSIE DAV bug for creation and modified date
         # taken from Resource.py @ Zope webdav
-        if (self.headers.get('User-Agent') ==
+        if (isinstance(DATA, bytes) and self.headers.get('User-Agent') ==
             'Microsoft Data Access Internet Publishing Provider DAV 1.1'):
             DATA = DATA.replace(b'<ns0:getlastmodified xmlns:ns0="DAV:">',
                                 b'<ns0:getlastmodified xmlns:n="DAV:" '
@@ -357,34 +642,80 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
                                 b'xmlns:b="urn:uuid:'
                                 b'c2f41010-65b3-11d1-a29f-00aa00c14882/" '
                                 b'b:dt="dateTime.tz">')
+            GZDATA = None
 
-        self.send_body_chunks_if_http11(DATA, 207, 'Multi-Status',
-                                        'Multiple responses')
+        try:
+            self.send_multistatus(DATA, GZDATA)
+        except (DAV_Error, OSError) as ex:
+            # the status line is out already, all we can do is to
+            # leave the body incomplete
+            log.info('PROPFIND of %s aborted: %r' % (uri, ex))
+            self.close_connection = True
 
     def do_REPORT(self):
         """ Query properties on defined resource. """
 
         dc = self.IFACE_CLASS
 
-        # read the body containing the xml request
-        # iff there is no body then this is an ALLPROP request
-        body = None
-        if 'Content-Length' in self.headers:
-            l = self.headers['Content-Length']
-            body = self.rfile.read(int(l))
-
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
 
-        rp = REPORT(uri, dc, self.headers.get('Depth', '0'), body)
+        depth = self.headers.get('Depth', '0')
 
+        settings = self.settings
+        limits = dict(max_entries=settings.propfind_max_entries,
+                      max_time=settings.propfind_max_time,
+                      max_bytes=settings.propfind_max_bytes,
+                      cancelled=self.client_disconnected,
+                      parser=self.XML_PARSER)
         try:
-            DATA = '%s\n' % rp.createResponse()
+            # read the body containing the xml request
+            # iff there is no body then this is an ALLPROP request
+            body = self.read_xml_body()
+            root = None
+            if body:
+                # parsed only once, REPORT and SYNC take the root element
+                root = self.XML_PARSER.parse(body)
+            sync = root is not None and \
+                root.tag == davxml.DAV + 'sync-collection'
+            if sync:
+                if depth != '0':
+                    return self.send_status(400)
+                rp = SYNC(uri, dc, root, **limits)
+            else:
+                rp = REPORT(uri, dc, depth, root, **limits)
         except DAV_Error as error:
             (ec, dd) = error.args
             return self.send_status(ec)
 
-        self.send_body_chunks_if_http11(DATA, 207, 'Multi-Status',
-                                        'Multiple responses')
+        cache = self.RESPONSE_CACHE
+        generation = cache is not None and cache.generation
+        key = None
+        if not sync:
+            # the changes since a sync token are not cached
+            key = self._response_key(dc, uri, depth, body_key(body))
+        entry = key is not None and cache.get(key)
+        if entry:
+            DATA, GZDATA = entry
+        else:
+            try:
+                DATA = rp.createResponse()
+                if not isinstance(DATA, bytes):
+                    DATA = utils.prefetch(DATA, PREFETCH_SIZE)
+            except DAV_Condition as error:
+                return self.send_condition(error)
+            except DAV_Error as error:
+                (ec, dd) = error.args
+                return self.send_status(ec)
+
+            GZDATA = None
+            if key is not None and isinstance(DATA, bytes):
+                DATA, GZDATA = cache.put(key, DATA, generation)
+
+        try:
+            self.send_multistatus(DATA, GZDATA)
+        except (DAV_Error, OSError) as ex:
+            log.info('REPORT of %s aborted: %r' % (uri, ex))
+            self.close_connection = True
 
     def do_MKCOL(self):
         """ create a new collection """
@@ -399,10 +730,11 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
             return self.send_status(415)
 
         dc = self.IFACE_CLASS
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
 
         try:
             dc.mkcol(uri)
+            self._resources_changed(uri, created=(uri,))
             self.send_status(201)
             self.log_request(201)
         except DAV_Error as error:
@@ -414,7 +746,7 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         """ delete an resource """
 
         dc = self.IFACE_CLASS
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
 
         # hastags not allowed
         if uri.find('#') >= 0:
@@ -472,19 +804,27 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
             dl = DELETE(uri, dc)
             if dc.is_collection(uri):
                 res = dl.delcol()
+                # some members may be left (207), the others are gone
+                self._resources_changed(uri)
                 if res:
                     self.send_status(207, body=res)
                 else:
                     self.send_status(204)
             else:
                 res = dl.delone() or 204
+                if res < 300:
+                    self._resources_changed(uri)
                 self.send_status(res)
         except DAV_NotFound:
             self.send_body(None, 404, 'Not Found', 'Not Found')
+        except DAV_Error as error:
+            (ec, dd) = error.args
+            self._invalidate_responses(uri)
+            self.send_status(ec)
 
     def do_PUT(self):
         dc = self.IFACE_CLASS
-        uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        uri = self.get_request_uri(dc)
 
         log.debug("do_PUT: uri = %s" % uri)
         log.debug('do_PUT: headers = %s' % self.headers)
@@ -571,6 +911,16 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
                 self.log_request(423)
                 return res
 
+        # reject uploads which do not fit before reading them
+        if 'Content-Length' in self.headers:
+            try:
+                dc.check_quota(uri, int(self.headers['Content-Length']))
+            except DAV_Error as error:
+                (ec, dd) = error.args
+                # the body is left unread
+                self.close_connection = True
+                return self.send_status(ec)
+
         # Handle expect
         expect = self.headers.get('Expect', '')
         if (expect.lower() == '100-continue' and
@@ -591,15 +941,29 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         except:
             pass
 
+        created = not dc.exists(uri) and (uri,) or ()
+
         expect = self.headers.get('transfer-encoding', '')
         if (
             expect.lower() == 'chunked' and
             self.protocol_version >= 'HTTP/1.1' and
             self.request_version >= 'HTTP/1.1'
         ):
-            self.send_body(None, 201, 'Created', '', headers=headers)
+            try:
+                dc.put(uri, self._readChunkedData(), content_type)
+            except DAV_Error as error:
+                (ec, dd) = error.args
+                self._invalidate_responses(uri)
+                # the rest of the body may be left unread
+                self.close_connection = True
+                return self.send_status(ec)
+            except BaseException:
+                self._invalidate_responses(uri)
+                raise
+            self._resources_changed(uri, created=created)
 
-            dc.put(uri, self._readChunkedData(), content_type)
+            self.send_body(None, 201, 'Created', '', headers=headers)
+            self.log_request(201)
         else:
             # read the body
             body = None
@@ -614,7 +978,9 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
                 dc.put(uri, body, content_type)
             except DAV_Error as error:
                 (ec, dd) = error.args
+                self._invalidate_responses(uri)
                 return self.send_status(ec)
+            self._resources_changed(uri, created=created)
 
             self.send_body(None, 201, 'Created', '', headers=headers)
             self.log_request(201)
@@ -628,7 +994,7 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
             l = int(self.rfile.readline(), 16)
 
     def _readNoChunkedData(self, content_length):
-        if self._config.DAV.getboolean('http_request_use_iterator'):
+        if self.settings.http_request_use_iterator:
             # Use iterator to reduce using memory
             return self.__readNoChunkedDataWithIterator(content_length)
         else:
@@ -651,26 +1017,57 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
 
     def do_COPY(self):
         """ copy one resource to another """
-        try:
-            self.copymove(COPY)
-        except DAV_Error as error:
-            (ec, dd) = error.args
-            return self.send_status(ec)
+        self._copymove(COPY, urllib.parse.unquote(
+            self.headers.get('Destination', '')))
 
     def do_MOVE(self):
         """ move one resource to another """
+        self._copymove(MOVE, self.get_request_uri(self.IFACE_CLASS),
+                       urllib.parse.unquote(
+                           self.headers.get('Destination', '')))
+
+    def _copymove(self, CLASS, *uris):
+        """ run copymove and note the changes of uris if it succeeded """
+        dc = self.IFACE_CLASS
+        created = [uri for uri in uris if uri and not dc.exists(uri)]
+
+        def done(status):
+            # before the status is sent, clients may ask for the
+            # changes as soon as they have it
+            if status < 300:
+                # including partial successes (207)
+                self._resources_changed(*uris, created=created)
+            else:
+                self._invalidate_responses(*uris)
+
         try:
-            self.copymove(MOVE)
+            self.copymove(CLASS, done)
         except DAV_Error as error:
             (ec, dd) = error.args
+            self._invalidate_responses(*uris)
             return self.send_status(ec)
 
-    def copymove(self, CLASS):
-        """ common method for copying or moving objects """
+    def copymove(self, CLASS, done=None):
+        """ common method for copying or moving objects
+
+        done is called with the status code before it is sent.
+        returns the status code sent
+        """
         dc = self.IFACE_CLASS
 
+        def send_status(code, body=None):
+            if done is not None:
+                done(code)
+            if body:
+                self.send_body_chunks_if_http11(
+                    body, 207, self.responses[207][0],
+                    self.responses[207][1], ctype='text/xml; charset="utf-8"')
+            else:
+                self.send_status(code)
+            return code
+
         # get the source URI
-        source_uri = urllib.parse.unquote(urllib.parse.urljoin(self.get_baseuri(dc), self.path))
+        source_uri = self.get_request_uri(dc)
 
         # get the destination URI
         dest_uri = self.headers['Destination']
@@ -678,7 +1075,8 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
 
         # check locks on source and dest
         if self._l_isLocked(source_uri) or self._l_isLocked(dest_uri):
-            return self.send_body(None, 423, 'Locked', 'Locked')
+            self.send_body(None, 423, 'Locked', 'Locked')
+            return 423
 
         # Overwrite?
         overwrite = 1
@@ -698,12 +1096,11 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
 
             if d != "0" and d != "infinity":
                 self.send_status(400)
-                return
+                return 400
 
             if d == "0":
-                res = cp.single_action()
-                self.send_status(res or 201)
-                return
+                res = cp.single_action() or 201
+                return send_status(res)
 
         # now it only can be "infinity" but we nevertheless check for a
         # collection
@@ -712,22 +1109,20 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
                 res = cp.tree_action()
             except DAV_Error as error:
                 (ec, dd) = error.args
-                self.send_status(ec)
-                return
+                return send_status(ec)
         else:
             try:
                 res = cp.single_action()
             except DAV_Error as error:
                 (ec, dd) = error.args
-                self.send_status(ec)
-                return
+                return send_status(ec)
+            if isinstance(res, int):
+                # the status of the single resource
+                return send_status(res)
 
         if res:
-            self.send_body_chunks_if_http11(res, 207, self.responses[207][0],
-                                            self.responses[207][1],
-                                            ctype='text/xml; charset="utf-8"')
-        else:
-            self.send_status(result_code)
+            return send_status(207, res)
+        return send_status(result_code)
 
     def get_userinfo(self, user, pw):
         """ Dummy method which lets all users in """
@@ -742,10 +1137,33 @@ class DAVRequestHandler(AuthServer.AuthRequestHandler, LockManager):
         self.send_body(body, code, self.responses.get(code, [''])[0], msg,
                        mediatype)
 
+    def read_xml_body(self):
+        """ return the body of the request or None
+
+        Bodies above the size limit of the XML_PARSER are not read
+        and raise DAV_Error(413), a malformed Content-Length raises
+        DAV_Error(400).
+        """
+        if 'Content-Length' not in self.headers:
+            return None
+        try:
+            length = int(self.headers['Content-Length'])
+            if length < 0:
+                raise ValueError(length)
+            self.XML_PARSER.check_size(length)
+        except ValueError:
+            # the end of the body is unknown
+            self.close_connection = True
+            raise DAV_Error(400)
+        except DAV_Error:
+            # the body is left unread
+            self.close_connection = True
+            raise
+        return self.rfile.read(length)
+
     def get_baseuri(self, dc):
-        baseuri = dc.baseuri
-        if 'Host' in self.headers:
-            uparts = list(urllib.parse.urlparse(dc.baseuri))
-            uparts[1] = self.headers['Host']
-            baseuri = urllib.parse.urlunparse(uparts)
-        return baseuri
+        return base_uri(dc.baseuri, self.headers.get('Host'))
+
+    def get_request_uri(self, dc):
+        """ return the unquoted absolute URI of the requested resource """
+        return request_uri(dc.baseuri, self.headers.get('Host'), self.path)
@@ -0,0 +1,74 @@
+"""
+    Cache of recently verified credentials
+
+    Clients resend their credentials with every request. Verifying
+    a password against a key derivation function is deliberately slow,
+    so successful verifications are remembered for a short time.
+
+    Entries are keyed by a keyed hash (HMAC with a per-process random
+    key) of the credentials, thus no plain text password is kept in
+    memory and the cache cannot be used to look up passwords.
+
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CredentialCache:
+    """ bounded LRU cache of verified credentials with a TTL """
+
+    def __init__(self, size=1024, ttl=300):
+        self.size = int(size)
+        self.ttl = float(ttl)
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, user, password, salt=''):
+        """ return the keyed hash for the given credentials
+
+        salt should be the stored password hash so that a changed
+        password automatically invalidates cached verifications.
+        """
+        msg = '\0'.join((user, password, salt)).encode('utf-8')
+        return hmac.new(self._key, msg, hashlib.sha256).digest()
+
+    def check(self, user, password, salt=''):
+        """ return True if the credentials have been verified recently """
+        if self.size <= 0:
+            return False
+
+        key = self._digest(user, password, salt)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+        return True
+
+    def add(self, user, password, salt=''):
+        """ remember successfully verified credentials """
+        if self.size <= 0:
+            return
+
+        key = self._digest(user, password, salt)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
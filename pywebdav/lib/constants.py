@@ -10,6 +10,10 @@ RT_ALLPROP=1
 RT_PROPNAME=2
 RT_PROP=3
 
+# commands which do not modify any resource, allowed to users
+# without write access (and to read-only sessions)
+READ_COMMANDS = ('OPTIONS', 'GET', 'HEAD', 'PROPFIND', 'REPORT')
+
 # server mode
 DAV_VERSION_1 = {
         'version' : '1',
@@ -213,7 +213,10 @@ def moveone(dc,src,dst,overwrite=None):
     """
 
     # first copy it
-    copyone(dc, src, dst, overwrite)
+    res = copyone(dc, src, dst, overwrite)
+    if res:
+        # the source is kept if it could not be copied
+        return res
 
     # then delete it
     dc.rm(src)
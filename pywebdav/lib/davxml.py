@@ -0,0 +1,235 @@
+"""
+    Parsing of XML request bodies
+
+    PROPFIND, REPORT, PROPPATCH and LOCK bodies are parsed by expat
+    into ElementTree elements (tags in {namespace}name notation). The
+    parser enforces limits against hostile bodies: the size of the
+    body, the nesting depth of elements and no document type
+    declarations (and thus no entities).
+
+    Clients send the same few PROPFIND bodies over and over again,
+    thus the parsed form of small bodies is kept in a LRU cache by the
+    hash of the body. Elements returned by BodyParser.parse() may be
+    shared between requests and must not be changed.
+
+    The functions below extract what the methods need from a parsed
+    body.
+
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from xml.etree.ElementTree import Element, TreeBuilder
+from xml.parsers import expat
+
+from .constants import RT_ALLPROP, RT_PROPNAME, RT_PROP
+from .errors import DAV_Error
+
+DAV = '{DAV:}'
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+
+def split_tag(tag):
+    """ return (namespace, local name) of a {namespace}name tag """
+    if tag[:1] == '{':
+        ns, sep, name = tag[1:].partition('}')
+        return ns, name
+    return '', tag
+
+
+def text(element):
+    """ return the stripped text content of an element """
+    if element is None:
+        return None
+    return ''.join(element.itertext()).strip()
+
+
+class BodyParser:
+    """ expat based parser of request bodies with a cache
+
+    max_size    -- largest body in bytes (413 above)
+    max_depth   -- deepest nesting of elements (400 below)
+    cache_size  -- number of parsed bodies kept
+    cache_body  -- largest body in bytes which is cached
+    """
+
+    def __init__(self, max_size=1024 * 1024, max_depth=32, cache_size=64,
+                 cache_body=4096):
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.cache_size = cache_size
+        self.cache_body = cache_body
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def check_size(self, length):
+        """ raise DAV_Error(413) if a body of length bytes is too large """
+        if self.max_size and length > self.max_size:
+            raise DAV_Error(413, 'Request body of %d bytes too large' %
+                            length)
+
+    def parse(self, body):
+        """ return the root element of the body
+
+        body may be the root element already. Malformed bodies raise
+        DAV_Error(400).
+        """
+        if isinstance(body, Element):
+            return body
+        if not body:
+            raise DAV_Error(400, 'Request body expected')
+        self.check_size(len(body))
+
+        if self.cache_size <= 0 or len(body) > self.cache_body:
+            return self._parse(body)
+
+        key = hashlib.sha1(body).digest()
+        with self._lock:
+            root = self._cache.get(key)
+            if root is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return root
+            self.misses += 1
+
+        root = self._parse(body)
+        with self._lock:
+            self._cache[key] = root
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return root
+
+    def _parse(self, body):
+        builder = TreeBuilder()
+        parser = expat.ParserCreate(namespace_separator='}')
+        depth = [0]
+
+        def start(name, attrs):
+            depth[0] += 1
+            if self.max_depth and depth[0] > self.max_depth:
+                raise DAV_Error(400, 'XML nested too deep')
+            if '}' in name:
+                name = '{' + name
+            builder.start(name, dict(('}' in k and '{' + k or k, v)
+                                     for k, v in attrs.items()))
+
+        def end(name):
+            depth[0] -= 1
+            builder.end('}' in name and '{' + name or name)
+
+        def doctype(*args):
+            raise DAV_Error(400, 'Document type declarations are not allowed')
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = builder.data
+        parser.StartDoctypeDeclHandler = doctype
+        parser.EntityDeclHandler = doctype
+        parser.buffer_text = True
+        try:
+            parser.Parse(body, True)
+        except expat.ExpatError as ex:
+            raise DAV_Error(400, 'Malformed XML: %s' % ex)
+        return builder.close()
+
+
+# the parser of handlers without a configured one
+default_parser = BodyParser()
+
+
+def propfind_request(root):
+    """ return (request type, {ns: [names]}, [namespaces]) of a
+    propfind (or REPORT) element """
+    if next(root.iter(DAV + 'allprop'), None) is not None:
+        return RT_ALLPROP, {}, []
+    if next(root.iter(DAV + 'propname'), None) is not None:
+        return RT_PROPNAME, {}, []
+
+    props = {}
+    namespaces = []
+    for prop in root.iter(DAV + 'prop'):
+        for e in prop:
+            ns, name = split_tag(e.tag)
+            if ns in props:
+                props[ns].append(name)
+            else:
+                props[ns] = [name]
+                namespaces.append(ns)
+    return RT_PROP, props, namespaces
+
+
+def propertyupdate_request(root):
+    """ return the (ns, name, fragment or None) changes of a
+    propertyupdate element in document order """
+    if root.tag != DAV + 'propertyupdate':
+        raise DAV_Error(400, 'propertyupdate expected')
+
+    changes = []
+    for action in root:
+        if action.tag not in (DAV + 'set', DAV + 'remove'):
+            continue
+        for prop in action.iter(DAV + 'prop'):
+            for e in prop:
+                ns, name = split_tag(e.tag)
+                value = None
+                if action.tag == DAV + 'set':
+                    value = serialize_children(e)
+                changes.append((ns, name, value))
+    return changes
+
+
+def lockinfo_request(root):
+    """ return the lockscope, locktype and lockowner of a lockinfo
+    element as keywords of LockItem """
+    info = root
+    if info.tag != DAV + 'lockinfo':
+        info = root.find('.//' + DAV + 'lockinfo')
+    if info is None:
+        raise DAV_Error(400, 'lockinfo expected')
+
+    data = {}
+    for key in ('lockscope', 'locktype'):
+        element = info.find(DAV + key)
+        if element is None or not len(element):
+            raise DAV_Error(400, '%s expected' % key)
+        data[key] = split_tag(element[0].tag)[1]
+    owner = info.find(DAV + 'owner')
+    data['lockowner'] = owner is not None and serialize_children(owner) or ''
+    return data
+
+
+def _escape(value, quote=False):
+    value = value.replace('&', '&amp;').replace('<', '&lt;')
+    value = value.replace('>', '&gt;')
+    if quote:
+        value = value.replace('"', '&quot;')
+    return value
+
+
+def serialize_children(element):
+    """ return the content of an element as XML fragment
+
+    Every element of the fragment declares its own namespace, thus
+    it can be stored and parsed again without the request document.
+    """
+    out = [_escape(element.text or '')]
+    for child in element:
+        ns, name = split_tag(child.tag)
+        attrs = ['xmlns="%s"' % _escape(ns, True)]
+        for i, (key, value) in enumerate(child.attrib.items()):
+            ans, aname = split_tag(key)
+            if ans == XML_NS:
+                attrs.append('xml:%s="%s"' % (aname, _escape(value, True)))
+            elif ans:
+                attrs.append('xmlns:a%d="%s" a%d:%s="%s"' % (
+                    i, _escape(ans, True), i, aname, _escape(value, True)))
+            else:
+                attrs.append('%s="%s"' % (aname, _escape(value, True)))
+        out.append('<%s %s>%s</%s>' % (name, ' '.join(attrs),
+                                       serialize_children(child), name))
+        out.append(_escape(child.tail or ''))
+    return ''.join(out)
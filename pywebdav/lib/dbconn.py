@@ -20,9 +20,9 @@ class Mconn:
 
             return 1
 
-    def execute(self,qry):
+    def execute(self,qry,args=None):
         if self.db:
-            try: res=self.db.execute(qry)
+            try: res=self.db.execute(qry,args)
             except MySQLdb.OperationalError as message:
                 log.error("Error %d:\n%s" % (message[ 0 ], message[ 1 ] ))
                 return 0
@@ -0,0 +1,143 @@
+"""
+    HTTP Digest access authentication (RFC 7616)
+
+    Nonces are kept in a bounded table together with the nonce counts
+    seen so far. A client may reuse a nonce with increasing nonce counts
+    until it expires, thus it only needs one extra round trip per nonce
+    lifetime instead of one per request. Replayed nonce counts are
+    rejected, expired or unknown nonces are reported as stale so that
+    clients retry with a fresh nonce without asking the user again.
+
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+ALGORITHMS = {
+    'MD5': hashlib.md5,
+    'MD5-SESS': hashlib.md5,
+    'SHA-256': hashlib.sha256,
+    'SHA-256-SESS': hashlib.sha256,
+}
+
+# nonce counts may arrive out of order when a client uses several
+# connections, accept counts within this window
+NC_WINDOW = 64
+
+# nonce check results
+NONCE_OK = 0
+NONCE_STALE = 1
+NONCE_INVALID = 2
+
+_param = re.compile(r'\s*([\w*-]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^,\s]*)\s*,?')
+
+
+def parse_digest_header(credentials):
+    """ parse the parameters of a Digest Authorization header """
+    params = {}
+    for name, value in _param.findall(credentials):
+        if value.startswith('"'):
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        params[name.lower()] = value
+    return params
+
+
+def hash_hex(algorithm, data):
+    """ return the hex digest of data with the given digest algorithm """
+    return ALGORITHMS[algorithm.upper()](data.encode('utf-8')).hexdigest()
+
+
+def make_ha1(algorithm, user, realm, password):
+    """ return the hash of user:realm:password """
+    return hash_hex(algorithm, '%s:%s:%s' % (user, realm, password))
+
+
+def check_response(params, ha1, method):
+    """ check the response parameter of a Digest Authorization header
+
+    params  -- the parsed header
+    ha1     -- the hash of user:realm:password
+    method  -- the request method
+    """
+    algorithm = params.get('algorithm', 'MD5').upper()
+    nonce = params['nonce']
+    cnonce = params.get('cnonce', '')
+
+    if algorithm.endswith('-SESS'):
+        ha1 = hash_hex(algorithm, '%s:%s:%s' % (ha1, nonce, cnonce))
+
+    ha2 = hash_hex(algorithm, '%s:%s' % (method, params['uri']))
+    if params.get('qop'):
+        expected = hash_hex(algorithm, ':'.join(
+            (ha1, nonce, params['nc'], cnonce, params['qop'], ha2)))
+    else:
+        expected = hash_hex(algorithm, '%s:%s:%s' % (ha1, nonce, ha2))
+
+    return hmac.compare_digest(expected.encode('ascii'),
+                               params.get('response', '').encode('ascii'))
+
+
+class NonceCache:
+    """ bounded LRU table of issued nonces """
+
+    def __init__(self, size=4096, ttl=3600):
+        self.size = int(size)
+        self.ttl = float(ttl)
+        self._nonces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new(self):
+        """ create and remember a new nonce """
+        nonce = os.urandom(16).hex()
+        with self._lock:
+            # expiry, highest nonce count, bitmask of seen counts
+            self._nonces[nonce] = [time.monotonic() + self.ttl, 0, 0]
+            while len(self._nonces) > self.size:
+                self._nonces.popitem(last=False)
+        return nonce
+
+    def check(self, nonce, nc):
+        """ validate a nonce and register its nonce count
+
+        returns NONCE_OK, NONCE_STALE or NONCE_INVALID
+        """
+        try:
+            nc = int(nc, 16)
+        except ValueError:
+            return NONCE_INVALID
+
+        with self._lock:
+            entry = self._nonces.get(nonce)
+            if entry is None:
+                # unknown or evicted: let the client retry silently
+                return NONCE_STALE
+            if entry[0] < time.monotonic():
+                del self._nonces[nonce]
+                return NONCE_STALE
+
+            highest, seen = entry[1], entry[2]
+            if nc > highest:
+                shift = nc - highest
+                seen = (seen << shift | 1) & ((1 << NC_WINDOW) - 1)
+                entry[1], entry[2] = nc, seen
+            else:
+                offset = highest - nc
+                if nc == 0 or offset >= NC_WINDOW or seen & (1 << offset):
+                    # replayed request
+                    return NONCE_INVALID
+                entry[2] = seen | (1 << offset)
+
+            self._nonces.move_to_end(nonce)
+        return NONCE_OK
+
+    def remaining(self, nonce):
+        """ return the remaining lifetime of a nonce in seconds """
+        entry = self._nonces.get(nonce)
+        if entry is None:
+            return 0
+        return entry[0] - time.monotonic()
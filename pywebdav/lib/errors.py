@@ -60,3 +60,12 @@ class DAV_Requested_Range_Not_Satisfiable(DAV_Error):
             DAV_Error.__init__(self, 416)
         pass
 
+class DAV_Condition(DAV_Error):
+    """ a precondition or postcondition (RFC 4918, section 16) failed
+
+    The second argument is the name of the condition element which
+    is sent back in a DAV:error body.
+    """
+
+    def __init__(self, code, condition):
+        DAV_Error.__init__(self, code, condition)
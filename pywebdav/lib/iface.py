@@ -10,6 +10,7 @@ class.
 from xml.dom import minidom
 from .locks import LockManager
 from .errors import DAV_Forbidden, DAV_NotFound
+from .utils import rfc1123_date, iso8601_date, get_parenturi
 
 import time
 
@@ -27,6 +28,8 @@ class dav_interface:
                      'getetag',
                      'getlastmodified',
                      'lockdiscovery',
+                     'quota-available-bytes',
+                     'quota-used-bytes',
                      'resourcetype',
                      'source',
                      'supportedlock'),
@@ -40,6 +43,14 @@ class dav_interface:
     M_NS={"DAV:" : "_get_dav",
           "NS2"  : "ns2" }
 
+    # number of threads reading properties for PROPFIND. More than one
+    # only helps if reading properties waits for I/O (e.g. network
+    # filesystems) and requires the property methods to be thread safe
+    propfind_workers = 1
+
+    # ChangeJournal for the sync-collection REPORT, see journal.py
+    journal = None
+
     def get_propnames(self,uri):
         """ return the property names allowed for the given URI
 
@@ -79,6 +90,28 @@ class dav_interface:
         except AttributeError:
             raise DAV_NotFound
 
+    ###
+    ### dead properties (PROPPATCH)
+    ###
+
+    def get_dead_props(self, uris):
+        """ return the dead properties of a list of URIs
+
+        The result maps each URI with properties to a dict
+        {(namespace, name): value}, the value being an XML fragment.
+        PROPFIND asks for all members of a collection at once.
+        """
+        return {}
+
+    def proppatch(self, uri, changes):
+        """ change the dead properties of uri
+
+        changes is a list of (namespace, name, value) tuples in the
+        order of the request, value is None to remove a property.
+        Either all changes are made or a DAV_Error is raised.
+        """
+        raise DAV_Forbidden
+
     ###
     ### DATA methods (for GET and PUT)
     ###
@@ -88,6 +121,11 @@ class dav_interface:
 
         return data or raise an exception
 
+        range is None or the (first, last) numbers of the bytes to
+        return. The server resolves them from the Range header and the
+        getcontentlength property and only asks for ranges of objects
+        which are no collections.
+
         """
         raise DAV_NotFound
 
@@ -123,6 +161,24 @@ class dav_interface:
 
         return ''
 
+    ###
+    ### Collection synchronization (RFC 6578), not part of allprop
+    ###
+
+    def _get_dav_sync_token(self, uri):
+        if self.journal is None or not self.is_collection(uri):
+            raise DAV_NotFound
+        return self.journal.token()
+
+    def _get_dav_supported_report_set(self, uri):
+        if self.journal is None or not self.is_collection(uri):
+            raise DAV_NotFound
+        txt = ('<main xmlns:D="http://dummy/D"><D:supported-report>'
+               '<D:report><D:sync-collection/></D:report>'
+               '</D:supported-report></main>')
+        xml = minidom.parseString(txt)
+        return xml.firstChild.firstChild
+
     ###
     ### Methods for DAV properties
     ###
@@ -131,13 +187,13 @@ class dav_interface:
         """ return the creationdate of a resource """
         d=self.get_creationdate(uri)
         # format it
-        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(d))
+        return iso8601_date(d)
 
     def _get_dav_getlastmodified(self,uri):
         """ return the last modified date of a resource """
         d=self.get_lastmodified(uri)
         # format it
-        return time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(d))
+        return rfc1123_date(d)
 
 
     ###
@@ -278,3 +334,44 @@ class dav_interface:
         """ return 1 or None depending on if a resource is a collection """
         return None # no
 
+    def compile_filter(self,filter):
+        """ return a predicate for the filter of a REPORT request
+
+        filter is the root element of the request. The predicate is
+        called with the URI of each resource the REPORT walks over
+        and returns True if the resource is part of the response.
+        None means that all resources are.
+
+        This implementation asks get_childs(parent, filter) once per
+        collection for the matching members. Interfaces which can
+        evaluate the filter for a single resource (or in an index)
+        should override it.
+        """
+        listed = {}
+
+        def match(uri):
+            parent = get_parenturi(uri)
+            members = listed.get(parent)
+            if members is None:
+                members = set(self.get_childs(parent, filter))
+                listed[parent] = members
+            return uri in members
+
+        return match
+
+    def check_quota(self,uri,length):
+        """ raise DAV_Error(507) if length bytes can not be stored at uri
+
+        Called before the body of a PUT is read.
+        """
+        pass
+
+    def get_collection_version(self,uri):
+        """ return a value which changes whenever the resource or its
+        list of members changes
+
+        It is used to validate cached PROPFIND and REPORT responses.
+        None means the resource must not be cached.
+        """
+        return None
+
@@ -0,0 +1,220 @@
+"""
+    Journal of changed resources for the sync-collection REPORT
+
+    Every modification handled by the server (and, with a Watcher, every
+    change made behind its back) appends the resource path to a SQLite
+    table, noting whether it was created or deleted. The number of the
+    latest entry is the state of the server, it is handed to clients as
+    sync token (RFC 6578). A client sending back a token gets the
+    resources changed since.
+
+    Compaction removes entries superseded by a later change of the same
+    path, which only forgets that a resource deleted since a token had
+    been created after it (it is then reported as removed although the
+    client never saw it), and entries older than
+    max_age seconds (or above max_entries), which invalidates the tokens
+    from before them. Clients then have to start over with an initial
+    synchronization.
+
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    deleted INTEGER NOT NULL,
+    time REAL NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS changes_parent ON changes (parent, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+TOKEN_PREFIX = 'urn:x-pywebdav-sync:'
+
+
+def _parent(path):
+    if path == '/':
+        return ''
+    return path.rsplit('/', 1)[0] or '/'
+
+
+class ChangeJournal:
+    """ append-only SQLite table of changed resource paths """
+
+    def __init__(self, database, max_age=30 * 24 * 3600, max_entries=1000000):
+        self.database = database
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db = self._db()
+        with self._write_lock, db:
+            columns = [c[1] for c in db.execute('PRAGMA table_info(changes)')]
+            if columns and 'created' not in columns:
+                # journal of an older version
+                db.execute('ALTER TABLE changes ADD COLUMN created INTEGER '
+                           'NOT NULL DEFAULT 0')
+            db.executescript(SCHEMA)
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('id', ?)",
+                       (uuid.uuid4().hex,))
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('first', '0')")
+        # tokens of another journal (e.g. a deleted database) are invalid
+        self.id = self._meta('id')
+
+    def _db(self):
+        """ return the connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _meta(self, name):
+        return self._db().execute('SELECT value FROM meta WHERE name = ?',
+                                  (name,)).fetchone()[0]
+
+    ### tokens
+
+    def current(self):
+        """ return the number of the latest change """
+        (seq,) = self._db().execute('SELECT MAX(seq) FROM changes').fetchone()
+        return max(seq or 0, int(self._meta('first')))
+
+    def token(self, seq=None):
+        """ return the sync token for seq (default: the current state) """
+        if seq is None:
+            seq = self.current()
+        return '%s%s:%d' % (TOKEN_PREFIX, self.id, seq)
+
+    def parse_token(self, token):
+        """ return the change number of a token or None if not valid """
+        if not token.startswith(TOKEN_PREFIX):
+            return None
+        jid, sep, seq = token[len(TOKEN_PREFIX):].rpartition(':')
+        if jid != self.id or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq < int(self._meta('first')) or seq > self.current():
+            return None
+        return seq
+
+    ### changes
+
+    def record(self, paths, deleted=False, created=False):
+        """ append changes of resource paths
+
+        created tells that the resources did not exist before.
+        """
+        now = time.time()
+        rows = [(path, _parent(path), deleted and 1 or 0, now,
+                 created and 1 or 0) for path in paths]
+        if not rows:
+            return
+        db = self._db()
+        with self._write_lock, db:
+            db.executemany('INSERT INTO changes (path, parent, deleted, time, '
+                           'created) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def changes(self, path, since, infinite=False, limit=0):
+        """ return the members of path changed after since
+
+        The result is a list of (path, deleted, seq, created) tuples
+        for the latest change of each member, ordered by seq. created
+        tells that the member did not exist at since, as far as the
+        (possibly compacted) journal knows. infinite includes all
+        descendants. With a limit, at most limit + 1 rows are returned
+        so callers can tell that the result was truncated.
+        """
+        if infinite:
+            prefix = path.rstrip('/') + '/'
+            where = 'substr(path, 1, ?) = ? AND path != ?'
+            args = [len(prefix), prefix, path]
+        else:
+            where = 'parent = ?'
+            args = [path]
+        # a member did not exist at since if it was created before it
+        # was deleted (changes reported by a Watcher do not tell)
+        query = ('SELECT path, MAX(seq) AS last, '
+                 'MAX(CASE WHEN deleted THEN seq END), '
+                 'MIN(CASE WHEN created THEN seq END), '
+                 'MIN(CASE WHEN deleted THEN seq END) FROM changes '
+                 'WHERE seq > ? AND %s GROUP BY path ORDER BY last' % where)
+        args.insert(0, since)
+        if limit:
+            query += ' LIMIT ?'
+            args.append(limit + 1)
+        return [(p, s == d, s, c is not None and (r is None or c < r))
+                for p, s, d, c, r in self._db().execute(query, args)]
+
+    ### maintenance
+
+    def reset(self):
+        """ invalidate all tokens, e.g. after changes were lost """
+        db = self._db()
+        with self._write_lock, db:
+            # a new state without any resource, earlier tokens are invalid
+            first = db.execute("INSERT INTO changes (path, parent, deleted, "
+                               "time) VALUES ('', '', 0, ?)",
+                               (time.time(),)).lastrowid
+            db.execute("UPDATE meta SET value = ? WHERE name = 'first'",
+                       (str(first),))
+            db.execute('DELETE FROM changes WHERE seq < ?', (first,))
+        log.info('Sync tokens before %d invalidated' % first)
+
+    def compact(self):
+        """ drop superseded and expired changes """
+        db = self._db()
+        with self._write_lock, db:
+            # only the latest change of a path is ever reported
+            db.execute('DELETE FROM changes WHERE seq NOT IN '
+                       '(SELECT MAX(seq) FROM changes GROUP BY path)')
+
+            (expired,) = db.execute(
+                'SELECT MAX(seq) FROM changes WHERE time < ?',
+                (time.time() - self.max_age,)).fetchone()
+            if self.max_entries:
+                row = db.execute('SELECT seq FROM changes ORDER BY seq DESC '
+                                 'LIMIT 1 OFFSET ?',
+                                 (self.max_entries,)).fetchone()
+                if row is not None:
+                    expired = max(expired or 0, row[0])
+
+            if expired:
+                db.execute('DELETE FROM changes WHERE seq <= ?', (expired,))
+                db.execute("UPDATE meta SET value = ? WHERE name = 'first' "
+                           "AND CAST(value AS INTEGER) < ?",
+                           (str(expired), expired))
+        log.debug('Change journal compacted, tokens before %s expired',
+                  self._meta('first'))
+
+    def run_compaction(self, interval):
+        """ compact the journal every interval seconds """
+        def run():
+            while interval > 0:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except Exception:
+                    log.exception('Compaction of the change journal failed')
+
+        thread = threading.Thread(target=run, name='journal-compaction')
+        thread.daemon = True
+        thread.start()
+        return thread
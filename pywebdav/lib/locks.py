@@ -1,14 +1,12 @@
 import time
-import urllib.parse
 import uuid
 
 import logging
 
 log = logging.getLogger(__name__)
 
-import xml.dom
-from xml.dom import minidom
-
+from .davxml import lockinfo_request
+from .errors import DAV_Error
 from .utils import rfc1123_date, IfParser, tokenFinder
 
 tokens_to_lock = {}
@@ -48,16 +46,7 @@ class LockManager:
         uris[lock.uri] = lock
 
     def _lock_unlock_parse(self, body):
-        doc = minidom.parseString(body)
-
-        data = {}
-        info = doc.getElementsByTagNameNS('DAV:', 'lockinfo')[0]
-        data['lockscope'] = info.getElementsByTagNameNS('DAV:', 'lockscope')[0]\
-                                .firstChild.localName
-        data['locktype'] = info.getElementsByTagNameNS('DAV:', 'locktype')[0]\
-                                .firstChild.localName
-        data['lockowner'] = info.getElementsByTagNameNS('DAV:', 'owner')
-        return data
+        return lockinfo_request(self.XML_PARSER.parse(body))
 
     def _lock_unlock_create(self, uri, creator, depth, data):
         lock = LockItem(uri, creator, **data)
@@ -70,6 +59,7 @@ class LockManager:
 
         if not self._l_isLocked(uri):
             self._l_setLock(lock)
+            self._invalidate_responses(uri)
 
         # because we do not handle children we leave result empty
         return lock.token, result
@@ -79,11 +69,10 @@ class LockManager:
 
         dc = self.IFACE_CLASS
 
-        if self._config.DAV.getboolean('verbose') is True:
+        if self.settings.verbose:
             log.info('UNLOCKing resource %s' % self.headers)
 
-        uri = urllib.parse.urljoin(self.get_baseuri(dc), self.path)
-        uri = urllib.parse.unquote(uri)
+        uri = self.get_request_uri(dc)
 
         # check lock token - must contain a dash
         if not self.headers.get('Lock-Token', '').find('-')>0:
@@ -92,6 +81,7 @@ class LockManager:
         token = tokenFinder(self.headers.get('Lock-Token'))
         if self._l_isLocked(uri):
             self._l_delLock(token)
+            self._invalidate_responses(uri)
 
         self.send_body(None, 204, 'OK', 'OK')
 
@@ -102,15 +92,14 @@ class LockManager:
 
         log.info('LOCKing resource %s' % self.headers)
 
-        body = None
-        if 'Content-Length' in self.headers:
-            l = self.headers['Content-Length']
-            body = self.rfile.read(int(l))
+        try:
+            body = self.read_xml_body()
+        except DAV_Error as error:
+            return self.send_status(error.args[0])
 
         depth = self.headers.get('Depth', 'infinity')
 
-        uri = urllib.parse.urljoin(self.get_baseuri(dc), self.path)
-        uri = urllib.parse.unquote(uri)
+        uri = self.get_request_uri(dc)
         log.info('do_LOCK: uri = %s' % uri)
 
         ifheader = self.headers.get('If')
@@ -124,7 +113,10 @@ class LockManager:
 
         elif body and not ifheader:
             # LOCK with XML information
-            data = self._lock_unlock_parse(body)
+            try:
+                data = self._lock_unlock_parse(body)
+            except DAV_Error as error:
+                return self.send_status(error.args[0])
             token, result = self._lock_unlock_create(uri, 'unknown', depth, data)
 
             if result:
@@ -207,8 +199,6 @@ class LockItem:
         owner_str = ''
         if isinstance(self.owner, str):
             owner_str = self.owner
-        elif isinstance(self.owner, xml.dom.minicompat.NodeList) and len(self.owner):
-            owner_str = "".join([node.toxml() for node in self.owner[0].childNodes])
 
         token = self.token
         base = ('<%(ns)s:activelock>\n'
@@ -0,0 +1,167 @@
+"""
+    Content type resolution
+
+    The content type of a resource is first looked up by its file name
+    suffix in a table compiled once from the mimetypes module (plus an
+    optional mime.types file). Only if that fails the first bytes of
+    the file are inspected. Results of this sniffing are cached by
+    device, inode and modification time.
+
+"""
+
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TYPE = 'application/octet-stream'
+
+# number of bytes read when sniffing
+SNIFF_SIZE = 512
+
+# compressed files are served as they are and have no inner type
+ENCODINGS = {
+    '.gz': 'application/gzip',
+    '.tgz': 'application/gzip',
+    '.z': 'application/x-compress',
+    '.bz2': 'application/x-bzip2',
+    '.xz': 'application/x-xz',
+    '.br': 'application/x-brotli',
+    '.zst': 'application/zstd',
+}
+
+# (offset, magic, type) checked in order
+SIGNATURES = (
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'%!PS', 'application/postscript'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (0, b'OggS', 'application/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (4, b'ftyp', 'video/mp4'),
+    (8, b'WEBP', 'image/webp'),
+    (8, b'WAVE', 'audio/wav'),
+    (8, b'AVI ', 'video/x-msvideo'),
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'MZ', 'application/x-msdownload'),
+    (0, b'SQLite format 3\x00', 'application/vnd.sqlite3'),
+    (257, b'ustar', 'application/x-tar'),
+)
+
+
+def _sniff_text(data):
+    """ return a text type for data that looks like text """
+    if b'\x00' in data:
+        return None
+    try:
+        # the sample may end in the middle of a multibyte character
+        data.decode('utf-8')
+    except UnicodeDecodeError as ex:
+        if ex.start < len(data) - 3:
+            return None
+
+    head = data.lstrip()[:64].lower()
+    if head.startswith((b'<!doctype html', b'<html')):
+        return 'text/html'
+    if head.startswith(b'<?xml'):
+        return 'application/xml'
+    return 'text/plain'
+
+
+class MimeTypeResolver:
+    """ resolve content types by name, then by content """
+
+    def __init__(self, mime_types=None, sniff=True, cache_size=4096):
+        if not mimetypes.inited:
+            mimetypes.init()
+
+        self.types = {}
+        self.types.update(mimetypes.types_map)
+        self.types.update(ENCODINGS)
+        if mime_types:
+            self.types.update(mimetypes.read_mime_types(mime_types) or {})
+
+        self.sniff = sniff
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # how often (and how long) we had to look into files
+        self.sniff_count = 0
+        self.sniff_time = 0.0
+        self.sniff_hits = 0
+
+    def add_type(self, suffix, type):
+        """ map a file name suffix (like .md) to a content type """
+        self.types[suffix.lower()] = type
+
+    def by_name(self, name):
+        """ return the content type for a file name or None """
+        dot = name.rfind('.')
+        if dot < 0 or name.find('/', dot) >= 0 or name.find(os.sep, dot) >= 0:
+            return None
+        suffix = name[dot:]
+        return self.types.get(suffix) or self.types.get(suffix.lower())
+
+    def resolve(self, path, st=None):
+        """ return the content type of a file
+
+        st is the stat result of path, it is used to validate
+        cached sniffing results.
+        """
+        type = self.by_name(path)
+        if type is not None:
+            return type
+
+        if not self.sniff or st is None:
+            return DEFAULT_TYPE
+
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            type = self._cache.get(key)
+            if type is not None:
+                self._cache.move_to_end(key)
+                self.sniff_hits += 1
+                return type
+
+        type = self._sniff(path) or DEFAULT_TYPE
+
+        with self._lock:
+            self._cache[key] = type
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return type
+
+    def _sniff(self, path):
+        """ guess the content type from the first bytes of a file """
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read(SNIFF_SIZE)
+        except OSError as ex:
+            log.info('Could not sniff %s: %s' % (path, ex))
+            return None
+        finally:
+            self.sniff_count += 1
+            self.sniff_time += time.perf_counter() - start
+
+        if not data:
+            return None
+
+        for offset, magic, type in SIGNATURES:
+            if data.startswith(magic, offset):
+                return type
+
+        return _sniff_text(data)
@@ -0,0 +1,231 @@
+"""
+    Serialization of multistatus responses
+
+    A PROPFIND asks for the same properties of every resource, so the
+    markup around the values is the same for all responses of a
+    request. A ResponseTemplate turns the namespaces and properties of
+    a request once into encoded fragments (prefixes, tags, status lines)
+    and each response is joined from these fragments and the escaped
+    values. The output is the same minidom wrote before.
+
+"""
+
+import urllib.parse
+from xml.dom import minidom
+
+from . import utils
+
+XML_DECL = b'<?xml version="1.0" encoding="utf-8"?>'
+MULTISTATUS_START = XML_DECL + b'<D:multistatus xmlns:D="DAV:">'
+MULTISTATUS_END = b'</D:multistatus>\n'
+EMPTY_MULTISTATUS = MULTISTATUS_START[:-1] + b'/>\n'
+
+STATUS_OK = b'<D:status>HTTP/1.1 200 OK</D:status>'
+COLLECTION = b'<D:collection/>'
+
+# characters minidom replaces in text
+_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '"': '&quot;',
+                          '>': '&gt;'})
+
+
+def escape(text):
+    """ escape text like minidom does """
+    return text.translate(_ESCAPES)
+
+
+def multistatus(responses, tail=b''):
+    """ return the body for a list of encoded responses """
+    if not responses and not tail:
+        return EMPTY_MULTISTATUS
+    return b''.join([MULTISTATUS_START] + responses +
+                    [tail, MULTISTATUS_END])
+
+
+def mk_status(line):
+    """ return the encoded <status> element of a status line """
+    return ('<D:status>%s</D:status>' % escape(line)).encode('utf-8')
+
+
+def mk_element(name, text):
+    """ return an encoded DAV: element containing text """
+    return ('<D:%s>%s</D:%s>' % (name, escape(text), name)).encode('utf-8')
+
+
+class ResponseTemplate:
+    """ encoded fragments of the responses to one request
+
+    namespaces is the list of namespaces of the request. Namespace
+    i is declared as nsi on each response (DAV: uses the D prefix of
+    the multistatus element) and the empty namespace as default
+    namespace of the property elements. The list may grow while
+    responses are made (dead properties of allprop requests).
+    """
+
+    def __init__(self, namespaces, baseurl=None):
+        self.namespaces = namespaces
+        self.baseurl = baseurl
+        # namespace -> prefix of its elements
+        self._prefixes = {'DAV:': 'D:'}
+        # (namespace, name) -> (start tag, end tag, empty element)
+        self._tags = {}
+        # (number of namespaces, start tag of <response>)
+        self._start = (None, None)
+        # scheme://host -> encoded start of hrefs
+        self._hosts = {}
+        # status code -> encoded <status>
+        self._status = {}
+
+    def prefix(self, ns):
+        """ return the prefix of the elements of a namespace """
+        prefix = self._prefixes.get(ns)
+        if prefix is None:
+            if not ns:
+                return ''
+            prefix = 'ns%d:' % self.namespaces.index(ns)
+            self._prefixes[ns] = prefix
+        return prefix
+
+    def tags(self, ns, name):
+        """ return the start and end tag and the empty element of a
+        property """
+        key = (ns, name)
+        tags = self._tags.get(key)
+        if tags is None:
+            name = self.prefix(ns) + str(name)
+            attrs = not ns and ' xmlns=""' or ''
+            tags = (('<%s%s>' % (name, attrs)).encode('utf-8'),
+                    ('</%s>' % name).encode('utf-8'),
+                    ('<%s%s/>' % (name, attrs)).encode('utf-8'))
+            self._tags[key] = tags
+        return tags
+
+    def response_start(self):
+        """ return the <response> start tag declaring the namespaces """
+        count, start = self._start
+        if count != len(self.namespaces):
+            count = len(self.namespaces)
+            attrs = ''.join(' xmlns:ns%d="%s"' % (i, escape(ns))
+                            for i, ns in enumerate(self.namespaces)
+                            if ns and ns != 'DAV:')
+            start = ('<D:response%s>' % attrs).encode('utf-8')
+            self._start = (count, start)
+        return start
+
+    def status(self, code):
+        """ return the <status> element of a status code """
+        status = self._status.get(code)
+        if status is None:
+            status = mk_status(utils.gen_estring(code))
+            self._status[code] = status
+        return status
+
+    def href(self, uri):
+        """ return the <href> element of a resource
+
+        Only the path of the URI is quoted, it is split off without
+        urlparse() unless it contains a query, parameters or fragment.
+        """
+        if self.baseurl:
+            uri = self.baseurl + '/' + '/'.join(uri.split('/')[3:])
+
+        host, sep, path = uri.partition('://')
+        if sep and not ('?' in path or ';' in path or '#' in path):
+            slash = path.find('/')
+            if slash < 0:
+                slash = len(path)
+            host = host + sep + path[:slash]
+            path = path[slash:]
+        else:
+            parts = urllib.parse.urlparse(uri)
+            host = parts[0] + '://' + parts[1]
+            path = parts[2]
+
+        start = self._hosts.get(host)
+        if start is None:
+            start = ('<D:href>' + escape(host)).encode('utf-8')
+            self._hosts[host] = start
+        return b''.join((start, urllib.parse.quote(path).encode('ascii'),
+                         b'</D:href>'))
+
+    def value(self, ns, name, value):
+        """ return a property element with its value """
+        start, end, empty = self.tags(ns, name)
+        if isinstance(value, minidom.Node):
+            return b''.join((start, value.toxml().encode('utf-8'), end))
+        if isinstance(value, list):
+            if not value:
+                return empty
+            return b''.join([start] +
+                            [node.toxml().encode('utf-8') for node in value] +
+                            [end])
+        if name == 'resourcetype':
+            if value == 1:
+                return b''.join((start, COLLECTION, end))
+            return empty
+        return b''.join((start, escape(str(value)).encode('utf-8'), end))
+
+    def prop_response(self, uri, good_props, bad_props):
+        """ return a response with property values
+
+        good_props is {ns: {name: value}}, bad_props is
+        {status code: {ns: [name]}}. The values of good properties
+        are text, minidom nodes or lists of nodes.
+        """
+        out = [self.response_start(), self.href(uri), b'<D:propstat>']
+        values = [self.value(ns, name, value)
+                  for ns, props in good_props.items()
+                  for name, value in props.items()]
+        if values:
+            out.append(b'<D:prop>')
+            out.extend(values)
+            out.append(b'</D:prop>')
+        else:
+            out.append(b'<D:prop/>')
+        out.append(STATUS_OK)
+        out.append(b'</D:propstat>')
+
+        for code, props in bad_props.items():
+            out.append(b'<D:propstat><D:prop>')
+            for ns, names in props.items():
+                for name in names:
+                    out.append(self.tags(ns, name)[2])
+            out.append(b'</D:prop>')
+            out.append(self.status(code))
+            out.append(b'</D:propstat>')
+        out.append(b'</D:response>')
+        return b''.join(out)
+
+    def propname_response(self, uri, propnames):
+        """ return a response listing property names
+
+        propnames is {ns: [name]}, the namespaces are declared on
+        the <prop> elements in the order of propnames.
+        """
+        out = [b'<D:response>', self.href(uri)]
+        if not propnames:
+            out.append(b'<D:propstat/></D:response>')
+            return b''.join(out)
+
+        out.append(b'<D:propstat>')
+        for i, (ns, names) in enumerate(propnames.items()):
+            if ns:
+                out.append(('<D:prop xmlns:ns%d="%s"' % (i, escape(ns)))
+                           .encode('utf-8'))
+                element = '<ns%d:%%s/>' % i
+            else:
+                out.append(b'<D:prop')
+                element = '<%s xmlns=""/>'
+            if not names:
+                out.append(b'/>')
+                continue
+            out.append(b'>')
+            out.append(''.join(element % name for name in names)
+                       .encode('utf-8'))
+            out.append(b'</D:prop>')
+        out.append(b'</D:propstat></D:response>')
+        return b''.join(out)
+
+    def status_response(self, uri, code):
+        """ return a response with a status instead of properties """
+        return b''.join((b'<D:response>', self.href(uri), self.status(code),
+                         b'</D:response>'))
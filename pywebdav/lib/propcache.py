@@ -0,0 +1,160 @@
+"""
+    Cache of serialized multistatus responses
+
+    Synchronization clients repeat the same PROPFIND (and REPORT)
+    requests every few seconds. Their responses are kept here as
+    serialized (and optionally gzipped) bodies until either the version
+    of the requested resource changes or a modifying request passes
+    through the server.
+
+    The version of a resource is provided by the dav_interface method
+    get_collection_version(). Interfaces returning None there are never
+    cached. Depth infinity responses are not cached either, as the
+    version of the root does not reflect changes further down.
+
+    Changes of children made behind the back of the server only show
+    up once they change the version of the collection, unless they are
+    reported to invalidate() (see server/watcher.py) or a ttl is set.
+
+"""
+
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# bodies smaller than this are not worth compressing
+GZIP_THRESHOLD = 1400
+
+
+def request_key(request_type, proplist):
+    """ return a hashable, order independent form of a PROPFIND request """
+    return (request_type,
+            tuple(sorted((ns, tuple(sorted(props)))
+                         for ns, props in proplist.items())))
+
+
+def body_key(body):
+    """ return a key for requests which are only compared as a whole """
+    return hashlib.sha1(body or b'').digest()
+
+
+def _ancestors(path):
+    """ return path and all of its parents """
+    yield path
+    while path != '/':
+        path = path.rsplit('/', 1)[0] or '/'
+        yield path
+
+
+class ResponseCache:
+    """ byte bounded LRU cache of multistatus bodies """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, compress=True, ttl=None):
+        self.max_bytes = int(max_bytes)
+        self.compress = compress
+        # maximum age of entries in seconds, None for no limit
+        self.ttl = ttl
+        self.size = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        # resource path -> keys of the cached responses of that resource
+        self._paths = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, path, host, depth, method, request, version):
+        """ return the cache key of a request or None if not cacheable
+
+        path    -- the resource path of the request
+        host    -- the Host header, it is part of the hrefs
+        request -- a request_key() or body_key()
+        version -- the version of the resource
+        """
+        if version is None:
+            return None
+        return (path, host, depth, method, request, version)
+
+    def get(self, key):
+        """ return (body, gzipped body or None) for key or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and \
+                    entry[2] + self.ttl < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[:2]
+
+    def put(self, key, body, generation):
+        """ store the body of a response for key
+
+        generation is the value of self.generation from before the
+        response was created. If something has been invalidated
+        since, the body may be outdated and is not stored.
+
+        returns (body, gzipped body or None) like get()
+        """
+        gz = None
+        if self.compress and len(body) > GZIP_THRESHOLD:
+            gz = gzip.compress(body)
+        cost = len(body) + (gz and len(gz) or 0)
+        if cost > self.max_bytes:
+            return body, gz
+
+        with self._lock:
+            if generation != self.generation:
+                return body, gz
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, gz, time.monotonic())
+            self._paths.setdefault(key[0], set()).add(key)
+            self.size += cost
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return body, gz
+
+    def _remove(self, key):
+        body, gz, created = self._entries.pop(key)
+        self.size -= len(body) + (gz and len(gz) or 0)
+        keys = self._paths[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._paths[key[0]]
+
+    def invalidate(self, path):
+        """ forget the responses affected by a change of path
+
+        These are the responses for the resource itself, for its
+        parent collections and, if path is a collection, for its
+        members. None stands for all paths.
+        """
+        if path is None:
+            return self.clear()
+
+        with self._lock:
+            self.generation += 1
+
+            paths = [p for p in _ancestors(path) if p in self._paths]
+            prefix = path.rstrip('/') + '/'
+            paths.extend(p for p in self._paths if p.startswith(prefix))
+            for p in paths:
+                for key in list(self._paths.get(p, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._paths.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,15 +1,66 @@
-import xml.dom.minidom
-domimpl = xml.dom.minidom.getDOMImplementation()
-
 import logging
-import urllib.parse
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from . import utils
+from . import davxml, utils
 from .constants import RT_ALLPROP, RT_PROPNAME, RT_PROP
-from .errors import DAV_Error, DAV_NotFound
+from .errors import DAV_Error, DAV_NotFound, DAV_Condition
+from .multistatus import ResponseTemplate, multistatus, \
+    MULTISTATUS_START, MULTISTATUS_END
 
 log = logging.getLogger(__name__)
 
+# Depth infinity responses are generated in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+# check for a disconnected client after this many resources
+CANCEL_CHECK_INTERVAL = 64
+
+# values of resources left out by walk()
+_SKIP = object()
+
+# live properties only returned when they are asked for, computing
+# them for every resource of an allprop request is expensive
+# (RFC 4331 section 3)
+ALLPROP_EXCLUDED = {'DAV:': ('quota-available-bytes', 'quota-used-bytes')}
+
+# thread pools shared by all requests, by number of workers
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(workers):
+    with _executors_lock:
+        pool = _executors.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix='propfind')
+            _executors[workers] = pool
+        return pool
+
+
+def map_ordered(func, items, workers=1):
+    """ yield func(item) for all items in their order
+
+    With more than one worker, up to workers calls run concurrently
+    in a thread pool. Only twice as many results as workers are
+    pending at any time.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = _executor(workers)
+    window = deque()
+    for item in items:
+        window.append(pool.submit(func, item))
+        if len(window) >= 2 * workers:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
+
 
 class PROPFIND:
     """ parse a propfind xml element and extract props
@@ -23,10 +74,20 @@ class PROPFIND:
     The list of properties will contain tuples of the form
     (element name, ns_prefix, ns_uri)
 
+    body is the request body or its root element (see davxml), it is
+    parsed by parser.
+
+    Responses for Depth infinity are generated while walking the tree.
+    The walk is aborted with a propfind-finite-depth condition once it
+    exceeds max_entries resources, max_time seconds or max_bytes of
+    output (0 means no limit), or with a ConnectionAbortedError if the
+    function cancelled returns True.
 
     """
 
-    def __init__(self, uri, dataclass, depth, body):
+    def __init__(self, uri, dataclass, depth, body, max_entries=0,
+                 max_time=0, max_bytes=0, cancelled=None,
+                 parser=davxml.default_parser):
         self.request_type = None
         self.nsmap = {}
         self.proplist = {}
@@ -35,15 +96,27 @@ class PROPFIND:
         self._depth = str(depth)
         self._uri = uri.rstrip('/')
         self._has_body = None   # did we parse a body?
+        self.max_entries = max_entries
+        self.max_time = max_time
+        self.max_bytes = max_bytes
+        self.cancelled = cancelled
+        # dead properties loaded in advance, by URI
+        self._dead = {}
+        self._allprop = False
+        self._template = None
 
         if dataclass.verbose:
             log.info('PROPFIND: Depth is %s, URI is %s' % (depth, uri))
 
-        if body:
-            self.request_type, self.proplist, self.namespaces = \
-                utils.parse_propfind(body)
+        if body is not None and body != b'':
+            self.parse_body(parser.parse(body))
             self._has_body = True
 
+    def parse_body(self, root):
+        """ take the requested properties from the parsed body """
+        self.request_type, self.proplist, self.namespaces = \
+            davxml.propfind_request(root)
+
     def createResponse(self):
         """ Create the multistatus response
 
@@ -84,46 +157,30 @@ class PROPFIND:
         """ create a multistatus response for the prop names """
 
         dc = self._dataclass
-        # create the document generator
-        doc = domimpl.createDocument(None, "multistatus", None)
-        ms = doc.documentElement
-        ms.setAttribute("xmlns:D", "DAV:")
-        ms.tagName = 'D:multistatus'
-
-        if self._depth == "0":
-            pnames = dc.get_propnames(self._uri)
-            re = self.mk_propname_response(self._uri, pnames, doc)
-            ms.appendChild(re)
-
-        elif self._depth == "1":
-            pnames = dc.get_propnames(self._uri)
-            re = self.mk_propname_response(self._uri, pnames, doc)
-            ms.appendChild(re)
-
-            for newuri in dc.get_childs(self._uri):
-                pnames = dc.get_propnames(newuri)
-                re = self.mk_propname_response(newuri, pnames, doc)
-                ms.appendChild(re)
-        elif self._depth == 'infinity':
-            uri_list = [self._uri]
-            while uri_list:
-                uri = uri_list.pop()
-                pnames = dc.get_propnames(uri)
-                re = self.mk_propname_response(uri, pnames, doc)
-                ms.appendChild(re)
-                uri_childs = self._dataclass.get_childs(uri)
-                if uri_childs:
-                    uri_list.extend(uri_childs)
+        if self._depth == 'infinity':
+            return self.walk(self.get_propnames, self.mk_propname_response)
+
+        pnames = self.get_propnames(self._uri)
+        responses = [self.mk_propname_response(self._uri, pnames)]
+        if self._depth == "1":
+            uris = dc.get_childs(self._uri)
+            self.load_dead_props(uris)
+            for newuri in uris:
+                pnames = self.get_propnames(newuri)
+                responses.append(self.mk_propname_response(newuri, pnames))
 
-        return doc.toxml(encoding="utf-8") + b"\n"
+        return multistatus(responses)
 
     def create_allprop(self):
         """ return a list of all properties """
         self.proplist = {}
         self.namespaces = []
         for ns, plist in self._dataclass.get_propnames(self._uri).items():
-            self.proplist[ns] = plist
+            excluded = ALLPROP_EXCLUDED.get(ns, ())
+            self.proplist[ns] = [p for p in plist if p not in excluded]
             self.namespaces.append(ns)
+        self._allprop = True
+        self._template = None
 
         return self.create_prop()
 
@@ -148,177 +205,140 @@ class PROPFIND:
         (Not Found) or 403 (Forbidden).
 
         """
-        # create the document generator
-        doc = domimpl.createDocument(None, "multistatus", None)
-        ms = doc.documentElement
-        ms.setAttribute("xmlns:D", "DAV:")
-        ms.tagName = 'D:multistatus'
-
-        if self._depth == "0":
-            gp, bp = self.get_propvalues(self._uri)
-            res = self.mk_prop_response(self._uri, gp, bp, doc)
-            ms.appendChild(res)
-
-        elif self._depth == "1":
-            gp, bp = self.get_propvalues(self._uri)
-            res = self.mk_prop_response(self._uri, gp, bp, doc)
-            ms.appendChild(res)
-
-            for newuri in self._dataclass.get_childs(self._uri):
-                gp, bp = self.get_propvalues(newuri)
-                res = self.mk_prop_response(newuri, gp, bp, doc)
-                ms.appendChild(res)
-        elif self._depth == 'infinity':
-            uri_list = [self._uri]
-            while uri_list:
-                uri = uri_list.pop()
-                gp, bp = self.get_propvalues(uri)
-                res = self.mk_prop_response(uri, gp, bp, doc)
-                ms.appendChild(res)
-                uri_childs = self._dataclass.get_childs(uri)
+        if self._depth == 'infinity':
+            return self.walk(self.get_propvalues, self.mk_values_response)
+
+        if self._depth == "1":
+            uris = [self._uri] + list(self._dataclass.get_childs(self._uri))
+            self.load_dead_props(uris)
+        else:
+            uris = [self._uri]
+        values = map_ordered(self.get_propvalues, uris,
+                             self._dataclass.propfind_workers)
+        return multistatus([self.mk_prop_response(uri, gp, bp)
+                            for uri, (gp, bp) in zip(uris, values)])
+
+    def walk(self, fetch, make_response, match=None, tail=b''):
+        """ generate the multistatus body for Depth infinity
+
+        fetch(uri) returns the values of a resource and is run by
+        propfind_workers threads of the interface class for a few
+        resources at a time, make_response(uri, values) returns the
+        encoded response. Only the URIs still to visit are kept
+        in memory, the body is yielded in chunks of about CHUNK_SIZE
+        bytes.
+
+        If match is given, only resources for which match(uri) is
+        true are part of the response (all of them are walked).
+        tail is appended to the responses.
+        """
+        dc = self._dataclass
+        workers = dc.propfind_workers
+        if match is not None:
+            fetch_all = fetch
+
+            def fetch(uri):
+                if match(uri):
+                    return fetch_all(uri)
+                return _SKIP
+        batch_size = workers > 1 and 4 * workers or 1
+        start = time.monotonic()
+
+        chunk = [MULTISTATUS_START]
+        chunk_size = total = count = 0
+        uri_list = [self._uri]
+        while uri_list:
+            batch = uri_list[-batch_size:]
+            del uri_list[-batch_size:]
+            batch.reverse()
+            self.load_dead_props(batch)
+            for uri, values in zip(batch, map_ordered(fetch, batch, workers)):
+                count += 1
+                if (self.max_entries and count > self.max_entries or
+                        self.max_time and
+                        time.monotonic() - start > self.max_time):
+                    raise DAV_Condition(403, 'propfind-finite-depth')
+                if (self.cancelled is not None and
+                        count % CANCEL_CHECK_INTERVAL == 0 and
+                        self.cancelled()):
+                    raise ConnectionAbortedError('client disconnected')
+
+                if values is not _SKIP:
+                    data = make_response(uri, values)
+
+                    total += len(data)
+                    if self.max_bytes and total > self.max_bytes:
+                        raise DAV_Condition(403, 'propfind-finite-depth')
+
+                    chunk.append(data)
+                    chunk_size += len(data)
+                    if chunk_size >= CHUNK_SIZE:
+                        yield b''.join(chunk)
+                        chunk = []
+                        chunk_size = 0
+
+                uri_childs = dc.get_childs(uri)
                 if uri_childs:
                     uri_list.extend(uri_childs)
 
-        return doc.toxml(encoding="utf-8") + b"\n"
+        chunk.append(tail + MULTISTATUS_END)
+        yield b''.join(chunk)
 
-    def mk_propname_response(self, uri, propnames, doc):
-        """ make a new <prop> result element for a PROPNAME request
+    @property
+    def template(self):
+        """ the ResponseTemplate of the requested properties """
+        if self._template is None:
+            self._template = ResponseTemplate(self.namespaces,
+                                              self._dataclass.baseurl)
+        return self._template
 
-        This will simply format the propnames list.
-        propnames should have the format {NS1 : [prop1, prop2, ...], NS2: ...}
-
-        """
-        re = doc.createElement("D:response")
-
-        if self._dataclass.baseurl:
-            uri = self._dataclass.baseurl + '/' + '/'.join(uri.split('/')[3:])
+    def mk_href(self, uri):
+        """ make the <href> element of a response """
+        return self.template.href(uri)
 
-        # write href information
-        uparts = urllib.parse.urlparse(uri)
-        fileloc = uparts[2]
-        href = doc.createElement("D:href")
+    def mk_values_response(self, uri, values):
+        """ make a <response> from get_propvalues() """
+        return self.template.prop_response(uri, values[0], values[1])
 
-        huri = doc.createTextNode(uparts[0] + '://' +
-                                  '/'.join(uparts[1:2]) +
-                                  urllib.parse.quote(fileloc))
-        href.appendChild(huri)
-        re.appendChild(href)
+    def mk_propname_response(self, uri, propnames):
+        """ make a <response> for a PROPNAME request
 
-        ps = doc.createElement("D:propstat")
-        nsnum = 0
-
-        for ns, plist in propnames.items():
-            # write prop element
-            pr = doc.createElement("D:prop")
-            nsp = "ns" + str(nsnum)
-            pr.setAttribute("xmlns:" + nsp, ns)
-            nsnum += 1
-
-            # write propertynames
-            for p in plist:
-                pe = doc.createElement(nsp + ":" + p)
-                pr.appendChild(pe)
-
-            ps.appendChild(pr)
-        re.appendChild(ps)
+        This will simply format the propnames list.
+        propnames should have the format {NS1 : [prop1, prop2, ...], NS2: ...}
 
-        return re
+        """
+        return self.template.propname_response(uri, propnames)
 
-    def mk_prop_response(self, uri, good_props, bad_props, doc):
-        """ make a new <prop> result element
+    def mk_prop_response(self, uri, good_props, bad_props):
+        """ make a <response> with property values
 
         We differ between the good props and the bad ones for
         each generating an extra <propstat>-Node (for each error
         one, that means).
 
         """
-        re = doc.createElement("D:response")
-        # append namespaces to response
-        nsnum = 0
-        for nsname in self.namespaces:
-            if nsname != 'DAV:':
-                re.setAttribute("xmlns:ns" + str(nsnum), nsname)
-            nsnum += 1
-
-        if self._dataclass.baseurl:
-            uri = self._dataclass.baseurl + '/' + '/'.join(uri.split('/')[3:])
-
-        # write href information
-        uparts = urllib.parse.urlparse(uri)
-        fileloc = uparts[2]
-        href = doc.createElement("D:href")
-
-        huri = doc.createTextNode(uparts[0] + '://' +
-                                  '/'.join(uparts[1:2]) +
-                                  urllib.parse.quote(fileloc))
-        href.appendChild(huri)
-        re.appendChild(href)
-
-        # write good properties
-        ps = doc.createElement("D:propstat")
-        if good_props:
-            re.appendChild(ps)
-
-        gp = doc.createElement("D:prop")
-        for ns in good_props.keys():
-            if ns != 'DAV:':
-                ns_prefix = "ns" + str(self.namespaces.index(ns)) + ":"
-            else:
-                ns_prefix = 'D:'
-            for p, v in good_props[ns].items():
-
-                pe = doc.createElement(ns_prefix + str(p))
-                if isinstance(v, xml.dom.minidom.Element):
-                    pe.appendChild(v)
-                elif isinstance(v, list):
-                    for val in v:
-                        pe.appendChild(val)
-                else:
-                    if p == "resourcetype":
-                        if v == 1:
-                            ve = doc.createElement("D:collection")
-                            pe.appendChild(ve)
-                    else:
-                        ve = doc.createTextNode(v)
-                        pe.appendChild(ve)
-
-                gp.appendChild(pe)
-
-        ps.appendChild(gp)
-        s = doc.createElement("D:status")
-        t = doc.createTextNode("HTTP/1.1 200 OK")
-        s.appendChild(t)
-        ps.appendChild(s)
-        re.appendChild(ps)
-
-        # now write the errors!
-        if len(list(bad_props.items())):
-
-            # write a propstat for each error code
-            for ecode in bad_props.keys():
-                ps = doc.createElement("D:propstat")
-                re.appendChild(ps)
-                bp = doc.createElement("D:prop")
-                ps.appendChild(bp)
-
-                for ns in bad_props[ecode].keys():
-                    if ns != 'DAV:':
-                        ns_prefix = "ns" + str(self.namespaces.index(ns)) + ":"
-                    else:
-                        ns_prefix = 'D:'
-
-                    for p in bad_props[ecode][ns]:
-                        pe = doc.createElement(ns_prefix + str(p))
-                        bp.appendChild(pe)
-
-                s = doc.createElement("D:status")
-                t = doc.createTextNode(utils.gen_estring(ecode))
-                s.appendChild(t)
-                ps.appendChild(s)
-                re.appendChild(ps)
-
-        # return the new response element
-        return re
+        return self.template.prop_response(uri, good_props, bad_props)
+
+    def load_dead_props(self, uris):
+        """ read the dead properties of uris with one call """
+        self._dead.update(self._dataclass.get_dead_props(uris))
+
+    def get_dead_props(self, uri):
+        """ return {(ns, name): value} of the dead properties of uri """
+        props = self._dead.pop(uri, None)
+        if props is None:
+            props = self._dataclass.get_dead_props([uri]).get(uri, {})
+        return props
+
+    def get_propnames(self, uri):
+        """ return the live and dead property names of uri """
+        pnames = self._dataclass.get_propnames(uri)
+        dead = self.get_dead_props(uri)
+        if dead:
+            pnames = dict((ns, list(plist)) for ns, plist in pnames.items())
+            for ns, name in dead:
+                pnames.setdefault(ns, []).append(name)
+        return pnames
 
     def get_propvalues(self, uri):
         """ create lists of property values for an URI
@@ -333,6 +353,7 @@ class PROPFIND:
         bad_props = {}
 
         ddc = self._dataclass
+        dead = self.get_dead_props(uri)
         for ns, plist in self.proplist.items():
             good_props[ns] = {}
             for prop in plist:
@@ -340,6 +361,12 @@ class PROPFIND:
                 try:
                     r = ddc.get_prop(uri, ns, prop)
                     good_props[ns][prop] = r
+                except DAV_NotFound:
+                    value = dead.get((ns or '', prop))
+                    if value is None:
+                        ec = 404
+                    else:
+                        good_props[ns][prop] = utils.parse_fragment(value)
                 except DAV_Error as error_code:
                     ec = error_code.args[0]
 
@@ -355,4 +382,13 @@ class PROPFIND:
                 else:
                     bad_props[ec] = {ns: [prop]}
 
+        if self._allprop:
+            for (ns, prop), value in dead.items():
+                if prop in self.proplist.get(ns, ()):
+                    continue
+                if ns and ns not in self.namespaces:
+                    self.namespaces.append(ns)
+                good_props.setdefault(ns, {})[prop] = \
+                    utils.parse_fragment(value)
+
         return good_props, bad_props
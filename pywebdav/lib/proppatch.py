@@ -0,0 +1,101 @@
+import logging
+from xml.dom import minidom
+
+from . import davxml, utils
+from .errors import DAV_Error
+
+domimpl = minidom.getDOMImplementation()
+
+log = logging.getLogger(__name__)
+
+
+class PROPPATCH:
+    """ parse a propertyupdate element and apply it
+
+    The instructions are kept in document order as a list of
+    (namespace, name, value) tuples, value is None for removals and
+    an XML fragment (see davxml.serialize_children) otherwise. Either
+    all of them are applied by the interface class or none.
+
+    Live properties (those in the DAV: namespace and those the
+    interface class has a method for) can not be changed.
+    """
+
+    def __init__(self, uri, dataclass, body, parser=davxml.default_parser):
+        self._dataclass = dataclass
+        self._uri = uri.rstrip('/')
+        self.changes = davxml.propertyupdate_request(parser.parse(body))
+        # set once the changes have been applied
+        self.applied = False
+
+    def is_protected(self, ns, name):
+        """ return True for live properties """
+        dc = self._dataclass
+        if ns == 'DAV:':
+            return True
+        prefix = dc.M_NS.get(ns)
+        return prefix is not None and \
+            hasattr(dc, prefix + '_' + name.replace('-', '_'))
+
+    def createResponse(self):
+        """ apply the changes and return the multistatus body """
+        dc = self._dataclass
+        results = {}
+        for ns, name, value in self.changes:
+            if self.is_protected(ns, name):
+                results[(ns, name)] = 403
+
+        if results:
+            # nothing is changed
+            code = 424
+        else:
+            code = 200
+            try:
+                dc.proppatch(self._uri, self.changes)
+                self.applied = True
+            except DAV_Error as error:
+                code = error.args[0]
+                log.info('PROPPATCH of %s failed: %s' % (self._uri, code))
+
+        for ns, name, value in self.changes:
+            results.setdefault((ns, name), code)
+
+        return self.mk_response(results)
+
+    def mk_response(self, results):
+        """ return a multistatus body for {(ns, name): status code} """
+        doc = domimpl.createDocument(None, "multistatus", None)
+        ms = doc.documentElement
+        ms.setAttribute("xmlns:D", "DAV:")
+        ms.tagName = 'D:multistatus'
+
+        re = doc.createElement("D:response")
+        ms.appendChild(re)
+        href = doc.createElement("D:href")
+        href.appendChild(doc.createTextNode(utils.quote_uri(self._uri)))
+        re.appendChild(href)
+
+        by_code = {}
+        for key, code in results.items():
+            by_code.setdefault(code, []).append(key)
+
+        for code, props in sorted(by_code.items()):
+            ps = doc.createElement("D:propstat")
+            pr = doc.createElement("D:prop")
+            for i, (ns, name) in enumerate(props):
+                if ns == 'DAV:':
+                    pe = doc.createElement("D:" + name)
+                elif ns:
+                    pe = doc.createElement("ns%d:%s" % (i, name))
+                    pe.setAttribute("xmlns:ns%d" % i, ns)
+                else:
+                    pe = doc.createElement(name)
+                    pe.setAttribute("xmlns", "")
+                pr.appendChild(pe)
+            ps.appendChild(pr)
+            st = doc.createElement("D:status")
+            st.appendChild(doc.createTextNode(utils.gen_estring(code)))
+            ps.appendChild(st)
+            re.appendChild(ps)
+
+        return doc.toxml(encoding="utf-8") + b"\n"
@@ -1,60 +1,47 @@
-from .propfind import PROPFIND
-from xml.dom import minidom
-domimpl = minidom.getDOMImplementation()
+from .propfind import PROPFIND, map_ordered
+from .multistatus import multistatus
 
-from .utils import get_parenturi
 
 class REPORT(PROPFIND):
+    """ a PROPFIND whose responses are filtered
 
-    def __init__(self, uri, dataclass, depth, body):
-        PROPFIND.__init__(self, uri, dataclass, depth, body)
+    The filter (the root element of the request) is compiled once by
+    the interface class into a predicate which is evaluated for every
+    resource, see dav_interface.compile_filter(). Each collection is
+    listed only once.
+    """
 
-        doc = minidom.parseString(body)
+    def __init__(self, uri, dataclass, depth, body, **limits):
+        self.filter = None
+        PROPFIND.__init__(self, uri, dataclass, depth, body, **limits)
+        self.match = dataclass.compile_filter(self.filter)
 
-        self.filter = doc.documentElement
+    def parse_body(self, root):
+        PROPFIND.parse_body(self, root)
+        self.filter = root
+
+    def get_members(self):
+        """ return the matching URIs for Depth 0 or 1 """
+        uris = [self._uri]
+        if self._depth == "1":
+            uris.extend(self._dataclass.get_childs(self._uri))
+
+        if self.match is None:
+            return uris
+        return [uri for uri in uris if self.match(uri)]
 
     def create_propname(self):
         """ create a multistatus response for the prop names """
 
-        dc=self._dataclass
-        # create the document generator
-        doc = domimpl.createDocument(None, "multistatus", None)
-        ms = doc.documentElement
-        ms.setAttribute("xmlns:D", "DAV:")
-        ms.tagName = 'D:multistatus'
-
-        if self._depth=="0":
-            if self._uri in self._dataclass.get_childs(get_parenturi(self._uri),
-                    self.filter):
-                pnames=dc.get_propnames(self._uri)
-                re=self.mk_propname_response(self._uri,pnames, doc)
-                ms.appendChild(re)
-
-        elif self._depth=="1":
-            if self._uri in self._dataclass.get_childs(get_parenturi(self._uri),
-                    self.filter):
-                pnames=dc.get_propnames(self._uri)
-                re=self.mk_propname_response(self._uri,pnames, doc)
-                ms.appendChild(re)
-
-            for newuri in dc.get_childs(self._uri, self.filter):
-                pnames=dc.get_propnames(newuri)
-                re=self.mk_propname_response(newuri,pnames, doc)
-                ms.appendChild(re)
-        elif self._depth=='infinity':
-            uri_list = [self._uri]
-            while uri_list:
-                uri = uri_list.pop()
-                if uri in self._dataclass.get_childs(get_parenturi(uri),
-                        self.filter):
-                    pnames=dc.get_propnames(uri)
-                    re=self.mk_propname_response(uri,pnames, doc)
-                    ms.appendChild(re)
-                uri_childs = self._dataclass.get_childs(uri)
-                if uri_childs:
-                    uri_list.extend(uri_childs)
-
-        return doc.toxml(encoding="utf-8") + b"\n"
+        if self._depth=='infinity':
+            return self.walk(self.get_propnames, self.mk_propname_response,
+                             self.match)
+
+        uris = self.get_members()
+        self.load_dead_props(uris)
+        return multistatus([self.mk_propname_response(uri,
+                                                      self.get_propnames(uri))
+                            for uri in uris])
 
     def create_prop(self):
         """ handle a <prop> request
@@ -78,43 +65,13 @@ class REPORT(PROPFIND):
 
         """
 
+        if self._depth=='infinity':
+            return self.walk(self.get_propvalues, self.mk_values_response,
+                             self.match)
 
-        # create the document generator
-        doc = domimpl.createDocument(None, "multistatus", None)
-        ms = doc.documentElement
-        ms.setAttribute("xmlns:D", "DAV:")
-        ms.tagName = 'D:multistatus'
-
-        if self._depth=="0":
-            if self._uri in self._dataclass.get_childs(get_parenturi(self._uri),
-                    self.filter):
-                gp,bp=self.get_propvalues(self._uri)
-                res=self.mk_prop_response(self._uri,gp,bp,doc)
-                ms.appendChild(res)
-
-        elif self._depth=="1":
-            if self._uri in self._dataclass.get_childs(get_parenturi(self._uri),
-                    self.filter):
-                gp,bp=self.get_propvalues(self._uri)
-                res=self.mk_prop_response(self._uri,gp,bp,doc)
-                ms.appendChild(res)
-
-            for newuri in self._dataclass.get_childs(self._uri, self.filter):
-                gp,bp=self.get_propvalues(newuri)
-                res=self.mk_prop_response(newuri,gp,bp,doc)
-                ms.appendChild(res)
-        elif self._depth=='infinity':
-            uri_list = [self._uri]
-            while uri_list:
-                uri = uri_list.pop()
-                if uri in self._dataclass.get_childs(get_parenturi(uri),
-                        self.filter):
-                    gp,bp=self.get_propvalues(uri)
-                    res=self.mk_prop_response(uri,gp,bp,doc)
-                    ms.appendChild(res)
-                uri_childs = self._dataclass.get_childs(uri)
-                if uri_childs:
-                    uri_list.extend(uri_childs)
-
-        return doc.toxml(encoding="utf-8") + b"\n"
-
+        uris = self.get_members()
+        self.load_dead_props(uris)
+        values = map_ordered(self.get_propvalues, uris,
+                             self._dataclass.propfind_workers)
+        return multistatus([self.mk_prop_response(uri, gp, bp)
+                            for uri, (gp, bp) in zip(uris, values)])
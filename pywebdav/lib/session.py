@@ -0,0 +1,84 @@
+"""
+    Signed session cookies
+
+    After a successful authentication the server hands out a cookie
+    containing the user name, an expiry time and a scope, signed with
+    HMAC-SHA256. Clients that send the cookie back can be authenticated
+    with a single MAC check, without asking the credential backend again.
+
+    The scope is 'r' if the credentials were checked for a read-only
+    command and 'rw' otherwise, because backends may grant write access
+    to some users only. A read-only session presented with a writing
+    command is not accepted and the credentials are checked again.
+
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+from .constants import READ_COMMANDS
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class SessionManager:
+    """ issue and validate signed session cookies """
+
+    def __init__(self, secret=None, ttl=3600, cookie_name='pywebdav_session'):
+        if not secret:
+            secret = os.urandom(32)
+        elif isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        self._secret = secret
+        self.ttl = int(ttl)
+        self.cookie_name = cookie_name
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._secret, payload.encode('ascii'),
+                                   hashlib.sha256).digest())
+
+    def issue(self, user, command):
+        """ return a Set-Cookie header value for the given user """
+        scope = command in READ_COMMANDS and 'r' or 'rw'
+        expires = int(time.time()) + self.ttl
+        payload = '%s.%d.%s' % (_b64encode(user.encode('utf-8')), expires,
+                                scope)
+        return ('%s=%s.%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Strict' %
+                (self.cookie_name, payload, self._sign(payload), self.ttl))
+
+    def validate(self, cookies, command):
+        """ return the user of a valid session cookie or None
+
+        cookies is the value of the Cookie request header
+        """
+        prefix = self.cookie_name + '='
+        for cookie in cookies.split(';'):
+            cookie = cookie.strip()
+            if cookie.startswith(prefix):
+                value = cookie[len(prefix):]
+                break
+        else:
+            return None
+
+        payload, _, mac = value.rpartition('.')
+        try:
+            if not hmac.compare_digest(mac.encode('ascii'),
+                                       self._sign(payload).encode('ascii')):
+                return None
+            user, expires, scope = payload.split('.')
+            if int(expires) < time.time():
+                return None
+            if scope != 'rw' and command not in READ_COMMANDS:
+                return None
+            return _b64decode(user).decode('utf-8')
+        except (ValueError, UnicodeError):
+            return None
@@ -0,0 +1,136 @@
+"""
+    Typed configuration snapshot
+
+    The request handlers used to look up their options in the
+    configuration (a ConfigParser behind INI_Parse) for every response.
+    Settings converts and validates the [DAV] section once and exposes
+    the options as plain attributes of an immutable object.
+
+"""
+
+from typing import NamedTuple, Tuple
+
+_BOOLEAN_STATES = {'1': True, 'yes': True, 'true': True, 'on': True,
+                   '0': False, 'no': False, 'false': False, 'off': False,
+                   '': False}
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        return _BOOLEAN_STATES[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError('Not a boolean: %r' % value)
+
+
+def _to_list(value):
+    if isinstance(value, (tuple, list)):
+        return tuple(value)
+    return tuple(v.strip().lower() for v in str(value).split(',') if v.strip())
+
+
+_CONVERTERS = {bool: _to_bool, int: int, float: float, str: str,
+               Tuple[str, ...]: _to_list}
+
+
+class Settings(NamedTuple):
+    """ immutable options of the [DAV] configuration section """
+
+    verbose: bool = False
+    lockemulation: bool = True
+    mimecheck: bool = True
+    mimesniff: bool = True
+    mime_types: str = ''
+    listing_cache_size: int = 64
+    listing_page_size: int = 1000
+    zip_download: bool = True
+    zip_compress_level: int = 0
+    backend: str = 'filesystem'
+    memory_max_bytes: int = 0
+    archive_cache_size: int = 16
+    propfind_cache_size: int = 0
+    propfind_cache_gzip: bool = True
+    propfind_workers: int = 0
+    propfind_max_entries: int = 100000
+    propfind_max_time: float = 300
+    propfind_max_bytes: int = 256 * 1024 * 1024
+    xml_max_size: int = 1024 * 1024
+    xml_max_depth: int = 32
+    xml_cache_size: int = 64
+    file_cache_size: int = 0
+    file_cache_small_size: int = 64 * 1024
+    file_cache_bytes: int = 32 * 1024 * 1024
+    file_cache_mmap_size: int = 0
+    watch: bool = False
+    watch_fallback_ttl: float = 5
+    index_database: str = ''
+    index_workers: int = 4
+    index_reconcile_interval: float = 3600
+    sync_database: str = ''
+    sync_token_ttl: float = 30 * 24 * 3600
+    sync_max_changes: int = 1000000
+    sync_compact_interval: float = 3600
+    quota_database: str = ''
+    quota_limits: str = ''
+    quota_reconcile_interval: float = 3600
+    property_store: str = ''
+    property_database: str = ''
+    baseurl: str = ''
+    chunked_http_response: bool = True
+    http_request_use_iterator: bool = False
+    http_response_use_iterator: bool = True
+
+    # authentication
+    user: str = ''
+    password: str = ''
+    htpasswd: str = ''
+    auth_cache_size: int = 1024
+    auth_cache_ttl: float = 300
+    auth_schemes: Tuple[str, ...] = ('basic',)
+    digest_nonce_cache_size: int = 4096
+    digest_nonce_ttl: float = 3600
+    session_cookie: bool = False
+    session_ttl: int = 3600
+    session_secret: str = ''
+
+    @classmethod
+    def from_config(cls, config):
+        """ compile the [DAV] section of a configuration object
+
+        Missing options get their default value, invalid values
+        raise a ValueError.
+        """
+        section = getattr(config, 'DAV', None)
+        if section is None:
+            return cls()
+
+        values = {}
+        for name, kind in cls.__annotations__.items():
+            if name not in section:
+                continue
+            value = section.get(name, None)
+            try:
+                values[name] = _CONVERTERS[kind](value)
+            except (TypeError, ValueError):
+                raise ValueError('Invalid value %r for option %s' %
+                                 (value, name))
+
+        for scheme in values.get('auth_schemes', ()):
+            if scheme not in ('basic', 'digest'):
+                raise ValueError('Unknown authentication scheme %s' % scheme)
+
+        backend = values.get('backend', 'filesystem')
+        if backend not in ('filesystem', 'memory', 'dedup', 'archive'):
+            raise ValueError('Unknown backend %s' % backend)
+
+        if not 0 <= values.get('zip_compress_level', 0) <= 9:
+            raise ValueError('zip_compress_level must be between 0 and 9')
+
+        store = values.get('property_store', '')
+        if store not in ('', 'xattr', 'sqlite'):
+            raise ValueError('Unknown property store %s' % store)
+        if store == 'sqlite' and not values.get('property_database'):
+            raise ValueError('property_store sqlite needs a property_database')
+
+        return cls(**values)
@@ -0,0 +1,122 @@
+import logging
+
+from .davxml import DAV, text
+from .errors import DAV_Error, DAV_NotFound, DAV_Condition
+from .propfind import PROPFIND, map_ordered
+from .multistatus import multistatus, mk_element
+from .urimap import uri_path, uri_prefix
+
+log = logging.getLogger(__name__)
+
+
+class SYNC(PROPFIND):
+    """ a sync-collection REPORT (RFC 6578)
+
+    Without a sync token all members of the collection are reported
+    (like a PROPFIND), otherwise only the members changed since, as
+    recorded in the ChangeJournal of the interface class. Removed
+    members are reported with a 404 status, except those which have
+    been created after the token as well. The response ends with the
+    token of the current state.
+    """
+
+    def __init__(self, uri, dataclass, body, **limits):
+        PROPFIND.__init__(self, uri, dataclass, '0', body, **limits)
+        self.journal = dataclass.journal
+
+    def parse_body(self, root):
+        PROPFIND.parse_body(self, root)
+        self.token = text(root.find(DAV + 'sync-token'))
+        self.level = text(root.find(DAV + 'sync-level'))
+        if self.level not in ('1', 'infinite'):
+            raise DAV_Error(400, 'Invalid sync-level %r' % self.level)
+
+        nresults = text(root.find('.//' + DAV + 'nresults'))
+        try:
+            self.limit = nresults and int(nresults) or 0
+        except ValueError:
+            raise DAV_Error(400, 'Invalid limit %r' % nresults)
+
+    def createResponse(self):
+        dc = self._dataclass
+        if self.journal is None or not dc.is_collection(self._uri):
+            if not dc.exists(self._uri):
+                raise DAV_NotFound
+            raise DAV_Condition(403, 'supported-report')
+
+        if not self.token:
+            return self.create_initial()
+
+        since = self.journal.parse_token(self.token)
+        if since is None:
+            raise DAV_Condition(403, 'valid-sync-token')
+        return self.create_changes(since)
+
+    def mk_token(self, seq):
+        """ make the <sync-token> element """
+        return mk_element('sync-token', self.journal.token(seq))
+
+    def create_initial(self):
+        """ report all members of the collection """
+        dc = self._dataclass
+        # changes made while listing are reported again next time
+        seq = self.journal.current()
+
+        if self.level == 'infinite':
+            count = [0]
+            root = self._uri
+
+            def match(uri):
+                if uri == root:
+                    return False
+                count[0] += 1
+                if self.limit and count[0] > self.limit:
+                    raise DAV_Condition(507, 'number-of-matches-within-limits')
+                return True
+
+            return self.walk(self.get_propvalues, self.mk_values_response,
+                             match, self.mk_token(seq))
+
+        uris = list(dc.get_childs(self._uri))
+        if self.limit and len(uris) > self.limit:
+            raise DAV_Condition(507, 'number-of-matches-within-limits')
+        self.load_dead_props(uris)
+        values = map_ordered(self.get_propvalues, uris, dc.propfind_workers)
+        return multistatus([self.mk_prop_response(uri, gp, bp)
+                            for uri, (gp, bp) in zip(uris, values)],
+                           self.mk_token(seq))
+
+    def create_changes(self, since):
+        """ report the members changed after the change number since """
+        dc = self._dataclass
+        seq = self.journal.current()
+        changes = self.journal.changes(uri_path(self._uri), since,
+                                       self.level == 'infinite', self.limit)
+        truncated = self.limit and len(changes) > self.limit
+        if truncated:
+            changes = changes[:self.limit]
+            # continue after the last reported change
+            seq = changes[-1][2]
+
+        prefix = uri_prefix(self._uri)
+        existing = []
+        removed = []
+        for path, deleted, last, created in changes:
+            uri = prefix + path
+            if deleted or not dc.exists(uri):
+                if not created:
+                    removed.append(uri)
+            else:
+                existing.append(uri)
+
+        self.load_dead_props(existing)
+        values = map_ordered(self.get_propvalues, existing,
+                             dc.propfind_workers)
+        responses = [self.mk_prop_response(uri, gp, bp)
+                     for uri, (gp, bp) in zip(existing, values)]
+        for uri in removed:
+            responses.append(self.template.status_response(uri, 404))
+        if truncated:
+            responses.append(self.template.status_response(self._uri, 507))
+
+        return multistatus(responses, self.mk_token(seq))
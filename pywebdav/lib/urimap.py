@@ -0,0 +1,78 @@
+"""
+    Mapping between request URIs and resource paths
+
+    URIs are handed around as unquoted absolute strings like
+    http://localhost:8008/dir/file. Parsing them with urllib.parse for
+    every request and every child of a collection is expensive, thus
+    this module splits them with plain string operations and memoizes
+    the results.
+
+    A resource path is the normalized, unquoted path part of an URI.
+    It always starts with a slash, never ends with one (except for the
+    root) and never contains . or .. segments.
+
+"""
+
+import functools
+import posixpath
+import urllib.parse
+
+# number of memoized paths
+PATH_CACHE_SIZE = 8192
+
+
+@functools.lru_cache(maxsize=256)
+def uri_prefix(baseuri, host=None):
+    """ return scheme://netloc of baseuri, using host as netloc if given """
+    uparts = urllib.parse.urlsplit(baseuri)
+    return '%s://%s' % (uparts.scheme, host or uparts.netloc)
+
+
+@functools.lru_cache(maxsize=256)
+def base_uri(baseuri, host=None):
+    """ return baseuri with its netloc replaced by host if given """
+    if not host:
+        return baseuri
+    uparts = list(urllib.parse.urlparse(baseuri))
+    uparts[1] = host
+    return urllib.parse.urlunparse(uparts)
+
+
+def request_uri(baseuri, host, path):
+    """ return the unquoted absolute URI for a request path """
+    if path.startswith('/'):
+        return urllib.parse.unquote(uri_prefix(baseuri, host) + path)
+    # absolute URI in the request line
+    return urllib.parse.unquote(
+        urllib.parse.urljoin(base_uri(baseuri, host), path))
+
+
+@functools.lru_cache(maxsize=PATH_CACHE_SIZE)
+def uri_path(uri):
+    """ return the normalized resource path of an URI """
+    start = uri.find('://')
+    if start >= 0:
+        start = uri.find('/', start + 3)
+        if start < 0:
+            return '/'
+        path = uri[start:]
+    else:
+        path = uri
+
+    # strip query and fragment
+    for sep in '?#':
+        end = path.find(sep)
+        if end >= 0:
+            path = path[:end]
+
+    path = posixpath.normpath('/' + path)
+    if path.startswith('//'):
+        path = '/' + path.lstrip('/')
+    return path
+
+
+def child_uri(uri, name):
+    """ return the URI of the member name of the collection uri """
+    if uri.endswith('/'):
+        return uri + name
+    return uri + '/' + name
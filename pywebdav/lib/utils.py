@@ -1,11 +1,14 @@
 import time
 import re
 import os
+import functools
+import itertools
 
 from xml.dom import minidom
 import urllib.parse
 
-from .constants import RT_ALLPROP, RT_PROPNAME, RT_PROP
+from .urimap import uri_path
+from .errors import DAV_Requested_Range_Not_Satisfiable
 from http.server import BaseHTTPRequestHandler
 
 def gen_estring(ecode):
@@ -16,38 +19,6 @@ def gen_estring(ecode):
     else:
         return "HTTP/1.1 %s" %(ec)
 
-def parse_propfind(xml_doc):
-    """
-    Parse an propfind xml file and return a list of props
-    """
-
-    doc = minidom.parseString(xml_doc)
-
-    request_type=None
-    props={}
-    namespaces=[]
-
-    if doc.getElementsByTagNameNS("DAV:", "allprop"):
-        request_type = RT_ALLPROP
-    elif doc.getElementsByTagNameNS("DAV:", "propname"):
-        request_type = RT_PROPNAME
-    else:
-        request_type = RT_PROP
-        for i in doc.getElementsByTagNameNS("DAV:", "prop"):
-            for e in i.childNodes:
-                if e.nodeType != minidom.Node.ELEMENT_NODE:
-                    continue
-                ns = e.namespaceURI
-                ename = e.localName
-                if ns in props:
-                    props[ns].append(ename)
-                else:
-                    props[ns]=[ename]
-                    namespaces.append(ns)
-
-    return request_type,props,namespaces
-
-
 def create_treelist(dataclass,uri):
     """ create a list of resources out of a tree
 
@@ -76,8 +47,8 @@ def create_treelist(dataclass,uri):
 
 def is_prefix(uri1,uri2):
     """ returns True if uri1 is a prefix of uri2 """
-    path1 = urllib.parse.urlparse(uri1).path
-    path2 = urllib.parse.urlparse(uri2).path
+    path1 = uri_path(uri1)
+    path2 = uri_path(uri2)
     return os.path.commonpath([path1, path2]) == path1
 
 def quote_uri(uri):
@@ -86,6 +57,13 @@ def quote_uri(uri):
     np=urllib.parse.quote(up[2])
     return urllib.parse.urlunparse((up[0],up[1],np,up[3],up[4],up[5]))
 
+def content_disposition(filename):
+    """ return a Content-Disposition header offering a download """
+    fallback = filename.encode('ascii', 'replace').decode('ascii')
+    fallback = fallback.replace('\\', '_').replace('"', '_')
+    return 'attachment; filename="%s"; filename*=UTF-8\'\'%s' % (
+        fallback, urllib.parse.quote(filename))
+
 def get_uriparentpath(uri):
     """ extract the uri path and remove the last element """
     up=urllib.parse.urlparse(uri)
@@ -124,6 +102,69 @@ def make_xmlresponse(result):
 
     return doc.toxml(encoding="utf-8") + b"\n"
 
+def make_condition(condition):
+    """ return a DAV:error body for a failed pre- or postcondition """
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<D:error xmlns:D="DAV:"><D:%s/></D:error>\n' % condition
+            ).encode('utf-8')
+
+def parse_fragment(value):
+    """ return a fragment from davxml.serialize_children() as text or
+    nodes """
+    if '<' not in value and '&' not in value:
+        return value
+    doc = minidom.parseString('<v>%s</v>' % value)
+    return list(doc.documentElement.childNodes)
+
+def prefetch(chunks, size):
+    """ start generating a body and buffer its first size bytes
+
+    Errors which occur before the buffer is full are raised here,
+    i.e. while a proper status can still be sent. Returns an iterator
+    over the complete body.
+    """
+    chunks = iter(chunks)
+    buffered = []
+    length = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return itertools.chain(buffered, chunks)
+
+def byte_range(range, size):
+    """ return the (first, end) offsets of a Range header
+
+    range is the (first, last) of the header as strings, one of them
+    may be empty, for content of size bytes. Unsatisfiable ranges raise
+    DAV_Requested_Range_Not_Satisfiable.
+    """
+    first, last = range
+    if first == '':
+        # the last bytes of the content
+        first = max(size - int(last), 0)
+        end = size
+    else:
+        first = int(first)
+        end = size if last == '' else min(int(last) + 1, size)
+
+    if first >= size or end <= first:
+        raise DAV_Requested_Range_Not_Satisfiable
+
+    return first, end
+
+def range_bounds(range, size):
+    """ return the (first, end) offsets of the range given to get_data()
+
+    range is None for the whole content or the (first, last) bytes
+    requested, the offsets are limited to the size of the content.
+    """
+    if range is None:
+        return 0, size
+    first = min(range[0], size)
+    return first, max(min(range[1] + 1, size), first)
+
 # taken from App.Common
 
 weekday_abbr = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
@@ -132,22 +173,47 @@ weekday_full = ['Monday', 'Tuesday', 'Wednesday', 'Thursday',
 monthname    = [None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
                 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
-def rfc1123_date(ts=None):
-    # Return an RFC 1123 format date string, required for
-    # use in HTTP Date headers per the HTTP 1.1 spec.
-    # 'Fri, 10 Nov 2000 16:21:09 GMT'
-    if ts is None: ts=time.time()
+# the formatted dates are memoized per second: every response carries
+# the current date and PROPFIND formats two dates for each resource
+# (which often share the same timestamps)
+DATE_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _rfc1123_date(ts):
     year, month, day, hh, mm, ss, wd, y, z = time.gmtime(ts)
     return "%s, %02d %3s %4d %02d:%02d:%02d GMT" % (weekday_abbr[wd],
                                                     day, monthname[month],
                                                     year,
                                                     hh, mm, ss)
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _iso8601_date(ts):
+    year, month, day, hh, mm, ss, wd, y, z = time.gmtime(ts)
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ" % (year, month, day, hh, mm, ss)
+
+# (second, formatted date) of the last Date header
+_current_date = (None, None)
+
+def rfc1123_date(ts=None):
+    # Return an RFC 1123 format date string, required for
+    # use in HTTP Date headers per the HTTP 1.1 spec.
+    # 'Fri, 10 Nov 2000 16:21:09 GMT'
+    global _current_date
+    if ts is None:
+        now = int(time.time())
+        second, date = _current_date
+        if second != now:
+            date = _rfc1123_date(now)
+            _current_date = (now, date)
+        return date
+    return _rfc1123_date(int(ts))
+
 def iso8601_date(ts=None):
     # Return an ISO 8601 formatted date string, required
     # for certain DAV properties.
     # '2000-11-10T16:21:09-08:00
     if ts is None: ts=time.time()
-    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+    return _iso8601_date(int(ts))
 
 def rfc850_date(ts=None):
     # Return an HTTP-date formatted date string.
@@ -0,0 +1,294 @@
+"""
+    Streaming ZIP archives of collections
+
+    A GET of a collection with ?download=zip (or an Accept header
+    asking for application/zip) is answered with a ZIP archive of the
+    whole tree below the collection. The archive is generated while
+    it is sent: the content of the files comes from get_data() chunk
+    by chunk and is never kept, neither in memory nor in a temporary
+    file, only the central directory grows with the number of members.
+
+    As the sizes and checksums of the members are only known after
+    their content has been written, every file is followed by a data
+    descriptor (general purpose flag bit 3) carrying them. All files
+    are written with ZIP64 extra fields, thus neither single members
+    nor the archive are limited to 4 GB or 65535 members. The ZIP64
+    end of central directory records are only added when needed.
+
+    Members are stored as they are (level 0) or deflated with the
+    given zlib compression level.
+
+    The tree is walked like the one of a Depth infinity PROPFIND, only
+    the collections still to visit are kept. As the status is sent
+    before the archive, check() walks the tree once in advance when
+    the number of resources or the time of the walk are limited.
+
+"""
+
+import logging
+import struct
+import time
+import zlib
+
+from .errors import DAV_Error, DAV_Forbidden
+from .urimap import uri_path
+
+log = logging.getLogger(__name__)
+
+# size of the pieces handed to the connection
+BUFFER_SIZE = 128 * 1000
+
+STORED = 0
+DEFLATED = 8
+
+# general purpose flags: data descriptor follows, names are UTF-8
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# version needed to extract: 2.0 (directories), 4.5 (ZIP64)
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# made by: 4.5 on Unix (the external attributes are Unix modes)
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+
+LIMIT_32 = 0xFFFFFFFF
+LIMIT_16 = 0xFFFF
+
+FILE_ATTRIBUTES = 0o100644 << 16
+DIR_ATTRIBUTES = (0o40755 << 16) | 0x10
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+DATA_DESCRIPTOR = struct.Struct('<4sLQQ')
+CENTRAL_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+END_RECORD = struct.Struct('<4sHHHHLLH')
+END_RECORD_64 = struct.Struct('<4sQHHLLQQQQ')
+END_LOCATOR_64 = struct.Struct('<4sLQL')
+
+
+def dos_datetime(timestamp):
+    """ return the (time, date) of timestamp in MS-DOS format """
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    if t.tm_year > 2107:
+        return (23 << 11) | (59 << 5) | 29, (127 << 9) | (12 << 5) | 31
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class Member:
+    """ what the central directory needs to know of a member """
+
+    __slots__ = ('name', 'flags', 'method', 'dostime', 'dosdate', 'crc',
+                 'compressed', 'size', 'offset', 'attributes')
+
+    def __init__(self, name, method, mtime, attributes):
+        self.name = name
+        self.flags = FLAG_UTF8
+        self.method = method
+        self.dostime, self.dosdate = dos_datetime(mtime)
+        self.crc = 0
+        self.compressed = 0
+        self.size = 0
+        self.offset = 0
+        self.attributes = attributes
+
+    def local_header(self):
+        """ return the local file header of the member """
+        if self.flags & FLAG_DESCRIPTOR:
+            # sizes are given in the data descriptor, the ZIP64 extra
+            # field tells readers to expect 8 byte sizes there
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            version, size = VERSION_ZIP64, LIMIT_32
+        else:
+            extra = b''
+            version, size = VERSION_DEFAULT, 0
+        return LOCAL_HEADER.pack(
+            b'PK\x03\x04', version, self.flags, self.method, self.dostime,
+            self.dosdate, 0, size, size, len(self.name),
+            len(extra)) + self.name + extra
+
+    def data_descriptor(self):
+        return DATA_DESCRIPTOR.pack(b'PK\x07\x08', self.crc,
+                                    self.compressed, self.size)
+
+    def central_header(self):
+        """ return the central directory record of the member """
+        fields = []
+        size, compressed, offset = self.size, self.compressed, self.offset
+        if size >= LIMIT_32:
+            fields.append(size)
+            size = LIMIT_32
+        if compressed >= LIMIT_32:
+            fields.append(compressed)
+            compressed = LIMIT_32
+        if offset >= LIMIT_32:
+            fields.append(offset)
+            offset = LIMIT_32
+        extra = b''
+        if fields:
+            extra = struct.pack('<HH%dQ' % len(fields), 1, 8 * len(fields),
+                                *fields)
+        version = (self.flags & FLAG_DESCRIPTOR and VERSION_ZIP64 or
+                   VERSION_DEFAULT)
+        return CENTRAL_HEADER.pack(
+            b'PK\x01\x02', VERSION_MADE_BY, version, self.flags,
+            self.method, self.dostime, self.dosdate, self.crc, compressed,
+            size, len(self.name), len(extra), 0, 0, 0, self.attributes,
+            offset) + self.name + extra
+
+
+class ZipStream:
+    """ the ZIP archive of the tree below the collection uri
+
+    Iterating over it generates the archive. level is the zlib
+    compression level of the members (0 stores them uncompressed).
+    check() refuses trees of more than max_entries resources or whose
+    walk takes more than max_time seconds (0 means no limit).
+    """
+
+    def __init__(self, dc, uri, level=0, max_entries=0, max_time=0):
+        self.dc = dc
+        self.uri = uri.partition('?')[0]
+        self.level = level
+        self.max_entries = max_entries
+        self.max_time = max_time
+        # bytes generated so far
+        self.offset = 0
+
+    def check(self):
+        """ raise DAV_Forbidden if the tree exceeds the limits """
+        if not self.max_entries and not self.max_time:
+            return
+        start = time.monotonic()
+        count = 0
+        for uri, name in self.members():
+            count += 1
+            if (self.max_entries and count > self.max_entries or
+                    self.max_time and
+                    time.monotonic() - start > self.max_time):
+                log.info('zip: %s exceeds the limits of a download' %
+                         self.uri)
+                raise DAV_Forbidden
+
+    def members(self):
+        """ yield (uri, name) of the resources below the collection """
+        base = uri_path(self.uri)
+        root = base.rstrip('/') + '/'
+        uri_list = [self.uri]
+        while uri_list:
+            uri = uri_list.pop()
+            path = uri_path(uri)
+            if path != base and path.startswith(root):
+                # not the collection itself
+                yield uri, path[len(root):]
+            try:
+                childs = self.dc.get_childs(uri)
+            except DAV_Error as error:
+                # unreadable or gone in the meantime
+                log.info('zip: Skipping the members of %s (%s)' %
+                         (uri, error.args[0]))
+                continue
+            if childs:
+                # visited in their order
+                uri_list.extend(reversed(childs))
+
+    def __iter__(self):
+        self.offset = 0
+        buffer = bytearray()
+        for data in self._generate():
+            self.offset += len(data)
+            if len(buffer) + len(data) < BUFFER_SIZE:
+                buffer += data
+                continue
+            if buffer:
+                yield bytes(buffer)
+                buffer = bytearray()
+            if len(data) < BUFFER_SIZE:
+                buffer += data
+            else:
+                yield data
+        if buffer:
+            yield bytes(buffer)
+
+    def _generate(self):
+        """ yield the pieces of the archive """
+        directory = []
+        for uri, name in self.members():
+            try:
+                mtime = self.dc.get_lastmodified(uri)
+            except DAV_Error:
+                mtime = time.time()
+            if self.dc.is_collection(uri):
+                member = Member((name + '/').encode('utf-8'), STORED,
+                                mtime, DIR_ATTRIBUTES)
+                member.offset = self.offset
+                yield member.local_header()
+            else:
+                try:
+                    data = self.dc.get_data(uri)
+                except DAV_Error as error:
+                    # gone or unreadable in the meantime
+                    log.info('zip: Skipping %s (%s)' % (uri, error.args[0]))
+                    continue
+                member = Member(name.encode('utf-8'),
+                                self.level and DEFLATED or STORED,
+                                mtime, FILE_ATTRIBUTES)
+                member.flags |= FLAG_DESCRIPTOR
+                member.offset = self.offset
+                yield member.local_header()
+                yield from self._content(member, data)
+                yield member.data_descriptor()
+            directory.append(member)
+
+        start = self.offset
+        for member in directory:
+            yield member.central_header()
+        yield from self._end(len(directory), start, self.offset - start)
+
+    def _content(self, member, data):
+        """ yield the (compressed) content of a file """
+        close = getattr(data, 'close', None)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = (data,)
+        compressor = None
+        if member.method == DEFLATED:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        crc = size = compressed = 0
+        try:
+            for buf in data:
+                if not buf:
+                    continue
+                crc = zlib.crc32(buf, crc)
+                size += len(buf)
+                if compressor is not None:
+                    buf = compressor.compress(buf)
+                    if not buf:
+                        continue
+                compressed += len(buf)
+                yield buf
+        finally:
+            # the download may be aborted in the middle of a file
+            if close is not None:
+                close()
+        if compressor is not None:
+            buf = compressor.flush()
+            compressed += len(buf)
+            yield buf
+        member.crc = crc
+        member.size = size
+        member.compressed = compressed
+
+    def _end(self, count, start, length):
+        """ yield the end of central directory record(s) """
+        if count >= LIMIT_16 or start >= LIMIT_32 or length >= LIMIT_32:
+            position = self.offset
+            yield END_RECORD_64.pack(
+                b'PK\x06\x06', END_RECORD_64.size - 12, VERSION_MADE_BY,
+                VERSION_ZIP64, 0, 0, count, count, length, start)
+            yield END_LOCATOR_64.pack(b'PK\x06\x07', 0, position, 1)
+            count = min(count, LIMIT_16)
+            start = min(start, LIMIT_32)
+            length = min(length, LIMIT_32)
+        yield END_RECORD.pack(b'PK\x05\x06', 0, 0, count, count, length,
+                              start, 0)
@@ -0,0 +1,542 @@
+"""
+    ZIP and TAR archives served as collections
+
+    Data sets are often published as large ZIP or TAR bundles, and
+    extracting them only to serve their content wastes time and space.
+    The ArchiveHandler serves a directory like the FilesystemHandler,
+    but .zip and (uncompressed) .tar files in it are shown as read-only
+    collections of their members.
+
+    The index of an archive (the central directory of a ZIP file, the
+    headers of a TAR file) is read once and kept in an ArchiveCache
+    until the archive changes. Members which are stored without
+    compression (all members of TAR files) are read straight from the
+    archive at their offset, through the FileCache if there is one, and
+    ranges of them can be requested. Deflated ZIP members are inflated
+    while they are sent, for a range from the start of the member on,
+    dropping the bytes before the range.
+
+    An archive itself is a collection, but it is deleted, copied and
+    moved like a file. Its members can only be read (or copied out of
+    the archive).
+
+"""
+
+import logging
+import os
+import posixpath
+import stat
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+
+from pywebdav.lib.constants import COLLECTION, OBJECT
+from pywebdav.lib.davcmd import copyone, copytree, moveone, movetree, delone, deltree
+from pywebdav.lib.errors import DAV_Error, DAV_Forbidden, DAV_NotFound
+from pywebdav.lib.mimetype import DEFAULT_TYPE
+from pywebdav.lib.urimap import uri_path, child_uri
+from pywebdav.lib.utils import range_bounds
+from pywebdav.server.fshandler import FilesystemHandler, Resource, make_etag
+from pywebdav.server.filecache import CachedResource
+from pywebdav.server.listing import ListingResource, sort_entries
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 128 * 1000
+
+# names of files shown as collections
+SUFFIXES = ('.zip', '.tar')
+
+# the fixed part of the local header of a ZIP member
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+class Member:
+    """ a file or directory in an archive
+
+    data is the position of the content in the archive. For ZIP
+    members it is only known once the local header at offset has
+    been read.
+    """
+
+    __slots__ = ('is_dir', 'size', 'mtime', 'offset', 'data',
+                 'compressed', 'method')
+
+    def __init__(self, is_dir=False, size=0, mtime=0, offset=0, data=None,
+                 compressed=0, method=zipfile.ZIP_STORED):
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.offset = offset
+        self.data = data
+        self.compressed = compressed
+        self.method = method
+
+
+class ArchiveIndex:
+    """ the members of an archive by their path in the archive
+
+    Paths have no leading or trailing slashes, the root is ''.
+    Directories missing in the archive are added.
+    """
+
+    def __init__(self, st):
+        self.st = st
+        self.key = (st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns)
+        self.members = {'': Member(is_dir=True, mtime=st.st_mtime)}
+        self.children = {'': []}
+
+    def add(self, name, member):
+        name = posixpath.normpath('/' + name).lstrip('/')
+        if not name:
+            return
+        if name in self.members:
+            if member.is_dir:
+                return
+            if self.members[name].is_dir:
+                # files and directories of the same name
+                return
+        else:
+            parent, sep, base = name.rpartition('/')
+            self.add(parent, Member(is_dir=True, mtime=member.mtime))
+            self.children[parent].append(base)
+        self.members[name] = member
+        if member.is_dir:
+            self.children.setdefault(name, [])
+
+
+def read_zip(path, st):
+    """ return the ArchiveIndex of a ZIP file """
+    index = ArchiveIndex(st)
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            try:
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+            except (OverflowError, ValueError):
+                mtime = st.st_mtime
+            if info.is_dir():
+                index.add(info.filename, Member(is_dir=True, mtime=mtime))
+            elif not info.flag_bits & 0x1:
+                # encrypted members are left out
+                index.add(info.filename, Member(
+                    size=info.file_size, mtime=mtime,
+                    offset=info.header_offset,
+                    compressed=info.compress_size,
+                    method=info.compress_type))
+    return index
+
+
+def read_tar(path, st):
+    """ return the ArchiveIndex of an uncompressed TAR file """
+    index = ArchiveIndex(st)
+    with tarfile.open(path, 'r:') as tf:
+        for info in tf:
+            if info.isdir():
+                index.add(info.name, Member(is_dir=True, mtime=info.mtime))
+            elif info.isreg() and not info.issparse():
+                index.add(info.name, Member(size=info.size, mtime=info.mtime,
+                                            data=info.offset_data))
+    return index
+
+
+READERS = {'.zip': read_zip, '.tar': read_tar}
+
+
+class ArchiveCache:
+    """ LRU cache of the indexes of up to max_archives archives """
+
+    def __init__(self, max_archives=16):
+        self.max_archives = max_archives
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """ return the ArchiveIndex of path or None if it is no archive """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = (st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        start = time.perf_counter()
+        reader = READERS[os.path.splitext(path)[1].lower()]
+        try:
+            index = reader(path, st)
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError,
+                UnicodeError) as ex:
+            # served as a plain file
+            log.info('Not an archive %s: %s' % (path, ex))
+            index = None
+        else:
+            log.debug('Read %d members of %s in %.3fs', len(index.members),
+                      path, time.perf_counter() - start)
+
+        with self._lock:
+            self._entries[path] = (key, index)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_archives:
+                self._entries.popitem(last=False)
+        return index
+
+
+class InflatedResource:
+    """ the content (or a range) of a deflated ZIP member for get_data()
+
+    The member is inflated from its start, the first bytes are dropped
+    and only length bytes are returned.
+    """
+
+    def __init__(self, fp, offset, compressed, first, length):
+        self.fp = fp
+        self.offset = offset
+        self.compressed = compressed
+        self.first = first
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        try:
+            yield from self._inflate()
+        finally:
+            self.close()
+
+    def _inflate(self):
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.fp.seek(self.offset)
+        skip, left = self.first, self.length
+        compressed = self.compressed
+        while compressed > 0 and left > 0:
+            data = self.fp.read(min(BUFFER_SIZE, compressed))
+            if not data:
+                break
+            compressed -= len(data)
+            data = inflater.decompress(data)
+            if not compressed:
+                data += inflater.flush()
+            if skip:
+                data, skip = data[skip:], max(skip - len(data), 0)
+            if data:
+                data = data[:left]
+                left -= len(data)
+                yield data
+
+    def read(self, length=0):
+        return b''.join(self)
+
+    def close(self):
+        self.fp.close()
+
+
+class ArchiveHandler(FilesystemHandler):
+    """ a FilesystemHandler showing archives as collections """
+
+    def __init__(self, directory, uri, verbose=False, max_archives=16):
+        FilesystemHandler.__init__(self, directory, uri, verbose)
+        self.archives = ArchiveCache(max_archives)
+
+    def _split(self, uri):
+        """ return (archive file, index, path in archive) of uri or
+        None if uri is not an archive or in one """
+        parts = uri_path(uri).split('/')
+        for i in range(1, len(parts)):
+            if not parts[i].lower().endswith(SUFFIXES):
+                continue
+            local = self.uri2local('/'.join(parts[:i + 1]))
+            index = self.archives.get(local)
+            if index is not None:
+                return local, index, '/'.join(parts[i + 1:])
+        return None
+
+    def _member(self, uri):
+        """ return (archive file, index, path, member) of a resource in
+        an archive or None for others
+
+        Raises DAV_NotFound if the archive has no such member.
+        """
+        found = self._split(uri)
+        if found is None:
+            return None
+        local, index, name = found
+        member = index.members.get(name)
+        if member is None:
+            raise DAV_NotFound
+        return local, index, name, member
+
+    def _read_only(self, uri):
+        """ raise DAV_Forbidden for resources in an archive """
+        found = self._split(uri)
+        if found is not None and found[2]:
+            log.info('%s is in the read-only archive %s' % (uri, found[0]))
+            raise DAV_Forbidden
+
+    def _is_archive(self, uri):
+        found = self._split(uri)
+        return found is not None and not found[2]
+
+    ###
+    ### lookups
+    ###
+
+    def get_childs(self, uri, filter=None):
+        """ return the members of a collection or archive directory """
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler.get_childs(self, uri, filter)
+        local, index, name, member = found
+        return [child_uri(uri, child) for child in
+                index.children.get(name, ())]
+
+    def exists(self, uri):
+        """ test if a resource exists """
+        try:
+            found = self._member(uri)
+        except DAV_NotFound:
+            return None
+        if found is None:
+            return FilesystemHandler.exists(self, uri)
+        return 1
+
+    def is_collection(self, uri):
+        """ test if the given uri is a collection """
+        try:
+            found = self._member(uri)
+        except DAV_NotFound:
+            return 0
+        if found is None:
+            return FilesystemHandler.is_collection(self, uri)
+        return found[3].is_dir and 1 or 0
+
+    def get_collection_version(self, uri):
+        """ archives change as a whole """
+        try:
+            found = self._member(uri)
+        except DAV_NotFound:
+            return None
+        if found is None:
+            return FilesystemHandler.get_collection_version(self, uri)
+        return found[1].key
+
+    ###
+    ### content
+    ###
+
+    def _get_archive_listing(self, uri, index, name):
+        offset, limit, sort, order = self.listing.parse_query(
+            uri.partition('?')[2])
+        prefix = name and name + '/' or ''
+        entries = []
+        for child in index.children.get(name, ()):
+            if child.startswith('.'):
+                continue
+            member = index.members[prefix + child]
+            entries.append((child, member.is_dir, member.size, member.mtime))
+        sort_entries(entries, sort, order)
+        return ListingResource(self.listing.render(
+            entries, uri_path(uri), offset, limit, sort, order))
+
+    def _data_offset(self, local, member):
+        """ return the offset of the content of a member """
+        if member.data is None:
+            with open(local, 'rb') as fp:
+                fp.seek(member.offset)
+                header = fp.read(_LOCAL_HEADER.size)
+            if len(header) != _LOCAL_HEADER.size or \
+                    header[:4] != b'PK\x03\x04':
+                raise DAV_Error(500, 'Bad ZIP member header in %s' % local)
+            fields = _LOCAL_HEADER.unpack(header)
+            # the name and extra field follow the fixed part
+            member.data = (member.offset + _LOCAL_HEADER.size + fields[9] +
+                           fields[10])
+        return member.data
+
+    def get_data(self, uri, range=None):
+        """ return the content of a resource, members of archives are
+        read from the archive """
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler.get_data(self, uri, range)
+        local, index, name, member = found
+        if member.is_dir:
+            return self._get_archive_listing(uri, index, name)
+
+        if member.method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            log.info('get_data: compression %d of %s is not supported' %
+                     (member.method, uri))
+            raise DAV_Error(415)
+
+        first, end = range_bounds(range, member.size)
+        if end <= first:
+            return b''
+
+        offset = self._data_offset(local, member)
+        if member.method == zipfile.ZIP_DEFLATED:
+            return InflatedResource(open(local, 'rb'), offset,
+                                    member.compressed, first, end - first)
+
+        if self.files is not None:
+            try:
+                file = self.files.open(local)
+            except OSError:
+                raise DAV_NotFound
+            if file.content is not None:
+                # small archives are kept in memory, see _get_cached_data
+                content = file.content[offset + first:offset + end]
+                file.release()
+                return content
+            return CachedResource(file, offset + first, end - first)
+        fp = open(local, 'rb')
+        fp.seek(offset + first)
+        return Resource(fp, end - first)
+
+    ###
+    ### properties
+    ###
+
+    def _get_dav_resourcetype(self, uri):
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler._get_dav_resourcetype(self, uri)
+        return found[3].is_dir and COLLECTION or OBJECT
+
+    def _get_dav_getcontentlength(self, uri):
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler._get_dav_getcontentlength(self, uri)
+        return str(found[3].size)
+
+    def _get_dav_getcontenttype(self, uri):
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler._get_dav_getcontenttype(self, uri)
+        if found[3].is_dir:
+            return "httpd/unix-directory"
+        if self.mimecheck is False:
+            return 'application/octet-stream'
+        return self.mimetypes.by_name(found[2]) or DEFAULT_TYPE
+
+    def _get_dav_getetag(self, uri):
+        """ return the entity tag of the archive and the path in it """
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler._get_dav_getetag(self, uri)
+        local, index, name, member = found
+        return '%s-%x"' % (make_etag(index.st)[:-1],
+                           zlib.crc32(name.encode('utf-8')))
+
+    def _get_dav_quota_used_bytes(self, uri):
+        found = self._member(uri)
+        if found is None:
+            return FilesystemHandler._get_dav_quota_used_bytes(self, uri)
+        if found[2]:
+            # the archive takes the space, not its members
+            raise DAV_NotFound
+        return str(self._file_size(found[0]))
+
+    def _get_dav_quota_available_bytes(self, uri):
+        if self._member(uri) is None:
+            return FilesystemHandler._get_dav_quota_available_bytes(self, uri)
+        # nothing can be stored in an archive
+        raise DAV_NotFound
+
+    def get_lastmodified(self, uri):
+        found = self._member(uri)
+        if found is None or not found[2]:
+            return FilesystemHandler.get_lastmodified(self, uri)
+        return found[3].mtime
+
+    def get_creationdate(self, uri):
+        found = self._member(uri)
+        if found is None or not found[2]:
+            return FilesystemHandler.get_creationdate(self, uri)
+        return found[3].mtime
+
+    def proppatch(self, uri, changes):
+        self._read_only(uri)
+        return FilesystemHandler.proppatch(self, uri, changes)
+
+    ###
+    ### changes, members of archives are read-only
+    ###
+
+    def put(self, uri, data, content_type=None):
+        self._read_only(uri)
+        return FilesystemHandler.put(self, uri, data, content_type)
+
+    def mkcol(self, uri):
+        self._read_only(uri)
+        return FilesystemHandler.mkcol(self, uri)
+
+    def rm(self, uri):
+        self._read_only(uri)
+        return FilesystemHandler.rm(self, uri)
+
+    def rmcol(self, uri):
+        self._read_only(uri)
+        return FilesystemHandler.rmcol(self, uri)
+
+    ###
+    ### DELETE, COPY and MOVE see archives as files
+    ###
+
+    def delone(self, uri):
+        return delone(_ArchivesAsFiles(self), uri)
+
+    def deltree(self, uri):
+        return deltree(_ArchivesAsFiles(self), uri)
+
+    def moveone(self, src, dst, overwrite):
+        return moveone(_ArchivesAsFiles(self), src, dst, overwrite)
+
+    def movetree(self, src, dst, overwrite):
+        return movetree(_ArchivesAsFiles(self), src, dst, overwrite)
+
+    def copyone(self, src, dst, overwrite):
+        return copyone(_ArchivesAsFiles(self), src, dst, overwrite)
+
+    def copytree(self, src, dst, overwrite):
+        return copytree(_ArchivesAsFiles(self), src, dst, overwrite)
+
+    def copy(self, src, dst):
+        """ copy a file, members of archives are extracted """
+        self._read_only(dst)
+        found = self._member(src)
+        if found is None or not found[2]:
+            return FilesystemHandler.copy(self, src, dst)
+        self.put(dst, (chunk for chunk in self.get_data(src)))
+
+    def copycol(self, src, dst):
+        self._read_only(dst)
+        return FilesystemHandler.copycol(self, src, dst)
+
+
+class _ArchivesAsFiles:
+    """ an ArchiveHandler for the functions of davcmd
+
+    These walk through the trees they copy, move or delete, but
+    archives are copied, moved and deleted as files.
+    """
+
+    def __init__(self, dc):
+        self.dc = dc
+
+    def __getattr__(self, name):
+        return getattr(self.dc, name)
+
+    def is_collection(self, uri):
+        if self.dc._is_archive(uri):
+            return 0
+        return self.dc.is_collection(uri)
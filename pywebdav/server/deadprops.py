@@ -0,0 +1,221 @@
+"""
+    Stores for dead properties (PROPPATCH)
+
+    Dead properties are the ones a client sets and the server only
+    keeps, like the Win32FileAttributes of Office or the Finder info
+    of macOS. Without a place to keep them these clients fall back to
+    extra files.
+
+    A store maps resource paths (see urimap) to dicts of
+    {(namespace, name): value} where value is an XML fragment. Stores
+    read the properties of many resources at once (all members of a
+    collection for PROPFIND) and apply all changes of a PROPPATCH or
+    none.
+
+    XattrPropertyStore keeps the properties of a file in one extended
+    attribute of the file itself, so they stay with it whatever happens
+    to the file. Filesystems usually limit the size of extended
+    attributes to a few KiB per file. SQLitePropertyStore keeps them in
+    a database and works with any filesystem.
+
+"""
+
+import errno
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from pywebdav.lib.errors import DAV_Error, DAV_NotFound
+
+log = logging.getLogger(__name__)
+
+
+class PropertyStore:
+    """ interface of dead property stores """
+
+    def get_many(self, paths):
+        """ return {path: {(ns, name): value}} for paths with properties """
+        return {}
+
+    def update(self, path, changes):
+        """ apply a list of (ns, name, value or None) changes """
+        raise DAV_Error(403)
+
+    def copy(self, src, dst):
+        """ give dst the properties of src (not recursive) """
+        pass
+
+    def delete(self, path, tree=False):
+        """ forget the properties of path (and of its members) """
+        pass
+
+
+def _apply(props, changes):
+    for ns, name, value in changes:
+        if value is None:
+            props.pop((ns, name), None)
+        else:
+            props[(ns, name)] = value
+    return props
+
+
+class XattrPropertyStore(PropertyStore):
+    """ properties kept as JSON in the extended attribute ATTRIBUTE """
+
+    ATTRIBUTE = 'user.pywebdav.props'
+
+    # set and removed again by supported()
+    PROBE = 'user.pywebdav.probe'
+
+    def __init__(self, directory):
+        self.directory = directory
+        # read-modify-write of the attribute
+        self._lock = threading.Lock()
+
+    def supported(self):
+        """ return whether the filesystem of directory keeps user xattrs """
+        try:
+            os.setxattr(self.directory, self.PROBE, b'1')
+            os.removexattr(self.directory, self.PROBE)
+        except (AttributeError, OSError) as ex:
+            # AttributeError: no xattr functions on this platform
+            log.debug('Extended attributes of %s: %s' % (self.directory, ex))
+            return False
+        return True
+
+    def local_path(self, path):
+        if path == '/':
+            return self.directory
+        return self.directory + path.replace('/', os.sep)
+
+    def _read(self, local):
+        try:
+            data = os.getxattr(local, self.ATTRIBUTE)
+        except OSError as ex:
+            if ex.errno == errno.ENOENT:
+                raise DAV_NotFound
+            # ENODATA: no properties
+            return {}
+        return dict(((ns, name), value) for ns, name, value in
+                    json.loads(data.decode('utf-8')))
+
+    def _write(self, local, props):
+        try:
+            if props:
+                data = json.dumps([(ns, name, value) for (ns, name), value
+                                   in props.items()]).encode('utf-8')
+                os.setxattr(local, self.ATTRIBUTE, data)
+            else:
+                try:
+                    os.removexattr(local, self.ATTRIBUTE)
+                except OSError as ex:
+                    if ex.errno != errno.ENODATA:
+                        raise
+        except OSError as ex:
+            log.info('Can not store properties of %s: %s' % (local, ex))
+            if ex.errno in (errno.ENOSPC, errno.E2BIG):
+                raise DAV_Error(507)
+            raise DAV_Error(403)
+
+    def get_many(self, paths):
+        result = {}
+        for path in paths:
+            try:
+                props = self._read(self.local_path(path))
+            except DAV_NotFound:
+                continue
+            if props:
+                result[path] = props
+        return result
+
+    def update(self, path, changes):
+        local = self.local_path(path)
+        with self._lock:
+            self._write(local, _apply(self._read(local), changes))
+
+    def copy(self, src, dst):
+        with self._lock:
+            try:
+                props = self._read(self.local_path(src))
+            except DAV_NotFound:
+                return
+            self._write(self.local_path(dst), props)
+
+
+class SQLitePropertyStore(PropertyStore):
+    """ properties kept in a SQLite table """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS props (
+        path TEXT NOT NULL,
+        ns TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (path, ns, name)
+    );
+    """
+
+    # paths per SELECT of get_many
+    BATCH_SIZE = 500
+
+    def __init__(self, database):
+        self.database = database
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db = self._db()
+        with self._write_lock, db:
+            db.executescript(self.SCHEMA)
+
+    def _db(self):
+        """ return the connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def get_many(self, paths):
+        paths = list(paths)
+        result = {}
+        db = self._db()
+        for start in range(0, len(paths), self.BATCH_SIZE):
+            batch = paths[start:start + self.BATCH_SIZE]
+            query = ('SELECT path, ns, name, value FROM props '
+                     'WHERE path IN (%s)' % ','.join('?' * len(batch)))
+            for path, ns, name, value in db.execute(query, batch):
+                result.setdefault(path, {})[(ns, name)] = value
+        return result
+
+    def update(self, path, changes):
+        db = self._db()
+        with self._write_lock, db:
+            for ns, name, value in changes:
+                if value is None:
+                    db.execute('DELETE FROM props WHERE path = ? AND ns = ? '
+                               'AND name = ?', (path, ns, name))
+                else:
+                    db.execute('INSERT OR REPLACE INTO props '
+                               'VALUES (?, ?, ?, ?)', (path, ns, name, value))
+
+    def copy(self, src, dst):
+        db = self._db()
+        with self._write_lock, db:
+            db.execute('DELETE FROM props WHERE path = ?', (dst,))
+            db.execute('INSERT INTO props SELECT ?, ns, name, value '
+                       'FROM props WHERE path = ?', (dst, src))
+
+    def delete(self, path, tree=False):
+        db = self._db()
+        with self._write_lock, db:
+            if tree:
+                prefix = path.rstrip('/') + '/'
+                db.execute('DELETE FROM props WHERE path = ? OR '
+                           'substr(path, 1, ?) = ?',
+                           (path, len(prefix), prefix))
+            else:
+                db.execute('DELETE FROM props WHERE path = ?', (path,))
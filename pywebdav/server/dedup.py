@@ -0,0 +1,544 @@
+"""
+    Content addressed storage backend
+
+    Users put the same installers and documents into many collections.
+    The DedupHandler stores the content of each file only once: files
+    are blobs named by the SHA-256 hash of their content, and an index
+    in SQLite maps resource paths to blobs. Blobs count the paths
+    referring to them and are removed with the last one.
+
+    The content of a PUT is hashed while it is written to a temporary
+    file. If a blob with that hash exists already, the temporary file
+    is dropped, and a PUT of the content a path has already is no
+    change at all. COPY and MOVE only add and remove index entries.
+    The ETag of a file is the hash of its content.
+
+    The directory of the backend contains the index (index.sqlite) and
+    the blobs below blobs/, sharded into two levels of directories by
+    the first four hex digits of their hash. It must not be changed by
+    other programs.
+
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from pywebdav.lib.constants import COLLECTION, OBJECT
+from pywebdav.lib.errors import DAV_Error, DAV_Forbidden, DAV_NotFound, DAV_Secret
+from pywebdav.lib.iface import dav_interface
+from pywebdav.lib.davcmd import copyone, copytree, moveone, movetree, delone, deltree
+from pywebdav.lib.mimetype import MimeTypeResolver
+from pywebdav.lib.urimap import uri_path, uri_prefix, child_uri
+from pywebdav.lib.utils import range_bounds
+from pywebdav.server.fshandler import Resource
+from pywebdav.server.listing import DirectoryLister, ListingResource, sort_entries
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    blob TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL
+);
+"""
+
+
+def _parent(path):
+    if path == '/':
+        return ''
+    return path.rsplit('/', 1)[0] or '/'
+
+
+class BlobStore:
+    """ files named by the SHA-256 hash of their content """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # on the same filesystem, blobs are renamed into place
+        self.tmp = os.path.join(directory, 'tmp')
+        os.makedirs(self.tmp, exist_ok=True)
+        for name in os.listdir(self.tmp):
+            # left behind by interrupted uploads
+            os.unlink(os.path.join(self.tmp, name))
+
+    def path(self, hash):
+        """ return the file of a blob """
+        return os.path.join(self.directory, hash[:2], hash[2:4], hash)
+
+    def write(self, data):
+        """ write data (bytes or an iterable of bytes) to a temporary
+        file and return its name, the hash and the size of data """
+        if isinstance(data, (bytes, bytearray)):
+            data = (data,)
+        elif data is None:
+            data = ()
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                for chunk in data:
+                    digest.update(chunk)
+                    fp.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return tmp, digest.hexdigest(), size
+
+    def add(self, tmp, hash):
+        """ make the temporary file tmp the blob hash """
+        path = self.path(hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+
+    def remove(self, hash):
+        try:
+            os.unlink(self.path(hash))
+        except FileNotFoundError:
+            pass
+
+
+class DedupHandler(dav_interface):
+    """ files stored once per content below directory """
+
+    # determine content types (set to False to serve everything
+    # as application/octet-stream)
+    mimecheck = True
+
+    # PropertyStore for dead properties, see deadprops.py
+    properties = None
+
+    def __init__(self, directory, uri, verbose=False):
+        self.directory = os.path.normpath(directory)
+        self.setBaseURI(uri)
+        self.blobs = BlobStore(os.path.join(self.directory, 'blobs'))
+        self.database = os.path.join(self.directory, 'index.sqlite')
+        self.mimetypes = MimeTypeResolver()
+        self.listing = DirectoryLister()
+        self.verbose = verbose
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db = self._db()
+        now = time.time_ns()
+        with self._write_lock, db:
+            db.executescript(SCHEMA)
+            db.execute("INSERT OR IGNORE INTO entries VALUES "
+                       "('/', '', NULL, 0, ?, ?)", (now, now / 1e9))
+        log.info('Initialized with %s %s' % (directory, uri))
+
+    def setBaseURI(self, uri):
+        """ Sets the base uri """
+
+        self.baseuri = uri
+        self._baseprefix = uri_prefix(uri)
+
+    def _db(self):
+        """ return the connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    ###
+    ### the index
+    ###
+
+    def _get(self, path):
+        """ return (blob, size, mtime_ns, ctime) of path or None
+
+        The blob of collections is None.
+        """
+        return self._db().execute(
+            'SELECT blob, size, mtime_ns, ctime FROM entries '
+            'WHERE path = ?', (path,)).fetchone()
+
+    def _entry(self, uri):
+        """ return the entry of uri or raise DAV_NotFound """
+        entry = self._get(uri_path(uri))
+        if entry is None:
+            raise DAV_NotFound
+        return entry
+
+    def _check_parent(self, path):
+        """ raise DAV_Error(409) unless the parent of path is a
+        collection """
+        parent = self._get(_parent(path))
+        if parent is None or parent[0] is not None:
+            raise DAV_Error(409)
+
+    def _touch(self, db, path):
+        """ change the modification time of the parent of path """
+        db.execute('UPDATE entries SET mtime_ns = max(?, mtime_ns + 1) '
+                   'WHERE path = ?', (time.time_ns(), _parent(path)))
+
+    def _ref(self, db, hash, size, tmp=None):
+        """ add a reference to a blob, tmp is its content if it is new """
+        if db.execute('UPDATE blobs SET refs = refs + 1 WHERE hash = ?',
+                      (hash,)).rowcount:
+            if tmp is not None:
+                os.unlink(tmp)
+            return
+        if tmp is None:
+            # the index lost its blob
+            raise DAV_NotFound
+        self.blobs.add(tmp, hash)
+        db.execute('INSERT INTO blobs VALUES (?, ?, 1)', (hash, size))
+
+    def _unref(self, db, hash, count=1):
+        """ remove references to a blob, return True if it is unused """
+        db.execute('UPDATE blobs SET refs = refs - ? WHERE hash = ?',
+                   (count, hash))
+        if db.execute('DELETE FROM blobs WHERE hash = ? AND refs <= 0',
+                      (hash,)).rowcount:
+            return True
+        return False
+
+    def get_childs(self, uri, filter=None):
+        """ return the URIs of the members of a collection """
+        path = uri_path(uri)
+        prefix = path.rstrip('/') + '/'
+        return [child_uri(uri, p[len(prefix):]) for (p,) in self._db().execute(
+            'SELECT path FROM entries WHERE parent = ?', (path,))]
+
+    def compile_filter(self, filter):
+        """ REPORT filters are not supported, all resources match """
+        return None
+
+    def exists(self, uri):
+        """ test if a resource exists """
+        if self._get(uri_path(uri)) is not None:
+            return 1
+        return None
+
+    def is_collection(self, uri):
+        """ test if the given uri is a collection """
+        entry = self._get(uri_path(uri))
+        if entry is not None and entry[0] is None:
+            return 1
+        return 0
+
+    def get_collection_version(self, uri):
+        """ return the modification time, which changes with members """
+        entry = self._get(uri_path(uri))
+        return entry is not None and entry[2] or None
+
+    ###
+    ### DATA methods (for GET and PUT)
+    ###
+
+    def _get_listing(self, uri):
+        """ return a (paged) HTML listing of a collection """
+        offset, limit, sort, order = self.listing.parse_query(
+            uri.partition('?')[2])
+        path = uri_path(uri)
+        prefix = path.rstrip('/') + '/'
+        entries = [(p[len(prefix):], blob is None, size, mtime_ns / 1e9)
+                   for p, blob, size, mtime_ns in self._db().execute(
+                       'SELECT path, blob, size, mtime_ns FROM entries '
+                       'WHERE parent = ?', (path,))
+                   if not p[len(prefix):].startswith('.')]
+        sort_entries(entries, sort, order)
+        return ListingResource(self.listing.render(
+            entries, path, offset, limit, sort, order))
+
+    def get_data(self, uri, range=None):
+        """ return the content of an object """
+        blob, size = self._entry(uri)[:2]
+        if blob is None:
+            return self._get_listing(uri)
+
+        first, end = range_bounds(range, size)
+        try:
+            fp = open(self.blobs.path(blob), 'rb')
+        except OSError:
+            # removed by a concurrent request
+            raise DAV_NotFound
+        fp.seek(first)
+        return Resource(fp, end - first)
+
+    def check_quota(self, uri, length):
+        """ reject a PUT of length bytes if it does not fit """
+        entry = self._get(uri_path(uri))
+        needed = length - (entry is not None and entry[1] or 0)
+        if needed <= 0:
+            return
+        try:
+            st = os.statvfs(self.directory)
+        except OSError:
+            return
+        if needed > st.f_bavail * st.f_frsize:
+            log.info('put: %d bytes for %s exceed the free space' %
+                     (length, uri))
+            raise DAV_Error(507)
+
+    def put(self, uri, data, content_type=None):
+        """ store the content as blob and point uri to it """
+        path = uri_path(uri)
+        try:
+            tmp, hash, size = self.blobs.write(data)
+        except OSError as ex:
+            log.info('put: Could not store %s, %r', uri, ex)
+            raise DAV_Error(424)
+
+        unused = None
+        db = self._db()
+        try:
+            with self._write_lock:
+                with db:
+                    self._check_parent(path)
+                    entry = self._get(path)
+                    if entry is not None and entry[0] is None:
+                        raise DAV_Error(405)
+                    if entry is not None and entry[0] == hash:
+                        log.info('put: %s is unchanged' % uri)
+                        return None
+
+                    self._ref(db, hash, size, tmp)
+                    tmp = None
+                    ctime = entry is not None and entry[3] or time.time()
+                    db.execute('INSERT OR REPLACE INTO entries VALUES '
+                               '(?, ?, ?, ?, ?, ?)',
+                               (path, _parent(path), hash, size,
+                                time.time_ns(), ctime))
+                    if entry is not None and self._unref(db, entry[0]):
+                        unused = entry[0]
+                    self._touch(db, path)
+                if unused is not None:
+                    self.blobs.remove(unused)
+        finally:
+            if tmp is not None:
+                os.unlink(tmp)
+
+        if entry is None and self.properties is not None:
+            # left behind by a resource removed before
+            self.properties.delete(path)
+        log.info('put: Stored %s as %s' % (uri, hash))
+        return None
+
+    ###
+    ### Methods for DAV properties
+    ###
+
+    def _get_dav_resourcetype(self, uri):
+        """ return type of object """
+        if self._entry(uri)[0] is None:
+            return COLLECTION
+        return OBJECT
+
+    def _get_dav_displayname(self, uri):
+        raise DAV_Secret    # do not show
+
+    def _get_dav_getcontentlength(self, uri):
+        """ return the content length of an object """
+        return str(self._entry(uri)[1])
+
+    def _get_dav_getcontenttype(self, uri):
+        """ return the type of the name or of the content """
+        blob = self._entry(uri)[0]
+        if blob is None:
+            return "httpd/unix-directory"
+        if self.mimecheck is False:
+            return 'application/octet-stream'
+        path = uri_path(uri)
+        content_type = self.mimetypes.by_name(path)
+        if content_type is None:
+            blob_path = self.blobs.path(blob)
+            try:
+                st = os.stat(blob_path)
+            except OSError:
+                raise DAV_NotFound
+            content_type = self.mimetypes.resolve(blob_path, st)
+        return content_type
+
+    def _get_dav_getetag(self, uri):
+        """ return the hash of the content (or the modification time
+        of collections) """
+        blob, size, mtime_ns = self._entry(uri)[:3]
+        if blob is None:
+            return '"%x"' % mtime_ns
+        return '"%s"' % blob
+
+    def _get_dav_quota_used_bytes(self, uri):
+        """ return the bytes of the files below a collection (counting
+        each path) """
+        path = uri_path(uri)
+        blob, size = self._entry(uri)[:2]
+        if blob is not None:
+            # only defined for collections (RFC 4331)
+            raise DAV_NotFound
+        prefix = path.rstrip('/') + '/'
+        used, = self._db().execute(
+            'SELECT total(size) FROM entries WHERE substr(path, 1, ?) = ?',
+            (len(prefix), prefix)).fetchone()
+        return str(int(used))
+
+    def _get_dav_quota_available_bytes(self, uri):
+        """ return the free space of the blob store """
+        if self._entry(uri)[0] is not None:
+            raise DAV_NotFound
+        st = os.statvfs(self.directory)
+        return str(st.f_bavail * st.f_frsize)
+
+    def get_lastmodified(self, uri):
+        """ return the last modified date of the object """
+        return self._entry(uri)[2] / 1e9
+
+    def get_creationdate(self, uri):
+        """ return the creation date of the object """
+        return self._entry(uri)[3]
+
+    def get_dead_props(self, uris):
+        """ return the dead properties of uris from the property store """
+        if self.properties is None:
+            return {}
+        paths = dict((uri_path(uri), uri) for uri in uris)
+        return dict((paths[path], props) for path, props in
+                    self.properties.get_many(paths).items())
+
+    def proppatch(self, uri, changes):
+        """ change the dead properties of uri in the property store """
+        if self.properties is None:
+            raise DAV_Forbidden
+        self._entry(uri)
+        self.properties.update(uri_path(uri), changes)
+
+    ###
+    ### MKCOL, DELETE, COPY and MOVE
+    ###
+
+    def mkcol(self, uri):
+        """ create a new collection """
+        path = uri_path(uri)
+        db = self._db()
+        with self._write_lock, db:
+            if self._get(path) is not None:
+                raise DAV_Error(405)
+            self._check_parent(path)
+            now = time.time_ns()
+            db.execute('INSERT INTO entries VALUES (?, ?, NULL, 0, ?, ?)',
+                       (path, _parent(path), now, now / 1e9))
+            self._touch(db, path)
+        if self.properties is not None:
+            self.properties.delete(path, tree=True)
+        log.info('mkcol: Created new collection %s' % uri)
+        return 201
+
+    def rmcol(self, uri):
+        """ delete a collection (and what is left below it) """
+        path = uri_path(uri)
+        if path == '/':
+            raise DAV_Forbidden
+        prefix = path + '/'
+        unused = []
+        db = self._db()
+        with self._write_lock:
+            with db:
+                if self._get(path) is None:
+                    raise DAV_NotFound
+                below = ('path = ? OR substr(path, 1, ?) = ?',
+                         (path, len(prefix), prefix))
+                for hash, count in db.execute(
+                        'SELECT blob, count(*) FROM entries WHERE '
+                        'blob IS NOT NULL AND (%s) GROUP BY blob' % below[0],
+                        below[1]).fetchall():
+                    if self._unref(db, hash, count):
+                        unused.append(hash)
+                db.execute('DELETE FROM entries WHERE %s' % below[0],
+                           below[1])
+                self._touch(db, path)
+            for hash in unused:
+                self.blobs.remove(hash)
+        if self.properties is not None:
+            self.properties.delete(path, tree=True)
+        return 204
+
+    def rm(self, uri):
+        """ delete a normal resource """
+        path = uri_path(uri)
+        unused = False
+        db = self._db()
+        with self._write_lock:
+            with db:
+                entry = self._get(path)
+                if entry is None:
+                    raise DAV_NotFound
+                db.execute('DELETE FROM entries WHERE path = ?', (path,))
+                if entry[0] is not None:
+                    unused = self._unref(db, entry[0])
+                self._touch(db, path)
+            if unused:
+                self.blobs.remove(entry[0])
+        if self.properties is not None:
+            self.properties.delete(path)
+        return 204
+
+    def delone(self, uri):
+        """ delete a single resource """
+        return delone(self, uri)
+
+    def deltree(self, uri):
+        """ delete a collection """
+        return deltree(self, uri)
+
+    def moveone(self, src, dst, overwrite):
+        """ move one resource with Depth=0 """
+        return moveone(self, src, dst, overwrite)
+
+    def movetree(self, src, dst, overwrite):
+        """ move a collection with Depth=infinity """
+        return movetree(self, src, dst, overwrite)
+
+    def copyone(self, src, dst, overwrite):
+        """ copy one resource with Depth=0 """
+        return copyone(self, src, dst, overwrite)
+
+    def copytree(self, src, dst, overwrite):
+        """ copy a collection with Depth=infinity """
+        return copytree(self, src, dst, overwrite)
+
+    def copy(self, src, dst):
+        """ copy a file by referring to its blob again """
+        path = uri_path(dst)
+        db = self._db()
+        with self._write_lock, db:
+            blob, size = self._entry(src)[:2]
+            self._check_parent(path)
+            self._ref(db, blob, size)
+            now = time.time_ns()
+            db.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                       (path, _parent(path), blob, size, now, now / 1e9))
+            self._touch(db, path)
+        if self.properties is not None:
+            self.properties.copy(uri_path(src), path)
+
+    def copycol(self, src, dst):
+        """ create the collection dst with the dead properties of src
+
+        The members are copied one by one by davcmd.
+        """
+        res = self.mkcol(dst)
+        if self.properties is not None:
+            self.properties.copy(uri_path(src), uri_path(dst))
+        return res
@@ -25,6 +25,7 @@ This is an example implementation of a DAVserver using the DAV package.
 import logging
 
 from pywebdav.lib.WebDAVServer import DAVRequestHandler
+from pywebdav.lib.digest import make_ha1
 from pywebdav.lib.dbconn import Mconn
 
 from .fshandler import FilesystemHandler
@@ -42,6 +43,10 @@ class DAVAuthHandler(DAVRequestHandler):
     # ex.: IFACE_CLASS = FilesystemHandler('/tmp', 'http://localhost/')
     verbose = False
 
+    # optional HtpasswdFile with hashed credentials
+    # ex.: PASSWORD_FILE = HtpasswdFile('/etc/pywebdav.htpasswd')
+    PASSWORD_FILE = None
+
     def _log(self, message):
         if self.verbose:
             log.info(message)
@@ -49,10 +54,28 @@ class DAVAuthHandler(DAVRequestHandler):
     def get_userinfo(self,user,pw,command):
         """ authenticate user """
 
-        if user == self._config.DAV.user and pw == self._config.DAV.password:
+        if self.PASSWORD_FILE is not None:
+            if self.PASSWORD_FILE.verify(user, pw):
+                log.info('Successfully authenticated user %s' % user)
+                return 1
+
+        elif user == self.settings.user and pw == self.settings.password:
             log.info('Successfully authenticated user %s' % user)
             return 1
 
         log.info('Authentication failed for user %s' % user)
         return 0
 
+    def get_digest_ha1(self, user, realm, algorithm, command):
+        """ return the digest credentials of the user """
+
+        if self.PASSWORD_FILE is not None:
+            # hashed passwords can not be used for digest authentication
+            log.info('Digest authentication unavailable with password file')
+            return None
+
+        if user == self.settings.user:
+            return make_ha1(algorithm, user, realm, self.settings.password)
+
+        log.info('Authentication failed for user %s' % user)
+        return None
@@ -0,0 +1,285 @@
+"""
+    Cache of open files for GET
+
+    Many clients fetch the same few small files (configuration files,
+    icons) over and over again. Without a cache every GET of such a
+    file checks its existence and type, asks for its size and opens,
+    reads and closes it.
+
+    The FileCache keeps the most recently served files open, by path.
+    An entry is valid as long as the inode, size and modification time
+    of the path are those of the open file, which costs one stat() per
+    request. When the directory is watched for changes (see watcher.py)
+    the cache is trusted and entries are only dropped on changes, thus
+    hot files are served without any system call but the reads.
+
+    Open files are shared by concurrent requests, which read with
+    os.pread() at their own offsets. Files evicted from the cache are
+    closed when the last request reading them is done. The content of
+    files up to small_size bytes is kept in memory (up to max_bytes in
+    total) and the file itself is closed.
+
+    Files of mmap_size bytes and more are memory mapped instead, for
+    clients which read small ranges all over large files (disk images,
+    databases). Ranges are served as memoryview slices of the mapping
+    without copying, the kernel is told to read ahead only what is
+    requested. A mapped file must not be truncated: reading the lost
+    pages kills the server (SIGBUS). The FilesystemHandler never writes
+    to an existing file but replaces it by a new one (see
+    FilesystemHandler._replace), other programs changing the served
+    files must do the same.
+
+"""
+
+import logging
+import mmap
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 128 * 1000
+
+# reads of mapped files announced to the kernel from this size on
+WILLNEED_SIZE = 64 * 1024
+
+_MADV_WILLNEED = getattr(mmap, 'MADV_WILLNEED', None)
+_MADV_RANDOM = getattr(mmap, 'MADV_RANDOM', None)
+
+
+def _key(st):
+    return (st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns)
+
+
+class OpenFile:
+    """ a file opened by the FileCache
+
+    st is the stat result of the open file, content the whole
+    content of small files and map the mmap of large files (then the
+    file is closed).
+    """
+
+    def __init__(self, path, fd, st, content=None, map=None):
+        self.path = path
+        self.fd = fd
+        self.st = st
+        self.key = _key(st)
+        self.content = content
+        self.map = map
+        # requests reading the file, the cache holds one reference
+        self.refs = 1
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.refs += 1
+
+    def release(self):
+        with self._lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            fd, self.fd = self.fd, None
+            map, self.map = self.map, None
+        if fd is not None:
+            os.close(fd)
+        if map is not None:
+            try:
+                map.close()
+            except BufferError:
+                # a slice is still referenced, the mapping goes with it
+                pass
+
+    def read(self, offset, length):
+        """ return up to length bytes at offset
+
+        The bytes of mapped files are a memoryview of the mapping.
+        """
+        if self.content is not None:
+            return self.content[offset:offset + length]
+        if self.map is not None:
+            end = min(offset + length, self.st.st_size)
+            if end <= offset:
+                return b''
+            if _MADV_WILLNEED is not None and \
+                    end - offset >= WILLNEED_SIZE:
+                # the kernel reads the whole range at once
+                start = offset - offset % mmap.PAGESIZE
+                self.map.madvise(_MADV_WILLNEED, start, end - start)
+            return memoryview(self.map)[offset:end]
+        return os.pread(self.fd, length, offset)
+
+
+class CachedResource:
+    """ the content (or a range) of an OpenFile for get_data()
+
+    The file is released when the content has been iterated over or
+    the resource is closed.
+    """
+
+    def __init__(self, file, offset, length):
+        self.file = file
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        try:
+            offset = self.offset
+            end = self.offset + self.length
+            while offset < end:
+                data = self.file.read(offset, min(BUFFER_SIZE, end - offset))
+                if not data:
+                    break
+                offset += len(data)
+                yield data
+        finally:
+            self.close()
+
+    def read(self, length=0):
+        if length == 0:
+            length = self.length
+        data = bytes(self.file.read(self.offset, min(length, self.length)))
+        self.offset += len(data)
+        self.length -= len(data)
+        return data
+
+    def close(self):
+        file, self.file = self.file, None
+        if file is not None:
+            file.release()
+
+
+class FileCache:
+    """ LRU cache of up to max_files open files """
+
+    def __init__(self, max_files=256, small_size=64 * 1024,
+                 max_bytes=32 * 1024 * 1024, mmap_size=0):
+        self.max_files = max_files
+        self.small_size = small_size
+        self.max_bytes = max_bytes
+        # map files from this size on, 0 for never
+        self.mmap_size = mmap_size
+        # entries are only dropped on changes reported by a watcher
+        self.trusted = False
+
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def open(self, path):
+        """ return the acquired OpenFile of the regular file path
+
+        Raises OSError if path can not be opened (FileNotFoundError if
+        it does not exist) and IsADirectoryError if it is no regular
+        file. The caller has to release() the file.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and self.trusted:
+                self._entries.move_to_end(path)
+                entry.acquire()
+                self.hits += 1
+                return entry
+
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise IsADirectoryError(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry.key == _key(st):
+                    self._entries.move_to_end(path)
+                    entry.acquire()
+                    self.hits += 1
+                    return entry
+                self._remove(path)
+            self.misses += 1
+
+        entry = self._open(path)
+        entry.acquire()
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+            self._entries[path] = entry
+            if entry.content is not None:
+                self.size += len(entry.content)
+            while self._entries and (len(self._entries) > self.max_files or
+                                     self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def _open(self, path):
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            # the stat of what has been opened, path may have changed
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode):
+                raise IsADirectoryError(path)
+            if self.mmap_size and st.st_size >= self.mmap_size:
+                return self._map(path, fd, st)
+            if st.st_size > self.small_size:
+                return OpenFile(path, fd, st)
+            content = os.pread(fd, st.st_size, 0)
+            if len(content) != st.st_size:
+                # changed while reading
+                return OpenFile(path, fd, st)
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+        return OpenFile(path, None, st, content)
+
+    def _map(self, path, fd, st):
+        """ return an OpenFile of the mapping of fd and close fd """
+        try:
+            map = mmap.mmap(fd, st.st_size, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as ex:
+            log.info('Can not map %s: %s' % (path, ex))
+            return OpenFile(path, fd, st)
+        os.close(fd)
+        if _MADV_RANDOM is not None:
+            # read ahead only what read() asks for
+            try:
+                map.madvise(_MADV_RANDOM)
+            except OSError:
+                pass
+        return OpenFile(path, None, st, map=map)
+
+    def stat(self, path):
+        """ return the stat result of a trusted entry of path or None """
+        if not self.trusted:
+            return None
+        entry = self._entries.get(path)
+        return entry is not None and entry.st or None
+
+    def _remove(self, path):
+        entry = self._entries.pop(path)
+        if entry.content is not None:
+            self.size -= len(entry.content)
+        entry.release()
+
+    def invalidate(self, path=None):
+        """ drop the entries of path and below, all for None """
+        with self._lock:
+            if path is None:
+                paths = list(self._entries)
+            else:
+                prefix = path.rstrip(os.sep) + os.sep
+                paths = [p for p in self._entries
+                         if p == path or p.startswith(prefix)]
+            for p in paths:
+                self._remove(p)
+
+    def distrust(self):
+        """ validate entries again, the watcher missed changes """
+        self.trusted = False
+        self.invalidate()
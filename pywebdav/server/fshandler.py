@@ -1,28 +1,49 @@
 import os
-import textwrap
+import stat
 import logging
+import secrets
+import threading
 import types
 import shutil
-from io import StringIO
-import urllib.parse
+from collections import OrderedDict
 from pywebdav.lib.constants import COLLECTION, OBJECT
-from pywebdav.lib.errors import DAV_Error, DAV_Forbidden, DAV_NotFound, DAV_Requested_Range_Not_Satisfiable, DAV_Secret
+from pywebdav.lib.errors import DAV_Error, DAV_Forbidden, DAV_NotFound, DAV_Secret
 from pywebdav.lib.iface import dav_interface
 from pywebdav.lib.davcmd import copyone, copytree, moveone, movetree, delone, deltree
-from html import escape
+from pywebdav.lib.urimap import uri_path, uri_prefix, child_uri
+from pywebdav.lib.mimetype import MimeTypeResolver
+from pywebdav.lib.utils import range_bounds
+from pywebdav.server.listing import DirectoryLister
+from pywebdav.server.filecache import CachedResource
 
 log = logging.getLogger(__name__)
 
 BUFFER_SIZE = 128 * 1000
-# include magic support to correctly determine mimetypes
-MAGIC_AVAILABLE = False
-try:
-    import mimetypes
-    MAGIC_AVAILABLE = True
-    log.info('Mimetype support ENABLED')
-except ImportError:
-    log.info('Mimetype support DISABLED')
-    pass
+
+# paths whose last change is remembered, see path_changed
+MAX_CHANGES = 65536
+
+# names of the temporary files new content is written to before it
+# replaces a file, they are no members of their collection
+TEMP_PREFIX = '.~dav-'
+
+
+def make_etag(st):
+    """ return the entity tag for the stat result of a file """
+    return '"%x-%x-%x"' % (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def copy_attributes(src, dst):
+    """ give the file dst the permissions and extended attributes of src """
+    shutil.copymode(src, dst)
+    if not hasattr(os, 'listxattr'):
+        return
+    try:
+        for name in os.listxattr(src):
+            os.setxattr(dst, name, os.getxattr(src, name))
+    except OSError as ex:
+        log.info('Could not copy the attributes of %s: %s' % (src, ex))
+
 
 class Resource:
     # XXX this class is ugly
@@ -34,12 +55,13 @@ class Resource:
         return self.__file_size
 
     def __iter__(self):
-        while 1:
-            data = self.__fp.read(BUFFER_SIZE)
+        left = self.__file_size
+        while left > 0:
+            data = self.__fp.read(min(BUFFER_SIZE, left))
             if not data:
                 break
+            left -= len(data)
             yield data
-            time.sleep(0.005)
         self.__fp.close()
 
     def read(self, length = 0):
@@ -49,6 +71,9 @@ class Resource:
         data = self.__fp.read(length)
         return data
 
+    def close(self):
+        self.__fp.close()
+
 
 class FilesystemHandler(dav_interface):
     """
@@ -64,9 +89,31 @@ class FilesystemHandler(dav_interface):
 
     """
 
+    # determine content types (set to False to serve everything
+    # as application/octet-stream)
+    mimecheck = True
+
+    # UsageCounter for the quota properties, see quota.py
+    usage = None
+
+    # PropertyStore for dead properties, see deadprops.py
+    properties = None
+
+    # FileCache of open files for GET, see filecache.py
+    files = None
+
     def __init__(self, directory, uri, verbose=False):
         self.setDirectory(directory)
         self.setBaseURI(uri)
+        self.mimetypes = MimeTypeResolver()
+        self.listing = DirectoryLister()
+
+        # the numbers of the last changes of local paths, made through
+        # the server or reported by the watcher, see path_changed
+        self._changes = OrderedDict()
+        self._change = 0
+        self._floor = 0
+        self._changes_lock = threading.Lock()
 
         # should we be verbose?
         self.verbose = verbose
@@ -78,77 +125,93 @@ class FilesystemHandler(dav_interface):
         if not os.path.isdir(path):
             raise Exception('%s not must be a directory!' % path)
 
-        self.directory = path
+        self.directory = os.path.normpath(path)
 
     def setBaseURI(self, uri):
         """ Sets the base uri """
 
         self.baseuri = uri
+        self._baseprefix = uri_prefix(uri)
 
     def uri2local(self,uri):
         """ map uri in baseuri and local part """
-        uparts=urllib.parse.urlparse(uri)
-        fileloc=uparts[2][1:]
-        filename=os.path.join(self.directory, fileloc)
-        filename=os.path.normpath(filename)
-        return filename
+        path=uri_path(uri)
+        if path == '/':
+            return self.directory
+        if os.sep != '/':
+            path=path.replace('/', os.sep)
+        return self.directory + path
 
     def local2uri(self,filename):
         """ map local filename to self.baseuri """
 
-        pnum=len(self.directory.replace("\\","/").split("/"))
-        parts=filename.replace("\\","/").split("/")[pnum:]
-        sparts="/"+"/".join(parts)
-        uri=urllib.parse.urljoin(self.baseuri,sparts)
-        return uri
+        path=filename[len(self.directory):]
+        if os.sep != '/':
+            path=path.replace(os.sep, '/')
+        return self._baseprefix + (path or '/')
 
 
     def get_childs(self, uri, filter=None):
         """ return the child objects as self.baseuris for the given URI """
 
         fileloc=self.uri2local(uri)
-        filelist=[]
-
-        if os.path.exists(fileloc):
-            if os.path.isdir(fileloc):
-                try:
-                    files=os.listdir(fileloc)
-                except:
-                    raise DAV_NotFound
 
-                for file in files:
-                    newloc=os.path.join(fileloc,file)
-                    filelist.append(self.local2uri(newloc))
+        try:
+            files=os.listdir(fileloc)
+        except NotADirectoryError:
+            return []
+        except FileNotFoundError:
+            return []
+        except OSError:
+            raise DAV_NotFound
 
-                log.info('get_childs: Childs %s' % filelist)
+        filelist=[child_uri(uri, file) for file in files
+                  if not file.startswith(TEMP_PREFIX)]
+        log.debug('get_childs: Childs %s', filelist)
 
         return filelist
 
-    def _get_listing(self, path):
-        """Return a directory listing similar to http.server's"""
-
-        template = textwrap.dedent("""
-            <html>
-                <head><title>Directory listing for {path}</title></head>
-                <body>
-                    <h1>Directory listing for {path}</h1>
-                    <hr>
-                    <ul>
-                    {items}
-                    </ul>
-                    <hr>
-                </body>
-            </html>
-            """)
-        escapeditems = (escape(i) + ('/' if os.path.isdir(os.path.join(path, i)) else '') for i in os.listdir(path) if not i.startswith('.'))
-        htmlitems = "\n".join('<li><a href="{i}">{i}</a></li>'.format(i=i) for i in escapeditems)
-
-        return template.format(items=htmlitems, path=path)
+    def compile_filter(self, filter):
+        """ REPORT filters are not supported, all resources match """
+        return None
+
+    def _get_listing(self, path, uri):
+        """ return a (paged) HTML listing of the directory path """
+        return self.listing.listing(path, uri_path(uri), uri.partition('?')[2],
+                                    self.get_collection_version(uri))
+
+    def _get_cached_data(self, uri, path, range):
+        """ return the content of a file from the file cache """
+        try:
+            file = self.files.open(path)
+        except IsADirectoryError:
+            return None
+        except OSError:
+            raise DAV_NotFound
+
+        try:
+            offset, end = range_bounds(range, file.st.st_size)
+            if file.content is not None:
+                # small files are served from memory, the slice is a
+                # copy and the file is not needed any further
+                content = file.content[offset:end]
+                file.release()
+                return content
+        except BaseException:
+            file.release()
+            raise
+        log.debug('Serving cached file %s' % uri)
+        return CachedResource(file, offset, end - offset)
 
     def get_data(self,uri, range = None):
         """ return the content of an object """
 
         path=self.uri2local(uri)
+        if self.files is not None:
+            data = self._get_cached_data(uri, path, range)
+            if data is not None:
+                return data
+
         if os.path.exists(path):
             if os.path.isfile(path):
                 file_size = os.path.getsize(path)
@@ -157,29 +220,13 @@ class FilesystemHandler(dav_interface):
                     log.info('Serving content of %s' % uri)
                     return Resource(fp, file_size)
                 else:
-                    if range[1] == '':
-                        range[1] = file_size
-                    else:
-                        range[1] = int(range[1])
-
-                    if range[0] == '':
-                        range[0] = file_size - range[1]
-                    else:
-                        range[0] = int(range[0])
-
-                    if range[0] > file_size:
-                        raise DAV_Requested_Range_Not_Satisfiable
-
-                    if range[1] > file_size:
-                        range[1] = file_size
-
+                    first, end = range_bounds(range, file_size)
                     fp=open(path,"rb")
-                    fp.seek(range[0])
-                    log.info('Serving range %s -> %s content of %s' % (range[0], range[1], uri))
-                    return Resource(fp, range[1] - range[0])
+                    fp.seek(first)
+                    log.info('Serving range %s -> %s content of %s' % (first, end, uri))
+                    return Resource(fp, end - first)
             elif os.path.isdir(path):
-                msg = self._get_listing(path)
-                return Resource(StringIO(msg), len(msg))
+                return self._get_listing(path, uri)
             else:
                 # also raise an error for collections
                 # don't know what should happen then..
@@ -201,25 +248,59 @@ class FilesystemHandler(dav_interface):
     def _get_dav_displayname(self,uri):
         raise DAV_Secret    # do not show
 
+    def _stat(self, path):
+        """ return os.stat(path), from the file cache if it is trusted """
+        st=self.files is not None and self.files.stat(path)
+        return st or os.stat(path)
+
+    def _forget(self, path):
+        """ drop path (and what is below it) from the file cache """
+        self.path_changed(path)
+        if self.files is not None:
+            self.files.invalidate(path)
+
+    def path_changed(self, path):
+        """ note a change of the local path (None for everything)
+
+        The versions of path and of its parent directory change, as
+        the size or date of a member is not reflected by the stat()
+        of its directory. Each change gets a new number. Only the last
+        MAX_CHANGES paths keep theirs, the others share the number of
+        the last change forgotten, which is newer than any number they
+        had (thus no version comes back after a change).
+        """
+        with self._changes_lock:
+            self._change += 1
+            if path is None:
+                self._floor = self._change
+                self._changes.clear()
+                return
+            for p in (path, os.path.dirname(path)):
+                self._changes[p] = self._change
+                self._changes.move_to_end(p)
+            while len(self._changes) > MAX_CHANGES:
+                self._floor = self._changes.popitem(last=False)[1]
+
     def _get_dav_getcontentlength(self,uri):
         """ return the content length of an object """
         path=self.uri2local(uri)
-        if os.path.exists(path):
-            if os.path.isfile(path):
-                s=os.stat(path)
-                return str(s[6])
+        try:
+            s=self._stat(path)
+        except OSError:
+            return '0'
+        if stat.S_ISREG(s.st_mode):
+            return str(s[6])
 
         return '0'
 
     def get_lastmodified(self,uri):
         """ return the last modified date of the object """
         path=self.uri2local(uri)
-        if os.path.exists(path):
-            s=os.stat(path)
-            date=s[8]
-            return date
-
-        raise DAV_NotFound
+        try:
+            s=self._stat(path)
+        except OSError:
+            raise DAV_NotFound
+        return s[8]
 
     def get_creationdate(self,uri):
         """ return the creation date of the object """
@@ -235,44 +316,178 @@ class FilesystemHandler(dav_interface):
         """ find out yourself! """
 
         path=self.uri2local(uri)
-        if os.path.exists(path):
-            if os.path.isfile(path):
-                if MAGIC_AVAILABLE is False \
-                        or self.mimecheck is False:
-                    return 'application/octet-stream'
-                else:
-                    ret, encoding = mimetypes.guess_type(path)
-
-                    # for non mimetype related result we
-                    # simply return an appropriate type
-                    if ret.find('/')==-1:
-                        if ret.find('text')>=0:
-                            return 'text/plain'
-                        else:
-                            return 'application/octet-stream'
-                    else:
-                        return ret
+        try:
+            st=self._stat(path)
+        except OSError:
+            raise DAV_NotFound('Could not find %s' % path)
 
-            elif os.path.isdir(path):
-                return "httpd/unix-directory"
+        if stat.S_ISREG(st.st_mode):
+            if self.mimecheck is False:
+                return 'application/octet-stream'
+            return self.mimetypes.resolve(path, st)
+
+        elif stat.S_ISDIR(st.st_mode):
+            return "httpd/unix-directory"
 
         raise DAV_NotFound('Could not find %s' % path)
 
+    def _file_size(self, path):
+        """ return the size of the file path or 0 """
+        try:
+            st=os.stat(path)
+        except OSError:
+            return 0
+        return stat.S_ISREG(st.st_mode) and st.st_size or 0
+
+    def _get_dav_quota_used_bytes(self, uri):
+        """ return the bytes used below a collection """
+        path=self.uri2local(uri)
+        if not os.path.isdir(path):
+            # only defined for collections (RFC 4331)
+            raise DAV_NotFound
+        if self.usage is None or not self.usage.ready:
+            raise DAV_NotFound
+        return str(self.usage.used(uri_path(uri)))
+
+    def _get_dav_quota_available_bytes(self, uri):
+        """ return the bytes which can still be stored in a collection """
+        path=self.uri2local(uri)
+        if not os.path.isdir(path):
+            raise DAV_NotFound
+        if self.usage is None:
+            st=os.statvfs(path)
+            return str(st.f_bavail * st.f_frsize)
+        return str(self.usage.available(uri_path(uri)))
+
+    def _tree_size(self, uri):
+        """ return the bytes of the file uri or of the files below it """
+        path=self.uri2local(uri)
+        if not os.path.isdir(path):
+            return self._file_size(path)
+        if self.usage is not None and self.usage.ready:
+            return self.usage.used(uri_path(uri))
+        total=0
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                total+=self._file_size(os.path.join(root, name))
+        return total
+
+    def _room(self, uri, moved=None):
+        """ return the bytes which may be stored at uri or None """
+        path=self.uri2local(uri)
+        parent=os.path.dirname(path)
+        if self.usage is not None:
+            available=self.usage.available(
+                uri_path(self.local2uri(parent)), moved)
+        else:
+            try:
+                st=os.statvfs(parent)
+            except OSError:
+                return None
+            available=st.f_bavail * st.f_frsize
+        # the file replaced by the new one
+        return available + self._file_size(path)
+
+    def check_quota(self, uri, length, moved=None):
+        """ reject length bytes for uri if they do not fit
+
+        Called before the body of a PUT is read and before COPY and
+        MOVE. moved is the source of a MOVE, its bytes are counted in
+        the collections containing it already.
+        """
+        room=self._room(uri, moved and uri_path(moved))
+        if room is not None and length > room:
+            log.info('%d bytes for %s exceed the quota' % (length, uri))
+            raise DAV_Error(507)
+
+    def get_dead_props(self, uris):
+        """ return the dead properties of uris from the property store """
+        if self.properties is None:
+            return {}
+        paths = dict((uri_path(uri), uri) for uri in uris)
+        return dict((paths[path], props) for path, props in
+                    self.properties.get_many(paths).items())
+
+    def proppatch(self, uri, changes):
+        """ change the dead properties of uri in the property store """
+        if self.properties is None:
+            raise DAV_Forbidden
+        if not os.path.exists(self.uri2local(uri)):
+            raise DAV_NotFound
+        self.properties.update(uri_path(uri), changes)
+
+    def _get_dav_getetag(self, uri):
+        """ return an entity tag made of inode, size and mtime """
+        path=self.uri2local(uri)
+        try:
+            st=self._stat(path)
+        except OSError:
+            raise DAV_NotFound
+        return make_etag(st)
+
+    def _replace(self, path, write, keep_attributes=True):
+        """ replace the file path by the one write(tmp) creates
+
+        The new content is written to a temporary file next to path
+        which is renamed over path when it is complete. Requests still
+        reading the old file (memory mappings of the file cache too)
+        keep its content and a failed write leaves it untouched. The
+        new file keeps the permissions and extended attributes of the
+        old one if keep_attributes is true.
+        """
+        tmp=os.path.join(os.path.dirname(path),
+                         TEMP_PREFIX + secrets.token_hex(8))
+        try:
+            write(tmp)
+            if keep_attributes and os.path.isfile(path):
+                copy_attributes(path, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
     def put(self, uri, data, content_type=None):
         """ put the object into the filesystem """
         path=self.uri2local(uri)
-        try:
-            with open(path, "bw+") as fp:
+        size=self._file_size(path)
+        existed=os.path.exists(path)
+        if self.properties is not None and not existed:
+            # left behind by a file removed outside of the server
+            self.properties.delete(uri_path(uri))
+        room=None
+        if isinstance(data, types.GeneratorType):
+            # the length of chunked uploads is not known in advance
+            room=self._room(uri)
+
+        def write(tmp):
+            with open(tmp, "xb") as fp:
                 if isinstance(data, types.GeneratorType):
+                    written=0
                     for d in data:
+                        written+=len(d)
+                        if room is not None and written > room:
+                            log.info('put: %s exceeds the quota' % uri)
+                            raise DAV_Error(507)
                         fp.write(d)
                 else:
                     if data:
                         fp.write(data)
+
+        try:
+            self._replace(path, write)
             log.info('put: Created %s' % uri)
+        except DAV_Error:
+            raise
         except Exception as e:
             log.info('put: Could not create %s, %r', uri, e)
             raise DAV_Error(424)
+        finally:
+            self._forget(path)
+            if self.usage is not None:
+                self.usage.add(uri_path(uri), self._file_size(path) - size)
 
         return None
 
@@ -296,6 +511,8 @@ class FilesystemHandler(dav_interface):
         try:
             os.mkdir(path)
             log.info('mkcol: Created new collection %s' % path)
+            if self.properties is not None:
+                self.properties.delete(uri_path(uri), tree=True)
             return 201
         except:
             log.info('mkcol: Creation of %s denied' % path)
@@ -314,6 +531,13 @@ class FilesystemHandler(dav_interface):
             shutil.rmtree(path)
         except OSError:
             raise DAV_Forbidden # forbidden
+        finally:
+            self._forget(path)
+            if not os.path.exists(path):
+                if self.usage is not None:
+                    self.usage.remove_tree(uri_path(uri))
+                if self.properties is not None:
+                    self.properties.delete(uri_path(uri), tree=True)
 
         return 204
 
@@ -323,11 +547,19 @@ class FilesystemHandler(dav_interface):
         if not os.path.exists(path):
             raise DAV_NotFound
 
+        size=self._file_size(path)
         try:
             os.unlink(path)
         except OSError as ex:
             log.info('rm: Forbidden (%s)' % ex)
             raise DAV_Forbidden # forbidden
+        finally:
+            self._forget(path)
+
+        if self.usage is not None:
+            self.usage.add(uri_path(uri), -size)
+        if self.properties is not None:
+            self.properties.delete(uri_path(uri))
 
         return 204
 
@@ -366,12 +598,14 @@ class FilesystemHandler(dav_interface):
         """ move one resource with Depth=0
         """
 
+        self.check_quota(dst, self._tree_size(src), moved=src)
         return moveone(self,src,dst,overwrite)
 
     def movetree(self,src,dst,overwrite):
         """ move a collection with Depth=infinity
         """
 
+        self.check_quota(dst, self._tree_size(src), moved=src)
         return movetree(self,src,dst,overwrite)
 
     ###
@@ -382,12 +616,14 @@ class FilesystemHandler(dav_interface):
         """ copy one resource with Depth=0
         """
 
+        self.check_quota(dst, self._file_size(self.uri2local(src)))
         return copyone(self,src,dst,overwrite)
 
     def copytree(self,src,dst,overwrite):
         """ copy a collection with Depth=infinity
         """
 
+        self.check_quota(dst, self._tree_size(src))
         return copytree(self,src,dst,overwrite)
 
     ###
@@ -403,22 +639,34 @@ class FilesystemHandler(dav_interface):
 
         srcfile=self.uri2local(src)
         dstfile=self.uri2local(dst)
+        size=self._file_size(dstfile)
         try:
-            shutil.copy(srcfile, dstfile)
+            # a copy over an existing file must not shorten it in place
+            self._replace(dstfile, lambda tmp: shutil.copy(srcfile, tmp),
+                          keep_attributes=False)
         except (OSError, IOError):
             log.info('copy: forbidden')
             raise DAV_Error(409)
+        finally:
+            self._forget(dstfile)
+            if self.usage is not None:
+                self.usage.add(uri_path(dst), self._file_size(dstfile) - size)
+
+        if self.properties is not None:
+            self.properties.copy(uri_path(src), uri_path(dst))
 
     def copycol(self, src, dst):
         """ copy a collection.
 
         As this is not recursive (the davserver recurses itself)
-        we will only create a new directory here. For some more
-        advanced systems we might also have to copy properties from
-        the source to the destination.
+        we will only create a new directory here and copy the dead
+        properties from the source to the destination.
         """
 
-        return self.mkcol(dst)
+        res = self.mkcol(dst)
+        if self.properties is not None:
+            self.properties.copy(uri_path(src), uri_path(dst))
+        return res
 
     def exists(self,uri):
         """ test if a resource exists """
@@ -427,6 +675,22 @@ class FilesystemHandler(dav_interface):
             return 1
         return None
 
+    def get_collection_version(self,uri):
+        """ return inode, modification time, size and last change
+
+        Adding, removing or renaming members changes the modification
+        time of a directory. Changes of the members themselves are
+        numbered by path_changed().
+        """
+        path=self.uri2local(uri)
+        try:
+            st = self._stat(path)
+        except OSError:
+            return None
+        with self._changes_lock:
+            change = self._changes.get(path, self._floor)
+        return (st.st_ino, st.st_mtime_ns, st.st_size, change)
+
     def is_collection(self,uri):
         """ test if the given uri is a collection """
         path=self.uri2local(uri)
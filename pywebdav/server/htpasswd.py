@@ -0,0 +1,230 @@
+"""
+    htpasswd style password file
+
+    Each line of the file holds one user in the form user:hash.
+    The following hash formats are understood:
+
+    $2a$, $2b$, $2y$          bcrypt (needs the bcrypt module)
+    $pbkdf2-sha256$...        PBKDF2 (passlib format, also sha1 and sha512)
+    $scrypt$ln=..,r=..,p=..$  scrypt (passlib format)
+
+    The file is reloaded when its modification time changes. A file
+    which can not be read or has malformed lines (e.g. one being
+    written) is ignored and the previous users are kept.
+
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+    log.info('No bcrypt support - bcrypt module missing...')
+
+# how often (in seconds) to check the password file for changes
+RELOAD_INTERVAL = 1.0
+
+
+def _ab64_decode(data):
+    """ decode the adapted base64 encoding used by passlib """
+    data = data.replace('.', '+')
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _ab64_encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=').replace('+', '.')
+
+
+def _b64_decode(data):
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _verify_pbkdf2(password, stored):
+    _, scheme, rounds, salt, checksum = stored.split('$')
+    digest = scheme[len('pbkdf2'):].lstrip('-') or 'sha1'
+    dk = hashlib.pbkdf2_hmac(digest, password.encode('utf-8'),
+                             _ab64_decode(salt), int(rounds))
+    return hmac.compare_digest(dk, _ab64_decode(checksum))
+
+
+def _verify_scrypt(password, stored):
+    _, _, params, salt, checksum = stored.split('$')
+    params = dict(p.split('=') for p in params.split(','))
+    n = 1 << int(params['ln'])
+    r = int(params['r'])
+    p = int(params['p'])
+    expected = _b64_decode(checksum)
+    dk = hashlib.scrypt(password.encode('utf-8'), salt=_b64_decode(salt),
+                        n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024,
+                        dklen=len(expected))
+    return hmac.compare_digest(dk, expected)
+
+
+def _verify_bcrypt(password, stored):
+    if bcrypt is None:
+        log.error('bcrypt hash found but bcrypt module is not installed')
+        return False
+    return bcrypt.checkpw(password.encode('utf-8'), stored.encode('ascii'))
+
+
+def check_hash(stored):
+    """ raise ValueError if stored is no complete hash of a known format """
+    if stored.startswith(('$2a$', '$2b$', '$2y$')):
+        # $2b$cost$ followed by 53 characters of salt and checksum
+        if len(stored) != 60:
+            raise ValueError('bcrypt hash of wrong length')
+    elif stored.startswith(('$pbkdf2', '$scrypt$')):
+        fields = stored.split('$')
+        if len(fields) != 5 or not all(fields[1:]):
+            raise ValueError('hash with missing fields')
+    else:
+        raise ValueError('unsupported hash format')
+
+
+def verify_password(password, stored):
+    """ check a password against a stored hash """
+    try:
+        if stored.startswith(('$2a$', '$2b$', '$2y$')):
+            return _verify_bcrypt(password, stored)
+        if stored.startswith('$pbkdf2'):
+            return _verify_pbkdf2(password, stored)
+        if stored.startswith('$scrypt$'):
+            return _verify_scrypt(password, stored)
+    except (ValueError, KeyError) as ex:
+        log.error('Malformed password hash: %s' % ex)
+        return False
+
+    log.error('Unsupported password hash format')
+    return False
+
+
+def make_password(password, scheme='pbkdf2-sha256', rounds=29000):
+    """ create a hash for the given password usable in a password file """
+    salt = os.urandom(16)
+    if scheme.startswith('pbkdf2'):
+        digest = scheme[len('pbkdf2'):].lstrip('-') or 'sha1'
+        dk = hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), salt,
+                                 rounds)
+        return '$%s$%d$%s$%s' % (scheme, rounds, _ab64_encode(salt),
+                                 _ab64_encode(dk))
+    if scheme == 'scrypt':
+        ln, r, p = 16, 8, 1
+        dk = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=1 << ln,
+                            r=r, p=p, maxmem=256 * (1 << ln) * r + 1024 * 1024,
+                            dklen=32)
+        return '$scrypt$ln=%d,r=%d,p=%d$%s$%s' % (
+            ln, r, p,
+            base64.b64encode(salt).decode('ascii').rstrip('='),
+            base64.b64encode(dk).decode('ascii').rstrip('='))
+    if scheme == 'bcrypt':
+        if bcrypt is None:
+            raise ValueError('bcrypt module is not installed')
+        return bcrypt.hashpw(password.encode('utf-8'),
+                             bcrypt.gensalt()).decode('ascii')
+
+    raise ValueError('Unknown password scheme %s' % scheme)
+
+
+class HtpasswdFile:
+    """ password file with hashed credentials
+
+    Successful verifications are remembered in the (optional)
+    CredentialCache, thus only the first request of a client
+    pays for the key derivation function.
+    """
+
+    def __init__(self, fileName, cache=None):
+        self.fileName = fileName
+        self.cache = cache
+        self._users = {}
+        self._mtime = None
+        self._checked = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """ (re)read the password file
+
+        Raises OSError if the file can not be read and ValueError if
+        it is not UTF-8 or has malformed lines.
+        """
+        users = {}
+        mtime = os.stat(self.fileName).st_mtime_ns
+        with open(self.fileName, 'r', encoding='utf-8') as fp:
+            for number, line in enumerate(fp, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                user, sep, stored = line.partition(':')
+                try:
+                    if not sep or not user:
+                        raise ValueError('no user:hash')
+                    check_hash(stored)
+                except ValueError as ex:
+                    raise ValueError('%s line %d: %s' %
+                                     (self.fileName, number, ex))
+                users[user] = stored
+
+        with self._lock:
+            self._users = users
+            self._mtime = mtime
+        log.info('Read %d users from %s' % (len(users), self.fileName))
+
+    def _check_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+
+        try:
+            mtime = os.stat(self.fileName).st_mtime_ns
+        except OSError as ex:
+            log.error('Could not stat password file: %s' % ex)
+            return
+
+        if mtime != self._mtime:
+            try:
+                self.reload()
+            except (OSError, UnicodeDecodeError, ValueError) as ex:
+                # replaced, missing or written for a moment, retry later
+                log.error('Could not reload password file, keeping the '
+                          'previous users: %s' % ex)
+
+    def verify(self, user, password):
+        """ return True if the password of the user is valid """
+        self._check_reload()
+
+        stored = self._users.get(user)
+        if stored is None:
+            return False
+
+        if self.cache is not None and self.cache.check(user, password, stored):
+            return True
+
+        if not verify_password(password, stored):
+            return False
+
+        if self.cache is not None:
+            self.cache.add(user, password, stored)
+        return True
+
+
+if __name__ == '__main__':
+    import getpass
+    import sys
+
+    if len(sys.argv) < 2:
+        print('Usage: %s username [scheme]' % sys.argv[0])
+        sys.exit(2)
+
+    scheme = len(sys.argv) > 2 and sys.argv[2] or 'pbkdf2-sha256'
+    print('%s:%s' % (sys.argv[1], make_password(getpass.getpass(), scheme)))
@@ -0,0 +1,380 @@
+"""
+    Filesystem handler backed by a persistent metadata index
+
+    For very large trees, walking the directory with get_childs and
+    calling stat for every property is the dominant cost of PROPFIND,
+    COPY and MOVE. The IndexedFilesystemHandler keeps the metadata of
+    all resources (type, size, times, ETag and content type) in a
+    SQLite database and answers get_childs, exists, is_collection and
+    the live properties from there.
+
+    The index is built by a scanner listing directories in parallel,
+    kept current by the modifications going through the handler and
+    (if a Watcher is used) by the changes reported by inotify. A
+    reconciliation pass rescans the tree at startup and periodically
+    to pick up everything else. An index kept from a previous run may
+    miss changes made while the server was down, thus all requests are
+    answered from the filesystem until the first pass is complete.
+
+"""
+
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pywebdav.lib.constants import COLLECTION, OBJECT
+from pywebdav.lib.urimap import uri_path, child_uri
+from pywebdav.server.fshandler import FilesystemHandler, make_etag, \
+    TEMP_PREFIX
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime REAL NOT NULL,
+    etag TEXT NOT NULL,
+    content_type TEXT,
+    seen INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# rows written per transaction while scanning
+BATCH_SIZE = 5000
+
+
+def _parent(path):
+    if path == '/':
+        return ''
+    return path.rsplit('/', 1)[0] or '/'
+
+
+class MetadataIndex:
+    """ SQLite table of the resources below a directory
+
+    Resources are stored by their resource path (see urimap), the
+    root collection is /.
+    """
+
+    def __init__(self, database, directory, content_type=None, workers=4):
+        self.database = database
+        self.directory = directory
+        # function returning the content type for a name (or None)
+        self.content_type = content_type
+        self.workers = workers
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+
+        db = self._db()
+        with self._write_lock, db:
+            db.executescript(SCHEMA)
+        row = db.execute("SELECT value FROM meta WHERE name = 'seen'").fetchone()
+        # number of the current scan, rows not seen by it are outdated
+        self.seen = row and int(row[0]) or 0
+        # set once the index has been reconciled with the filesystem
+        self.ready = False
+
+    def _db(self):
+        """ return the connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def local_path(self, path):
+        if path == '/':
+            return self.directory
+        return self.directory + path.replace('/', os.sep)
+
+    def _row(self, path, st):
+        is_dir = stat.S_ISDIR(st.st_mode)
+        content_type = None
+        if not is_dir and self.content_type is not None:
+            content_type = self.content_type(path)
+        return (path, _parent(path), is_dir, not is_dir and st.st_size or 0,
+                st.st_mtime_ns, st.st_ctime, make_etag(st), content_type,
+                self.seen)
+
+    def _write(self, rows):
+        db = self._db()
+        with self._write_lock, db:
+            db.executemany('INSERT OR REPLACE INTO entries VALUES '
+                           '(?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    ### lookups
+
+    def get(self, path):
+        """ return (is_dir, size, mtime_ns, ctime, etag, content_type) """
+        return self._db().execute(
+            'SELECT is_dir, size, mtime_ns, ctime, etag, content_type '
+            'FROM entries WHERE path = ?', (path,)).fetchone()
+
+    def children(self, path):
+        """ return the names of the members of a collection """
+        prefix = path.rstrip('/') + '/'
+        return [p[len(prefix):] for (p,) in self._db().execute(
+            'SELECT path FROM entries WHERE parent = ?', (path,))]
+
+    ### updates
+
+    def update(self, path):
+        """ re-read the metadata of path (and its members if new) """
+        try:
+            st = os.stat(self.local_path(path))
+        except OSError:
+            return self.remove(path)
+
+        known = self.get(path)
+        self._write([self._row(path, st)])
+        if stat.S_ISDIR(st.st_mode) and (known is None or not known[0]):
+            # a new collection, e.g. moved into the tree
+            self.scan(path, self.seen)
+
+    def remove(self, path):
+        """ remove path and everything below it """
+        db = self._db()
+        prefix = path.rstrip('/') + '/'
+        with self._write_lock, db:
+            db.execute('DELETE FROM entries WHERE path = ? OR '
+                       'substr(path, 1, ?) = ?', (path, len(prefix), prefix))
+
+    ### scanning
+
+    def _scan_dir(self, path):
+        """ list one directory, return its rows and subdirectories """
+        rows = []
+        dirs = []
+        local = self.local_path(path)
+        try:
+            with os.scandir(local) as it:
+                for entry in it:
+                    if entry.name.startswith(TEMP_PREFIX):
+                        # written by a PUT in progress
+                        continue
+                    try:
+                        st = entry.stat(follow_symlinks=True)
+                    except OSError:
+                        continue
+                    child = child_uri(path, entry.name)
+                    rows.append(self._row(child, st))
+                    if stat.S_ISDIR(st.st_mode):
+                        dirs.append((child, (st.st_dev, st.st_ino)))
+        except OSError as ex:
+            log.info('Could not scan %s: %s' % (local, ex))
+        return rows, dirs
+
+    def scan(self, path='/', seen=None):
+        """ (re)index the tree below path, listing directories in parallel """
+        if seen is not None:
+            self.seen = seen
+        start = time.monotonic()
+        try:
+            st = os.stat(self.local_path(path))
+        except OSError:
+            return self.remove(path)
+
+        rows = [self._row(path, st)]
+        count = 0
+        # symbolic links may create loops
+        visited = {(st.st_dev, st.st_ino)}
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque([pool.submit(self._scan_dir, path)])
+            while pending:
+                future = pending.popleft()
+                found, dirs = future.result()
+                rows.extend(found)
+                for child, key in dirs:
+                    if key not in visited:
+                        visited.add(key)
+                        pending.append(pool.submit(self._scan_dir, child))
+                if len(rows) >= BATCH_SIZE:
+                    count += len(rows)
+                    self._write(rows)
+                    rows = []
+        count += len(rows)
+        self._write(rows)
+        log.debug('Indexed %d entries below %s in %.1fs', count, path,
+                  time.monotonic() - start)
+
+    def reconcile(self):
+        """ rescan the whole tree and drop entries which are gone """
+        with self._scan_lock:
+            seen = self.seen + 1
+            self.scan('/', seen)
+            db = self._db()
+            with self._write_lock, db:
+                db.execute('DELETE FROM entries WHERE seen < ?', (seen,))
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('seen', ?)",
+                           (str(seen),))
+            self.ready = True
+        log.info('Metadata index of %s reconciled' % self.directory)
+
+    def run_reconciliation(self, interval):
+        """ reconcile now and every interval seconds """
+        def run():
+            try:
+                self.reconcile()
+            except Exception:
+                log.exception('Reconciliation of the index failed')
+            while interval > 0:
+                time.sleep(interval)
+                try:
+                    self.reconcile()
+                except Exception:
+                    log.exception('Reconciliation of the index failed')
+
+        thread = threading.Thread(target=run, name='index-reconciliation')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class IndexedFilesystemHandler(FilesystemHandler):
+    """ FilesystemHandler answering metadata queries from a MetadataIndex """
+
+    def __init__(self, directory, uri, verbose=False, database=None,
+                 workers=4):
+        FilesystemHandler.__init__(self, directory, uri, verbose)
+        # only the lookup by name, sniffing is left to the handler
+        self.index = MetadataIndex(database, self.directory,
+                                   lambda path: self.mimetypes.by_name(path),
+                                   workers)
+
+    def _entry(self, uri):
+        """ return the index row of uri or None if not known (yet) """
+        if not self.index.ready:
+            return None
+        path = uri_path(uri)
+        entry = self.index.get(path)
+        if entry is None and os.path.lexists(self.uri2local(uri)):
+            # created behind our back and not reported (yet)
+            self.index.update(path)
+            entry = self.index.get(path)
+        return entry
+
+    def index_changed(self, path):
+        """ update the index for a changed local path (None: all) """
+        if path is None:
+            threading.Thread(target=self.index.reconcile, daemon=True).start()
+        else:
+            self.index.update(uri_path(self.local2uri(path)))
+
+    ### lookups
+
+    def get_childs(self, uri, filter=None):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler.get_childs(self, uri, filter)
+        if not entry[0]:
+            return []
+        return [child_uri(uri, name)
+                for name in self.index.children(uri_path(uri))]
+
+    def exists(self, uri):
+        if self._entry(uri) is not None:
+            return 1
+        return FilesystemHandler.exists(self, uri)
+
+    def is_collection(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler.is_collection(self, uri)
+        return entry[0] and 1 or 0
+
+    def _get_dav_resourcetype(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler._get_dav_resourcetype(self, uri)
+        return entry[0] and COLLECTION or OBJECT
+
+    def _get_dav_getcontentlength(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler._get_dav_getcontentlength(self, uri)
+        return str(entry[1])
+
+    def get_lastmodified(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler.get_lastmodified(self, uri)
+        return entry[2] / 1e9
+
+    def get_creationdate(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler.get_creationdate(self, uri)
+        return entry[3]
+
+    def _get_dav_getetag(self, uri):
+        entry = self._entry(uri)
+        if entry is None:
+            return FilesystemHandler._get_dav_getetag(self, uri)
+        return entry[4]
+
+    def _get_dav_getcontenttype(self, uri):
+        entry = self._entry(uri)
+        if entry is not None:
+            if entry[0]:
+                return "httpd/unix-directory"
+            if self.mimecheck is False:
+                return 'application/octet-stream'
+            if entry[5]:
+                return entry[5]
+        return FilesystemHandler._get_dav_getcontenttype(self, uri)
+
+    ### modifications
+
+    def _changed(self, uri):
+        path = uri_path(uri)
+        self.index.update(path)
+        if path != '/':
+            self.index.update(_parent(path))
+
+    def put(self, uri, data, content_type=None):
+        try:
+            return FilesystemHandler.put(self, uri, data, content_type)
+        finally:
+            self._changed(uri)
+
+    def mkcol(self, uri):
+        try:
+            return FilesystemHandler.mkcol(self, uri)
+        finally:
+            self._changed(uri)
+
+    def rmcol(self, uri):
+        try:
+            return FilesystemHandler.rmcol(self, uri)
+        finally:
+            self._changed(uri)
+
+    def rm(self, uri):
+        try:
+            return FilesystemHandler.rm(self, uri)
+        finally:
+            self._changed(uri)
+
+    def copy(self, src, dst):
+        try:
+            return FilesystemHandler.copy(self, src, dst)
+        finally:
+            self._changed(dst)
@@ -0,0 +1,268 @@
+"""
+    HTML listings of directories
+
+    Listings are shown to browsers doing a GET on a collection. The
+    entries of a directory are read once with os.scandir and kept in a
+    LRU cache keyed by the version of the collection (see
+    get_collection_version of the handler), as are the rendered pages.
+    The query string selects a page and the sort order:
+
+        ?offset=0&limit=1000&sort=name|size|mtime&order=asc|desc
+
+    Pages are generated incrementally so that the first rows can be sent
+    before the last ones have been rendered.
+
+"""
+
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from html import escape
+
+log = logging.getLogger(__name__)
+
+# number of rows rendered into one chunk
+ROWS_PER_CHUNK = 256
+
+SORT_KEYS = {
+    'name': lambda e: e[0],
+    'size': lambda e: e[2],
+    'mtime': lambda e: e[3],
+}
+
+HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Directory listing for %(title)s</title>
+</head>
+<body>
+<h1>Directory listing for %(title)s</h1>
+<p>%(navigation)s</p>
+<hr>
+<table>
+<tr><th><a href="?sort=name&amp;order=%(order_name)s&amp;limit=%(limit)d">Name</a></th>\
+<th><a href="?sort=size&amp;order=%(order_size)s&amp;limit=%(limit)d">Size</a></th>\
+<th><a href="?sort=mtime&amp;order=%(order_mtime)s&amp;limit=%(limit)d">Modified</a></th></tr>
+"""
+
+ROW = """<tr><td><a href="%s">%s</a></td><td>%s</td><td>%s</td></tr>
+"""
+
+FOOTER = """</table>
+<hr>
+<p>%(navigation)s</p>
+</body>
+</html>
+"""
+
+
+def sort_entries(entries, sort='name', order='asc'):
+    """ sort a list of (name, is_dir, size, mtime) entries in place """
+    entries.sort(key=SORT_KEYS[sort], reverse=order == 'desc')
+    # collections first
+    entries.sort(key=lambda e: not e[1])
+    return entries
+
+
+class ListingResource:
+    """ a listing as returned by get_data
+
+    The length of a listing is not known before it has been rendered,
+    thus it can only be iterated (or read at once).
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def read(self, length=0):
+        return b''.join(self._chunks)
+
+
+class _Page:
+    """ render a page of a listing and store it in the cache when done """
+
+    def __init__(self, lister, key, entries, title, params):
+        self.lister = lister
+        self.key = key
+        self.entries = entries
+        self.title = title
+        self.params = params
+
+    def __iter__(self):
+        parts = []
+        for chunk in self.lister.render(self.entries, self.title,
+                                        **self.params):
+            parts.append(chunk)
+            yield chunk
+        self.lister._store(self.lister._pages, self.key, b''.join(parts))
+
+
+class DirectoryLister:
+    """ create (and cache) HTML listings of directories """
+
+    def __init__(self, cache_size=64, page_size=1000, ttl=None):
+        self.cache_size = cache_size
+        self.page_size = page_size
+        # maximum age of cached listings in seconds, None for no limit
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            entry = cache.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if self.ttl is not None and created + self.ttl < time.monotonic():
+                del cache[key]
+                return None
+            cache.move_to_end(key)
+            return value
+
+    def _store(self, cache, key, value):
+        with self._lock:
+            cache[key] = (value, time.monotonic())
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pages.clear()
+
+    def invalidate(self, path):
+        """ forget the listings showing the local path
+
+        These are the listing of path itself and the one of its
+        parent directory. None stands for all paths.
+        """
+        if path is None:
+            return self.clear()
+
+        paths = (path, os.path.dirname(path))
+        with self._lock:
+            for cache in (self._entries, self._pages):
+                for key in [k for k in cache if k[0] in paths]:
+                    del cache[key]
+
+    def parse_query(self, query):
+        """ return offset, limit, sort and order from a query string """
+        args = urllib.parse.parse_qs(query)
+
+        def arg(name, default):
+            return args.get(name, [default])[-1]
+
+        try:
+            offset = max(0, int(arg('offset', 0)))
+            limit = max(0, int(arg('limit', self.page_size)))
+        except ValueError:
+            offset, limit = 0, self.page_size
+
+        sort = arg('sort', 'name')
+        if sort not in SORT_KEYS:
+            sort = 'name'
+        order = arg('order', 'asc') == 'desc' and 'desc' or 'asc'
+        return offset, limit, sort, order
+
+    def scan(self, path):
+        """ return the entries (name, is_dir, size, mtime) of path """
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.name, is_dir,
+                                not is_dir and st.st_size or 0,
+                                st.st_mtime))
+        return entries
+
+    def listing(self, path, title, query='', version=None):
+        """ return a ListingResource for the directory path
+
+        title   -- the path of the URI, used as heading and for links
+        query   -- the query string of the request
+        version -- the version of the collection, the modification
+                   time of the directory if not given
+        """
+        offset, limit, sort, order = self.parse_query(query)
+        if version is None:
+            version = os.stat(path).st_mtime_ns
+
+        key = (path, version, offset, limit, sort, order)
+        page = self._lookup(self._pages, key)
+        if page is not None:
+            return ListingResource((page,))
+
+        ekey = (path, version)
+        entries = self._lookup(self._entries, ekey)
+        if entries is None:
+            start = time.perf_counter()
+            entries = self.scan(path)
+            log.debug('Scanned %d entries of %s in %.3fs', len(entries), path,
+                      time.perf_counter() - start)
+            self._store(self._entries, ekey, entries)
+        entries = sort_entries(list(entries), sort, order)
+
+        params = {'offset': offset, 'limit': limit, 'sort': sort,
+                  'order': order}
+        return ListingResource(_Page(self, key, entries, title, params))
+
+    def _navigation(self, total, offset, limit, sort, order):
+        if not limit or total <= limit:
+            return '%d entries' % total
+
+        def link(label, start):
+            return '<a href="?offset=%d&amp;limit=%d&amp;sort=%s&amp;order=%s">%s</a>' % (
+                start, limit, sort, order, label)
+
+        nav = ['entries %d-%d of %d' % (min(offset + 1, total),
+                                         min(offset + limit, total), total)]
+        if offset > 0:
+            nav.insert(0, link('&laquo; previous', max(0, offset - limit)))
+        if offset + limit < total:
+            nav.append(link('next &raquo;', offset + limit))
+        return ' | '.join(nav)
+
+    def render(self, entries, title, offset=0, limit=0, sort='name',
+               order='asc'):
+        """ generate the HTML of a page as chunks of bytes """
+        navigation = self._navigation(len(entries), offset, limit, sort, order)
+        orders = {}
+        for name in SORT_KEYS:
+            orders['order_' + name] = (name == sort and order == 'asc'
+                                       and 'desc' or 'asc')
+        yield (HEADER % dict(title=escape(title), navigation=navigation,
+                             limit=limit, **orders)).encode('utf-8')
+
+        base = urllib.parse.quote(title.rstrip('/') + '/')
+
+        end = limit and offset + limit or len(entries)
+        rows = []
+        for name, is_dir, size, mtime in entries[offset:end]:
+            suffix = is_dir and '/' or ''
+            rows.append(ROW % (
+                base + urllib.parse.quote(name) + suffix,
+                escape(name) + suffix,
+                not is_dir and size or '-',
+                time.strftime('%Y-%m-%d %H:%M', time.gmtime(mtime))))
+            if len(rows) >= ROWS_PER_CHUNK:
+                yield ''.join(rows).encode('utf-8')
+                rows = []
+        if rows:
+            yield ''.join(rows).encode('utf-8')
+
+        yield (FOOTER % {'navigation': navigation}).encode('utf-8')
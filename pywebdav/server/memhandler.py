@@ -0,0 +1,429 @@
+"""
+    In-memory storage backend
+
+    The MemoryHandler keeps a whole tree of collections and files in
+    memory. Nothing is ever written to disk and the tree is lost when
+    the server stops, so it is no place for real data. It serves to
+    measure what the protocol and the serialization of responses cost,
+    without the system calls and disk I/O of the FilesystemHandler,
+    and as a fast backend for tests.
+
+    Every resource is a Node. The content of a file is a bytearray
+    which is never changed once stored: PUT replaces it, thus COPY
+    shares it with the copy and GET hands out memoryviews of it. The
+    ETag of a resource is made of a counter which increases with every
+    change. Dead properties are kept with the nodes.
+
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+from pywebdav.lib.constants import COLLECTION, OBJECT
+from pywebdav.lib.errors import DAV_Error, DAV_NotFound, DAV_Secret
+from pywebdav.lib.iface import dav_interface
+from pywebdav.lib.davcmd import copyone, copytree, moveone, movetree, delone, deltree
+from pywebdav.lib.mimetype import MimeTypeResolver, DEFAULT_TYPE
+from pywebdav.lib.urimap import uri_path, uri_prefix, child_uri
+from pywebdav.lib.utils import range_bounds
+from pywebdav.server.listing import DirectoryLister, ListingResource, sort_entries
+
+log = logging.getLogger(__name__)
+
+BUFFER_SIZE = 128 * 1000
+
+
+class Node:
+    """ a collection (children is a dict) or a file (content) """
+
+    __slots__ = ('children', 'content', 'content_type', 'created',
+                 'modified', 'version', 'used', 'props')
+
+    def __init__(self, version, children=None, content=None,
+                 content_type=None):
+        self.children = children
+        self.content = content
+        self.content_type = content_type
+        self.created = self.modified = time.time()
+        self.version = version
+        # bytes of the files below a collection
+        self.used = 0
+        # dead properties {(namespace, name): value}
+        self.props = {}
+
+    @property
+    def size(self):
+        return self.content is not None and len(self.content) or 0
+
+
+class MemoryResource:
+    """ the content (or a range) of a file for get_data() """
+
+    def __init__(self, content, offset, length):
+        self.content = content
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        view = memoryview(self.content)
+        end = self.offset + self.length
+        for offset in range(self.offset, end, BUFFER_SIZE):
+            yield view[offset:min(offset + BUFFER_SIZE, end)]
+
+    def read(self, length=0):
+        if length == 0:
+            length = self.length
+        length = min(length, self.length)
+        data = bytes(self.content[self.offset:self.offset + length])
+        self.offset += length
+        self.length -= length
+        return data
+
+
+class MemoryHandler(dav_interface):
+    """ a tree of resources in memory
+
+    max_bytes limits the total size of all files (0 for no limit).
+    """
+
+    # determine content types (set to False to serve everything
+    # as application/octet-stream)
+    mimecheck = True
+
+    def __init__(self, uri, verbose=False, max_bytes=0):
+        self.setBaseURI(uri)
+        self.max_bytes = max_bytes
+        self.mimetypes = MimeTypeResolver()
+        self.listing = DirectoryLister()
+        self.verbose = verbose
+
+        self._versions = itertools.count(1)
+        self.root = Node(next(self._versions), children={})
+        # changes of the tree, lookups go without it
+        self._lock = threading.RLock()
+        log.info('Initialized in memory %s' % uri)
+
+    def setBaseURI(self, uri):
+        """ Sets the base uri """
+
+        self.baseuri = uri
+        self._baseprefix = uri_prefix(uri)
+
+    ###
+    ### the tree
+    ###
+
+    def _lookup(self, path):
+        """ return the node of a resource path or None """
+        node = self.root
+        if path == '/':
+            return node
+        for name in path[1:].split('/'):
+            if node.children is None:
+                return None
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def _node(self, uri):
+        """ return the node of uri or raise DAV_NotFound """
+        node = self._lookup(uri_path(uri))
+        if node is None:
+            raise DAV_NotFound
+        return node
+
+    def _parent(self, uri):
+        """ return (parent collection, name) of uri
+
+        Raises DAV_Error(409) if the parent collection does not exist.
+        """
+        path = uri_path(uri)
+        if path == '/':
+            raise DAV_Error(409)
+        parent_path, sep, name = path.rpartition('/')
+        parent = self._lookup(parent_path or '/')
+        if parent is None or parent.children is None:
+            raise DAV_Error(409)
+        return parent, name
+
+    def _touch(self, node):
+        node.modified = time.time()
+        node.version = next(self._versions)
+
+    def _add_usage(self, uri, delta):
+        """ add delta bytes to the usage of the parents of uri """
+        if not delta:
+            return
+        path = uri_path(uri)
+        node = self.root
+        node.used += delta
+        for name in path[1:].split('/')[:-1]:
+            node = node.children[name]
+            node.used += delta
+
+    def _attach(self, uri, node):
+        """ make node the member of its parent collection """
+        parent, name = self._parent(uri)
+        old = parent.children.get(name)
+        parent.children[name] = node
+        self._touch(parent)
+        self._add_usage(uri, node.size + node.used -
+                        (old is not None and old.size + old.used or 0))
+
+    def _detach(self, uri):
+        """ remove the node of uri (and everything below it) """
+        parent, name = self._parent(uri)
+        node = parent.children.pop(name, None)
+        if node is None:
+            raise DAV_NotFound
+        self._touch(parent)
+        self._add_usage(uri, -(node.size + node.used))
+        return node
+
+    def get_childs(self, uri, filter=None):
+        """ return the URIs of the members of a collection """
+        node = self._lookup(uri_path(uri))
+        if node is None or node.children is None:
+            return []
+        with self._lock:
+            names = list(node.children)
+        return [child_uri(uri, name) for name in names]
+
+    def compile_filter(self, filter):
+        """ REPORT filters are not supported, all resources match """
+        return None
+
+    def exists(self, uri):
+        """ test if a resource exists """
+        if self._lookup(uri_path(uri)) is not None:
+            return 1
+        return None
+
+    def is_collection(self, uri):
+        """ test if the given uri is a collection """
+        node = self._lookup(uri_path(uri))
+        if node is not None and node.children is not None:
+            return 1
+        return 0
+
+    def get_collection_version(self, uri):
+        """ return the change counter of the resource """
+        node = self._lookup(uri_path(uri))
+        return node is not None and node.version or None
+
+    ###
+    ### DATA methods (for GET and PUT)
+    ###
+
+    def _get_listing(self, node, uri):
+        """ return a (paged) HTML listing of a collection """
+        offset, limit, sort, order = self.listing.parse_query(
+            uri.partition('?')[2])
+        with self._lock:
+            members = list(node.children.items())
+        entries = [(name, child.children is not None, child.size,
+                    child.modified)
+                   for name, child in members if not name.startswith('.')]
+        sort_entries(entries, sort, order)
+        return ListingResource(self.listing.render(
+            entries, uri_path(uri), offset, limit, sort, order))
+
+    def get_data(self, uri, range=None):
+        """ return the content of an object """
+        node = self._node(uri)
+        if node.children is not None:
+            return self._get_listing(node, uri)
+
+        content = node.content
+        offset, end = range_bounds(range, len(content))
+
+        if end - offset <= BUFFER_SIZE:
+            return bytes(content[offset:end])
+        return MemoryResource(content, offset, end - offset)
+
+    def check_quota(self, uri, length):
+        """ reject a PUT of length bytes if it does not fit """
+        if not self.max_bytes:
+            return
+        node = self._lookup(uri_path(uri))
+        needed = length - (node is not None and node.size or 0)
+        if needed > self.max_bytes - self.root.used:
+            log.info('put: %d bytes for %s exceed the memory' % (length, uri))
+            raise DAV_Error(507)
+
+    def put(self, uri, data, content_type=None):
+        """ store the content of a file """
+        content = bytearray()
+        if isinstance(data, (bytes, bytearray)):
+            content += data
+        elif data is not None:
+            for d in data:
+                content += d
+        # chunked uploads have not been checked before
+        self.check_quota(uri, len(content))
+
+        with self._lock:
+            parent, name = self._parent(uri)
+            old = parent.children.get(name)
+            if old is not None and old.children is not None:
+                raise DAV_Error(405)
+            node = Node(next(self._versions), content=content,
+                        content_type=content_type)
+            if old is not None:
+                node.created = old.created
+                node.props = old.props
+            self._attach(uri, node)
+        log.info('put: Created %s' % uri)
+
+        return None
+
+    ###
+    ### Methods for DAV properties
+    ###
+
+    def _get_dav_resourcetype(self, uri):
+        """ return type of object """
+        if self._node(uri).children is not None:
+            return COLLECTION
+        return OBJECT
+
+    def _get_dav_displayname(self, uri):
+        raise DAV_Secret    # do not show
+
+    def _get_dav_getcontentlength(self, uri):
+        """ return the content length of an object """
+        return str(self._node(uri).size)
+
+    def _get_dav_getcontenttype(self, uri):
+        """ return the type given by PUT or the one of the name """
+        node = self._node(uri)
+        if node.children is not None:
+            return "httpd/unix-directory"
+        if self.mimecheck is False:
+            return 'application/octet-stream'
+        return (node.content_type or
+                self.mimetypes.by_name(uri_path(uri)) or DEFAULT_TYPE)
+
+    def _get_dav_getetag(self, uri):
+        """ return an entity tag made of the change counter and size """
+        node = self._node(uri)
+        return '"%x-%x"' % (node.version, node.size)
+
+    def _get_dav_quota_used_bytes(self, uri):
+        """ return the bytes used below a collection """
+        node = self._node(uri)
+        if node.children is None:
+            # only defined for collections (RFC 4331)
+            raise DAV_NotFound
+        return str(node.used)
+
+    def _get_dav_quota_available_bytes(self, uri):
+        """ return the bytes which can still be stored """
+        if self._node(uri).children is None or not self.max_bytes:
+            raise DAV_NotFound
+        return str(max(self.max_bytes - self.root.used, 0))
+
+    def get_lastmodified(self, uri):
+        """ return the last modified date of the object """
+        return self._node(uri).modified
+
+    def get_creationdate(self, uri):
+        """ return the creation date of the object """
+        return self._node(uri).created
+
+    def get_dead_props(self, uris):
+        """ return the dead properties kept with the nodes """
+        result = {}
+        for uri in uris:
+            node = self._lookup(uri_path(uri))
+            if node is not None and node.props:
+                result[uri] = dict(node.props)
+        return result
+
+    def proppatch(self, uri, changes):
+        """ change the dead properties of uri """
+        with self._lock:
+            node = self._node(uri)
+            props = dict(node.props)
+            for ns, name, value in changes:
+                if value is None:
+                    props.pop((ns, name), None)
+                else:
+                    props[(ns, name)] = value
+            node.props = props
+
+    ###
+    ### MKCOL, DELETE, COPY and MOVE
+    ###
+
+    def mkcol(self, uri):
+        """ create a new collection """
+        with self._lock:
+            if self._lookup(uri_path(uri)) is not None:
+                raise DAV_Error(405)
+            self._attach(uri, Node(next(self._versions), children={}))
+        log.info('mkcol: Created new collection %s' % uri)
+        return 201
+
+    def rmcol(self, uri):
+        """ delete a collection (and what is left below it) """
+        with self._lock:
+            self._detach(uri)
+        return 204
+
+    def rm(self, uri):
+        """ delete a normal resource """
+        with self._lock:
+            self._detach(uri)
+        return 204
+
+    def delone(self, uri):
+        """ delete a single resource """
+        return delone(self, uri)
+
+    def deltree(self, uri):
+        """ delete a collection """
+        return deltree(self, uri)
+
+    def moveone(self, src, dst, overwrite):
+        """ move one resource with Depth=0 """
+        return moveone(self, src, dst, overwrite)
+
+    def movetree(self, src, dst, overwrite):
+        """ move a collection with Depth=infinity """
+        return movetree(self, src, dst, overwrite)
+
+    def copyone(self, src, dst, overwrite):
+        """ copy one resource with Depth=0 """
+        return copyone(self, src, dst, overwrite)
+
+    def copytree(self, src, dst, overwrite):
+        """ copy a collection with Depth=infinity """
+        return copytree(self, src, dst, overwrite)
+
+    def copy(self, src, dst):
+        """ copy a file, the copy shares the content """
+        with self._lock:
+            source = self._node(src)
+            self.check_quota(dst, source.size)
+            node = Node(next(self._versions), content=source.content,
+                        content_type=source.content_type)
+            node.props = source.props
+            self._attach(dst, node)
+
+    def copycol(self, src, dst):
+        """ create the collection dst with the dead properties of src
+
+        The members are copied one by one by davcmd.
+        """
+        with self._lock:
+            source = self._node(src)
+            res = self.mkcol(dst)
+            self._node(dst).props = source.props
+        return res
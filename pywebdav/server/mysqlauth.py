@@ -16,6 +16,9 @@
 #MA 02111-1307, USA
 
 from .fileauth import DAVAuthHandler
+from pywebdav.lib.dbconn import Mconn
+from pywebdav.lib.digest import make_ha1
+from pywebdav.lib.constants import READ_COMMANDS
 import sys
 
 class MySQLAuthHandler(DAVAuthHandler):
@@ -26,9 +29,6 @@ class MySQLAuthHandler(DAVAuthHandler):
     def get_userinfo(self,user,pw,command):
         """ authenticate user """
 
-        # Commands that need write access
-        nowrite=['OPTIONS','PROPFIND','GET']
-
         Mysql=self._config.MySQL
         DB=Mconn(Mysql.user,Mysql.passwd,Mysql.host,Mysql.port,Mysql.dbtable)
         if self.verbose:
@@ -39,7 +39,7 @@ class MySQLAuthHandler(DAVAuthHandler):
 
         if len(Auth) == 1:
             can_write=Auth[0][3]
-            if not can_write and not command in nowrite:
+            if not can_write and not command in READ_COMMANDS:
                 self._log('Authentication failed for user %s using command %s' %(user,command))
                 return 0
             else:
@@ -52,3 +52,22 @@ class MySQLAuthHandler(DAVAuthHandler):
         self._log('Authentication failed for user %s' % user)
         return 0
 
+    def get_digest_ha1(self, user, realm, algorithm, command):
+        """ return the digest credentials of the user """
+
+        Mysql=self._config.MySQL
+        DB=Mconn(Mysql.user,Mysql.passwd,Mysql.host,Mysql.port,Mysql.dbtable)
+
+        qry="select * from %s.Users where User=%%s"%(Mysql.dbtable)
+        Auth=DB.execute(qry,(user,))
+
+        if not Auth or len(Auth) != 1:
+            self._log('Authentication failed for user %s' % user)
+            return None
+
+        can_write=Auth[0][3]
+        if not can_write and not command in READ_COMMANDS:
+            self._log('Authentication failed for user %s using command %s' %(user,command))
+            return None
+
+        return make_ha1(algorithm, user, realm, Auth[0][2])
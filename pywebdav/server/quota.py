@@ -0,0 +1,204 @@
+"""
+    Disk usage counters for quota properties (RFC 4331)
+
+    Clients ask for DAV:quota-used-bytes and DAV:quota-available-bytes
+    of collections, and summing up the sizes of all files below a
+    collection for every request is not an option for large trees. The
+    UsageCounter keeps the total size of the files below each
+    collection in a SQLite table. The FilesystemHandler adjusts the
+    totals of all parents whenever it writes or deletes a file, and a
+    periodic scan corrects the totals for changes made outside of the
+    server.
+
+    Limits can be set for single collections (e.g. the home collection
+    of a user). Uploads which would exceed the limit of a collection or
+    of any of its parents are rejected.
+
+"""
+
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    path TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_UNITS = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_limits(value):
+    """ parse "path=size, ..." with sizes like 500M into a dict """
+    limits = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        path, sep, size = item.rpartition('=')
+        size = size.strip().lower()
+        factor = _UNITS.get(size[-1:], 1)
+        if factor > 1:
+            size = size[:-1]
+        try:
+            limits[path.strip().rstrip('/') or '/'] = int(size) * factor
+        except ValueError:
+            raise ValueError('Invalid quota limit %r' % item.strip())
+    return limits
+
+
+def _ancestors(path):
+    """ return the parent collections of path, the nearest first """
+    while path != '/':
+        path = path.rsplit('/', 1)[0] or '/'
+        yield path
+
+
+class UsageCounter:
+    """ total size of the files below each collection
+
+    Collections are stored by their resource path (see urimap), the
+    root collection is /.
+    """
+
+    def __init__(self, database, directory, limits=None):
+        self.database = database
+        self.directory = directory
+        # resource path -> maximum bytes below it
+        self.limits = limits or {}
+
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db = self._db()
+        with self._write_lock, db:
+            db.executescript(SCHEMA)
+        row = db.execute("SELECT value FROM meta WHERE name = 'scanned'"
+                         ).fetchone()
+        # counters are only valid after the first scan
+        self.ready = row is not None
+
+    def _db(self):
+        """ return the connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    ### lookups
+
+    def used(self, path):
+        """ return the bytes used below the collection path """
+        row = self._db().execute('SELECT bytes FROM usage WHERE path = ?',
+                                 (path,)).fetchone()
+        return row and max(row[0], 0) or 0
+
+    def available(self, path, moved=None):
+        """ return the bytes which may still be stored below path
+
+        This is the free space of the filesystem or less if path
+        or one of its parents has a limit. The limits of collections
+        containing moved, the source of a MOVE, do not apply, as the
+        moved bytes are counted there already.
+        """
+        st = os.statvfs(self.directory)
+        available = st.f_bavail * st.f_frsize
+        for p in (path,) + tuple(_ancestors(path)):
+            limit = self.limits.get(p)
+            if limit is None:
+                continue
+            if moved is not None and (moved == p or p in _ancestors(moved)):
+                continue
+            available = min(available, limit - self.used(p))
+        return max(available, 0)
+
+    ### updates
+
+    def add(self, path, delta):
+        """ account delta bytes for the file path in its parents """
+        if not delta:
+            return
+        db = self._db()
+        with self._write_lock, db:
+            db.executemany('INSERT INTO usage VALUES (?, ?) ON CONFLICT(path) '
+                           'DO UPDATE SET bytes = bytes + excluded.bytes',
+                           [(p, delta) for p in _ancestors(path)])
+
+    def remove_tree(self, path):
+        """ account the removal of the collection path """
+        used = self.used(path)
+        prefix = path.rstrip('/') + '/'
+        self.add(path, -used)
+        db = self._db()
+        with self._write_lock, db:
+            db.execute('DELETE FROM usage WHERE path = ? OR '
+                       'substr(path, 1, ?) = ?', (path, len(prefix), prefix))
+
+    ### scanning
+
+    def scan(self):
+        """ return the totals of all collections from the filesystem """
+        totals = {}
+        top = len(self.directory)
+        for root, dirs, files in os.walk(self.directory, topdown=False):
+            path = root[top:].replace(os.sep, '/') or '/'
+            total = 0
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    total += st.st_size
+            for name in dirs:
+                total += totals.get(path.rstrip('/') + '/' + name, 0)
+            totals[path] = total
+        return totals
+
+    def reconcile(self):
+        """ replace all counters by the totals of a scan
+
+        Changes made by the server while scanning may be lost and are
+        corrected by the next scan.
+        """
+        start = time.monotonic()
+        totals = self.scan()
+        db = self._db()
+        with self._write_lock, db:
+            db.execute('DELETE FROM usage')
+            db.executemany('INSERT INTO usage VALUES (?, ?)', totals.items())
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('scanned', ?)",
+                       (str(time.time()),))
+        self.ready = True
+        log.info('Usage of %d collections below %s counted in %.1fs' %
+                 (len(totals), self.directory, time.monotonic() - start))
+
+    def run_reconciliation(self, interval):
+        """ reconcile now (if needed) and every interval seconds """
+        def run():
+            if not self.ready:
+                self.reconcile()
+            while interval > 0:
+                time.sleep(interval)
+                try:
+                    self.reconcile()
+                except Exception:
+                    log.exception('Counting the disk usage failed')
+
+        thread = threading.Thread(target=run, name='usage-reconciliation')
+        thread.daemon = True
+        thread.start()
+        return thread
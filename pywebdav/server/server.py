@@ -9,6 +9,7 @@ This is an example implementation of a DAVserver using the DAV package.
 
 import getopt, sys, os
 import logging
+import signal
 
 logging.basicConfig(level=logging.WARNING)
 log = logging.getLogger('pywebdav')
@@ -25,10 +26,28 @@ except ImportError:
 
 from pywebdav.server.fileauth import DAVAuthHandler
 from pywebdav.server.mysqlauth import MySQLAuthHandler
-from pywebdav.server.fshandler import FilesystemHandler
+from pywebdav.server.fshandler import FilesystemHandler, TEMP_PREFIX
+from pywebdav.server.indexhandler import IndexedFilesystemHandler
+from pywebdav.server.memhandler import MemoryHandler
+from pywebdav.server.dedup import DedupHandler
+from pywebdav.server.archive import ArchiveHandler
+from pywebdav.server.htpasswd import HtpasswdFile
+from pywebdav.server.watcher import Watcher
+from pywebdav.server.quota import UsageCounter, parse_limits
+from pywebdav.server.deadprops import XattrPropertyStore, SQLitePropertyStore
+from pywebdav.server.filecache import FileCache
 from pywebdav.server.daemonize import startstop
 
 from pywebdav.lib.INI_Parse import Configuration
+from pywebdav.lib.authcache import CredentialCache
+from pywebdav.lib.session import SessionManager
+from pywebdav.lib.digest import NonceCache
+from pywebdav.lib.davxml import BodyParser
+from pywebdav.lib.mimetype import MimeTypeResolver
+from pywebdav.lib.propcache import ResponseCache
+from pywebdav.lib.journal import ChangeJournal
+from pywebdav.lib.urimap import uri_path
+from pywebdav.server.listing import DirectoryLister
 from pywebdav import __version__, __author__
 
 LEVELS = {'debug': logging.DEBUG,
@@ -69,9 +88,31 @@ def runserver(
         log.error('Root directory not allowed!')
         sys.exit(233)
 
+    settings = handler.set_config(handler._config)
+
     # dispatch directory and host to the filesystem handler
     # This handler is responsible from where to take the data
-    handler.IFACE_CLASS = FilesystemHandler(directory, 'http://%s:%s/' % (host, port), verbose )
+    baseuri = 'http://%s:%s/' % (host, port)
+    if settings.backend == 'memory':
+        handler.IFACE_CLASS = MemoryHandler(baseuri, verbose,
+                                            settings.memory_max_bytes)
+        log.warning('Keeping all data in memory, it is lost on exit!')
+    elif settings.backend == 'dedup':
+        handler.IFACE_CLASS = DedupHandler(directory, baseuri, verbose)
+        log.info('Storing deduplicated content in %s' % directory)
+    elif settings.backend == 'archive':
+        handler.IFACE_CLASS = ArchiveHandler(directory, baseuri, verbose,
+                                             settings.archive_cache_size)
+        log.info('Serving the members of archives in %s' % directory)
+        if settings.index_database:
+            log.warning('Option index_database is ignored by the archive backend')
+    elif settings.index_database:
+        handler.IFACE_CLASS = IndexedFilesystemHandler(
+            directory, baseuri, verbose, settings.index_database,
+            settings.index_workers)
+        log.info('Using metadata index %s' % settings.index_database)
+    else:
+        handler.IFACE_CLASS = FilesystemHandler(directory, baseuri, verbose)
 
     # put some extra vars
     handler.verbose = verbose
@@ -79,19 +120,104 @@ def runserver(
         log.warning('Authentication disabled!')
         handler.DO_AUTH = False
 
-    log.info('Serving data from %s' % directory)
-
-    if handler._config.DAV.getboolean('lockemulation') is False:
+    if settings.htpasswd and not noauth:
+        cache = CredentialCache(settings.auth_cache_size,
+                                settings.auth_cache_ttl)
+        handler.PASSWORD_FILE = HtpasswdFile(settings.htpasswd, cache)
+        log.info('Using password file %s' % settings.htpasswd)
+
+    handler.AUTH_SCHEMES = settings.auth_schemes
+    if 'digest' in settings.auth_schemes:
+        handler.NONCES = NonceCache(settings.digest_nonce_cache_size,
+                                    settings.digest_nonce_ttl)
+        if handler.PASSWORD_FILE is not None:
+            log.warning('Digest authentication does not work with hashed passwords')
+
+    if settings.session_cookie and not noauth:
+        handler.SESSION = SessionManager(settings.session_secret,
+                                         settings.session_ttl)
+        log.info('Session cookies enabled')
+
+    # options of the filesystem backend
+    filesystem = isinstance(handler.IFACE_CLASS, FilesystemHandler)
+    # other backends may keep dead properties in a database
+    properties = hasattr(handler.IFACE_CLASS, 'properties') and (
+        filesystem or settings.property_store != 'xattr')
+    if filesystem:
+        log.info('Serving data from %s' % directory)
+    else:
+        ignored = ['index_database', 'quota_database', 'file_cache_size',
+                   'watch']
+        if not properties:
+            ignored.append('property_store')
+        for option in ignored:
+            if getattr(settings, option):
+                log.warning('Option %s is ignored by the %s backend' %
+                            (option, settings.backend))
+
+    if settings.lockemulation is False:
         log.info('Deactivated LOCK, UNLOCK (WebDAV level 2) support')
 
     handler.IFACE_CLASS.mimecheck = True
-    if handler._config.DAV.getboolean('mimecheck') is False:
+    if settings.mimecheck is False:
         handler.IFACE_CLASS.mimecheck = False
-        log.info('Disabled mimetype sniffing (All files will have type application/octet-stream)')
-
-    if handler._config.DAV.baseurl:
-        log.info('Using %s as base url for PROPFIND requests' % handler._config.DAV.baseurl)
-    handler.IFACE_CLASS.baseurl = handler._config.DAV.baseurl
+        log.info('Disabled mimetype detection (All files will have type application/octet-stream)')
+    else:
+        handler.IFACE_CLASS.mimetypes = MimeTypeResolver(settings.mime_types,
+                                                         settings.mimesniff)
+
+    handler.IFACE_CLASS.listing = DirectoryLister(settings.listing_cache_size,
+                                                  settings.listing_page_size)
+
+    if settings.propfind_workers > 0:
+        handler.IFACE_CLASS.propfind_workers = settings.propfind_workers
+
+    handler.XML_PARSER = BodyParser(settings.xml_max_size,
+                                    settings.xml_max_depth,
+                                    settings.xml_cache_size)
+
+    if settings.propfind_cache_size > 0:
+        handler.RESPONSE_CACHE = ResponseCache(settings.propfind_cache_size,
+                                               settings.propfind_cache_gzip)
+        log.info('Caching PROPFIND responses (%d bytes)' %
+                 settings.propfind_cache_size)
+
+    if settings.sync_database:
+        journal = ChangeJournal(settings.sync_database, settings.sync_token_ttl,
+                                settings.sync_max_changes)
+        journal.run_compaction(settings.sync_compact_interval)
+        handler.IFACE_CLASS.journal = journal
+        log.info('Recording changes in %s' % settings.sync_database)
+
+    if filesystem and settings.quota_database:
+        usage = UsageCounter(settings.quota_database,
+                             handler.IFACE_CLASS.directory,
+                             parse_limits(settings.quota_limits))
+        usage.run_reconciliation(settings.quota_reconcile_interval)
+        handler.IFACE_CLASS.usage = usage
+        log.info('Counting disk usage in %s' % settings.quota_database)
+
+    if properties and settings.property_store:
+        handler.IFACE_CLASS.properties = setup_properties(
+            settings, getattr(handler.IFACE_CLASS, 'directory', None))
+
+    if filesystem and settings.file_cache_size > 0:
+        handler.IFACE_CLASS.files = FileCache(settings.file_cache_size,
+                                              settings.file_cache_small_size,
+                                              settings.file_cache_bytes,
+                                              settings.file_cache_mmap_size)
+        log.info('Keeping up to %d files open' % settings.file_cache_size)
+
+    if filesystem and settings.watch:
+        setup_watcher(handler, settings.watch_fallback_ttl)
+
+    if isinstance(handler.IFACE_CLASS, IndexedFilesystemHandler):
+        handler.IFACE_CLASS.index.run_reconciliation(
+            settings.index_reconcile_interval)
+
+    if settings.baseurl:
+        log.info('Using %s as base url for PROPFIND requests' % settings.baseurl)
+    handler.IFACE_CLASS.baseurl = settings.baseurl
 
     # initialize server on specified port
     runner = server( (host, port), handler )
@@ -102,6 +228,98 @@ def runserver(
     except KeyboardInterrupt:
         log.info('Killed by user')
 
+def setup_properties(settings, directory):
+    """ return the PropertyStore selected by property_store or None
+
+    Falls back to the database property_database if directory does not
+    keep extended attributes.
+    """
+    if settings.property_store == 'xattr':
+        store = XattrPropertyStore(directory)
+        if store.supported():
+            log.info('Storing dead properties in extended attributes')
+            return store
+        if not settings.property_database:
+            log.warning('%s does not support extended attributes and no '
+                        'property_database is set, dead properties are '
+                        'disabled' % directory)
+            return None
+        log.warning('%s does not support extended attributes, storing dead '
+                    'properties in %s instead' %
+                    (directory, settings.property_database))
+    store = SQLitePropertyStore(settings.property_database)
+    log.info('Storing dead properties in %s' % settings.property_database)
+    return store
+
+def setup_watcher(handler, ttl):
+    """ invalidate the caches on changes made outside of the server """
+    dc = handler.IFACE_CLASS
+    # the temporary files of PUT are renamed to their target
+    watcher = Watcher(dc.directory, ignore=TEMP_PREFIX)
+
+    # the index has to be current before the caches are refilled
+    if hasattr(dc, 'index_changed'):
+        watcher.add_listener(dc.index_changed)
+
+    # change the versions of collections holding changed files
+    watcher.add_listener(dc.path_changed)
+
+    def expire_listings():
+        dc.listing.ttl = ttl
+
+    watcher.add_listener(dc.listing.invalidate, expire_listings)
+
+    files = getattr(dc, 'files', None)
+    if files is not None:
+        # entries are dropped on changes instead of checked
+        files.trusted = True
+        watcher.add_listener(files.invalidate, files.distrust)
+
+    cache = handler.RESPONSE_CACHE
+    if cache is not None:
+        def invalidate_responses(path):
+            cache.invalidate(path and uri_path(dc.local2uri(path)))
+
+        def expire_responses():
+            cache.ttl = ttl
+
+        watcher.add_listener(invalidate_responses, expire_responses)
+
+    journal = dc.journal
+    if journal is not None:
+        def record_change(path):
+            if path is None:
+                # changes were lost, clients have to start over
+                return journal.reset()
+            journal.record([uri_path(dc.local2uri(path))],
+                           deleted=not os.path.lexists(path))
+
+        watcher.add_listener(record_change)
+
+    watcher.start()
+    return watcher
+
+def reload_config(handler, configfile):
+    """ re-read the configuration file, called on SIGHUP
+
+    Options used on each request take effect immediately. The address,
+    directory and authentication backends need a restart.
+    """
+    log.info('Reloading configuration from %s' % configfile)
+    conf = Configuration(configfile)
+    if conf.DAV is None:
+        log.error('No [DAV] section in %s, keeping old configuration' % configfile)
+        return
+
+    try:
+        settings = handler.set_config(conf)
+    except ValueError as ex:
+        log.error('Invalid configuration, keeping old one: %s' % ex)
+        return
+
+    handler.IFACE_CLASS.mimecheck = settings.mimecheck
+    handler.IFACE_CLASS.baseurl = settings.baseurl
+
 usage = """PyWebDAV server (version %s)
 Standalone WebDAV server
 
@@ -114,6 +332,7 @@ Parameters:
     -c, --config    Specify a file where configuration is specified. In this
                     file you can specify options for a running server.
                     For an example look at the config.ini in this directory.
+                    Send SIGHUP to the server to reload the configuration.
     -D, --directory Directory where to serve data from
                     The user that runs this server must have permissions
                     on that directory. NEVER run as root!
@@ -126,15 +345,21 @@ Parameters:
     -P, --port      Port to bind server to  (default: 8008)
     -u, --user      Username for authentication
     -p, --password  Password for given user
+        --htpasswd  File with hashed credentials (user:hash per line) to use
+                    instead of --user and --password. Supported hashes are
+                    bcrypt, pbkdf2 and scrypt. The file is reloaded on change.
+        --auth      Comma separated list of accepted authentication schemes:
+                    basic, digest (default: basic)
     -n, --noauth    Pass parameter if server should not ask for authentication
                     This means that every user has access
     -m, --mysql     Pass this parameter if you want MySQL based authentication.
                     If you want to use MySQL then the usage of a configuration
                     file is mandatory.
     -J, --nolock    Deactivate LOCK and UNLOCK mode (WebDAV Version 2).
-    -M, --nomime    Deactivate mimetype sniffing. Sniffing is based on magic numbers
-                    detection but can be slow under heavy load. If you are experiencing
-                    speed problems try to use this parameter.
+    -M, --nomime    Deactivate mimetype detection. All files will be served as
+                    application/octet-stream. Types are looked up by file name
+                    and the content of a file is only inspected (once, the result
+                    is cached) if its name has no known suffix.
     -T, --noiter    Deactivate iterator. Use this if you encounter file corruption during 
                     download. Also disables chunked body response.
     -i, --icounter  If you want to run multiple instances then you have to
@@ -166,6 +391,12 @@ def setupDummyConfig(**kw):
         def getboolean(self, name):
             return (str(getattr(self, name, 0)) in ('1', "yes", "true", "on", "True"))
 
+        def __contains__(self, name):
+            return name in self.__dict__
+
+        def get(self, name, default):
+            return self.__dict__.get(name, default)
+
     class DummyConfig:
         DAV = DummyConfigDAV(**kw)
 
@@ -190,6 +421,8 @@ def run():
     mimecheck = True
     loglevel = 'warning'
     baseurl = ''
+    htpasswd = ''
+    auth_schemes = 'basic'
 
     # parse commandline
     try:
@@ -197,7 +430,7 @@ def run():
                 ['host=', 'port=', 'directory=', 'user=', 'password=',
                  'daemon=', 'noauth', 'help', 'verbose', 'mysql', 
                  'icounter=', 'config=', 'nolock', 'nomime', 'loglevel', 'noiter',
-                 'baseurl='])
+                 'baseurl=', 'htpasswd=', 'auth='])
     except getopt.GetoptError as e:
         print(usage)
         print('>>>> ERROR: %s' % str(e))
@@ -258,6 +491,12 @@ def run():
         if o in ['-B', '--baseurl']:
             baseurl = a.lower()
 
+        if o in ['--htpasswd']:
+            htpasswd = a
+
+        if o in ['--auth']:
+            auth_schemes = a
+
     # This feature are disabled because they are unstable
     http_request_use_iterator = 0
 
@@ -275,6 +514,7 @@ def run():
         noauth = bool(int(dv.noauth))
         user = dv.user
         password = dv.password
+        htpasswd = dv.get('htpasswd', htpasswd)
         daemonize = bool(int(dv.daemonize))
         if daemonaction != 'stop':
             daemonaction = dv.daemonaction
@@ -308,7 +548,9 @@ def run():
                 'chunked_http_response': chunked_http_response,
                 'http_request_use_iterator': http_request_use_iterator,
                 'http_response_use_iterator': http_response_use_iterator,
-                'baseurl' : baseurl
+                'baseurl' : baseurl,
+                'htpasswd' : htpasswd,
+                'auth_schemes' : auth_schemes
                 }
 
         conf = setupDummyConfig(**_dc)
@@ -332,7 +574,7 @@ def run():
         log.info('Stopping PyWebDAV server (version %s)' % __version__)
 
     if not noauth and daemonaction not in ['status', 'stop']:
-        if not user:
+        if not user and not htpasswd:
             print(usage)
             print('>> ERROR: No parameter specified!', file=sys.stderr)
             print('>> Example: davserver -D /tmp -n', file=sys.stderr)
@@ -344,9 +586,21 @@ def run():
     if type(port) == type(''):
         port = int(port.strip())
 
-    log.info('chunked_http_response feature %s' % (conf.DAV.getboolean('chunked_http_response') and 'ON' or 'OFF' ))
-    log.info('http_request_use_iterator feature %s' % (conf.DAV.getboolean('http_request_use_iterator') and 'ON' or 'OFF' ))
-    log.info('http_response_use_iterator feature %s' % (conf.DAV.getboolean('http_response_use_iterator') and 'ON' or 'OFF' ))
+    # start now
+    handler = DAVAuthHandler
+    if mysql == True:
+        handler = MySQLAuthHandler
+
+    # injecting options
+    try:
+        settings = handler.set_config(conf)
+    except ValueError as ex:
+        log.error('Invalid configuration: %s' % ex)
+        sys.exit(3)
+
+    log.info('chunked_http_response feature %s' % (settings.chunked_http_response and 'ON' or 'OFF' ))
+    log.info('http_request_use_iterator feature %s' % (settings.http_request_use_iterator and 'ON' or 'OFF' ))
+    log.info('http_response_use_iterator feature %s' % (settings.http_response_use_iterator and 'ON' or 'OFF' ))
  
     if daemonize:
 
@@ -362,13 +616,9 @@ def run():
                     startmsg='>> Started PyWebDAV (PID: %s)',
                     action=daemonaction)
 
-    # start now
-    handler = DAVAuthHandler
-    if mysql == True:
-        handler = MySQLAuthHandler
-
-    # injecting options
-    handler._config = conf
+    if configfile != '' and hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP,
+                      lambda signum, frame: reload_config(handler, configfile))
 
     runserver(port, host, directory, verbose, noauth, user, password, 
               handler=handler)
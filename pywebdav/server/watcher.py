@@ -0,0 +1,205 @@
+"""
+    Watch the served directory for changes made outside of WebDAV
+
+    Files may be changed by other programs (rsync, Samba, ...) while
+    they are served. The Watcher uses Linux inotify (through ctypes, no
+    extra module needed) to tell the caches of the server which paths
+    have changed.
+
+    A listener is a callable which gets the local path that changed, or
+    None if everything has to be considered changed (the kernel dropped
+    events). Listeners may also give a fallback callable which is run
+    once if the watcher cannot see all changes anymore, for example
+    because the limit of inotify watches has been reached. Caches should
+    then validate their entries with a TTL instead.
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import threading
+
+log = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event without the name
+_EVENT = struct.Struct('iIII')
+
+READ_SIZE = 64 * 1024
+
+
+def _libc():
+    """ return libc with the inotify functions or raise OSError """
+    name = ctypes.util.find_library('c') or 'libc.so.6'
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError(errno.ENOSYS, 'inotify is not available')
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class Watcher:
+    """ report changes below a directory to listeners """
+
+    def __init__(self, directory, ignore=None):
+        self.directory = directory
+        # prefix of the names of files whose changes are not reported
+        self.ignore = ignore
+        # False as soon as some changes can not be seen
+        self.complete = True
+
+        self._listeners = []
+        self._libc = None
+        self._fd = -1
+        self._wds = {}
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback, fallback=None):
+        """ call callback(path) on changes, fallback() if degraded """
+        self._listeners.append((callback, fallback))
+        if not self.complete and fallback is not None:
+            fallback()
+
+    def start(self):
+        """ watch the directory tree from a background thread
+
+        If inotify is not available the watcher is degraded right
+        away and no thread is started.
+        """
+        try:
+            self._libc = _libc()
+            fd = self._libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+        except (OSError, AttributeError) as ex:
+            self._degrade('Can not watch %s: %s' % (self.directory, ex))
+            return False
+
+        self._fd = fd
+        self._watch_tree(self.directory)
+        log.info('Watching %d directories below %s' % (len(self._wds),
+                                                        self.directory))
+
+        thread = threading.Thread(target=self._run, name='watcher')
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _degrade(self, reason):
+        if not self.complete:
+            return
+        log.warning('%s, falling back to TTL validation of caches' % reason)
+        self.complete = False
+        for callback, fallback in self._listeners:
+            if fallback is not None:
+                fallback()
+
+    def _add_watch(self, path):
+        """ watch a single directory, return False to stop the walk """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self._degrade('Limit of inotify watches reached')
+                return False
+            if err not in (errno.ENOENT, errno.ENOTDIR):
+                log.info('Can not watch %s: %s' % (path, os.strerror(err)))
+            return True
+
+        with self._lock:
+            self._wds[wd] = path
+        return True
+
+    def _watch_tree(self, top):
+        for root, dirs, files in os.walk(top):
+            if not self._add_watch(root):
+                break
+
+    def _unwatch_tree(self, top):
+        """ remove the watches of a directory moved away """
+        prefix = top + os.sep
+        with self._lock:
+            wds = [wd for wd, path in self._wds.items()
+                   if path == top or path.startswith(prefix)]
+            for wd in wds:
+                del self._wds[wd]
+        for wd in wds:
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _run(self):
+        while True:
+            try:
+                data = os.read(self._fd, READ_SIZE)
+            except InterruptedError:
+                continue
+            except OSError as ex:
+                self._degrade('Watching failed: %s' % ex)
+                return
+
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                try:
+                    self._handle(wd, mask, os.fsdecode(name))
+                except Exception:
+                    log.exception('Could not handle event for %s' % name)
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            log.info('Lost file system events, flushing caches')
+            self._notify(None)
+            return
+
+        with self._lock:
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                return
+            base = self._wds.get(wd)
+        if base is None:
+            return
+
+        if name and self.ignore and name.startswith(self.ignore):
+            return
+        path = name and os.path.join(base, name) or base
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+            elif mask & IN_MOVED_FROM:
+                self._unwatch_tree(path)
+        self._notify(path)
+
+    def _notify(self, path):
+        for callback, fallback in self._listeners:
+            try:
+                callback(path)
+            except Exception:
+                log.exception('Cache invalidation failed for %s' % path)
@@ -0,0 +1,85 @@
+"""
+Benchmark of the storage backends.
+
+The same tree is created in a FilesystemHandler, a MemoryHandler and
+a DedupHandler, which answer Depth 1 PROPFIND requests and GETs of
+all files. The MemoryHandler shows what the server itself costs, the
+difference to the others is the cost of the storage.
+
+usage: python test/bench_backends.py [entries] [file size]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.propfind import PROPFIND
+from pywebdav.server.fshandler import FilesystemHandler
+from pywebdav.server.memhandler import MemoryHandler
+from pywebdav.server.dedup import DedupHandler
+
+BASEURI = 'http://localhost:8008/'
+
+BODY = b"""<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:"><D:prop>
+<D:getcontentlength/><D:getlastmodified/><D:getcontenttype/>
+<D:resourcetype/><D:getetag/>
+</D:prop></D:propfind>"""
+
+
+def propfind(dc):
+    PROPFIND(BASEURI, dc, 1, BODY).createResponse()
+
+
+def get_all(dc):
+    for uri in dc.get_childs(BASEURI):
+        data = dc.get_data(uri)
+        if not isinstance(data, bytes):
+            b''.join(data)
+
+
+def measure(function, dc, rounds=5):
+    """ return the best time of some rounds """
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        function(dc)
+        elapsed = time.perf_counter() - start
+        best = best is None and elapsed or min(best, elapsed)
+    return best
+
+
+def main():
+    entries = len(sys.argv) > 1 and int(sys.argv[1]) or 1000
+    size = len(sys.argv) > 2 and int(sys.argv[2]) or 4096
+
+    directory = tempfile.mkdtemp()
+    store = tempfile.mkdtemp()
+    try:
+        fs = FilesystemHandler(directory, BASEURI)
+        mem = MemoryHandler(BASEURI)
+        dedup = DedupHandler(store, BASEURI)
+        content = b'x' * size
+        for dc in (fs, mem, dedup):
+            dc.baseurl = ''
+            for i in range(entries):
+                dc.put(BASEURI + 'file%05d.txt' % i, content)
+
+        print('%d files of %d bytes' % (entries, size))
+        print('backend      PROPFIND s   GET s')
+        for name, dc in (('filesystem', fs), ('memory', mem),
+                         ('dedup', dedup)):
+            print('%-10s  %10.3f  %6.3f' % (name, measure(propfind, dc),
+                                            measure(get_all, dc)))
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(store)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of Depth 1 PROPFIND responses against the number of
+propfind_workers.
+
+Network filesystems are simulated by a FilesystemHandler whose
+property reads wait for a fixed latency.
+
+usage: python test/bench_propfind.py [entries] [latency in ms]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.propfind import PROPFIND
+from pywebdav.server.fshandler import FilesystemHandler
+
+BODY = b"""<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:"><D:prop>
+<D:getcontentlength/><D:getlastmodified/><D:getcontenttype/>
+<D:resourcetype/><D:getetag/>
+</D:prop></D:propfind>"""
+
+
+class SlowFilesystemHandler(FilesystemHandler):
+    """ waits for latency seconds for every property """
+
+    latency = 0.001
+
+    def get_prop(self, uri, ns, propname):
+        time.sleep(self.latency)
+        return FilesystemHandler.get_prop(self, uri, ns, propname)
+
+
+def main():
+    entries = len(sys.argv) > 1 and int(sys.argv[1]) or 500
+    latency = len(sys.argv) > 2 and float(sys.argv[2]) / 1000 or 0.001
+
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(entries):
+            with open(os.path.join(directory, 'file%05d.txt' % i), 'w') as fp:
+                fp.write('x' * i)
+
+        dc = SlowFilesystemHandler(directory, 'http://localhost:8008/')
+        dc.latency = latency
+        dc.baseurl = ''
+        print('%d entries, %.1f ms per property' % (entries, latency * 1000))
+        print('workers  seconds  entries/s')
+
+        expected = None
+        for workers in (1, 2, 4, 8, 16, 32):
+            dc.propfind_workers = workers
+            start = time.perf_counter()
+            body = PROPFIND('http://localhost:8008/', dc, 1,
+                            BODY).createResponse()
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = body
+            assert body == expected, 'responses differ'
+            print('%7d  %7.2f  %9.0f' % (workers, elapsed,
+                                         (entries + 1) / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+    An in-process server for the tests
+
+    DAVTestCase serves a temporary directory (self.rundir) on a free
+    port of localhost. The interface and the options of the [DAV]
+    section are set up by make_interface() and config, subclasses
+    change them to test other backends and features.
+
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import http.client
+from http.server import ThreadingHTTPServer
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.fileauth import DAVAuthHandler
+from pywebdav.server.fshandler import FilesystemHandler
+from pywebdav.server.server import setupDummyConfig
+
+
+class DAVTestCase(unittest.TestCase):
+    """ a test served by a fresh server """
+
+    # options of the [DAV] section
+    config = {}
+
+    # attributes of the request handler class
+    handler_attributes = {}
+
+    def make_interface(self, baseuri):
+        """ return the dav_interface to serve """
+        return FilesystemHandler(self.rundir, baseuri)
+
+    def setUp(self):
+        self.rundir = tempfile.mkdtemp()
+        config = setupDummyConfig(**self.config)
+
+        class Handler(DAVAuthHandler):
+            DO_AUTH = False
+            _config = config
+
+            def log_message(self, *args):
+                pass
+
+        for name, value in self.handler_attributes.items():
+            setattr(Handler, name, value)
+        Handler.set_config(config)
+        self.handler = Handler
+
+        self.server = ThreadingHTTPServer(('localhost', 0), Handler)
+        self.server.daemon_threads = True
+        self.baseuri = 'http://localhost:%d/' % self.server.server_port
+        self.dc = Handler.IFACE_CLASS = self.make_interface(self.baseuri)
+        # as set up by runserver()
+        self.dc.baseurl = self.config.get('baseurl', '')
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.rundir)
+
+    def connect(self):
+        return http.client.HTTPConnection('localhost',
+                                          self.server.server_port)
+
+    def request(self, method, path, body=None, headers={}):
+        """ return the status, headers and body of a response """
+        conn = self.connect()
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            conn.close()
+
+    def path(self, name):
+        """ return the local path of a resource name """
+        return os.path.join(self.rundir, *name.strip('/').split('/'))
+
+    def write(self, name, content):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as fp:
+            return fp.read()
+
+
+class BackendTests:
+    """ behaviour every storage backend shares
+
+    Mixed into a DAVTestCase which serves the backend. Content is
+    created through the server, the tests do not know where it is
+    stored.
+    """
+
+    # chunked bodies are read with HTTP/1.1 only
+    handler_attributes = {'protocol_version': 'HTTP/1.1'}
+
+    # status of a PUT below a missing collection and onto a collection
+    put_conflict = 409
+    put_collection = 405
+
+    def put(self, path, content):
+        self.assertEqual(self.request('PUT', path, content)[0], 201)
+
+    def get(self, path, headers={}):
+        status, headers, body = self.request('GET', path, headers=headers)
+        self.assertIn(status, (200, 206))
+        return body
+
+    def propfind(self, path, depth='1'):
+        status, headers, body = self.request('PROPFIND', path,
+                                             headers={'Depth': depth})
+        self.assertEqual(status, 207)
+        return body
+
+    def test_put_get(self):
+        self.put('/file', b'content')
+        self.assertEqual(self.get('/file'), b'content')
+        self.put('/file', b'new')
+        self.assertEqual(self.get('/file'), b'new')
+        self.assertEqual(self.request('GET', '/missing')[0], 404)
+
+    def test_chunked_put(self):
+        conn = self.connect()
+        conn.request('PUT', '/chunked', iter([b'a' * 20, b'b' * 20]),
+                     encode_chunked=True)
+        self.assertEqual(conn.getresponse().status, 201)
+        conn.close()
+        self.assertEqual(self.get('/chunked'), b'a' * 20 + b'b' * 20)
+
+    def test_range(self):
+        self.put('/file', b'0123456789')
+        status, headers, body = self.request('GET', '/file',
+                                             headers={'Range': 'bytes=2-4'})
+        self.assertEqual(status, 206)
+        self.assertEqual(body, b'234')
+        self.assertEqual(self.get('/file', {'Range': 'bytes=-3'}), b'789')
+
+    def test_mkcol(self):
+        self.assertEqual(self.request('MKCOL', '/dir')[0], 201)
+        self.assertEqual(self.request('MKCOL', '/dir')[0], 405)
+        self.assertEqual(self.request('MKCOL', '/missing/dir')[0], 409)
+        self.assertEqual(self.request('PUT', '/missing/file', b'')[0],
+                         self.put_conflict)
+        self.put('/dir/file', b'x')
+        body = self.propfind('/dir')
+        self.assertIn(b'/dir/file</D:href>', body)
+        self.assertIn(b'<D:collection/>', body)
+
+    def test_put_on_collection(self):
+        self.request('MKCOL', '/dir')
+        self.assertEqual(self.request('PUT', '/dir', b'x')[0],
+                         self.put_collection)
+
+    def test_delete(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/file', b'x')
+        self.assertEqual(self.request('DELETE', '/dir')[0], 204)
+        self.assertEqual(self.request('GET', '/dir/file')[0], 404)
+        self.assertEqual(self.request('DELETE', '/dir')[0], 404)
+
+    def test_copy_move(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/file', b'x')
+        self.assertIn(self.request('COPY', '/dir', headers={
+            'Destination': '/copy'})[0], (201, 204))
+        self.assertIn(self.request('MOVE', '/dir/file', headers={
+            'Destination': '/moved'})[0], (201, 204))
+        self.assertEqual(self.get('/copy/file'), b'x')
+        self.assertEqual(self.get('/moved'), b'x')
+        self.assertEqual(self.request('GET', '/dir/file')[0], 404)
+
+        # the copy is independent of the source
+        self.put('/moved', b'changed')
+        self.assertEqual(self.get('/copy/file'), b'x')
+
+    def test_overwrite(self):
+        self.put('/a', b'a')
+        self.put('/b', b'b')
+        self.assertEqual(self.request('COPY', '/a', headers={
+            'Destination': '/b', 'Overwrite': 'F'})[0], 412)
+        self.assertEqual(self.get('/b'), b'b')
+
+    def test_etag_changes(self):
+        self.put('/file', b'one')
+        etag = self.request('GET', '/file')[1]['ETag']
+        self.put('/file', b'two')
+        self.assertNotEqual(self.request('GET', '/file')[1]['ETag'], etag)
+
+    def test_dead_properties(self):
+        self.put('/file', b'x')
+        status = self.request('PROPPATCH', '/file', (
+            b'<?xml version="1.0"?><D:propertyupdate xmlns:D="DAV:" '
+            b'xmlns:x="urn:x"><D:set><D:prop><x:note>hello</x:note>'
+            b'</D:prop></D:set></D:propertyupdate>'))[0]
+        self.assertEqual(status, 207)
+        self.assertIn(b'hello', self.propfind('/file', '0'))
+        self.assertIn(self.request('COPY', '/file', headers={
+            'Destination': '/copy'})[0], (201, 204))
+        self.assertIn(b'hello', self.propfind('/copy', '0'))
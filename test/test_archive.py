@@ -0,0 +1,212 @@
+import io
+import os
+import sys
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server import archive
+from pywebdav.server.archive import ArchiveCache, ArchiveHandler
+from pywebdav.server.filecache import FileCache
+
+from davtest import DAVTestCase
+
+DEFLATED = bytes(range(256)) * 4000
+STORED = b'stored content ' * 100
+
+
+class TestArchive(DAVTestCase):
+    """ ZIP and TAR files served as read-only collections """
+
+    def make_interface(self, baseuri):
+        return ArchiveHandler(self.rundir, baseuri, max_archives=2)
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        with zipfile.ZipFile(self.path('data.zip'), 'w') as zf:
+            zf.writestr('docs/deflated.bin', DEFLATED,
+                        zipfile.ZIP_DEFLATED)
+            zf.writestr('stored.txt', STORED, zipfile.ZIP_STORED)
+            zf.writestr('../outside.txt', b'x')
+        with tarfile.open(self.path('data.tar'), 'w') as tf:
+            info = tarfile.TarInfo('dir/member.txt')
+            info.size = len(STORED)
+            tf.addfile(info, io.BytesIO(STORED))
+        self.write('broken.zip', b'not a zip file')
+
+    def get(self, path, headers={}):
+        status, headers, body = self.request('GET', path, headers=headers)
+        self.assertIn(status, (200, 206), path)
+        return body
+
+    def test_members(self):
+        self.assertEqual(self.get('/data.zip/docs/deflated.bin'), DEFLATED)
+        self.assertEqual(self.get('/data.zip/stored.txt'), STORED)
+        self.assertEqual(self.get('/data.tar/dir/member.txt'), STORED)
+        # names are kept inside the archive
+        self.assertEqual(self.get('/data.zip/outside.txt'), b'x')
+        self.assertEqual(self.request('GET', '/data.zip/missing')[0], 404)
+
+    def test_ranges(self):
+        for path, content in (('/data.zip/docs/deflated.bin', DEFLATED),
+                              ('/data.zip/stored.txt', STORED),
+                              ('/data.tar/dir/member.txt', STORED)):
+            for first, last in ((0, 9), (5, 1004),
+                                (len(content) - 200000, len(content) - 1)):
+                first = max(first, 0)
+                body = self.get(path, {'Range': 'bytes=%d-%d' % (first,
+                                                                 last)})
+                self.assertEqual(body, content[first:last + 1],
+                                 (path, first))
+
+    def test_propfind(self):
+        status, headers, body = self.request('PROPFIND', '/data.zip',
+                                             headers={'Depth': '1'})
+        self.assertEqual(status, 207)
+        self.assertIn(b'/data.zip/docs</D:href>', body)
+        self.assertIn(b'/data.zip/stored.txt</D:href>', body)
+        self.assertIn(b'<D:collection/>', body)
+        self.assertIn(('>%d<' % len(STORED)).encode(), body)
+
+    def test_listing(self):
+        body = self.get('/data.zip/docs/')
+        self.assertIn(b'>deflated.bin</a>', body)
+
+    def test_not_an_archive(self):
+        self.assertEqual(self.get('/broken.zip'), b'not a zip file')
+        self.assertFalse(self.dc.is_collection(self.baseuri + 'broken.zip'))
+
+    def test_read_only(self):
+        for method, body in (('PUT', b'x'), ('MKCOL', None),
+                             ('DELETE', None)):
+            status = self.request(method, '/data.zip/new', body)[0]
+            self.assertIn(status, (403, 404), method)
+        self.assertEqual(self.request('PUT', '/data.zip/stored.txt',
+                                      b'x')[0], 403)
+        status = self.request('DELETE', '/data.zip/stored.txt')[0]
+        self.assertNotEqual(status, 204)
+        self.assertEqual(self.get('/data.zip/stored.txt'), STORED)
+        status = self.request('MOVE', '/data.tar/dir/member.txt', headers={
+            'Destination': '/moved'})[0]
+        self.assertNotIn(status, (201, 204))
+
+    def test_copy_out(self):
+        status = self.request('COPY', '/data.zip/docs', headers={
+            'Destination': '/extracted'})[0]
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.read('extracted/deflated.bin'), DEFLATED)
+
+    def test_archive_as_file(self):
+        original = self.read('data.zip')
+        status = self.request('COPY', '/data.zip', headers={
+            'Destination': '/copy.zip'})[0]
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.read('copy.zip'), original)
+        status = self.request('MOVE', '/copy.zip', headers={
+            'Destination': '/moved.zip'})[0]
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.request('DELETE', '/moved.zip')[0], 204)
+        self.assertFalse(os.path.exists(self.path('moved.zip')))
+
+    def test_archive_changed(self):
+        self.assertEqual(self.get('/data.zip/stored.txt'), STORED)
+        with zipfile.ZipFile(self.path('data.zip'), 'w') as zf:
+            zf.writestr('stored.txt', b'new', zipfile.ZIP_STORED)
+        self.assertEqual(self.get('/data.zip/stored.txt'), b'new')
+        self.assertEqual(self.request('GET', '/data.zip/docs/')[0], 404)
+
+    def test_unsupported_compression(self):
+        with zipfile.ZipFile(self.path('bz.zip'), 'w') as zf:
+            zf.writestr('member', b'x', zipfile.ZIP_BZIP2)
+        self.assertEqual(self.request('GET', '/bz.zip/member')[0], 415)
+
+    def test_quota_properties(self):
+        body = self.request('PROPFIND', '/data.zip', (
+            b'<?xml version="1.0"?><propfind xmlns="DAV:"><prop>'
+            b'<quota-used-bytes/></prop></propfind>'), {'Depth': '1'})[2]
+        size = os.path.getsize(self.path('data.zip'))
+        self.assertEqual(body.count(b'<D:quota-used-bytes>'), 1)
+        self.assertIn(('>%d</D:quota-used-bytes>' % size).encode(), body)
+
+
+class TestCachedArchive(TestArchive):
+    """ stored members read through the FileCache """
+
+    def make_interface(self, baseuri):
+        dc = TestArchive.make_interface(self, baseuri)
+        dc.files = self.files = FileCache(small_size=100)
+        return dc
+
+    def test_released(self):
+        self.get('/data.zip/stored.txt')
+        self.get('/data.tar/dir/member.txt', {'Range': 'bytes=3-7'})
+        self.assertEqual(len(self.files._entries), 2)
+        for path, file in self.files._entries.items():
+            self.assertEqual(file.refs, 1, path)
+
+    def test_small_archive(self):
+        self.files.small_size = 1 << 20
+        self.assertEqual(self.get('/data.tar/dir/member.txt',
+                                  {'Range': 'bytes=3-7'}), STORED[3:8])
+        file, = self.files._entries.values()
+        self.assertIsNotNone(file.content)
+
+
+class TestArchiveCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def archive(self, name, *members):
+        path = os.path.join(self.directory, name)
+        with zipfile.ZipFile(path, 'w') as zf:
+            for member in members:
+                zf.writestr(member, b'x')
+        return path
+
+    def test_bounded(self):
+        cache = ArchiveCache(max_archives=2)
+        paths = [self.archive('%d.zip' % i, 'a') for i in range(3)]
+        for path in paths:
+            self.assertIsNotNone(cache.get(path))
+        self.assertEqual(list(cache._entries), paths[1:])
+
+    def test_reread_when_changed(self):
+        cache = ArchiveCache()
+        path = self.archive('a.zip', 'a')
+        index = cache.get(path)
+        self.assertIs(cache.get(path), index)
+        self.archive('a.zip', 'a', 'b/c')
+        index = cache.get(path)
+        self.assertEqual(sorted(index.children['']), ['a', 'b'])
+        self.assertEqual(index.children['b'], ['c'])
+
+    def test_no_archive(self):
+        cache = ArchiveCache()
+        path = os.path.join(self.directory, 'bad.tar')
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * 1000)
+        self.assertIsNone(cache.get(path))
+        self.assertIsNone(cache.get(self.directory))
+        self.assertIsNone(cache.get(path + '.missing'))
+
+    def test_file_and_directory(self):
+        index = archive.ArchiveIndex(os.stat(self.directory))
+        index.add('a/b', archive.Member(size=1))
+        index.add('a', archive.Member(size=2))
+        index.add('a/b/', archive.Member(is_dir=True))
+        self.assertTrue(index.members['a'].is_dir)
+        self.assertFalse(index.members['a/b'].is_dir)
+        self.assertEqual(index.children['a'], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import sys
+import socket
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import davxml
+from pywebdav.lib.constants import RT_ALLPROP, RT_PROP, RT_PROPNAME
+from pywebdav.lib.davxml import BodyParser, DAV
+from pywebdav.lib.errors import DAV_Error
+
+from davtest import DAVTestCase
+
+PROP = (b'<?xml version="1.0"?><D:propfind xmlns:D="DAV:" xmlns:x="urn:x">'
+        b'<D:prop><D:getetag/><x:a/><x:b/></D:prop></D:propfind>')
+DOCTYPE = (b'<?xml version="1.0"?><!DOCTYPE propfind [<!ENTITY e "e">]>'
+           b'<propfind xmlns="DAV:"><allprop/></propfind>')
+
+
+def nested(depth):
+    return (b'<?xml version="1.0"?>' + b'<a xmlns="DAV:">' * depth +
+            b'</a>' * depth)
+
+
+class TestBodyParser(unittest.TestCase):
+
+    def assertStatus(self, code, function, *args):
+        with self.assertRaises(DAV_Error) as cm:
+            function(*args)
+        self.assertEqual(cm.exception.args[0], code)
+
+    def test_parse(self):
+        root = BodyParser().parse(PROP)
+        self.assertEqual(root.tag, DAV + 'propfind')
+        self.assertEqual([e.tag for e in root.find(DAV + 'prop')],
+                         [DAV + 'getetag', '{urn:x}a', '{urn:x}b'])
+        self.assertIs(BodyParser().parse(root), root)
+
+    def test_malformed(self):
+        parser = BodyParser()
+        self.assertStatus(400, parser.parse, b'<a><b></a>')
+        self.assertStatus(400, parser.parse, b'')
+        self.assertStatus(400, parser.parse, b'<a xmlns:x="urn:x"><y:b/></a>')
+
+    def test_doctype(self):
+        self.assertStatus(400, BodyParser().parse, DOCTYPE)
+        self.assertStatus(400, BodyParser().parse,
+                          b'<!DOCTYPE a SYSTEM "file:///etc/passwd"><a/>')
+
+    def test_depth(self):
+        parser = BodyParser(max_depth=5)
+        parser.parse(nested(5))
+        self.assertStatus(400, parser.parse, nested(6))
+        BodyParser(max_depth=0).parse(nested(100))
+
+    def test_size(self):
+        parser = BodyParser(max_size=len(PROP))
+        parser.parse(PROP)
+        self.assertStatus(413, parser.parse, PROP + b' ')
+        self.assertStatus(413, parser.check_size, len(PROP) + 1)
+        BodyParser(max_size=0).check_size(1 << 40)
+
+    def test_cache(self):
+        parser = BodyParser(cache_size=2)
+        root = parser.parse(PROP)
+        self.assertIs(parser.parse(PROP), root)
+        self.assertEqual((parser.hits, parser.misses), (1, 1))
+
+        parser.parse(nested(1))
+        parser.parse(nested(2))
+        self.assertEqual(len(parser._cache), 2)
+        self.assertIsNot(parser.parse(PROP), root)
+
+    def test_large_bodies_not_cached(self):
+        parser = BodyParser(cache_body=10)
+        parser.parse(PROP)
+        self.assertEqual(len(parser._cache), 0)
+        parser = BodyParser(cache_size=0)
+        parser.parse(PROP)
+        self.assertEqual(len(parser._cache), 0)
+
+    def test_propfind_request(self):
+        parse = davxml.default_parser.parse
+        self.assertEqual(davxml.propfind_request(parse(PROP)),
+                         (RT_PROP, {'DAV:': ['getetag'],
+                                    'urn:x': ['a', 'b']},
+                          ['DAV:', 'urn:x']))
+        self.assertEqual(davxml.propfind_request(parse(
+            b'<propfind xmlns="DAV:"><allprop/></propfind>'))[0], RT_ALLPROP)
+        self.assertEqual(davxml.propfind_request(parse(
+            b'<propfind xmlns="DAV:"><propname/></propfind>'))[0],
+            RT_PROPNAME)
+
+    def test_propertyupdate_request(self):
+        root = davxml.default_parser.parse(
+            b'<D:propertyupdate xmlns:D="DAV:" xmlns:x="urn:x">'
+            b'<D:set><D:prop><x:a>value</x:a></D:prop></D:set>'
+            b'<D:remove><D:prop><x:b/></D:prop></D:remove>'
+            b'</D:propertyupdate>')
+        changes = davxml.propertyupdate_request(root)
+        self.assertEqual([c[:2] for c in changes],
+                         [('urn:x', 'a'), ('urn:x', 'b')])
+        self.assertIn('value', changes[0][2])
+        self.assertIsNone(changes[1][2])
+        self.assertRaises(DAV_Error, davxml.propertyupdate_request,
+                          davxml.default_parser.parse(PROP))
+
+    def test_lockinfo_request(self):
+        root = davxml.default_parser.parse(
+            b'<D:lockinfo xmlns:D="DAV:"><D:lockscope><D:exclusive/>'
+            b'</D:lockscope><D:locktype><D:write/></D:locktype>'
+            b'</D:lockinfo>')
+        info = davxml.lockinfo_request(root)
+        self.assertEqual((info['lockscope'], info['locktype']),
+                         ('exclusive', 'write'))
+        self.assertRaises(DAV_Error, davxml.lockinfo_request,
+                          davxml.default_parser.parse(
+                              b'<D:lockinfo xmlns:D="DAV:"><D:lockscope/>'
+                              b'</D:lockinfo>'))
+
+
+class TestRequestLimits(DAVTestCase):
+    """ bodies rejected by the server """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.handler.XML_PARSER = BodyParser(max_size=1024, max_depth=8)
+        self.write('file', b'x')
+
+    def propfind(self, body, headers={'Depth': '0'}):
+        return self.request('PROPFIND', '/file', body, headers)[0]
+
+    def test_valid(self):
+        self.assertEqual(self.propfind(PROP), 207)
+
+    def test_doctype(self):
+        self.assertEqual(self.propfind(DOCTYPE), 400)
+
+    def test_depth(self):
+        self.assertEqual(self.propfind(nested(9)), 400)
+
+    def test_size(self):
+        for method in ('PROPFIND', 'PROPPATCH', 'REPORT', 'LOCK'):
+            status = self.request(method, '/file', PROP + b' ' * 1024)[0]
+            self.assertEqual(status, 413, method)
+
+    def test_invalid_content_length(self):
+        for length in (b'x', b'-1'):
+            sock = socket.create_connection(('localhost',
+                                             self.server.server_port))
+            try:
+                sock.sendall(b'PROPFIND /file HTTP/1.1\r\nHost: localhost\r\n'
+                             b'Content-Length: ' + length + b'\r\n\r\n')
+                response = sock.makefile('rb').readline()
+            finally:
+                sock.close()
+            self.assertIn(b' 400 ', response, length)
+
+    def test_malformed(self):
+        self.assertEqual(self.propfind(b'<propfind'), 400)
+        status = self.request('PROPPATCH', '/file', b'<a', {})[0]
+        self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.settings import Settings
+from pywebdav.server.deadprops import XattrPropertyStore, SQLitePropertyStore
+from pywebdav.server.server import setup_properties
+
+from davtest import DAVTestCase
+
+SET = ('<?xml version="1.0"?><propertyupdate xmlns="DAV:" xmlns:x="urn:x">'
+       '<set><prop><x:color>%s</x:color></prop></set></propertyupdate>')
+REMOVE = ('<?xml version="1.0"?><propertyupdate xmlns="DAV:" '
+          'xmlns:x="urn:x"><remove><prop><x:color/></prop></remove>'
+          '</propertyupdate>')
+# the live property makes the whole update fail
+SET_LIVE = ('<?xml version="1.0"?><propertyupdate xmlns="DAV:" '
+            'xmlns:x="urn:x"><set><prop><x:color>red</x:color>'
+            '<getcontentlength>1</getcontentlength></prop></set>'
+            '</propertyupdate>')
+GET = ('<?xml version="1.0"?><propfind xmlns="DAV:" xmlns:x="urn:x">'
+       '<prop><x:color/></prop></propfind>')
+
+
+class DeadPropsTests:
+    """ PROPPATCH and the properties of copied, moved and deleted files """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/file', b'data')
+
+    def proppatch(self, path, body):
+        status, headers, body = self.request('PROPPATCH', path, body)
+        self.assertEqual(status, 207)
+        return body
+
+    def color(self, path):
+        """ return the color of path or None """
+        status, headers, body = self.request('PROPFIND', path, GET,
+                                             {'Depth': '0'})
+        self.assertEqual(status, 207)
+        if b'>blue<' in body:
+            return 'blue'
+        if b'>green<' in body:
+            return 'green'
+        self.assertIn(b'404', body)
+        return None
+
+    def test_set_read_remove(self):
+        body = self.proppatch('/dir/file', SET % 'blue')
+        self.assertIn(b'200 OK', body)
+        self.assertEqual(self.color('/dir/file'), 'blue')
+        self.proppatch('/dir/file', SET % 'green')
+        self.assertEqual(self.color('/dir/file'), 'green')
+        self.proppatch('/dir/file', REMOVE)
+        self.assertIsNone(self.color('/dir/file'))
+
+    def test_collection(self):
+        self.proppatch('/dir/', SET % 'blue')
+        self.assertEqual(self.color('/dir/'), 'blue')
+
+    def test_update_is_atomic(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        body = self.proppatch('/dir/file', SET_LIVE)
+        self.assertIn(b'403', body)
+        self.assertIn(b'424', body)
+        self.assertEqual(self.color('/dir/file'), 'blue')
+
+    def test_missing_resource(self):
+        status, headers, body = self.request('PROPPATCH', '/missing',
+                                             SET % 'blue')
+        self.assertEqual(status, 404)
+
+    def test_copy(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        status, headers, body = self.request(
+            'COPY', '/dir/file', headers={'Destination': '/copy'})
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.color('/copy'), 'blue')
+        self.assertEqual(self.color('/dir/file'), 'blue')
+
+    def test_copy_collection(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        status, headers, body = self.request(
+            'COPY', '/dir/', headers={'Destination': '/other/'})
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.color('/other/file'), 'blue')
+
+    def test_copy_replaces_properties(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        self.write('plain', b'')
+        self.proppatch('/plain', SET % 'green')
+        status, headers, body = self.request(
+            'COPY', '/dir/file', headers={'Destination': '/plain'})
+        self.assertEqual(status, 204)
+        self.assertEqual(self.color('/plain'), 'blue')
+
+    def test_move(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        status, headers, body = self.request(
+            'MOVE', '/dir/', headers={'Destination': '/moved/'})
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.color('/moved/file'), 'blue')
+        # a new file at the old place has no properties
+        self.write('dir/file', b'new')
+        self.assertIsNone(self.color('/dir/file'))
+
+    def test_delete(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        status, headers, body = self.request('DELETE', '/dir/')
+        self.assertEqual(status, 204)
+        self.write('dir/file', b'new')
+        self.assertIsNone(self.color('/dir/file'))
+
+    def test_put_keeps_properties(self):
+        self.proppatch('/dir/file', SET % 'blue')
+        status, headers, body = self.request('PUT', '/dir/file', b'changed')
+        self.assertEqual(status, 201)
+        self.assertEqual(self.color('/dir/file'), 'blue')
+
+
+class TestSQLiteStore(DeadPropsTests, DAVTestCase):
+
+    def make_interface(self, baseuri):
+        dc = DAVTestCase.make_interface(self, baseuri)
+        self.database = self.rundir + '.db'
+        dc.properties = SQLitePropertyStore(self.database)
+        return dc
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+
+@unittest.skipUnless(XattrPropertyStore(tempfile.gettempdir()).supported(),
+                     'no user xattrs in %s' % tempfile.gettempdir())
+class TestXattrStore(DeadPropsTests, DAVTestCase):
+
+    def make_interface(self, baseuri):
+        dc = DAVTestCase.make_interface(self, baseuri)
+        dc.properties = XattrPropertyStore(self.rundir)
+        return dc
+
+
+class TestSetup(unittest.TestCase):
+    """ the xattr store falls back to the database """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = os.path.join(self.directory, 'props.db')
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_probe_leaves_nothing(self):
+        store = XattrPropertyStore(self.directory)
+        if store.supported():
+            self.assertEqual(os.listxattr(self.directory), [])
+
+    @mock.patch.object(XattrPropertyStore, 'supported', return_value=False)
+    def test_fallback(self, supported):
+        settings = Settings(property_store='xattr',
+                            property_database=self.database)
+        with self.assertLogs('pywebdav', 'WARNING'):
+            store = setup_properties(settings, self.directory)
+        self.assertIsInstance(store, SQLitePropertyStore)
+        store.update('/file', [('urn:x', 'color', 'blue')])
+        self.assertEqual(store.get_many(['/file']),
+                         {'/file': {('urn:x', 'color'): 'blue'}})
+
+    @mock.patch.object(XattrPropertyStore, 'supported', return_value=False)
+    def test_no_database(self, supported):
+        settings = Settings(property_store='xattr')
+        with self.assertLogs('pywebdav', 'WARNING'):
+            self.assertIsNone(setup_properties(settings, self.directory))
+
+    @mock.patch.object(XattrPropertyStore, 'supported', return_value=True)
+    def test_xattr(self, supported):
+        settings = Settings(property_store='xattr')
+        self.assertIsInstance(setup_properties(settings, self.directory),
+                              XattrPropertyStore)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import sys
+import hashlib
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.errors import DAV_Error
+from pywebdav.server.deadprops import SQLitePropertyStore
+from pywebdav.server.dedup import DedupHandler
+
+from davtest import BackendTests, DAVTestCase
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class TestDedupBackend(BackendTests, DAVTestCase):
+    """ content stored once below the served directory """
+
+    def make_interface(self, baseuri):
+        dc = DedupHandler(self.rundir, baseuri)
+        dc.properties = SQLitePropertyStore(os.path.join(self.rundir,
+                                                         'props.sqlite'))
+        return dc
+
+    def blobs(self):
+        """ return the hashes of the stored blobs and their references """
+        stored = set()
+        for root, dirs, files in os.walk(self.dc.blobs.directory):
+            if root != self.dc.blobs.tmp:
+                stored.update(files)
+        refs = dict(self.dc._db().execute('SELECT hash, refs FROM blobs'))
+        self.assertEqual(stored, set(refs))
+        return refs
+
+    def test_stored_once(self):
+        self.request('MKCOL', '/dir')
+        self.put('/a', b'same')
+        self.put('/dir/b', b'same')
+        self.request('COPY', '/dir', headers={'Destination': '/copy'})
+        self.assertEqual(self.blobs(), {sha256(b'same'): 3})
+
+        self.put('/a', b'other')
+        self.assertEqual(self.blobs(), {sha256(b'same'): 2,
+                                        sha256(b'other'): 1})
+        self.request('DELETE', '/dir')
+        self.request('MOVE', '/copy/b', headers={'Destination': '/moved'})
+        self.assertEqual(self.blobs(), {sha256(b'same'): 1,
+                                        sha256(b'other'): 1})
+        self.request('DELETE', '/moved')
+        self.assertEqual(self.blobs(), {sha256(b'other'): 1})
+        self.assertEqual(os.listdir(self.dc.blobs.tmp), [])
+
+    def test_etag_is_hash(self):
+        self.put('/a', b'content')
+        self.assertEqual(self.request('GET', '/a')[1]['ETag'],
+                         '"%s"' % sha256(b'content'))
+
+    def test_unchanged_put(self):
+        self.put('/a', b'content')
+        before = self.dc._get('/a')
+        self.put('/a', b'content')
+        self.assertEqual(self.dc._get('/a'), before)
+        self.assertEqual(os.listdir(self.dc.blobs.tmp), [])
+
+    def test_persistent(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/a', b'content')
+        dc = DedupHandler(self.rundir, self.baseuri)
+        self.assertTrue(dc.is_collection(self.baseuri + 'dir'))
+        self.assertEqual(dc.get_childs(self.baseuri + 'dir'),
+                         [self.baseuri + 'dir/a'])
+
+    def test_interrupted_upload(self):
+        def upload():
+            yield b'partial'
+            raise ConnectionResetError
+
+        self.assertRaises(DAV_Error, self.dc.put, self.baseuri + 'a',
+                          upload())
+        self.assertEqual(os.listdir(self.dc.blobs.tmp), [])
+        self.assertFalse(self.dc.exists(self.baseuri + 'a'))
+
+        # left behind by a crash, removed on start
+        open(os.path.join(self.dc.blobs.tmp, 'stale'), 'w').close()
+        DedupHandler(self.rundir, self.baseuri)
+        self.assertEqual(os.listdir(self.dc.blobs.tmp), [])
+
+    def test_write_error(self):
+        with mock.patch('tempfile.mkstemp', side_effect=OSError('full')):
+            self.assertEqual(self.request('PUT', '/a', b'x')[0], 424)
+        self.assertEqual(self.blobs(), {})
+
+    def test_lost_blob(self):
+        self.put('/a', b'content')
+        os.unlink(self.dc.blobs.path(sha256(b'content')))
+        self.assertEqual(self.request('GET', '/a')[0], 404)
+
+    def test_root(self):
+        status, headers, body = self.request('DELETE', '/')
+        self.assertEqual(status, 207)
+        self.assertIn(b'403', body)
+        self.assertTrue(self.dc.is_collection(self.baseuri))
+
+    def test_content_type_of_content(self):
+        self.put('/page', b'<html><body>x</body></html>')
+        self.put('/page.txt', b'<html><body>x</body></html>')
+        self.assertEqual(self.request('GET', '/page')[1]['Content-Type'],
+                         'text/html')
+        # the name wins
+        self.assertEqual(self.request('GET', '/page.txt')[1]['Content-Type'],
+                         'text/plain')
+
+    def test_quota_properties(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/a', b'x' * 10)
+        self.put('/dir/b', b'x' * 10)
+        body = self.request('PROPFIND', '/dir', (
+            b'<?xml version="1.0"?><propfind xmlns="DAV:"><prop>'
+            b'<quota-used-bytes/></prop></propfind>'), {'Depth': '0'})[2]
+        # each path counts
+        self.assertIn(b'>20</D:quota-used-bytes>', body)
+
+    def test_no_space(self):
+        st = os.statvfs(self.rundir)
+        free = mock.Mock(f_bavail=1, f_frsize=st.f_frsize)
+        with mock.patch('os.statvfs', return_value=free):
+            status = self.request('PUT', '/a', b'x' * (st.f_frsize + 1))[0]
+        self.assertEqual(status, 507)
+
+    def test_properties_of_removed(self):
+        self.put('/a', b'x')
+        self.dc.proppatch(self.baseuri + 'a', [('urn:x', 'note', 'old')])
+        self.request('DELETE', '/a')
+        self.put('/a', b'x')
+        self.assertEqual(self.dc.get_dead_props([self.baseuri + 'a']), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import digest
+from pywebdav.lib.digest import (NonceCache, NONCE_OK, NONCE_STALE,
+                                 NONCE_INVALID, check_response, make_ha1,
+                                 hash_hex, parse_digest_header)
+
+from davtest import DAVTestCase
+
+REALM = 'PyWebDAV'
+
+
+def authorization(nonce, nc, method, uri, algorithm='MD5',
+                  password='secret', user='alice'):
+    """ return the Authorization header of a client """
+    cnonce = 'c0ffee'
+    ha1 = make_ha1(algorithm.replace('-SESS', ''), user, REALM, password)
+    if algorithm.endswith('-SESS'):
+        ha1 = hash_hex(algorithm, '%s:%s:%s' % (ha1, nonce, cnonce))
+    ha2 = hash_hex(algorithm, '%s:%s' % (method, uri))
+    nc = '%08x' % nc
+    response = hash_hex(algorithm, ':'.join(
+        (ha1, nonce, nc, cnonce, 'auth', ha2)))
+    return ('Digest username="%s", realm="%s", nonce="%s", uri="%s", '
+            'algorithm=%s, qop=auth, nc=%s, cnonce="%s", response="%s"' %
+            (user, REALM, nonce, uri, algorithm, nc, cnonce, response))
+
+
+class TestDigest(unittest.TestCase):
+
+    def test_parse(self):
+        params = parse_digest_header(
+            'username="a\\"b", realm="r", nc=00000001, qop=auth')
+        self.assertEqual(params, {'username': 'a"b', 'realm': 'r',
+                                  'nc': '00000001', 'qop': 'auth'})
+
+    def test_response(self):
+        for algorithm in digest.ALGORITHMS:
+            params = parse_digest_header(authorization(
+                'n', 1, 'GET', '/file', algorithm)[len('Digest '):])
+            ha1 = make_ha1(algorithm.replace('-SESS', ''), 'alice', REALM,
+                           'secret')
+            self.assertTrue(check_response(params, ha1, 'GET'))
+            self.assertFalse(check_response(params, ha1, 'PUT'))
+            wrong = make_ha1(algorithm.replace('-SESS', ''), 'alice', REALM,
+                             'wrong')
+            self.assertFalse(check_response(params, wrong, 'GET'))
+
+    def test_rfc2617_example(self):
+        # RFC 2617 section 3.5
+        params = {'nonce': 'dcd98b7102dd2f0e8b11d0f600bfb0c093',
+                  'uri': '/dir/index.html', 'qop': 'auth', 'nc': '00000001',
+                  'cnonce': '0a4f113b',
+                  'response': '6629fae49393a05397450978507c4ef1'}
+        ha1 = make_ha1('MD5', 'Mufasa', 'testrealm@host.com',
+                       'Circle Of Life')
+        self.assertTrue(check_response(params, ha1, 'GET'))
+
+
+class TestNonceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.nonces = NonceCache(size=4, ttl=60)
+        self.nonce = self.nonces.new()
+
+    def test_increasing_counts(self):
+        for nc in ('00000001', '00000002', '00000005'):
+            self.assertEqual(self.nonces.check(self.nonce, nc), NONCE_OK)
+
+    def test_replay(self):
+        self.assertEqual(self.nonces.check(self.nonce, '1'), NONCE_OK)
+        self.assertEqual(self.nonces.check(self.nonce, '1'), NONCE_INVALID)
+
+    def test_out_of_order(self):
+        self.assertEqual(self.nonces.check(self.nonce, '3'), NONCE_OK)
+        self.assertEqual(self.nonces.check(self.nonce, '2'), NONCE_OK)
+        self.assertEqual(self.nonces.check(self.nonce, '2'), NONCE_INVALID)
+        self.assertEqual(self.nonces.check(self.nonce, '3'), NONCE_INVALID)
+        self.assertEqual(self.nonces.check(self.nonce, '0'), NONCE_INVALID)
+
+    def test_outside_window(self):
+        self.assertEqual(self.nonces.check(self.nonce, '%x' % 100), NONCE_OK)
+        old = '%x' % (100 - digest.NC_WINDOW)
+        self.assertEqual(self.nonces.check(self.nonce, old), NONCE_INVALID)
+
+    def test_invalid_count(self):
+        self.assertEqual(self.nonces.check(self.nonce, 'xyz'), NONCE_INVALID)
+
+    def test_unknown_nonce_is_stale(self):
+        self.assertEqual(self.nonces.check('unknown', '1'), NONCE_STALE)
+
+    def test_evicted_nonce_is_stale(self):
+        for i in range(4):
+            self.nonces.new()
+        self.assertEqual(self.nonces.check(self.nonce, '1'), NONCE_STALE)
+
+    def test_expired_nonce_is_stale(self):
+        with mock.patch.object(digest.time, 'monotonic',
+                               return_value=time.monotonic() + 61):
+            self.assertEqual(self.nonces.check(self.nonce, '1'), NONCE_STALE)
+            self.assertEqual(self.nonces.remaining(self.nonce), 0)
+
+
+class TestDigestAuth(DAVTestCase):
+    """ Digest authentication of requests """
+
+    config = {'user': 'alice', 'password': 'secret'}
+
+    def setUp(self):
+        self.nonces = NonceCache(ttl=60)
+        self.handler_attributes = {'DO_AUTH': True,
+                                   'AUTH_SCHEMES': ('digest',),
+                                   'NONCES': self.nonces}
+        DAVTestCase.setUp(self)
+        self.write('file', b'data')
+
+    def get(self, authorization, method='GET', path='/file'):
+        return self.request(method, path, None,
+                            {'Authorization': authorization})
+
+    def challenge(self):
+        status, headers, body = self.request('GET', '/file')
+        self.assertEqual(status, 401)
+        challenges = headers.get_all('WWW-Authenticate')
+        self.assertEqual(len(challenges), 2)
+        return parse_digest_header(challenges[0][len('Digest '):])
+
+    def test_challenge(self):
+        params = self.challenge()
+        self.assertEqual(params['algorithm'], 'SHA-256')
+        self.assertEqual(params['stale'], 'false')
+        self.assertEqual(params['qop'], 'auth')
+
+    def test_valid(self):
+        nonce = self.challenge()['nonce']
+        for algorithm in ('MD5', 'SHA-256', 'SHA-256-SESS'):
+            nc = algorithm.count('-') + 1
+            status, headers, body = self.get(
+                authorization(nonce, nc, 'GET', '/file', algorithm))
+            self.assertEqual(status, 200)
+            self.assertEqual(body, b'data')
+
+    def test_replay_is_rejected(self):
+        nonce = self.challenge()['nonce']
+        header = authorization(nonce, 1, 'GET', '/file')
+        self.assertEqual(self.get(header)[0], 200)
+        status, headers, body = self.get(header)
+        self.assertEqual(status, 401)
+        self.assertIn('stale=false', headers['WWW-Authenticate'])
+
+    def test_wrong_password(self):
+        nonce = self.challenge()['nonce']
+        status, headers, body = self.get(
+            authorization(nonce, 1, 'GET', '/file', password='wrong'))
+        self.assertEqual(status, 401)
+
+    def test_other_uri(self):
+        nonce = self.challenge()['nonce']
+        status, headers, body = self.get(
+            authorization(nonce, 1, 'GET', '/other'))
+        self.assertEqual(status, 401)
+
+    def test_stale_nonce(self):
+        status, headers, body = self.get(
+            authorization('unknown', 1, 'GET', '/file'))
+        self.assertEqual(status, 401)
+        self.assertIn('stale=true', headers['WWW-Authenticate'])
+
+    def test_next_nonce(self):
+        nonce = self.challenge()['nonce']
+        with mock.patch.object(digest.time, 'monotonic',
+                               return_value=time.monotonic() + 55):
+            status, headers, body = self.get(
+                authorization(nonce, 1, 'GET', '/file'))
+        self.assertEqual(status, 200)
+        self.assertIn('nextnonce=', headers['Authentication-Info'])
+
+    def test_basic_not_accepted(self):
+        status, headers, body = self.get('Basic YWxpY2U6c2VjcmV0')
+        self.assertEqual(status, 501)
+
+    def test_no_digest_with_password_file(self):
+        self.handler.PASSWORD_FILE = mock.Mock()
+        nonce = self.challenge()['nonce']
+        status, headers, body = self.get(
+            authorization(nonce, 1, 'GET', '/file'))
+        self.assertEqual(status, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
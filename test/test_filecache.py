@@ -0,0 +1,142 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import http.client
+from http.server import HTTPServer
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.fileauth import DAVAuthHandler
+from pywebdav.server.fshandler import FilesystemHandler
+from pywebdav.server.filecache import FileCache
+from pywebdav.server.server import setupDummyConfig
+
+from davtest import DAVTestCase
+
+
+class Test(unittest.TestCase):
+    """ files opened for GET and HEAD are released by the server """
+
+    def setUp(self):
+        self.rundir = tempfile.mkdtemp()
+        with open(os.path.join(self.rundir, 'small'), 'wb') as fp:
+            fp.write(b'x' * 10)
+        with open(os.path.join(self.rundir, 'large'), 'wb') as fp:
+            fp.write(b'y' * 1000)
+
+        class Handler(DAVAuthHandler):
+            DO_AUTH = False
+            _config = setupDummyConfig()
+
+            def log_message(self, *args):
+                pass
+
+        # one request at a time, handle_request() returns when the
+        # connection is closed
+        self.server = HTTPServer(('localhost', 0), Handler)
+        baseuri = 'http://localhost:%d/' % self.server.server_port
+        Handler.IFACE_CLASS = FilesystemHandler(self.rundir, baseuri)
+        self.files = FileCache(small_size=100)
+        Handler.IFACE_CLASS.files = self.files
+
+    def tearDown(self):
+        self.server.server_close()
+        shutil.rmtree(self.rundir)
+
+    def request(self, method, path, headers={}):
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.start()
+        try:
+            conn = http.client.HTTPConnection('localhost',
+                                              self.server.server_port)
+            conn.request(method, path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            conn.close()
+        finally:
+            thread.join()
+        return response.status, body
+
+    def entry(self, name):
+        return self.files._entries[os.path.join(self.rundir, name)]
+
+    def test_head_releases_file(self):
+        status, body = self.request('HEAD', '/large')
+        self.assertEqual(status, 200)
+        entry = self.entry('large')
+        fd = entry.fd
+        self.assertIsNotNone(fd)
+        # only the cache holds the file
+        self.assertEqual(entry.refs, 1)
+
+        self.files.invalidate()
+        self.assertEqual(entry.refs, 0)
+        self.assertIsNone(entry.fd)
+        self.assertRaises(OSError, os.fstat, fd)
+
+    def test_get_releases_file(self):
+        status, body = self.request('GET', '/large')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'y' * 1000)
+        self.assertEqual(self.entry('large').refs, 1)
+
+        status, body = self.request('GET', '/large',
+                                    {'Range': 'bytes=10-19'})
+        self.assertEqual(status, 206)
+        self.assertEqual(body, b'y' * 10)
+        self.assertEqual(self.entry('large').refs, 1)
+
+    def test_small_files_are_released(self):
+        for method in ('GET', 'HEAD', 'GET'):
+            status, body = self.request(method, '/small')
+            self.assertEqual(status, 200)
+        self.assertEqual(self.entry('small').refs, 1)
+
+        status, body = self.request('GET', '/small', {'Range': 'bytes=2-'})
+        self.assertEqual(status, 206)
+        self.assertEqual(body, b'x' * 8)
+        self.assertEqual(self.entry('small').refs, 1)
+
+
+class TestMapped(DAVTestCase):
+    """ files replaced while mapped ranges of them are sent """
+
+    SIZE = 32 * 1024 * 1024
+
+    def make_interface(self, baseuri):
+        dc = DAVTestCase.make_interface(self, baseuri)
+        dc.files = self.files = FileCache(small_size=100, mmap_size=1000)
+        return dc
+
+    def test_put_during_range_get(self):
+        old = bytes(range(256)) * (self.SIZE // 256)
+        self.write('image', old)
+
+        conn = self.connect()
+        conn.request('GET', '/image', headers={'Range': 'bytes=1000-'})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 206)
+        # the server is blocked in the middle of the range
+        start = response.read(64 * 1024)
+        entry = self.files._entries[self.path('image')]
+        self.assertIsNotNone(entry.map)
+
+        status, headers, body = self.request('PUT', '/image', b'new')
+        self.assertEqual(status, 201)
+        self.assertEqual(self.read('image'), b'new')
+
+        # the mapping still has the old content
+        rest = response.read()
+        conn.close()
+        self.assertEqual(start + rest, old[1000:])
+
+        status, headers, body = self.request('GET', '/image')
+        self.assertEqual(body, b'new')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import sys
+import base64
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.authcache import CredentialCache
+from pywebdav.server import htpasswd
+from pywebdav.server.htpasswd import (HtpasswdFile, check_hash,
+                                      make_password, verify_password)
+
+from davtest import DAVTestCase
+
+
+def basic(user, password):
+    credentials = ('%s:%s' % (user, password)).encode('utf-8')
+    return {'Authorization': 'Basic ' + base64.b64encode(credentials).decode()}
+
+
+class TestHashes(unittest.TestCase):
+
+    def test_pbkdf2(self):
+        for scheme in ('pbkdf2', 'pbkdf2-sha256', 'pbkdf2-sha512'):
+            stored = make_password('secret', scheme, rounds=1000)
+            check_hash(stored)
+            self.assertTrue(verify_password('secret', stored))
+            self.assertFalse(verify_password('Secret', stored))
+
+    def test_passlib_pbkdf2(self):
+        # as written by passlib: adapted base64 without padding
+        salt = b'\xfb' * 16
+        dk = hashlib.pbkdf2_hmac('sha256', b'password', salt, 1000)
+        ab64 = lambda data: base64.b64encode(data).decode().rstrip('=') \
+            .replace('+', '.')
+        stored = '$pbkdf2-sha256$1000$%s$%s' % (ab64(salt), ab64(dk))
+        self.assertIn('.', stored)
+        self.assertTrue(verify_password('password', stored))
+        self.assertFalse(verify_password('passwort', stored))
+
+    def test_scrypt(self):
+        stored = make_password('secret', 'scrypt')
+        check_hash(stored)
+        self.assertTrue(verify_password('secret', stored))
+        self.assertFalse(verify_password('secret ', stored))
+
+    @unittest.skipIf(htpasswd.bcrypt is None, 'bcrypt module missing')
+    def test_bcrypt(self):
+        stored = make_password('secret', 'bcrypt')
+        check_hash(stored)
+        self.assertTrue(verify_password('secret', stored))
+        self.assertFalse(verify_password('other', stored))
+
+    def test_malformed(self):
+        stored = make_password('secret', rounds=1000)
+        for broken in (stored[:20], stored.replace('$1000$', '$many$'),
+                       '$apr1$salt$hash', 'plain'):
+            with self.assertLogs(htpasswd.log, 'ERROR'):
+                self.assertFalse(verify_password('secret', broken))
+        self.assertRaises(ValueError, check_hash, stored[:20])
+        self.assertRaises(ValueError, check_hash, '$2b$12$short')
+        self.assertRaises(ValueError, check_hash, 'plain')
+
+    def test_unknown_scheme(self):
+        self.assertRaises(ValueError, make_password, 'secret', 'md5')
+
+
+@mock.patch.object(htpasswd, 'RELOAD_INTERVAL', 0)
+class TestReload(unittest.TestCase):
+    """ the password file is reloaded when it changes """
+
+    def setUp(self):
+        fd, self.fileName = tempfile.mkstemp()
+        os.close(fd)
+        self.alice = make_password('alice', rounds=1000)
+        self.bob = make_password('bob', rounds=1000)
+        self.store(b'# users\nalice:%s\n\n' % self.alice.encode())
+        self.passwords = HtpasswdFile(self.fileName)
+
+    def tearDown(self):
+        os.remove(self.fileName)
+
+    def store(self, content):
+        with open(self.fileName, 'wb') as fp:
+            fp.write(content)
+        # a new modification time even on coarse filesystems
+        st = os.stat(self.fileName)
+        ns = st.st_mtime_ns + getattr(self, 'tick', 0)
+        os.utime(self.fileName, ns=(ns, ns))
+        self.tick = getattr(self, 'tick', 0) + 10 ** 9
+
+    def test_verify(self):
+        self.assertTrue(self.passwords.verify('alice', 'alice'))
+        self.assertFalse(self.passwords.verify('alice', 'bob'))
+        self.assertFalse(self.passwords.verify('bob', 'bob'))
+
+    def test_reload(self):
+        self.store(b'bob:%s\n' % self.bob.encode())
+        self.assertTrue(self.passwords.verify('bob', 'bob'))
+        self.assertFalse(self.passwords.verify('alice', 'alice'))
+
+    def test_missing_file_keeps_users(self):
+        os.remove(self.fileName)
+        with self.assertLogs(htpasswd.log, 'ERROR'):
+            self.assertTrue(self.passwords.verify('alice', 'alice'))
+        open(self.fileName, 'w').close()
+
+    def test_bad_encoding_keeps_users(self):
+        self.store(b'bob:%s\n\xff\xfe:x\n' % self.bob.encode())
+        with self.assertLogs(htpasswd.log, 'ERROR'):
+            self.assertTrue(self.passwords.verify('alice', 'alice'))
+        self.assertFalse(self.passwords.verify('bob', 'bob'))
+
+    def test_malformed_line_keeps_users(self):
+        for content in (b'bob\n', b':%s\n' % self.bob.encode(),
+                        # written halfway
+                        b'bob:%s\n' % self.bob[:30].encode()):
+            self.store(content)
+            with self.assertLogs(htpasswd.log, 'ERROR'):
+                self.assertTrue(self.passwords.verify('alice', 'alice'))
+            self.assertFalse(self.passwords.verify('bob', 'bob'))
+
+        # the complete file is read
+        self.store(b'bob:%s\n' % self.bob.encode())
+        self.assertTrue(self.passwords.verify('bob', 'bob'))
+
+    def test_malformed_file_at_start(self):
+        self.store(b'bob\n')
+        self.assertRaises(ValueError, HtpasswdFile, self.fileName)
+
+    def test_changed_password_is_not_cached(self):
+        passwords = HtpasswdFile(self.fileName, CredentialCache())
+        self.assertTrue(passwords.verify('alice', 'alice'))
+        self.store(b'alice:%s\n' % self.bob.encode())
+        self.assertFalse(passwords.verify('alice', 'alice'))
+        self.assertTrue(passwords.verify('alice', 'bob'))
+
+
+class TestBasicAuth(DAVTestCase):
+    """ Basic authentication against a password file """
+
+    def setUp(self):
+        fd, self.fileName = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as fp:
+            fp.write('alice:%s\n' % make_password('secret', rounds=1000))
+        self.handler_attributes = {
+            'DO_AUTH': True,
+            'PASSWORD_FILE': HtpasswdFile(self.fileName, CredentialCache())}
+        DAVTestCase.setUp(self)
+        self.write('file', b'data')
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        os.remove(self.fileName)
+
+    def test_valid(self):
+        status, headers, body = self.request('GET', '/file', None,
+                                             basic('alice', 'secret'))
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'data')
+
+    def test_missing_credentials(self):
+        status, headers, body = self.request('GET', '/file')
+        self.assertEqual(status, 401)
+        self.assertIn('Basic', headers['WWW-Authenticate'])
+
+    def test_wrong_password(self):
+        for headers in (basic('alice', 'wrong'), basic('bob', 'secret'),
+                        {'Authorization': 'Basic !!!'}):
+            status, headers, body = self.request('GET', '/file', None, headers)
+            self.assertEqual(status, 401)
+
+    def test_unknown_scheme(self):
+        status, headers, body = self.request(
+            'GET', '/file', None, {'Authorization': 'Bearer token'})
+        self.assertEqual(status, 501)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.fshandler import TEMP_PREFIX
+from pywebdav.server.indexhandler import (IndexedFilesystemHandler,
+                                          MetadataIndex)
+
+from davtest import DAVTestCase
+
+DEPTH1 = {'Depth': '1'}
+
+
+class TestMetadataIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = self.directory + '.db'
+        for name in ('a/b/c', 'a/file', 'top'):
+            path = os.path.join(self.directory, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fp:
+                fp.write(b'x' * len(name))
+        self.index = MetadataIndex(self.database, self.directory,
+                                   workers=2)
+        self.index.reconcile()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def local(self, path):
+        return os.path.join(self.directory, *path.strip('/').split('/'))
+
+    def test_scan(self):
+        self.assertTrue(self.index.ready)
+        self.assertEqual(sorted(self.index.children('/')), ['a', 'top'])
+        self.assertEqual(sorted(self.index.children('/a')), ['b', 'file'])
+        self.assertEqual(self.index.get('/a/b/c')[:2], (0, 5))
+        self.assertEqual(self.index.get('/a')[0], 1)
+        self.assertIsNone(self.index.get('/missing'))
+
+    def test_reconcile_drops_removed(self):
+        shutil.rmtree(self.local('/a/b'))
+        self.index.reconcile()
+        self.assertIsNone(self.index.get('/a/b'))
+        self.assertIsNone(self.index.get('/a/b/c'))
+        self.assertEqual(self.index.children('/a'), ['file'])
+
+    def test_persistent(self):
+        seen = self.index.seen
+        index = MetadataIndex(self.database, self.directory)
+        self.assertEqual(index.seen, seen)
+        # answered from the filesystem until reconciled
+        self.assertFalse(index.ready)
+        self.assertIsNotNone(index.get('/a/file'))
+
+    def test_update(self):
+        with open(self.local('/a/file'), 'ab') as fp:
+            fp.write(b'more')
+        self.index.update('/a/file')
+        self.assertEqual(self.index.get('/a/file')[1], 10)
+
+        os.remove(self.local('/a/file'))
+        self.index.update('/a/file')
+        self.assertIsNone(self.index.get('/a/file'))
+
+    def test_moved_in_directory(self):
+        os.rename(self.local('/a'), self.local('/moved'))
+        self.index.update('/moved')
+        self.index.update('/a')
+        self.assertEqual(self.index.get('/moved/b/c')[1], 5)
+        self.assertIsNone(self.index.get('/a/b/c'))
+
+    def test_temporary_files(self):
+        open(self.local('/a/' + TEMP_PREFIX + 'x'), 'w').close()
+        self.index.reconcile()
+        self.assertNotIn(TEMP_PREFIX + 'x', self.index.children('/a'))
+
+    def test_symlink_loop(self):
+        os.symlink(self.local('/a'), self.local('/a/b/loop'))
+        self.index.reconcile()
+        self.assertEqual(self.index.get('/a/b/loop')[0], 1)
+        self.assertIsNone(self.index.get('/a/b/loop/b/loop/file'))
+
+
+class TestIndexedHandler(DAVTestCase):
+    """ requests answered from the index """
+
+    def make_interface(self, baseuri):
+        self.database = self.rundir + '.db'
+        return IndexedFilesystemHandler(self.rundir, baseuri,
+                                        database=self.database, workers=2)
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/file.txt', b'text')
+        self.write('dir/sub/other', b'other')
+        self.dc.index.reconcile()
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def propfind(self, path, headers=DEPTH1):
+        status, headers, body = self.request('PROPFIND', path,
+                                             headers=headers)
+        self.assertEqual(status, 207)
+        return body
+
+    def test_propfind(self):
+        body = self.propfind('/dir/')
+        self.assertIn(b'/dir/file.txt<', body)
+        self.assertIn(b'/dir/sub<', body)
+        self.assertIn(b'>text/plain<', body)
+        self.assertIn(b'>4<', body)
+
+    def test_same_as_filesystem(self):
+        indexed = self.propfind('/dir/')
+        self.dc.index.ready = False
+        self.assertEqual(self.propfind('/dir/'), indexed)
+
+    def test_modifications(self):
+        self.assertEqual(self.request('PUT', '/dir/new', b'new')[0], 201)
+        self.assertEqual(self.request('MKCOL', '/dir/col')[0], 201)
+        self.assertIn(self.request(
+            'COPY', '/dir/sub/', headers={'Destination': '/dir/copy/'})[0],
+            (201, 204))
+        self.assertIn(self.request(
+            'MOVE', '/dir/file.txt',
+            headers={'Destination': '/dir/moved.txt'})[0], (201, 204))
+        self.assertEqual(self.request('DELETE', '/dir/sub/')[0], 204)
+
+        self.assertEqual(sorted(self.dc.index.children('/dir')),
+                         ['col', 'copy', 'moved.txt', 'new'])
+        self.assertEqual(self.dc.index.get('/dir/copy/other')[1], 5)
+        self.assertIsNone(self.dc.index.get('/dir/sub/other'))
+
+    def test_put_over_file(self):
+        self.request('PUT', '/dir/file.txt', b'longer text')
+        self.assertIn(b'>11<', self.propfind('/dir/file.txt', {'Depth': '0'}))
+
+    def test_created_behind_the_server(self):
+        self.write('dir/outside', b'x')
+        status, headers, body = self.request('GET', '/dir/outside')
+        self.assertEqual(status, 200)
+        self.assertIsNotNone(self.dc.index.get('/dir/outside'))
+
+    def test_index_changed(self):
+        self.write('dir/sub/other', b'changed!')
+        self.dc.index_changed(self.path('dir/sub/other'))
+        self.assertEqual(self.dc.index.get('/dir/sub/other')[1], 8)
+
+    def test_missing(self):
+        status, headers, body = self.request('PROPFIND', '/missing',
+                                             headers=DEPTH1)
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
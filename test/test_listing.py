@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.listing import DirectoryLister, sort_entries
+
+from davtest import DAVTestCase
+
+
+def names(body):
+    """ return the names of the rows of a listing """
+    return re.findall(r'<tr><td><a href="[^"]*">([^<]*)</a>',
+                      body.decode('utf-8'))
+
+
+class TestListing(DAVTestCase):
+    """ HTML listings of collections """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.dc.listing = self.lister = DirectoryLister(cache_size=4,
+                                                        page_size=3)
+        for i, name in enumerate(('b', 'a', 'c', 'e', 'd')):
+            self.write('dir/' + name, b'x' * (10 - i))
+        os.mkdir(self.path('dir/sub'))
+        self.write('dir/.hidden', b'')
+
+    def get(self, path='/dir/'):
+        status, headers, body = self.request('GET', path)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], 'text/html;charset=utf-8')
+        return body
+
+    def test_first_page(self):
+        body = self.get()
+        # collections first, the hidden file is left out
+        self.assertEqual(names(body), ['sub/', 'a', 'b'])
+        self.assertIn(b'entries 1-3 of 6', body)
+        self.assertIn(b'offset=3&amp;limit=3', body)
+        self.assertNotIn(b'previous', body)
+
+    def test_last_page(self):
+        body = self.get('/dir/?offset=3')
+        self.assertEqual(names(body), ['c', 'd', 'e'])
+        self.assertIn(b'previous', body)
+        self.assertNotIn(b'next', body)
+
+    def test_sort(self):
+        body = self.get('/dir/?sort=size&order=desc&limit=0')
+        self.assertEqual(names(body), ['sub/', 'b', 'a', 'c', 'e', 'd'])
+        self.assertIn(b'6 entries', body)
+
+    def test_invalid_query(self):
+        body = self.get('/dir/?offset=x&sort=owner&order=up')
+        self.assertEqual(names(body), ['sub/', 'a', 'b'])
+
+    def test_escaping(self):
+        self.write('dir/<b>&"', b'')
+        body = self.get('/dir/?limit=0')
+        self.assertIn(b'&lt;b&gt;&amp;&quot;', body)
+        self.assertIn(b'href="/dir/%3Cb%3E%26%22"', body)
+
+    def test_cached_until_changed(self):
+        first = self.get()
+        self.assertEqual(self.get(), first)
+        self.assertEqual(len(self.lister._pages), 1)
+
+        status, headers, body = self.request('PUT', '/dir/0', b'')
+        self.assertEqual(status, 201)
+        self.assertEqual(names(self.get()), ['sub/', '0', 'a'])
+
+    def test_invalidate(self):
+        self.get()
+        self.lister.invalidate(self.path('dir/a'))
+        self.assertEqual(len(self.lister._pages), 0)
+        self.assertEqual(len(self.lister._entries), 0)
+
+    def test_cache_is_bounded(self):
+        for offset in range(6):
+            self.get('/dir/?offset=%d' % offset)
+        self.assertEqual(len(self.lister._pages), 4)
+
+    def test_missing(self):
+        status, headers, body = self.request('GET', '/missing/')
+        self.assertEqual(status, 404)
+
+
+class TestSortEntries(unittest.TestCase):
+
+    def test_collections_first(self):
+        entries = [('b', False, 1, 3), ('z', True, 0, 1), ('a', False, 2, 2)]
+        self.assertEqual([e[0] for e in sort_entries(entries, 'mtime')],
+                         ['z', 'a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server import memhandler
+from pywebdav.server.memhandler import MemoryHandler, MemoryResource
+
+from davtest import BackendTests, DAVTestCase
+
+
+class TestMemoryBackend(BackendTests, DAVTestCase):
+    """ the tree in memory served """
+
+    def make_interface(self, baseuri):
+        return MemoryHandler(baseuri, max_bytes=100)
+
+    def used(self, path='/'):
+        return self.dc._lookup(path).used
+
+    def test_nothing_on_disk(self):
+        self.put('/file', b'x')
+        self.assertEqual(os.listdir(self.rundir), [])
+
+    def test_large_file(self):
+        self.dc.max_bytes = 0
+        content = os.urandom(3 * memhandler.BUFFER_SIZE + 5)
+        self.put('/large', content)
+        self.assertIsInstance(self.dc.get_data(self.baseuri + 'large'),
+                              MemoryResource)
+        self.assertEqual(self.get('/large'), content)
+        start = memhandler.BUFFER_SIZE - 2
+        self.assertEqual(self.get('/large', {'Range': 'bytes=%d-%d' % (
+            start, start + memhandler.BUFFER_SIZE)}),
+            content[start:start + memhandler.BUFFER_SIZE + 1])
+
+    def test_resource_read(self):
+        resource = MemoryResource(bytearray(b'0123456789'), 2, 6)
+        self.assertEqual(resource.read(4), b'2345')
+        self.assertEqual(resource.read(), b'67')
+        self.assertEqual(resource.read(), b'')
+
+    def test_usage(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/a', b'x' * 10)
+        self.put('/dir/b', b'x' * 20)
+        self.assertEqual((self.used(), self.used('/dir')), (30, 30))
+        self.put('/dir/a', b'x' * 5)
+        self.assertEqual(self.used(), 25)
+        self.request('COPY', '/dir', headers={'Destination': '/copy'})
+        self.assertEqual((self.used(), self.used('/copy')), (50, 25))
+        self.request('MOVE', '/copy/b', headers={'Destination': '/b'})
+        self.assertEqual((self.used(), self.used('/copy')), (50, 5))
+        self.request('DELETE', '/dir')
+        self.assertEqual(self.used(), 25)
+
+    def test_limit(self):
+        self.put('/a', b'x' * 60)
+        self.assertEqual(self.request('PUT', '/b', b'x' * 50)[0], 507)
+        # replacing counts only the difference
+        self.put('/a', b'x' * 100)
+        self.assertEqual(self.request('COPY', '/a', headers={
+            'Destination': '/b'})[0], 507)
+        self.assertEqual(self.request('GET', '/b')[0], 404)
+        self.assertEqual(self.used(), 100)
+
+    def test_chunked_limit(self):
+        conn = self.connect()
+        conn.request('PUT', '/chunked', iter([b'a' * 60, b'b' * 60]),
+                     encode_chunked=True)
+        self.assertEqual(conn.getresponse().status, 507)
+        conn.close()
+        self.assertEqual(self.used(), 0)
+
+    def test_copy_shares_content(self):
+        self.put('/a', b'shared')
+        self.request('COPY', '/a', headers={'Destination': '/b'})
+        self.assertIs(self.dc._lookup('/a').content,
+                      self.dc._lookup('/b').content)
+
+    def test_quota_properties(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/a', b'x' * 10)
+        body = self.request('PROPFIND', '/dir', (
+            b'<?xml version="1.0"?><propfind xmlns="DAV:"><prop>'
+            b'<quota-used-bytes/><quota-available-bytes/></prop>'
+            b'</propfind>'), {'Depth': '0'})[2]
+        self.assertIn(b'>10</D:quota-used-bytes>', body)
+        self.assertIn(b'>90</D:quota-available-bytes>', body)
+
+    def test_content_type(self):
+        self.request('PUT', '/page', b'x', {'Content-Type': 'text/x-custom'})
+        self.put('/page.html', b'x')
+        self.assertEqual(self.request('GET', '/page')[1]['Content-Type'],
+                         'text/x-custom')
+        self.assertEqual(self.request('GET', '/page.html')[1]
+                         ['Content-Type'], 'text/html')
+
+    def test_listing(self):
+        self.request('MKCOL', '/dir')
+        self.put('/dir/file', b'x')
+        status, headers, body = self.request('GET', '/dir/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'>file</a>', body)
+
+    def test_concurrent_puts(self):
+        self.dc.max_bytes = 0
+        self.request('MKCOL', '/dir')
+
+        def put(i):
+            for j in range(10):
+                self.put('/dir/%d-%d' % (i, j), b'x' * i)
+
+        threads = [threading.Thread(target=put, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.dc._lookup('/dir').children), 80)
+        self.assertEqual(self.used(), 10 * sum(range(8)))
+
+
+if __name__ == '__main__':
+    unittest.main()
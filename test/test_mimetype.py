@@ -0,0 +1,124 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.mimetype import DEFAULT_TYPE, MimeTypeResolver
+
+from davtest import DAVTestCase
+
+
+class TestMimeTypeResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.resolver = MimeTypeResolver(cache_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+        return path
+
+    def resolve(self, path):
+        return self.resolver.resolve(path, os.stat(path))
+
+    def test_by_name(self):
+        self.assertEqual(self.resolver.by_name('a.HTML'), 'text/html')
+        self.assertEqual(self.resolver.by_name('a.tar.gz'), 'application/gzip')
+        self.assertIsNone(self.resolver.by_name('README'))
+        self.assertIsNone(self.resolver.by_name('dir.d/README'))
+        self.assertIsNone(self.resolver.by_name('a.unknownsuffix'))
+
+    def test_add_type(self):
+        self.resolver.add_type('.MD', 'text/markdown')
+        self.assertEqual(self.resolver.by_name('a.md'), 'text/markdown')
+
+    def test_mime_types_file(self):
+        path = self.file('mime.types', b'text/x-special  special\n')
+        resolver = MimeTypeResolver(path)
+        self.assertEqual(resolver.by_name('a.special'), 'text/x-special')
+
+    def test_name_wins(self):
+        path = self.file('image.txt', b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(self.resolve(path), 'text/plain')
+        self.assertEqual(self.resolver.sniff_count, 0)
+
+    def test_sniff(self):
+        for content, type in ((b'\x89PNG\r\n\x1a\n....', 'image/png'),
+                              (b'%PDF-1.4', 'application/pdf'),
+                              (b'  <!DOCTYPE html><html>', 'text/html'),
+                              (b'<?xml version="1.0"?>', 'application/xml'),
+                              ('grüße'.encode('utf-8'), 'text/plain'),
+                              (b'\x00\x01\x02', DEFAULT_TYPE),
+                              (b'\xff\xfe\xfd\xfc\xfb\xfa', DEFAULT_TYPE),
+                              (b'', DEFAULT_TYPE)):
+            path = self.file('noname', content)
+            self.assertEqual(self.resolve(path), type, content)
+
+    def test_truncated_utf8_is_text(self):
+        path = self.file('noname', b'a' * 511 + 'ü'.encode('utf-8'))
+        self.assertEqual(self.resolve(path), 'text/plain')
+
+    def test_tar(self):
+        path = self.file('noname', b'\x00' * 257 + b'ustar' + b'\x00' * 250)
+        self.assertEqual(self.resolve(path), 'application/x-tar')
+
+    def test_cached_by_inode(self):
+        path = self.file('noname', b'%PDF-1.4')
+        self.resolve(path)
+        self.resolve(path)
+        self.assertEqual(self.resolver.sniff_count, 1)
+        self.assertEqual(self.resolver.sniff_hits, 1)
+
+        # a changed file is sniffed again
+        path = self.file('noname', b'GIF89a and more')
+        self.assertEqual(self.resolve(path), 'image/gif')
+        self.assertEqual(self.resolver.sniff_count, 2)
+
+    def test_cache_is_bounded(self):
+        for i in range(4):
+            self.resolve(self.file('noname%d' % i, b'plain'))
+        self.assertEqual(len(self.resolver._cache), 2)
+
+    def test_no_sniffing(self):
+        resolver = MimeTypeResolver(sniff=False)
+        path = self.file('noname', b'%PDF-1.4')
+        self.assertEqual(resolver.resolve(path, os.stat(path)), DEFAULT_TYPE)
+        self.assertEqual(resolver.resolve(path), DEFAULT_TYPE)
+
+    def test_missing_file(self):
+        path = self.file('noname', b'%PDF')
+        st = os.stat(path)
+        os.remove(path)
+        self.assertEqual(self.resolver.resolve(path, st), DEFAULT_TYPE)
+
+
+class TestContentType(DAVTestCase):
+    """ Content-Type of GET responses """
+
+    def test_get(self):
+        self.write('page.html', b'<html></html>')
+        self.write('noname', b'%PDF-1.4')
+        for name, type in (('page.html', 'text/html'),
+                           ('noname', 'application/pdf')):
+            status, headers, body = self.request('GET', '/' + name)
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['Content-Type'], type)
+
+    def test_mimecheck_off(self):
+        self.dc.mimecheck = False
+        self.write('page.html', b'<html></html>')
+        status, headers, body = self.request('GET', '/page.html')
+        self.assertEqual(headers['Content-Type'], DEFAULT_TYPE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import unittest
+from xml.dom import minidom
+from xml.etree import ElementTree
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.multistatus import (EMPTY_MULTISTATUS, ResponseTemplate,
+                                      escape, mk_element, multistatus)
+
+DAV = '{DAV:}'
+
+
+def parse(responses):
+    """ return the parsed multistatus of encoded responses """
+    return ElementTree.fromstring(multistatus(responses))
+
+
+class TestMultistatus(unittest.TestCase):
+
+    def setUp(self):
+        self.template = ResponseTemplate(['DAV:', 'urn:x', ''])
+
+    def test_escape_like_minidom(self):
+        text = 'a&b<c>"d\'e'
+        node = minidom.Document().createTextNode(text)
+        element = minidom.Document().createElement('p')
+        element.setAttribute('a', text)
+        self.assertEqual(escape(text), node.toxml())
+        self.assertEqual('<p a="%s"/>' % escape(text), element.toxml())
+
+    def test_empty(self):
+        self.assertEqual(multistatus([]), EMPTY_MULTISTATUS)
+        self.assertEqual(ElementTree.fromstring(EMPTY_MULTISTATUS).tag,
+                         DAV + 'multistatus')
+        tail = mk_element('sync-token', 'a&b')
+        root = parse([tail])
+        self.assertEqual(root.find(DAV + 'sync-token').text, 'a&b')
+
+    def test_prop_response(self):
+        good = {'DAV:': {'getcontentlength': 3, 'resourcetype': 1},
+                'urn:x': {'note': '<&>'},
+                '': {'plain': 'text'}}
+        bad = {404: {'urn:x': ['missing']}, 403: {'DAV:': ['quota']}}
+        root = parse([self.template.prop_response(
+            'http://h:8/a b/c', good, bad)])
+        response = root.find(DAV + 'response')
+        self.assertEqual(response.find(DAV + 'href').text,
+                         'http://h:8/a%20b/c')
+
+        ok, missing, forbidden = response.findall(DAV + 'propstat')
+        prop = ok.find(DAV + 'prop')
+        self.assertEqual(prop.find(DAV + 'getcontentlength').text, '3')
+        self.assertIsNotNone(prop.find(DAV + 'resourcetype/' + DAV +
+                                       'collection'))
+        self.assertEqual(prop.find('{urn:x}note').text, '<&>')
+        self.assertEqual(prop.find('plain').text, 'text')
+        self.assertEqual(ok.find(DAV + 'status').text, 'HTTP/1.1 200 OK')
+
+        self.assertIsNotNone(missing.find(DAV + 'prop/{urn:x}missing'))
+        self.assertIn('404', missing.find(DAV + 'status').text)
+        self.assertIsNotNone(forbidden.find(DAV + 'prop/' + DAV + 'quota'))
+        self.assertIn('403', forbidden.find(DAV + 'status').text)
+
+    def test_resourcetype_of_file(self):
+        root = parse([self.template.prop_response(
+            'http://h/a', {'DAV:': {'resourcetype': 0}}, {})])
+        self.assertEqual(list(root.find('.//' + DAV + 'resourcetype')), [])
+
+    def test_node_values(self):
+        doc = minidom.parseString('<r xmlns:D="DAV:"><D:lockentry/>'
+                                  '<D:lockentry/></r>')
+        nodes = doc.documentElement.childNodes
+        root = parse([self.template.prop_response(
+            'http://h/a', {'DAV:': {'supportedlock': list(nodes),
+                                    'lockdiscovery': [],
+                                    'owner': nodes[0]}}, {})])
+        prop = root.find('.//' + DAV + 'prop')
+        self.assertEqual(len(prop.findall(DAV + 'supportedlock/' +
+                                          DAV + 'lockentry')), 2)
+        self.assertEqual(len(prop.find(DAV + 'lockdiscovery')), 0)
+        self.assertIsNotNone(prop.find(DAV + 'owner/' + DAV + 'lockentry'))
+
+    def test_no_properties(self):
+        root = parse([self.template.prop_response('http://h/a', {}, {})])
+        self.assertIsNotNone(root.find('.//' + DAV + 'propstat/' +
+                                       DAV + 'prop'))
+
+    def test_namespaces_added_later(self):
+        first = self.template.response_start()
+        self.template.namespaces.append('urn:late')
+        self.assertNotEqual(self.template.response_start(), first)
+        root = parse([self.template.prop_response(
+            'http://h/a', {'urn:late': {'dead': 'value'}}, {})])
+        self.assertEqual(root.find('.//{urn:late}dead').text, 'value')
+
+    def test_propname_response(self):
+        root = parse([self.template.propname_response(
+            'http://h/a', {'DAV:': ['getetag'], 'urn:x': ['a', 'b'],
+                           '': ['plain'], 'urn:empty': []})])
+        props = root.findall('.//' + DAV + 'prop')
+        self.assertEqual(len(props), 4)
+        names = [child.tag for prop in props for child in prop]
+        self.assertEqual(names, [DAV + 'getetag', '{urn:x}a', '{urn:x}b',
+                                 'plain'])
+
+        root = parse([self.template.propname_response('http://h/a', {})])
+        self.assertIsNotNone(root.find('.//' + DAV + 'propstat'))
+
+    def test_status_response(self):
+        root = parse([self.template.status_response('http://h/a', 507)])
+        self.assertIn('507', root.find('.//' + DAV + 'status').text)
+
+    def test_href(self):
+        href = self.template.href
+        self.assertEqual(href('http://h/a b'),
+                         b'<D:href>http://h/a%20b</D:href>')
+        self.assertEqual(href('http://h'), b'<D:href>http://h</D:href>')
+        # not split by hand
+        self.assertEqual(href('http://h/a;b?c#d'),
+                         b'<D:href>http://h/a</D:href>')
+        self.assertEqual(href('http://h/\xe4'),
+                         b'<D:href>http://h/%C3%A4</D:href>')
+        self.assertEqual(list(self.template._hosts), ['http://h'])
+
+    def test_baseurl(self):
+        template = ResponseTemplate(['DAV:'], baseurl='https://proxy/dav')
+        self.assertEqual(template.href('http://h:8/a/b'),
+                         b'<D:href>https://proxy/dav/a/b</D:href>')
+
+
+if __name__ == '__main__':
+    unittest.main()
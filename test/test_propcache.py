@@ -0,0 +1,106 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.propcache import ResponseCache
+from pywebdav.server import fshandler
+from pywebdav.server.fshandler import FilesystemHandler
+
+from davtest import DAVTestCase
+
+DEPTH1 = {'Depth': '1'}
+
+
+class TestVersions(unittest.TestCase):
+    """ versions of collections change with their members """
+
+    def setUp(self):
+        self.rundir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.rundir, 'dir'))
+        self.dc = FilesystemHandler(self.rundir, 'http://localhost/')
+
+    def tearDown(self):
+        shutil.rmtree(self.rundir)
+
+    def test_member_changes_version(self):
+        before = self.dc.get_collection_version('/dir')
+        self.dc.path_changed(os.path.join(self.rundir, 'dir', 'file'))
+        self.assertNotEqual(self.dc.get_collection_version('/dir'), before)
+
+    def test_missing_resource_has_no_version(self):
+        self.assertIsNone(self.dc.get_collection_version('/missing'))
+
+    @mock.patch.object(fshandler, 'MAX_CHANGES', 4)
+    def test_changes_are_bounded(self):
+        versions = set()
+        for i in range(20):
+            versions.add(self.dc.get_collection_version('/dir'))
+            self.dc.path_changed(os.path.join(self.rundir, 'dir', str(i)))
+            # others push dir out of the remembered paths
+            for j in range(3):
+                self.dc.path_changed(os.path.join(self.rundir, 'o%d' % j,
+                                                  str(i)))
+        self.assertLessEqual(len(self.dc._changes), 4)
+        # no version came back after a change
+        self.assertEqual(len(versions), 20)
+
+    def test_flush_changes_all_versions(self):
+        before = self.dc.get_collection_version('/')
+        self.dc.path_changed(None)
+        self.assertNotEqual(self.dc.get_collection_version('/'), before)
+
+
+class TestResponseCache(DAVTestCase):
+    """ PROPFIND responses served from the ResponseCache """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.cache = self.handler.RESPONSE_CACHE = ResponseCache()
+        self.write('dir/file', b'x' * 10)
+
+    def propfind(self, path='/dir/', headers=DEPTH1):
+        status, headers, body = self.request('PROPFIND', path,
+                                             headers=headers)
+        self.assertEqual(status, 207)
+        return body
+
+    def test_repeated_propfind_is_cached(self):
+        first = self.propfind()
+        self.assertEqual(self.propfind(), first)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_put_invalidates(self):
+        self.assertIn(b'>10<', self.propfind())
+        status, headers, body = self.request('PUT', '/dir/file', b'y' * 12)
+        self.assertEqual(status, 201)
+        self.assertIn(b'>12<', self.propfind())
+
+    def test_change_behind_the_server(self):
+        self.propfind()
+        # same size, the directory itself is unchanged
+        self.write('dir/file', b'z' * 11)
+        self.dc.path_changed(self.path('dir/file'))
+        self.assertIn(b'>11<', self.propfind())
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_depth_infinity_is_not_cached(self):
+        headers = {'Depth': 'infinity'}
+        self.propfind('/', headers)
+        self.propfind('/', headers)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_missing_resource(self):
+        status, headers, body = self.request('PROPFIND', '/missing',
+                                             headers=DEPTH1)
+        self.assertEqual(status, 404)
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import os
+import re
+import sys
+import time
+import threading
+import unittest
+import http.client
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import propfind
+from pywebdav.lib.errors import DAV_Condition, DAV_NotFound
+from pywebdav.lib.propfind import PROPFIND, map_ordered
+from pywebdav.server.server import setupDummyConfig
+
+from davtest import DAVTestCase
+
+INFINITY = {'Depth': 'infinity'}
+PROPNAME = b'<?xml version="1.0"?><propfind xmlns="DAV:"><propname/></propfind>'
+
+
+def hrefs(body):
+    """ return the paths of the responses, the root is empty """
+    return set(re.findall(r'<D:href>[^<]*?:\d+([^<]*)</D:href>',
+                          body.decode('utf-8')))
+
+
+class TestDepthInfinity(DAVTestCase):
+    """ streamed Depth infinity PROPFIND and its limits """
+
+    handler_attributes = {'protocol_version': 'HTTP/1.1'}
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        for name in ('a/1', 'a/b/2', 'a/b/c/3', 'd/4', '5'):
+            self.write(name, b'x')
+
+    def configure(self, **options):
+        self.handler.set_config(setupDummyConfig(**options))
+
+    def propfind(self, body=None):
+        return self.request('PROPFIND', '/', body, INFINITY)
+
+    def test_whole_tree(self):
+        status, headers, body = self.propfind()
+        self.assertEqual(status, 207)
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(hrefs(body), {
+            '', '/a', '/a/1', '/a/b', '/a/b/2', '/a/b/c', '/a/b/c/3',
+            '/d', '/d/4', '/5'})
+        self.assertTrue(body.rstrip().endswith(b'</D:multistatus>'))
+
+    def test_propname(self):
+        status, headers, body = self.propfind(PROPNAME)
+        self.assertEqual(status, 207)
+        self.assertEqual(len(hrefs(body)), 10)
+        self.assertIn(b':getcontentlength/>', body)
+
+    def test_parallel_walk(self):
+        self.dc.propfind_workers = 4
+        status, headers, body = self.propfind()
+        self.assertEqual(len(hrefs(body)), 10)
+
+    def test_max_entries(self):
+        self.configure(propfind_max_entries=9)
+        status, headers, body = self.propfind()
+        self.assertEqual(status, 403)
+        self.assertIn(b'propfind-finite-depth', body)
+
+        self.configure(propfind_max_entries=10)
+        self.assertEqual(self.propfind()[0], 207)
+
+    def test_max_bytes(self):
+        self.configure(propfind_max_bytes=2000)
+        status, headers, body = self.propfind()
+        self.assertEqual(status, 403)
+        self.assertIn(b'propfind-finite-depth', body)
+
+    def test_max_time(self):
+        self.configure(propfind_max_time=1e-9)
+        self.assertEqual(self.propfind()[0], 403)
+
+    def test_limit_after_status(self):
+        # more than the prefetched part of the body
+        for i in range(1000):
+            self.write('many/%04d' % i, b'')
+        self.configure(propfind_max_entries=900)
+        conn = self.connect()
+        conn.request('PROPFIND', '/many/', headers=INFINITY)
+        response = conn.getresponse()
+        self.assertEqual(response.status, 207)
+        self.assertRaises(http.client.IncompleteRead, response.read)
+        conn.close()
+
+    def test_depth_one_has_no_limit(self):
+        self.configure(propfind_max_entries=2)
+        status, headers, body = self.request('PROPFIND', '/',
+                                             headers={'Depth': '1'})
+        self.assertEqual(status, 207)
+
+
+class TestWalk(DAVTestCase):
+    """ the walk of PROPFIND itself """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        for i in range(3 * propfind.CANCEL_CHECK_INTERVAL):
+            self.write('dir/%d' % i, b'')
+
+    def test_cancelled(self):
+        calls = []
+
+        def cancelled():
+            calls.append(1)
+            return len(calls) > 1
+
+        pf = PROPFIND(self.baseuri + 'dir', self.dc, 'infinity', None,
+                      cancelled=cancelled)
+        walk = pf.createResponse()
+        self.assertRaises(ConnectionAbortedError, b''.join, walk)
+        # only checked every CANCEL_CHECK_INTERVAL resources
+        self.assertEqual(len(calls), 2)
+
+    def test_chunks(self):
+        pf = PROPFIND(self.baseuri + 'dir', self.dc, 'infinity', None)
+        chunks = list(pf.createResponse())
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), propfind.CHUNK_SIZE)
+
+    def test_limit_raises(self):
+        pf = PROPFIND(self.baseuri + 'dir', self.dc, 'infinity', None,
+                      max_entries=5)
+        self.assertRaises(DAV_Condition, b''.join, pf.createResponse())
+
+
+class TestMapOrdered(unittest.TestCase):
+
+    def test_order(self):
+        def slow(i):
+            time.sleep((5 - i % 5) * 0.002)
+            return i * i
+        self.assertEqual(list(map_ordered(slow, range(20), 4)),
+                         [i * i for i in range(20)])
+
+    def test_serial(self):
+        self.assertEqual(list(map_ordered(str, range(3))), ['0', '1', '2'])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(i):
+            with lock:
+                running.append(i)
+                peak.append(len(running))
+            time.sleep(0.005)
+            with lock:
+                running.remove(i)
+            return i
+
+        list(map_ordered(work, range(30), 3))
+        self.assertLessEqual(max(peak), 3)
+        self.assertGreater(max(peak), 1)
+
+    def test_items_are_consumed_lazily(self):
+        taken = []
+
+        def items():
+            for i in range(100):
+                taken.append(i)
+                yield i
+
+        results = map_ordered(lambda i: i, items(), 2)
+        self.assertEqual(next(results), 0)
+        # only a window of twice the workers is submitted ahead
+        self.assertLessEqual(len(taken), 4)
+        results.close()
+
+    def test_error(self):
+        def fail(i):
+            if i == 3:
+                raise ValueError(i)
+            return i
+        self.assertRaises(ValueError, list, map_ordered(fail, range(10), 4))
+
+
+class TestParallelFetch(DAVTestCase):
+    """ properties read by a pool of threads """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        for i in range(50):
+            self.write('dir/%02d' % i, b'x' * i)
+
+    def propfind(self, depth):
+        status, headers, body = self.request('PROPFIND', '/dir/',
+                                             headers={'Depth': depth})
+        self.assertEqual(status, 207)
+        return body
+
+    def test_same_response(self):
+        for depth in ('0', '1', 'infinity'):
+            serial = self.propfind(depth)
+            self.dc.propfind_workers = 8
+            self.assertEqual(self.propfind(depth), serial)
+            self.dc.propfind_workers = 0
+
+    def test_failing_property(self):
+        def fail(uri):
+            if uri.endswith('/07'):
+                raise DAV_NotFound
+            return 'text/plain'
+
+        self.dc._get_dav_getcontenttype = fail
+        self.dc.propfind_workers = 8
+        body = self.propfind('1')
+        # the collection and all members but one
+        self.assertEqual(body.count(b'>text/plain<'), 50)
+        self.assertEqual(body.count(b'getcontenttype/>'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import unittest
+import http.client
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.quota import UsageCounter, parse_limits
+
+from davtest import DAVTestCase
+
+ALLPROP = b'<?xml version="1.0"?><propfind xmlns="DAV:"><allprop/></propfind>'
+PROPNAME = b'<?xml version="1.0"?><propfind xmlns="DAV:"><propname/></propfind>'
+QUOTA = (b'<?xml version="1.0"?><propfind xmlns="DAV:"><prop>'
+         b'<quota-used-bytes/><quota-available-bytes/></prop></propfind>')
+
+
+class TestParseLimits(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_limits('/alice=3k, /bob/=2M,'),
+                         {'/alice': 3072, '/bob': 2 * 1024 ** 2})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_limits, '/alice=lots')
+
+
+class TestQuota(DAVTestCase):
+    """ disk usage below collections and uploads over the limits """
+
+    def make_interface(self, baseuri):
+        dc = DAVTestCase.make_interface(self, baseuri)
+        self.usage = UsageCounter(self.rundir + '.db', self.rundir,
+                                  {'/alice': 100})
+        dc.usage = self.usage
+        return dc
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('alice/old', b'o' * 40)
+        self.write('bob/big', b'b' * 80)
+        self.usage.reconcile()
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        os.remove(self.usage.database)
+
+    def propfind(self, path, body, depth='0'):
+        status, headers, body = self.request('PROPFIND', path, body,
+                                             {'Depth': depth})
+        self.assertEqual(status, 207)
+        return body
+
+    def test_allprop_leaves_out_quota(self):
+        body = self.propfind('/alice/', ALLPROP, '1')
+        self.assertIn(b'getcontentlength', body)
+        self.assertNotIn(b'quota', body)
+
+    def test_propname_lists_quota(self):
+        self.assertIn(b'quota-used-bytes', self.propfind('/alice/', PROPNAME))
+
+    def test_collection_quota(self):
+        body = self.propfind('/alice/', QUOTA)
+        self.assertIn(b'quota-used-bytes>40<', body)
+        self.assertIn(b'quota-available-bytes>60<', body)
+
+    def test_no_quota_of_files(self):
+        body = self.propfind('/alice/old', QUOTA)
+        self.assertNotIn(b'bytes>', body)
+        self.assertIn(b'404', body)
+
+    def test_put_counts(self):
+        status, headers, body = self.request('PUT', '/alice/new', b'n' * 50)
+        self.assertEqual(status, 201)
+        self.assertEqual(self.usage.used('/alice'), 90)
+        self.assertEqual(self.usage.used('/'), 170)
+        status, headers, body = self.request('DELETE', '/alice/old')
+        self.assertEqual(status, 204)
+        self.assertEqual(self.usage.used('/alice'), 50)
+
+    def test_put_replacing_counts_difference(self):
+        status, headers, body = self.request('PUT', '/alice/old', b'n' * 100)
+        self.assertEqual(status, 201)
+        self.assertEqual(self.usage.used('/alice'), 100)
+
+    def test_put_over_limit(self):
+        status, headers, body = self.request('PUT', '/alice/new', b'n' * 61)
+        self.assertEqual(status, 507)
+        self.assertFalse(os.path.exists(self.path('alice/new')))
+        self.assertEqual(self.usage.used('/alice'), 40)
+
+    def test_chunked_put_over_limit_keeps_file(self):
+        self.handler.protocol_version = 'HTTP/1.1'
+        conn = self.connect()
+        conn.request('PUT', '/alice/old', (b'n' * 30 for i in range(4)),
+                     encode_chunked=True)
+        try:
+            status = conn.getresponse().status
+        except (ConnectionError, http.client.HTTPException):
+            # the server may close before the whole body is sent
+            status = 507
+        conn.close()
+        self.assertEqual(status, 507)
+        self.assertEqual(self.read('alice/old'), b'o' * 40)
+        self.assertEqual(self.usage.used('/alice'), 40)
+        self.assertEqual(os.listdir(self.path('alice')), ['old'])
+
+    def test_copy_over_limit(self):
+        status, headers, body = self.request(
+            'COPY', '/bob/big', headers={'Destination': '/alice/big'})
+        self.assertEqual(status, 507)
+        self.assertFalse(os.path.exists(self.path('alice/big')))
+
+    def test_move_within_limit(self):
+        # the bytes are counted in the parents already
+        self.write('alice/sub/file', b's' * 10)
+        self.usage.reconcile()
+        status, headers, body = self.request(
+            'MOVE', '/alice/sub/file', headers={'Destination': '/alice/file'})
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.usage.used('/alice'), 50)
+        self.assertEqual(self.usage.used('/alice/sub'), 0)
+
+    def test_move_over_limit(self):
+        status, headers, body = self.request(
+            'MOVE', '/bob/big', headers={'Destination': '/alice/big'})
+        self.assertEqual(status, 507)
+        self.assertEqual(self.read('bob/big'), b'b' * 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import davxml
+from pywebdav.lib.iface import dav_interface
+from pywebdav.lib.propcache import ResponseCache
+from pywebdav.server.fshandler import FilesystemHandler
+
+from davtest import DAVTestCase
+
+REPORT = ('<?xml version="1.0"?><x:suffix-report xmlns:x="urn:x" '
+          'xmlns:D="DAV:"><D:prop><D:getcontentlength/></D:prop>'
+          '<x:suffix>%s</x:suffix></x:suffix-report>')
+
+
+def hrefs(body):
+    return sorted(re.findall(r'<D:href>[^<]*?:\d+([^<]*)</D:href>',
+                             body.decode('utf-8')))
+
+
+class SuffixHandler(FilesystemHandler):
+    """ evaluates the x:suffix filter for single resources """
+
+    def compile_filter(self, filter):
+        if filter is None:
+            return None
+        suffix = filter.find('{urn:x}suffix').text
+        return lambda uri: uri.endswith(suffix)
+
+
+class TestReport(DAVTestCase):
+    """ REPORT responses filtered by the interface """
+
+    def make_interface(self, baseuri):
+        return SuffixHandler(self.rundir, baseuri)
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        for name in ('a.txt', 'b.bin', 'dir/c.txt', 'dir/sub/d.txt',
+                     'dir/e.bin'):
+            self.write(name, b'x')
+
+    def report(self, depth, suffix='.txt', path='/'):
+        status, headers, body = self.request('REPORT', path,
+                                             REPORT % suffix,
+                                             {'Depth': depth})
+        self.assertEqual(status, 207)
+        return hrefs(body)
+
+    def test_depth_one(self):
+        self.assertEqual(self.report('1'), ['/a.txt'])
+
+    def test_depth_zero(self):
+        self.assertEqual(self.report('0', path='/a.txt'), ['/a.txt'])
+        self.assertEqual(self.report('0', path='/b.bin'), [])
+
+    def test_depth_infinity(self):
+        self.assertEqual(self.report('infinity'),
+                         ['/a.txt', '/dir/c.txt', '/dir/sub/d.txt'])
+        self.assertEqual(self.report('infinity', '.bin'),
+                         ['/b.bin', '/dir/e.bin'])
+
+    def test_parallel(self):
+        self.dc.propfind_workers = 4
+        self.assertEqual(self.report('infinity'),
+                         ['/a.txt', '/dir/c.txt', '/dir/sub/d.txt'])
+
+    def test_no_filter(self):
+        self.dc.compile_filter = lambda filter: None
+        self.assertEqual(len(self.report('1')), 4)
+
+    def test_cached_by_body(self):
+        self.handler.RESPONSE_CACHE = cache = ResponseCache()
+        self.assertEqual(self.report('1'), ['/a.txt'])
+        self.assertEqual(self.report('1', '.bin'), ['/b.bin'])
+        self.assertEqual(self.report('1'), ['/a.txt'])
+        self.assertEqual(cache.hits, 1)
+
+    def test_missing(self):
+        status, headers, body = self.request('REPORT', '/missing',
+                                             REPORT % '.txt',
+                                             {'Depth': '1'})
+        self.assertEqual(status, 404)
+
+    def test_malformed(self):
+        status, headers, body = self.request('REPORT', '/', b'<x',
+                                             {'Depth': '1'})
+        self.assertEqual(status, 400)
+
+
+class TestDefaultFilter(unittest.TestCase):
+    """ the filter of dav_interface lists each collection once """
+
+    def test_listed_once(self):
+        dc = dav_interface()
+        members = {
+            'http://h': ['http://h/a', 'http://h/dir'],
+            'http://h/dir': ['http://h/dir/b'],
+        }
+        dc.get_childs = mock.Mock(side_effect=lambda uri, filter=None:
+                                  members.get(uri, []))
+        root = davxml.default_parser.parse((REPORT % '.txt').encode())
+        match = dc.compile_filter(root)
+        for uri in ('http://h/a', 'http://h/dir', 'http://h/dir/b',
+                    'http://h/dir/b'):
+            self.assertTrue(match(uri))
+        self.assertFalse(match('http://h/other'))
+        self.assertEqual(dc.get_childs.call_count, 2)
+        for call in dc.get_childs.call_args_list:
+            self.assertIs(call[0][1], root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import re
+import sys
+import gzip
+import time
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server.deadprops import SQLitePropertyStore
+from pywebdav.server.fshandler import FilesystemHandler
+
+from davtest import BackendTests, DAVTestCase
+
+LOCKINFO = (b'<?xml version="1.0"?><D:lockinfo xmlns:D="DAV:">'
+            b'<D:lockscope><D:exclusive/></D:lockscope>'
+            b'<D:locktype><D:write/></D:locktype>'
+            b'<D:owner>tester</D:owner></D:lockinfo>')
+
+
+class TestFilesystemBackend(BackendTests, DAVTestCase):
+    """ the shared backend tests against the FilesystemHandler """
+
+    # the FilesystemHandler reports any failed PUT as 424
+    put_conflict = put_collection = 424
+
+    def make_interface(self, baseuri):
+        dc = FilesystemHandler(self.rundir, baseuri)
+        dc.properties = SQLitePropertyStore(self.rundir + '.db')
+        return dc
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.rundir + '.db' + suffix):
+                os.remove(self.rundir + '.db' + suffix)
+
+    def test_on_disk(self):
+        self.put('/file', b'content')
+        self.assertEqual(self.read('file'), b'content')
+
+
+class TestWebDAVServer(DAVTestCase):
+    """ behaviour of the request handler itself """
+
+    handler_attributes = {'protocol_version': 'HTTP/1.1'}
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('file', b'x' * 5000)
+
+    def test_options(self):
+        status, headers, body = self.request('OPTIONS', '/')
+        self.assertEqual(status, 200)
+        self.assertIn('2', headers['DAV'])
+        for method in ('PROPFIND', 'LOCK', 'REPORT'):
+            self.assertIn(method, headers['Allow'])
+
+    def test_single_date_header(self):
+        for method in ('GET', 'PROPFIND', 'OPTIONS', 'PUT'):
+            status, headers, body = self.request(method, '/file', b'x' * 5000)
+            self.assertEqual(len(headers.get_all('Date')), 1, method)
+            self.assertRegex(headers['Date'], r' GMT$')
+
+    def test_keep_alive(self):
+        conn = self.connect()
+        try:
+            for i in range(3):
+                conn.request('PROPFIND', '/file', headers={'Depth': '0'})
+                response = conn.getresponse()
+                self.assertEqual(response.status, 207)
+                response.read()
+        finally:
+            conn.close()
+
+    def test_gzip(self):
+        accept = {'Accept-Encoding': 'gzip', 'Depth': '1'}
+        status, headers, body = self.request('GET', '/file', headers=accept)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'x' * 5000)
+
+        for i in range(40):
+            self.write('dir/%02d' % i, b'')
+        status, headers, body = self.request('PROPFIND', '/dir/',
+                                             headers=accept)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'/dir/39', gzip.decompress(body))
+
+        # ranges are sent as they are
+        accept['Range'] = 'bytes=0-9'
+        status, headers, body = self.request('GET', '/file', headers=accept)
+        self.assertEqual(status, 206)
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(body, b'x' * 10)
+
+    def test_ranges(self):
+        status, headers, body = self.request(
+            'GET', '/file', headers={'Range': 'bytes=4990-'})
+        self.assertEqual(status, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 4990-4999/5000')
+        self.assertEqual(body, b'x' * 10)
+
+        status = self.request('GET', '/file',
+                              headers={'Range': 'bytes=6000-'})[0]
+        self.assertEqual(status, 416)
+        # multiple ranges are ignored
+        status, headers, body = self.request(
+            'GET', '/file', headers={'Range': 'bytes=0-1,3-4'})
+        self.assertEqual((status, len(body)), (200, 5000))
+
+    def test_conditional_put(self):
+        etag = self.request('GET', '/file')[1]['ETag']
+        self.assertEqual(self.request('PUT', '/file', b'new', {
+            'If-Match': '"other"'})[0], 412)
+        self.assertEqual(self.request('PUT', '/file', b'new', {
+            'If-None-Match': '*'})[0], 412)
+        self.assertEqual(self.request('PUT', '/created', b'new', {
+            'If-None-Match': '*'})[0], 201)
+        self.assertEqual(self.request('PUT', '/file', b'new', {
+            'If-Match': etag})[0], 201)
+        self.assertEqual(self.read('file'), b'new')
+
+    def test_expect_continue(self):
+        conn = self.connect()
+        try:
+            conn.putrequest('PUT', '/continued')
+            conn.putheader('Content-Length', '4')
+            conn.putheader('Expect', '100-continue')
+            conn.endheaders()
+            line = conn.sock.makefile('rb').readline()
+            self.assertIn(b' 100 ', line)
+            conn.send(b'body')
+        finally:
+            conn.close()
+        for i in range(50):
+            if os.path.exists(self.path('continued')) and \
+                    self.read('continued') == b'body':
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.read('continued'), b'body')
+
+    def test_lock(self):
+        status, headers, body = self.request('LOCK', '/file', LOCKINFO,
+                                             {'Timeout': 'Second-60'})
+        self.assertEqual(status, 200)
+        token = headers['Lock-Token']
+        self.assertIn(b'tester', body)
+
+        self.assertEqual(self.request('PUT', '/file', b'y')[0], 423)
+        self.assertEqual(self.request('PUT', '/file', b'y', {
+            'If': '(%s)' % token})[0], 201)
+
+        status = self.request('UNLOCK', '/file',
+                              headers={'Lock-Token': token})[0]
+        self.assertEqual(status, 204)
+        self.assertEqual(self.request('PUT', '/file', b'z')[0], 201)
+
+    def test_copy_errors(self):
+        self.assertEqual(self.request('COPY', '/missing', headers={
+            'Destination': '/copy'})[0], 404)
+        self.assertEqual(self.request('COPY', '/file', headers={
+            'Destination': '/missing/copy'})[0], 409)
+
+    def test_propfind_of_missing(self):
+        status = self.request('PROPFIND', '/missing',
+                              headers={'Depth': '0'})[0]
+        self.assertEqual(status, 404)
+
+    def test_quoted_paths(self):
+        self.write('a b/\xe4', b'umlaut')
+        status, headers, body = self.request('GET', '/a%20b/%C3%A4')
+        self.assertEqual((status, body), (200, b'umlaut'))
+        status, headers, body = self.request('PROPFIND', '/a%20b/',
+                                             headers={'Depth': '1'})
+        self.assertIn(b'/a%20b/%C3%A4</D:href>', body)
+
+    def test_no_escape(self):
+        for path in ('/../etc/passwd', '/%2e%2e/etc/passwd'):
+            status, headers, body = self.request('GET', path)
+            self.assertNotEqual(status, 200, path)
+            self.assertIsNone(re.search(b'root:', body))
+
+
+if __name__ == '__main__':
+    unittest.main()
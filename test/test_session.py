@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import base64
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import session
+from pywebdav.lib.session import SessionManager
+
+from davtest import DAVTestCase
+
+BASIC = {'Authorization': 'Basic ' +
+         base64.b64encode(b'alice:secret').decode('ascii')}
+
+
+def cookie(set_cookie):
+    """ return the Cookie header sending a Set-Cookie value back """
+    return set_cookie.split(';')[0]
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions = SessionManager('secret', ttl=60)
+
+    def test_valid(self):
+        value = cookie(self.sessions.issue('alice', 'PUT'))
+        self.assertEqual(self.sessions.validate(value, 'PUT'), 'alice')
+        self.assertEqual(self.sessions.validate(value, 'GET'), 'alice')
+
+    def test_attributes(self):
+        value = self.sessions.issue('alice', 'GET')
+        for attribute in ('Max-Age=60', 'Path=/', 'HttpOnly',
+                          'SameSite=Strict'):
+            self.assertIn(attribute, value)
+
+    def test_unicode_user(self):
+        value = cookie(self.sessions.issue('jürgen', 'GET'))
+        self.assertEqual(self.sessions.validate(value, 'GET'), 'jürgen')
+
+    def test_among_other_cookies(self):
+        value = cookie(self.sessions.issue('alice', 'GET'))
+        self.assertEqual(self.sessions.validate('a=b; %s; c=d' % value,
+                                                'GET'), 'alice')
+        self.assertIsNone(self.sessions.validate('a=b', 'GET'))
+
+    def test_read_scope(self):
+        value = cookie(self.sessions.issue('alice', 'PROPFIND'))
+        self.assertEqual(self.sessions.validate(value, 'GET'), 'alice')
+        for command in ('PUT', 'DELETE', 'PROPPATCH', 'MOVE', 'LOCK'):
+            self.assertIsNone(self.sessions.validate(value, command))
+
+    def test_widened_scope(self):
+        value = cookie(self.sessions.issue('alice', 'GET'))
+        payload, mac = value.rsplit('.', 1)
+        self.assertTrue(payload.endswith('.r'))
+        self.assertIsNone(self.sessions.validate(payload + 'w.' + mac, 'PUT'))
+
+    def test_tampered(self):
+        value = cookie(self.sessions.issue('alice', 'PUT'))
+        name, _, rest = value.partition('=')
+        user, _, rest = rest.partition('.')
+        mallory = session._b64encode(b'mallory')
+        forged = '%s=%s.%s' % (name, mallory, rest)
+        self.assertIsNone(self.sessions.validate(forged, 'GET'))
+        for broken in (value[:-1], value + 'x', value.replace('.', '')):
+            self.assertIsNone(self.sessions.validate(broken, 'GET'))
+
+    def test_other_secret(self):
+        value = cookie(SessionManager('other').issue('alice', 'GET'))
+        self.assertIsNone(self.sessions.validate(value, 'GET'))
+
+    def test_random_secret(self):
+        value = cookie(SessionManager().issue('alice', 'GET'))
+        self.assertIsNone(SessionManager().validate(value, 'GET'))
+
+    def test_expired(self):
+        value = cookie(self.sessions.issue('alice', 'GET'))
+        with mock.patch.object(session.time, 'time',
+                               return_value=time.time() + 61):
+            self.assertIsNone(self.sessions.validate(value, 'GET'))
+
+
+class TestSessionCookies(DAVTestCase):
+    """ clients authenticated once are accepted with the cookie """
+
+    config = {'user': 'alice', 'password': 'secret'}
+
+    def setUp(self):
+        self.sessions = SessionManager('secret', ttl=60)
+        self.handler_attributes = {'DO_AUTH': True, 'SESSION': self.sessions}
+        DAVTestCase.setUp(self)
+        self.write('file', b'data')
+
+    def login(self, method='GET', path='/file', body=None):
+        status, headers, body = self.request(method, path, body, BASIC)
+        self.assertLess(status, 300)
+        return cookie(headers['Set-Cookie'])
+
+    def test_cookie_replaces_credentials(self):
+        value = self.login()
+        status, headers, body = self.request('GET', '/file', None,
+                                             {'Cookie': value})
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'data')
+        # no new cookie for a request authenticated by the cookie
+        self.assertIsNone(headers['Set-Cookie'])
+
+    def test_read_cookie_can_not_write(self):
+        value = self.login()
+        status, headers, body = self.request('PUT', '/file', b'new',
+                                             {'Cookie': value})
+        self.assertEqual(status, 401)
+        self.assertEqual(self.read('file'), b'data')
+
+    def test_write_cookie(self):
+        value = self.login('PUT', '/other', b'x')
+        status, headers, body = self.request('PUT', '/file', b'new',
+                                             {'Cookie': value})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.read('file'), b'new')
+
+    def test_no_cookie_for_failed_login(self):
+        headers = {'Authorization': 'Basic ' +
+                   base64.b64encode(b'alice:wrong').decode('ascii')}
+        status, headers, body = self.request('GET', '/file', None, headers)
+        self.assertEqual(status, 401)
+        self.assertIsNone(headers['Set-Cookie'])
+
+    def test_invalid_cookie(self):
+        status, headers, body = self.request(
+            'GET', '/file', None, {'Cookie': 'pywebdav_session=x.1.r.y'})
+        self.assertEqual(status, 401)
+
+    def test_expired_cookie(self):
+        value = self.login()
+        with mock.patch.object(session.time, 'time',
+                               return_value=time.time() + 61):
+            status, headers, body = self.request('GET', '/file', None,
+                                                 {'Cookie': value})
+        self.assertEqual(status, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.INI_Parse import Configuration
+from pywebdav.lib.settings import Settings
+from pywebdav.server.server import reload_config, setupDummyConfig
+
+from davtest import DAVTestCase
+
+
+class TestSettings(unittest.TestCase):
+
+    def test_defaults(self):
+        settings = Settings.from_config(setupDummyConfig())
+        self.assertEqual(settings, Settings())
+        self.assertTrue(settings.lockemulation)
+
+    def test_no_section(self):
+        self.assertEqual(Settings.from_config(object()), Settings())
+
+    def test_conversions(self):
+        settings = Settings.from_config(setupDummyConfig(
+            verbose='yes', lockemulation='0', listing_page_size='10',
+            propfind_max_time='1.5', auth_schemes='Digest, basic'))
+        self.assertIs(settings.verbose, True)
+        self.assertIs(settings.lockemulation, False)
+        self.assertEqual(settings.listing_page_size, 10)
+        self.assertEqual(settings.propfind_max_time, 1.5)
+        self.assertEqual(settings.auth_schemes, ('digest', 'basic'))
+
+    def test_immutable(self):
+        settings = Settings()
+        self.assertRaises(AttributeError, setattr, settings, 'verbose', True)
+
+    def test_invalid(self):
+        for options in ({'verbose': 'maybe'}, {'listing_page_size': 'ten'},
+                        {'auth_schemes': 'basic,ntlm'},
+                        {'backend': 'cloud'}, {'zip_compress_level': '10'},
+                        {'property_store': 'ldap'},
+                        {'property_store': 'sqlite'}):
+            self.assertRaises(ValueError, Settings.from_config,
+                              setupDummyConfig(**options))
+
+    def test_ini_file(self):
+        fd, fileName = tempfile.mkstemp(suffix='.ini')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write('[DAV]\nlockemulation = false\nxml_max_depth = 8\n')
+        try:
+            settings = Settings.from_config(Configuration(fileName))
+        finally:
+            os.remove(fileName)
+        self.assertIs(settings.lockemulation, False)
+        self.assertEqual(settings.xml_max_depth, 8)
+
+
+class TestReload(DAVTestCase):
+    """ the configuration of a running server is replaced on SIGHUP """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        fd, self.fileName = tempfile.mkstemp(suffix='.ini')
+        os.close(fd)
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        os.remove(self.fileName)
+
+    def reload(self, content):
+        with open(self.fileName, 'w') as fp:
+            fp.write(content)
+        reload_config(self.handler, self.fileName)
+
+    def allowed(self):
+        status, headers, body = self.request('OPTIONS', '/')
+        self.assertEqual(status, 200)
+        return headers['Allow']
+
+    def test_reload(self):
+        self.assertIn('LOCK', self.allowed())
+        self.reload('[DAV]\nlockemulation = false\nbaseurl = http://dav/\n')
+        self.assertNotIn('LOCK', self.allowed())
+        self.assertEqual(self.dc.baseurl, 'http://dav/')
+
+    def test_invalid_keeps_configuration(self):
+        self.reload('[DAV]\nlockemulation = false\n')
+        with self.assertLogs('pywebdav', 'ERROR'):
+            self.reload('[DAV]\nlockemulation = true\nverbose = maybe\n')
+        self.assertNotIn('LOCK', self.allowed())
+
+    def test_missing_section_keeps_configuration(self):
+        self.reload('[DAV]\nlockemulation = false\n')
+        with self.assertLogs('pywebdav', 'ERROR'):
+            self.reload('[Other]\n')
+        self.assertNotIn('LOCK', self.allowed())
+
+    def test_replaced_config(self):
+        # set without set_config() is compiled on the next request
+        self.handler._config = setupDummyConfig(lockemulation='false')
+        self.assertNotIn('LOCK', self.allowed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import time
+import tempfile
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.journal import ChangeJournal, TOKEN_PREFIX
+
+from davtest import DAVTestCase
+
+SYNC = ('<?xml version="1.0"?><D:sync-collection xmlns:D="DAV:">'
+        '<D:sync-token>%s</D:sync-token><D:sync-level>%s</D:sync-level>'
+        '%s<D:prop><D:getcontentlength/></D:prop></D:sync-collection>')
+
+
+def remove_database(database):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(self.database)
+        self.journal = ChangeJournal(self.database)
+
+    def tearDown(self):
+        remove_database(self.database)
+
+    def paths(self, since, path='/', infinite=False):
+        return [c[0] for c in self.journal.changes(path, since, infinite)]
+
+    def test_tokens(self):
+        start = self.journal.current()
+        token = self.journal.token()
+        self.assertTrue(token.startswith(TOKEN_PREFIX))
+        self.assertEqual(self.journal.parse_token(token), start)
+
+        self.journal.record(['/a'])
+        self.assertEqual(self.journal.current(), start + 1)
+        self.assertEqual(self.journal.parse_token(token), start)
+
+    def test_invalid_tokens(self):
+        self.journal.record(['/a'])
+        current = self.journal.current()
+        for token in ('', 'urn:other:1', TOKEN_PREFIX + 'x:1',
+                      self.journal.token()[:-1] + 'x',
+                      self.journal.token(current + 1)):
+            self.assertIsNone(self.journal.parse_token(token), token)
+
+        # tokens of another journal
+        other = ChangeJournal(self.database + '2')
+        try:
+            self.assertIsNone(other.parse_token(self.journal.token()))
+        finally:
+            remove_database(self.database + '2')
+
+    def test_persistent(self):
+        self.journal.record(['/a'])
+        token = self.journal.token()
+        journal = ChangeJournal(self.database)
+        self.assertEqual(journal.parse_token(token), journal.current())
+
+    def test_changes(self):
+        since = self.journal.current()
+        self.journal.record(['/a', '/dir'])
+        self.journal.record(['/dir/b', '/dir/c'], created=True)
+        self.journal.record(['/a'], deleted=True)
+        self.assertEqual(self.paths(since), ['/dir', '/a'])
+        self.assertEqual(self.paths(since, '/dir'), ['/dir/b', '/dir/c'])
+        self.assertEqual(self.paths(since, infinite=True),
+                         ['/dir', '/dir/b', '/dir/c', '/a'])
+
+        changes = dict((c[0], c) for c in
+                       self.journal.changes('/', since, True))
+        self.assertTrue(changes['/a'][1])
+        self.assertFalse(changes['/dir'][3])
+        self.assertTrue(changes['/dir/c'][3])
+
+    def test_created_and_deleted(self):
+        since = self.journal.current()
+        self.journal.record(['/a'], created=True)
+        self.journal.record(['/a'], deleted=True)
+        (path, deleted, seq, created), = self.journal.changes('/', since)
+        self.assertTrue(deleted)
+        self.assertTrue(created)
+
+        # deleted, then created again: it existed at since
+        since = self.journal.current()
+        self.journal.record(['/a'], deleted=True)
+        self.journal.record(['/a'], created=True)
+        (path, deleted, seq, created), = self.journal.changes('/', since)
+        self.assertFalse(deleted)
+        self.assertFalse(created)
+
+    def test_limit(self):
+        since = self.journal.current()
+        self.journal.record(['/a', '/b', '/c'])
+        self.assertEqual(len(self.journal.changes('/', since, limit=2)), 3)
+        self.assertEqual(len(self.journal.changes('/', since, limit=5)), 3)
+
+    def test_prefix_is_not_a_sibling(self):
+        since = self.journal.current()
+        self.journal.record(['/dir/a', '/dir2/b'])
+        self.assertEqual(self.paths(since, '/dir', True), ['/dir/a'])
+
+    def test_compact_superseded(self):
+        since = self.journal.current()
+        self.journal.record(['/a'])
+        self.journal.record(['/a'])
+        self.journal.record(['/b'])
+        self.journal.compact()
+        (count,) = self.journal._db().execute(
+            'SELECT COUNT(*) FROM changes').fetchone()
+        self.assertEqual(count, 2)
+        self.assertEqual(self.paths(since), ['/a', '/b'])
+        self.assertEqual(self.journal.parse_token(self.journal.token(since)),
+                         since)
+
+    def test_compact_max_entries(self):
+        self.journal.max_entries = 2
+        since = self.journal.current()
+        self.journal.record(['/a', '/b', '/c', '/d'])
+        self.journal.compact()
+        self.assertIsNone(self.journal.parse_token(
+            self.journal.token(since)))
+        recent = self.journal.current() - 2
+        self.assertEqual(self.paths(recent), ['/c', '/d'])
+
+    def test_compact_max_age(self):
+        self.journal.max_age = 60
+        since = self.journal.current()
+        self.journal.record(['/a'])
+        with self.journal._db() as db:
+            db.execute('UPDATE changes SET time = ?', (time.time() - 120,))
+        self.journal.record(['/b'])
+        self.journal.compact()
+        self.assertIsNone(self.journal.parse_token(
+            self.journal.token(since)))
+        self.assertIsNotNone(self.journal.parse_token(self.journal.token()))
+
+    def test_reset(self):
+        self.journal.record(['/a'])
+        token = self.journal.token()
+        self.journal.reset()
+        self.assertIsNone(self.journal.parse_token(token))
+        self.assertEqual(self.journal.parse_token(self.journal.token()),
+                         self.journal.current())
+        self.assertEqual(self.paths(0, infinite=True), [])
+
+
+class TestSyncCollection(DAVTestCase):
+    """ sync-collection REPORTs of the server """
+
+    def make_interface(self, baseuri):
+        dc = DAVTestCase.make_interface(self, baseuri)
+        self.database = self.rundir + '.db'
+        dc.journal = ChangeJournal(self.database)
+        return dc
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/a', b'a')
+        self.write('dir/b', b'b')
+        self.write('dir/sub/c', b'c')
+
+    def tearDown(self):
+        DAVTestCase.tearDown(self)
+        remove_database(self.database)
+
+    def sync(self, token='', level='1', path='/dir/', limit=None,
+             status=207):
+        limit = limit and ('<D:limit><D:nresults>%d</D:nresults></D:limit>'
+                           % limit) or ''
+        body = (SYNC % (token, level, limit)).encode()
+        code, headers, response = self.request('REPORT', path, body,
+                                               {'Depth': '0'})
+        self.assertEqual(code, status)
+        return response.decode('utf-8')
+
+    def parse(self, response):
+        """ return the token and the paths with their status """
+        token = re.search(r'<D:sync-token>([^<]*)</D:sync-token>',
+                          response).group(1)
+        responses = re.findall(r'<D:response>.*?</D:response>', response)
+        result = {}
+        for r in responses:
+            path = re.search(r'<D:href>[^<]*?:\d+([^<]*)</D:href>',
+                             r).group(1)
+            status = re.findall(r'HTTP/1.1 (\d+)', r)
+            result[path] = status[0] if len(status) == 1 else '200'
+        return token, result
+
+    def test_initial(self):
+        token, members = self.parse(self.sync())
+        self.assertEqual(members, {'/dir/a': '200', '/dir/b': '200',
+                                   '/dir/sub': '200'})
+        token, members = self.parse(self.sync(level='infinite'))
+        self.assertIn('/dir/sub/c', members)
+        self.assertNotIn('/dir', members)
+
+    def test_changes(self):
+        token, members = self.parse(self.sync())
+        self.assertEqual(self.request('PUT', '/dir/new', b'new')[0], 201)
+        self.assertEqual(self.request('PUT', '/dir/a', b'aa')[0], 201)
+        self.assertEqual(self.request('DELETE', '/dir/b')[0], 204)
+        self.assertEqual(self.request('PUT', '/dir/sub/d', b'd')[0], 201)
+
+        token2, members = self.parse(self.sync(token))
+        self.assertEqual(members, {'/dir/new': '200', '/dir/a': '200',
+                                   '/dir/b': '404'})
+        token3, members = self.parse(self.sync(token, 'infinite'))
+        self.assertIn('/dir/sub/d', members)
+
+        # nothing changed since
+        self.assertEqual(self.parse(self.sync(token2))[1], {})
+
+    def test_created_and_removed(self):
+        token, members = self.parse(self.sync())
+        self.request('PUT', '/dir/tmp', b'')
+        self.request('DELETE', '/dir/tmp')
+        self.assertEqual(self.parse(self.sync(token))[1], {})
+
+    def test_move(self):
+        token, members = self.parse(self.sync())
+        status = self.request('MOVE', '/dir/a',
+                              headers={'Destination': '/dir/moved'})[0]
+        self.assertIn(status, (201, 204))
+        self.assertEqual(self.parse(self.sync(token))[1],
+                         {'/dir/a': '404', '/dir/moved': '200'})
+
+    def test_recorded_before_the_status(self):
+        journal = self.dc.journal
+        send_status = self.handler.send_status
+        seen = []
+
+        def check(handler, *args, **kwargs):
+            seen.append(journal.current())
+            return send_status(handler, *args, **kwargs)
+
+        self.handler.send_status = check
+        before = journal.current()
+        for method, path in (('COPY', '/dir/copy'), ('MOVE', '/dir/moved')):
+            status = self.request(method, '/dir/a', headers={
+                'Destination': path})[0]
+            self.assertIn(status, (201, 204))
+            self.assertGreater(seen[-1], before, method)
+            before = journal.current()
+
+    def test_limit(self):
+        self.assertIn('number-of-matches-within-limits',
+                      self.sync(limit=2, status=507))
+
+        token, members = self.parse(self.sync())
+        for name in ('x', 'y', 'z'):
+            self.request('PUT', '/dir/' + name, b'')
+        token2, members = self.parse(self.sync(token, limit=2))
+        self.assertEqual(members, {'/dir/x': '200', '/dir/y': '200',
+                                   '/dir': '507'})
+        # the rest is reported with the next token
+        token3, members = self.parse(self.sync(token2, limit=2))
+        self.assertEqual(members, {'/dir/z': '200'})
+
+    def test_invalid_token(self):
+        self.assertIn('valid-sync-token',
+                      self.sync(TOKEN_PREFIX + 'other:1', status=403))
+        self.dc.journal.record(['/dir/a'])
+        token = self.dc.journal.token()
+        self.dc.journal.reset()
+        self.assertIn('valid-sync-token', self.sync(token, status=403))
+
+    def test_invalid_request(self):
+        self.sync(level='2', status=400)
+        body = (SYNC % ('', '1', '')).encode()
+        self.assertEqual(self.request('REPORT', '/dir/', body,
+                                      {'Depth': '1'})[0], 400)
+
+    def test_not_a_collection(self):
+        self.assertIn('supported-report',
+                      self.sync(path='/dir/a', status=403))
+        self.sync(path='/missing/', status=404)
+
+    def test_sync_token_property(self):
+        token, members = self.parse(self.sync())
+        body = (b'<?xml version="1.0"?><propfind xmlns="DAV:"><prop>'
+                b'<sync-token/></prop></propfind>')
+        status, headers, response = self.request('PROPFIND', '/dir/', body,
+                                                 {'Depth': '0'})
+        self.assertEqual(status, 207)
+        self.assertIn(token.encode(), response)
+
+
+if __name__ == '__main__':
+    unittest.main()
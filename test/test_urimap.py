@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib.urimap import (base_uri, child_uri, request_uri,
+                                 uri_path, uri_prefix)
+
+from davtest import DAVTestCase
+
+
+class TestUriMap(unittest.TestCase):
+
+    def test_uri_path(self):
+        for uri, path in (('http://host:8008/dir/file', '/dir/file'),
+                          ('http://host', '/'),
+                          ('http://host/', '/'),
+                          ('http://host/dir/', '/dir'),
+                          ('http://host//dir//file', '/dir/file'),
+                          ('http://host/dir/./file', '/dir/file'),
+                          ('http://host/file?x=1#y', '/file'),
+                          ('/dir/', '/dir'),
+                          ('dir', '/dir'),
+                          ('http://host/a b/ä', '/a b/ä')):
+            self.assertEqual(uri_path(uri), path, uri)
+
+    def test_no_escape_from_root(self):
+        for uri in ('http://host/../etc/passwd', 'http://host/a/../../etc/passwd',
+                    '/../../etc/passwd', '..//etc/passwd'):
+            self.assertEqual(uri_path(uri), '/etc/passwd', uri)
+
+    def test_child_uri(self):
+        self.assertEqual(child_uri('http://host/dir', 'f'), 'http://host/dir/f')
+        self.assertEqual(child_uri('http://host/dir/', 'f'),
+                         'http://host/dir/f')
+
+    def test_request_uri(self):
+        base = 'http://localhost:8008/'
+        self.assertEqual(request_uri(base, None, '/a%20b'),
+                         'http://localhost:8008/a b')
+        self.assertEqual(request_uri(base, 'dav.example', '/a'),
+                         'http://dav.example/a')
+        # absolute URI in the request line
+        self.assertEqual(request_uri(base, None, 'http://localhost:8008/a%2Fb'),
+                         'http://localhost:8008/a/b')
+
+    def test_prefix(self):
+        self.assertEqual(uri_prefix('http://localhost:8008/dav/'),
+                         'http://localhost:8008')
+        self.assertEqual(uri_prefix('https://localhost/dav/', 'h:1'),
+                         'https://h:1')
+        self.assertEqual(base_uri('http://localhost/dav/', 'h'),
+                         'http://h/dav/')
+        self.assertEqual(base_uri('http://localhost/dav/'),
+                         'http://localhost/dav/')
+
+
+class TestRequests(DAVTestCase):
+    """ request paths are mapped into the served directory """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/a b', b'space')
+        self.write('file', b'file')
+
+    def test_quoted(self):
+        status, headers, body = self.request('GET', '/dir/a%20b')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'space')
+
+    def test_dot_segments(self):
+        status, headers, body = self.request('GET', '/dir/../file')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'file')
+
+    def test_traversal(self):
+        # the parent of the served directory
+        name = os.path.basename(self.rundir)
+        for path in ('/../' + name + '/file', '/%2e%2e/' + name + '/file',
+                     '/dir/%2e%2e/%2e%2e/' + name + '/file'):
+            status, headers, body = self.request('GET', path)
+            self.assertEqual(status, 404, path)
+
+    def test_href(self):
+        status, headers, body = self.request('PROPFIND', '/dir/',
+                                             headers={'Depth': '1'})
+        self.assertEqual(status, 207)
+        self.assertIn(b'/dir/a%20b<', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
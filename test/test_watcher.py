@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import queue
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.server import watcher
+from pywebdav.server.fshandler import TEMP_PREFIX
+from pywebdav.server.server import setup_watcher
+from pywebdav.server.watcher import Watcher
+
+from davtest import DAVTestCase
+
+
+def inotify():
+    try:
+        watcher._libc()
+    except OSError:
+        return False
+    return True
+
+
+class TestDegraded(unittest.TestCase):
+    """ without inotify caches fall back to their TTL """
+
+    @mock.patch.object(watcher, '_libc', side_effect=OSError('no inotify'))
+    def test_no_inotify(self, libc):
+        w = Watcher(tempfile.gettempdir())
+        fallback = mock.Mock()
+        w.add_listener(mock.Mock(), fallback)
+        with self.assertLogs(watcher.log, 'WARNING'):
+            self.assertFalse(w.start())
+        self.assertFalse(w.complete)
+        fallback.assert_called_once_with()
+
+        # listeners added later are degraded right away
+        late = mock.Mock()
+        w.add_listener(mock.Mock(), late)
+        late.assert_called_once_with()
+
+    def test_overflow_flushes(self):
+        w = Watcher(tempfile.gettempdir())
+        callback = mock.Mock()
+        w.add_listener(callback)
+        w._handle(-1, watcher.IN_Q_OVERFLOW, '')
+        callback.assert_called_once_with(None)
+
+    def test_failing_listener(self):
+        w = Watcher(tempfile.gettempdir())
+        w._wds[1] = '/dir'
+        callback = mock.Mock()
+        w.add_listener(mock.Mock(side_effect=ValueError))
+        w.add_listener(callback)
+        with self.assertLogs(watcher.log, 'ERROR'):
+            w._handle(1, watcher.IN_MODIFY, 'file')
+        callback.assert_called_once_with(os.path.join('/dir', 'file'))
+
+
+@unittest.skipUnless(inotify(), 'inotify is not available')
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'dir'))
+        self.events = queue.Queue()
+        self.watcher = Watcher(self.directory, ignore=TEMP_PREFIX)
+        self.watcher.add_listener(self.events.put)
+        self.assertTrue(self.watcher.start())
+
+    def tearDown(self):
+        # the watcher has no stop(), its thread keeps the descriptor
+        shutil.rmtree(self.directory)
+
+    def path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def wait_for(self, path):
+        """ return the paths reported before path """
+        events = []
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if event == path:
+                return events
+            events.append(event)
+        self.fail('no event for %s' % path)
+
+    def test_file(self):
+        with open(self.path('dir', 'file'), 'w') as fp:
+            fp.write('x')
+        self.wait_for(self.path('dir', 'file'))
+
+    def test_new_directory_is_watched(self):
+        os.mkdir(self.path('new'))
+        self.wait_for(self.path('new'))
+        # the watch may be added after the file is created
+        time.sleep(0.1)
+        open(self.path('new', 'file'), 'w').close()
+        self.wait_for(self.path('new', 'file'))
+
+    def test_moved_directory(self):
+        os.rename(self.path('dir'), self.path('moved'))
+        self.wait_for(self.path('moved'))
+        time.sleep(0.1)
+        self.assertNotIn(self.path('dir'), self.watcher._wds.values())
+        open(self.path('moved', 'file'), 'w').close()
+        self.wait_for(self.path('moved', 'file'))
+
+    def test_temporary_files_are_ignored(self):
+        temp = self.path('dir', TEMP_PREFIX + 'x')
+        open(temp, 'w').close()
+        os.rename(temp, self.path('dir', 'file'))
+        self.assertNotIn(temp, self.wait_for(self.path('dir', 'file')))
+
+
+@unittest.skipUnless(inotify(), 'inotify is not available')
+class TestInvalidation(DAVTestCase):
+    """ changes made behind the server reach its caches """
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/file', b'x')
+        self.watcher = setup_watcher(self.handler, 5)
+
+    def test_listing(self):
+        status, headers, body = self.request('GET', '/dir/')
+        self.assertIn(b'>1<', body)
+        notified = mock.Mock()
+        self.watcher.add_listener(notified)
+
+        # same size and directory, only the watcher sees the change
+        st = os.stat(self.path('dir'))
+        self.write('dir/file', b'y' * 2)
+        os.utime(self.path('dir'), ns=(st.st_atime_ns, st.st_mtime_ns))
+        deadline = time.monotonic() + 5
+        while not notified.called and time.monotonic() < deadline:
+            time.sleep(0.05)
+        status, headers, body = self.request('GET', '/dir/')
+        self.assertIn(b'>2<', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
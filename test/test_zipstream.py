@@ -0,0 +1,194 @@
+import io
+import os
+import sys
+import struct
+import zipfile
+import unittest
+from unittest import mock
+
+testdir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(testdir, '..'))
+
+from pywebdav.lib import zipstream
+from pywebdav.lib.errors import DAV_Forbidden, DAV_NotFound
+from pywebdav.lib.zipstream import Member, ZipStream, dos_datetime
+from pywebdav.server.server import setupDummyConfig
+
+from davtest import DAVTestCase
+
+LARGE = os.urandom(3 * zipstream.BUFFER_SIZE)
+
+
+class TestZipDownload(DAVTestCase):
+    """ collections downloaded as ZIP archives """
+
+    handler_attributes = {'protocol_version': 'HTTP/1.1'}
+
+    def setUp(self):
+        DAVTestCase.setUp(self)
+        self.write('dir/a.txt', b'a' * 100)
+        self.write('dir/sub/b.txt', b'b')
+        self.write('dir/sub/large', LARGE)
+        self.write('dir/\xe4.txt', b'umlaut')
+        os.mkdir(self.path('dir/empty'))
+
+    def configure(self, **options):
+        self.handler.set_config(setupDummyConfig(**options))
+
+    def download(self, path='/dir/?download=zip', headers={}):
+        status, headers, body = self.request('GET', path, headers=headers)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(body))
+
+    def check(self, zf):
+        self.assertIsNone(zf.testzip())
+        self.assertEqual(sorted(zf.namelist()), [
+            'a.txt', 'empty/', 'sub/', 'sub/b.txt', 'sub/large',
+            '\xe4.txt'])
+        self.assertEqual(zf.read('sub/large'), LARGE)
+        self.assertEqual(zf.read('\xe4.txt'), b'umlaut')
+        self.assertTrue(zf.getinfo('empty/').is_dir())
+
+    def test_stored(self):
+        zf = self.download()
+        self.check(zf)
+        self.assertEqual(zf.getinfo('a.txt').compress_type,
+                         zipfile.ZIP_STORED)
+
+    def test_deflated(self):
+        self.configure(zip_compress_level=6)
+        zf = self.download()
+        self.check(zf)
+        info = zf.getinfo('a.txt')
+        self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(info.compress_size, 100)
+
+    def test_accept(self):
+        self.check(self.download('/dir/', {'Accept': 'application/zip'}))
+        for accept in ('application/zip;q=0', 'text/html'):
+            status, headers, body = self.request('GET', '/dir/',
+                                                 headers={'Accept': accept})
+            self.assertEqual(headers['Content-Type'],
+                             'text/html;charset=utf-8', accept)
+
+    def test_disabled(self):
+        self.configure(zip_download=False)
+        status, headers, body = self.request('GET', '/dir/?download=zip')
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['Content-Type'], 'application/zip')
+
+    def test_files_are_not_zipped(self):
+        status, headers, body = self.request('GET', '/dir/a.txt?download=zip')
+        self.assertEqual(body, b'a' * 100)
+
+    def test_headers(self):
+        status, headers, body = self.request('HEAD', '/dir/sub/?download=zip')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'')
+        self.assertIn('sub.zip', headers['Content-Disposition'])
+
+        status, headers, body = self.request('GET', '/?download=zip')
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertIn('download.zip', headers['Content-Disposition'])
+        self.assertIn('dir/sub/large',
+                      zipfile.ZipFile(io.BytesIO(body)).namelist())
+
+    def test_not_chunked(self):
+        self.configure(chunked_http_response=False)
+        status, headers, body = self.request('GET', '/dir/?download=zip')
+        self.assertNotIn('Transfer-Encoding', headers)
+        self.assertEqual(headers['Connection'], 'close')
+        self.check(zipfile.ZipFile(io.BytesIO(body)))
+
+    def test_limits(self):
+        self.configure(propfind_max_entries=5)
+        status, headers, body = self.request('GET', '/dir/?download=zip')
+        self.assertEqual(status, 403)
+        self.configure(propfind_max_entries=6)
+        self.check(self.download())
+
+    def test_removed_while_walking(self):
+        get_data = self.dc.get_data
+
+        def gone(uri, range=None):
+            if uri.endswith('b.txt'):
+                raise DAV_NotFound
+            return get_data(uri, range)
+
+        self.dc.get_data = gone
+        zf = self.download()
+        self.assertIsNone(zf.testzip())
+        self.assertNotIn('sub/b.txt', zf.namelist())
+        self.assertIn('sub/large', zf.namelist())
+
+
+class TestZipStream(unittest.TestCase):
+
+    def test_members_in_order(self):
+        dc = mock.Mock()
+        tree = {'http://h/c': ['http://h/c/b', 'http://h/c/a'],
+                'http://h/c/b': ['http://h/c/b/x']}
+        dc.get_childs.side_effect = lambda uri: tree.get(uri, [])
+        self.assertEqual([name for uri, name in
+                          ZipStream(dc, 'http://h/c?download=zip').members()],
+                         ['b', 'b/x', 'a'])
+
+    def test_unreadable_collection(self):
+        dc = mock.Mock()
+        dc.get_childs.side_effect = DAV_Forbidden
+        self.assertEqual(list(ZipStream(dc, 'http://h/c').members()), [])
+
+    def test_check_time(self):
+        dc = mock.Mock()
+        dc.get_childs.side_effect = lambda uri: uri.count('/') < 5 and [
+            uri + '/a', uri + '/b'] or []
+        stream = ZipStream(dc, 'http://h/c', max_time=1e-9)
+        self.assertRaises(DAV_Forbidden, stream.check)
+        ZipStream(dc, 'http://h/c', max_entries=6).check()
+
+    def test_dos_datetime(self):
+        self.assertEqual(dos_datetime(0), (0, (1 << 5) | 1))
+        self.assertEqual(dos_datetime(1e11)[1] >> 9, 127)
+
+    def test_zip64_central_header(self):
+        member = Member(b'big', zipstream.STORED, 0,
+                        zipstream.FILE_ATTRIBUTES)
+        member.flags |= zipstream.FLAG_DESCRIPTOR
+        member.size = member.compressed = 5 << 30
+        member.offset = 10
+        header = member.central_header()
+        fields = zipstream.CENTRAL_HEADER.unpack(
+            header[:zipstream.CENTRAL_HEADER.size])
+        self.assertEqual(fields[8:10], (zipstream.LIMIT_32,
+                                        zipstream.LIMIT_32))
+        self.assertEqual(fields[16], 10)
+        extra = header[zipstream.CENTRAL_HEADER.size + 3:]
+        self.assertEqual(struct.unpack('<HHQQ', extra),
+                         (1, 16, 5 << 30, 5 << 30))
+
+    def test_zip64_end(self):
+        stream = ZipStream(mock.Mock(), 'http://h/c')
+        stream.offset = 5 << 30
+        records = b''.join(stream._end(70000, 5 << 30, 100))
+        self.assertTrue(records.startswith(b'PK\x06\x06'))
+        end = zipstream.END_RECORD.unpack(
+            records[-zipstream.END_RECORD.size:])
+        self.assertEqual(end[3:7], (zipstream.LIMIT_16, zipstream.LIMIT_16,
+                                    100, zipstream.LIMIT_32))
+
+        records = b''.join(stream._end(3, 100, 100))
+        self.assertEqual(len(records), zipstream.END_RECORD.size)
+
+    def test_closed_when_aborted(self):
+        data = mock.MagicMock()
+        data.__iter__.return_value = iter([b'x', b'y'])
+        member = Member(b'f', zipstream.STORED, 0, zipstream.FILE_ATTRIBUTES)
+        content = ZipStream(mock.Mock(), 'http://h/c')._content(member, data)
+        next(content)
+        content.close()
+        data.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()